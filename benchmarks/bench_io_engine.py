@@ -0,0 +1,141 @@
+"""
+Backup ingestion with the threaded I/O path against the asyncio engine: an
+MMS backup with one attachment per message is parsed, its attachments
+checked and uploaded, and its records written to DynamoDB.
+
+Runs against the Docker Compose Minio and DynamoDB Local services, or the
+endpoints given by `S3_ENDPOINT_URL` and `DYNAMODB_ENDPOINT_URL`.
+
+    docker-compose up -d
+    python benchmarks/bench_io_engine.py [messages]
+"""
+
+import base64
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import boto3  # noqa: E402
+
+from backup_processor import BackupRestoreProcessor  # noqa: E402
+from io_engine import AsyncIOEngine  # noqa: E402
+from rate_control import AdaptiveWriteRateController  # noqa: E402
+from sinks import DynamoDBSink  # noqa: E402
+
+MESSAGES = 2000
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", "http://localhost:9000")
+DYNAMODB_ENDPOINT_URL = os.environ.get("DYNAMODB_ENDPOINT_URL", "http://localhost:8000")
+BUCKET_NAME = "sms-backup-restore"
+
+MMS_TEMPLATE = """<mms date="{date}" rr="null" sub="null"
+ ct_t="application/vnd.wap.multipart.related" read_status="null" seen="1"
+ msg_box="1" address="+1555{contact:07d}" sub_cs="null" resp_st="null"
+ retr_st="null" d_tm="null" text_only="0" exp="null" locked="0" m_id="m{i}"
+ st="null" retr_txt_cs="null" retr_txt="null" creator="null" date_sent="0"
+ read="1" m_size="8192" rpt_a="null" ct_cls="null" pri="null" sub_id="1"
+ tr_id="null" resp_txt="null" ct_l="null" m_cls="personal" d_rpt="null" v="18"
+ m_type="132" readable_date="Nov 14, 2023 10:16:40 PM" contact_name="(Unknown)">
+ <parts>
+  <part seq="0" ct="image/jpeg" name="{i}.jpg" chset="null" cd="null" fn="null"
+   cid="&lt;{i}&gt;" cl="{i}.jpg" ctt_s="null" ctt_t="null" text="null"
+   data="{data}" />
+ </parts>
+ <addrs><addr address="+1555{contact:07d}" type="137" charset="106" /></addrs>
+</mms>
+"""
+
+
+def make_backup(messages: int) -> bytes:
+    """Builds an MMS backup whose attachments are unique per run."""
+    run = uuid.uuid4().bytes
+    mms = "".join(
+        MMS_TEMPLATE.format(
+            i=i,
+            date=1700000000000 + i * 1000,
+            contact=i % 97,
+            data=base64.b64encode(run + i.to_bytes(4, "big") * 2048).decode(),
+        )
+        for i in range(messages)
+    )
+    return (
+        f"<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>"
+        f'<smses count="{messages}">{mms}</smses>'
+    ).encode()
+
+
+def create_table(dynamodb_client, table_name: str) -> None:
+    dynamodb_client.create_table(
+        TableName=table_name,
+        KeySchema=[
+            {"AttributeName": "id", "KeyType": "HASH"},
+            {"AttributeName": "timestamp", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "id", "AttributeType": "S"},
+            {"AttributeName": "timestamp", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def ingest(s3_client, dynamodb_client, backup_key, table_name, io_engine) -> float:
+    started = time.perf_counter()
+    processor = BackupRestoreProcessor(
+        s3_client=s3_client,
+        s3_resource=boto3.resource("s3", endpoint_url=S3_ENDPOINT_URL),
+        io_engine=io_engine,
+    )
+    records = {
+        r.hash(): r
+        for r in processor.process_backup(
+            bucket_name=BUCKET_NAME, backup_key=backup_key
+        )
+    }
+    sink = DynamoDBSink(
+        dynamodb_client,
+        table_name,
+        rate_controller=AdaptiveWriteRateController(max_write_request_units=40000),
+        io_engine=io_engine,
+    )
+    sink.write(records.items())
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else MESSAGES
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "minioadmin")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "minioadmin")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    s3_client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL)
+    dynamodb_client = boto3.client("dynamodb", endpoint_url=DYNAMODB_ENDPOINT_URL)
+    io_engine = AsyncIOEngine(
+        endpoint_urls={"s3": S3_ENDPOINT_URL, "dynamodb": DYNAMODB_ENDPOINT_URL}
+    )
+    try:
+        for name, engine in (("threads", None), ("asyncio", io_engine)):
+            backup_key = f"bench/sms-{uuid.uuid4().hex}.xml"
+            s3_client.put_object(
+                Bucket=BUCKET_NAME, Key=backup_key, Body=make_backup(messages)
+            )
+            table_name = f"bench-{uuid.uuid4().hex[:8]}"
+            create_table(dynamodb_client, table_name)
+            try:
+                seconds = ingest(
+                    s3_client, dynamodb_client, backup_key, table_name, engine
+                )
+            finally:
+                dynamodb_client.delete_table(TableName=table_name)
+            print(
+                f"{name:>8}: {messages:,} messages in {seconds:.2f}s "
+                f"({messages / seconds:,.0f}/s)"
+            )
+    finally:
+        io_engine.close()
+
+
+if __name__ == "__main__":
+    main()
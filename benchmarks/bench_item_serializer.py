@@ -0,0 +1,136 @@
+"""
+Serialization cost per 1,000 records: boto3's `TypeSerializer` over
+`model_dump()` (the `boto3.resource` path) against `serialize_record`.
+
+    python benchmarks/bench_item_serializer.py
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from boto3.dynamodb.types import TypeSerializer  # noqa: E402
+
+from item_serializer import serialize_record  # noqa: E402
+from schemas import MMS, SMS, Call  # noqa: E402
+
+RECORDS_PER_ROUND = 1000
+ROUNDS = 20
+
+
+def make_records(count: int) -> list:
+    """Builds a representative mix of SMS, calls and MMS records."""
+    records = []
+    for i in range(count):
+        date = str(1700000000000 + i * 1000)
+        match i % 3:
+            case 0:
+                record = SMS.model_validate(
+                    {
+                        "protocol": "0",
+                        "address": f"+1555{i % 97:07d}",
+                        "date": date,
+                        "type": "1",
+                        "subject": None,
+                        "body": f"Message body number {i} " * 4,
+                        "toa": None,
+                        "sc_toa": None,
+                        "service_center": "+12063130004",
+                        "read": "1",
+                        "status": "-1",
+                        "locked": "0",
+                        "date_sent": "0",
+                        "sub_id": "1",
+                        "readable_date": "Nov 14, 2023 10:13:20 PM",
+                        "contact_name": f"Contact {i % 97}",
+                    }
+                )
+            case 1:
+                record = Call.model_validate(
+                    {
+                        "number": f"555{i % 97:07d}",
+                        "duration": str(i % 600),
+                        "date": date,
+                        "type": "2",
+                        "presentation": "1",
+                        "subscription_id": "1",
+                        "subscription_component_name": None,
+                        "readable_date": "Nov 14, 2023 10:15:00 PM",
+                        "contact_name": None,
+                    }
+                )
+            case _:
+                record = MMS.model_validate(
+                    {
+                        "address": f"+1555{i % 97:07d}~+15557654321",
+                        "date": date,
+                        "text_only": "0",
+                        "read": "1",
+                        "m_id": f"mms-{i}",
+                        "m_type": "132",
+                        "msg_box": "1",
+                        "readable_date": "Nov 14, 2023 10:16:40 PM",
+                        **{
+                            k: None
+                            for k in MMS.model_fields
+                            if k
+                            not in (
+                                "timestamp",
+                                "address",
+                                "text_only",
+                                "read",
+                                "m_id",
+                                "m_type",
+                                "msg_box",
+                                "parts",
+                                "date_sent",
+                            )
+                        },
+                        "date_sent": "0",
+                        "parts": [
+                            {
+                                "seq": str(seq),
+                                "ct": "text/plain" if seq else "application/smil",
+                                "name": None,
+                                "chset": "106",
+                                "cd": None,
+                                "cid": f"<part{seq}>",
+                                "cl": f"part{seq}.txt",
+                                "ctt_s": None,
+                                "ctt_t": None,
+                                "text": f"Part {seq} of message {i}",
+                                "data": None,
+                            }
+                            for seq in range(3)
+                        ],
+                    }
+                )
+        records.append((record.hash(), record))
+    return records
+
+
+def main() -> None:
+    records = make_records(RECORDS_PER_ROUND)
+    type_serializer = TypeSerializer()
+
+    def resource_path():
+        for record_id, record in records:
+            item = {"id": record_id, **record.model_dump()}
+            {k: type_serializer.serialize(v) for k, v in item.items()}
+
+    def low_level_path():
+        for record_id, record in records:
+            serialize_record(record_id, record)
+
+    for name, func in [
+        ("TypeSerializer(model_dump())", resource_path),
+        ("serialize_record", low_level_path),
+    ]:
+        best = min(timeit.repeat(func, number=1, repeat=ROUNDS))
+        print(f"{name:<30} {best * 1000:8.2f} ms / {RECORDS_PER_ROUND} records")
+
+
+if __name__ == "__main__":
+    main()
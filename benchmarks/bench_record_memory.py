@@ -0,0 +1,58 @@
+"""
+Memory held per 100,000 records between parsing and writing: the Pydantic
+models the pipeline used to carry against `CompactRecord`s.
+
+    python benchmarks/bench_record_memory.py [records]
+"""
+
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from bench_item_serializer import make_records  # noqa: E402
+
+from compact_records import CompactRecord  # noqa: E402
+
+RECORDS = 100_000
+BATCH_RECORDS = 1000
+
+
+def held_bytes(build) -> int:
+    """Returns the bytes still allocated by the records `build` returns."""
+    gc.collect()
+    tracemalloc.start()
+    records = build()
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return held
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else RECORDS
+    batches = range(count // BATCH_RECORDS)
+
+    def models():
+        return [r for _ in batches for _, r in make_records(BATCH_RECORDS)]
+
+    def compact():
+        return [
+            CompactRecord.from_model(r)
+            for _ in batches
+            for _, r in make_records(BATCH_RECORDS)
+        ]
+
+    for name, build in [("pydantic models", models), ("CompactRecord", compact)]:
+        held = held_bytes(build)
+        print(
+            f"{name:<16} {held / 2**20:8.1f} MiB per {count:,} records "
+            f"({held / count:,.0f} bytes each)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Search latency over synthetic message segments: a merged segment of most
+documents plus a tail of small unmerged ones, as the merge leaves them.
+
+    python benchmarks/bench_search_index.py [documents]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import boto3  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+from search_index import (  # noqa: E402
+    SearchIndex,
+    _create_segment,
+    _finish_segment,
+    segment_key,
+)
+
+DOCUMENTS = 1_000_000
+SMALL_SEGMENTS = 9
+SMALL_SEGMENT_DOCUMENTS = 2000
+QUERIES = ["dinner tonight", "running late", "airport pickup", "happy birthday"]
+ROUNDS = 20
+WORDS = (
+    "ok yes no see you at the on for be there soon later tomorrow call me "
+    "when get home love thanks sure meeting work lunch running late dinner "
+    "tonight airport pickup happy birthday movie weekend"
+).split()
+
+
+def build_segment(path: str, start: int, count: int) -> None:
+    rng = random.Random(start)
+    connection = _create_segment(path)
+    connection.executemany(
+        "INSERT INTO documents (record_id, record_type, address, timestamp, body) "
+        "VALUES (?, 'SMS', ?, ?, ?)",
+        (
+            (
+                f"{i:064x}",
+                f"+1555{i % 997:07d}",
+                f"2023-11-14T22:13:{i % 60:02d}",
+                " ".join(rng.choices(WORDS, k=rng.randint(3, 25))),
+            )
+            for i in range(start, start + count)
+        ),
+    )
+    connection.commit()
+    _finish_segment(connection)
+
+
+def main() -> None:
+    documents = int(sys.argv[1]) if len(sys.argv) > 1 else DOCUMENTS
+    large = documents - SMALL_SEGMENTS * SMALL_SEGMENT_DOCUMENTS
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws(), tempfile.TemporaryDirectory() as tmp_dir:
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(Bucket="bench")
+        started = time.perf_counter()
+        sizes = [(1, large)] + [(0, SMALL_SEGMENT_DOCUMENTS)] * SMALL_SEGMENTS
+        start = 0
+        for level, count in sizes:
+            path = os.path.join(tmp_dir, f"{start}.sqlite")
+            build_segment(path, start, count)
+            s3_client.upload_file(path, "bench", segment_key(level))
+            start += count
+        print(f"built {documents:,} documents in {time.perf_counter() - started:.1f}s")
+
+        index = SearchIndex(s3_client, "bench", cache_dir=os.path.join(tmp_dir, "c"))
+        started = time.perf_counter()
+        index.search(QUERIES[0])
+        print(f"first search (downloads) {time.perf_counter() - started:.2f}s")
+        for query in QUERIES:
+            seconds = timeit.timeit(lambda: index.search(query), number=ROUNDS)
+            print(f"{query!r:>18}: {seconds / ROUNDS * 1000:.1f} ms per search")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,11 @@ from aws_cdk import aws_events as events
 from aws_cdk import aws_events_targets as targets
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_lambda as _lambda
+from aws_cdk import aws_lambda_event_sources as lambda_event_sources
 from aws_cdk import aws_logs as logs
 from aws_cdk import aws_s3 as s3
+from aws_cdk import aws_secretsmanager as secretsmanager
+from aws_cdk import aws_sqs as sqs
 from constructs import Construct
 
 
@@ -67,6 +70,13 @@ class SMSBackupRestoreS3(Construct):
             block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
             removal_policy=RemovalPolicy.RETAIN,
             event_bridge_enabled=True,
+            lifecycle_rules=[
+                s3.LifecycleRule(
+                    id="ExpireFanOutRecordBatches",
+                    prefix="batches/",
+                    expiration=Duration.days(7),
+                )
+            ],
         )
         self.event_rule = events.Rule(
             scope=self,
@@ -92,6 +102,9 @@ class SMSBackupRestoreS3(Construct):
                     effect=iam.Effect.ALLOW,
                     actions=[
                         "s3:PutObject",
+                        "s3:AbortMultipartUpload",
+                        "s3:DeleteObject",
+                        "s3:ListBucket",
                         "s3:GetObject",
                         "s3:GetObjectAttributes",
                         "s3:GetObjectTagging",
@@ -111,14 +124,14 @@ class SMSBackupRestoreS3(Construct):
 class SMSBackupRestoreLogGroup(Construct):
     """Log Group Configuration for SMSBackupRestoreStack"""
 
-    def __init__(self, scope: Construct, id: str, **kwargs):
+    def __init__(self, scope: Construct, id: str, function_name: str = None, **kwargs):
         super().__init__(scope=scope, id=id)
         stack = Stack.of(self)
 
         self.log_group = logs.CfnLogGroup(
             scope=self,
             id="LogsLogGroup",
-            log_group_name=f"/aws/lambda/{stack.stack_name}",
+            log_group_name=f"/aws/lambda/{function_name or stack.stack_name}",
             retention_in_days=180,
         )
 
@@ -150,6 +163,10 @@ class SMSBackupRestoreLogGroup(Construct):
 class SMSBackupRestoreDynamoDB(Construct):
     """DynamoDB Configuration for SMSBackupRestoreStack"""
 
+    max_read_request_units = 1000
+    max_write_request_units = 1000
+    thread_index_name = "thread-timestamp-index"
+
     def __init__(self, scope: Construct, id: str, **kwargs):
         super().__init__(scope=scope, id=id)
         stack = Stack.of(self)
@@ -165,11 +182,58 @@ class SMSBackupRestoreDynamoDB(Construct):
                 name="timestamp", type=dynamodb.AttributeType.STRING
             ),
             billing=dynamodb.Billing.on_demand(
-                max_read_request_units=1000,
-                max_write_request_units=1000,
+                max_read_request_units=self.max_read_request_units,
+                max_write_request_units=self.max_write_request_units,
+            ),
+            global_secondary_indexes=[
+                # Conversation reads: `thread` is `{addresses}#{shard}`
+                dynamodb.GlobalSecondaryIndexPropsV2(
+                    index_name=self.thread_index_name,
+                    partition_key=dynamodb.Attribute(
+                        name="thread", type=dynamodb.AttributeType.STRING
+                    ),
+                    sort_key=dynamodb.Attribute(
+                        name="timestamp", type=dynamodb.AttributeType.STRING
+                    ),
+                    projection_type=dynamodb.ProjectionType.ALL,
+                )
+            ],
+            removal_policy=RemovalPolicy.RETAIN,
+        )
+        # Per-contact counts, kept apart from the records scans and exports read
+        self.contact_summary_table = dynamodb.TableV2(
+            scope=self,
+            id="ContactSummaryTable",
+            table_name=f"{stack.stack_name}-contact-summaries",
+            partition_key=dynamodb.Attribute(
+                name="address", type=dynamodb.AttributeType.STRING
+            ),
+            billing=dynamodb.Billing.on_demand(),
+            removal_policy=RemovalPolicy.RETAIN,
+        )
+        # Locations of the attachments appended to packs, by content hash
+        self.part_index_table = dynamodb.TableV2(
+            scope=self,
+            id="PartIndexTable",
+            table_name=f"{stack.stack_name}-part-index",
+            partition_key=dynamodb.Attribute(
+                name="part", type=dynamodb.AttributeType.STRING
             ),
+            billing=dynamodb.Billing.on_demand(),
             removal_policy=RemovalPolicy.RETAIN,
         )
+        # Powertools idempotency records and processing checkpoints
+        self.idempotency_table = dynamodb.TableV2(
+            scope=self,
+            id="IdempotencyTable",
+            table_name=f"{stack.stack_name}-idempotency",
+            partition_key=dynamodb.Attribute(
+                name="id", type=dynamodb.AttributeType.STRING
+            ),
+            billing=dynamodb.Billing.on_demand(),
+            time_to_live_attribute="expiration",
+            removal_policy=RemovalPolicy.DESTROY,
+        )
 
     @property
     def access_policy_document(self) -> iam.PolicyDocument:
@@ -207,6 +271,10 @@ class SMSBackupRestoreDynamoDB(Construct):
                     ],
                     resources=[
                         self.dynamodb_table.table_arn,
+                        f"{self.dynamodb_table.table_arn}/index/*",
+                        self.contact_summary_table.table_arn,
+                        self.part_index_table.table_arn,
+                        self.idempotency_table.table_arn,
                     ],
                 ),
                 iam.PolicyStatement(
@@ -227,6 +295,76 @@ class SMSBackupRestoreDynamoDB(Construct):
         return lambda_access_dynamodb_policy_document
 
 
+class SMSBackupRestoreSQS(Construct):
+    """SQS fan-out queue Configuration for SMSBackupRestoreStack"""
+
+    def __init__(self, scope: Construct, id: str, **kwargs):
+        super().__init__(scope=scope, id=id)
+        stack = Stack.of(self)
+
+        self.dead_letter_queue = sqs.Queue(
+            scope=self,
+            id="RecordBatchDeadLetterQueue",
+            queue_name=f"{stack.stack_name}-record-batches-dlq",
+            encryption=sqs.QueueEncryption.SQS_MANAGED,
+            retention_period=Duration.days(14),
+        )
+        self.queue = sqs.Queue(
+            scope=self,
+            id="RecordBatchQueue",
+            queue_name=f"{stack.stack_name}-record-batches",
+            encryption=sqs.QueueEncryption.SQS_MANAGED,
+            # Six times the writer function timeout, as recommended for Lambda
+            visibility_timeout=Duration.minutes(30),
+            retention_period=Duration.days(4),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=5, queue=self.dead_letter_queue
+            ),
+        )
+        self.reprocess_dead_letter_queue = sqs.Queue(
+            scope=self,
+            id="ReprocessDeadLetterQueue",
+            queue_name=f"{stack.stack_name}-reprocess-dlq",
+            encryption=sqs.QueueEncryption.SQS_MANAGED,
+            retention_period=Duration.days(14),
+        )
+        # One message per backup of a reprocessing run
+        self.reprocess_queue = sqs.Queue(
+            scope=self,
+            id="ReprocessQueue",
+            queue_name=f"{stack.stack_name}-reprocess",
+            encryption=sqs.QueueEncryption.SQS_MANAGED,
+            # Six times the processing function timeout, as recommended for Lambda
+            visibility_timeout=Duration.minutes(90),
+            retention_period=Duration.days(4),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=3, queue=self.reprocess_dead_letter_queue
+            ),
+        )
+
+    @property
+    def access_policy_document(self) -> iam.PolicyDocument:
+        """Returns Policy Document for Lambda SQS Access"""
+        lambda_access_sqs_policy_document = iam.PolicyDocument(
+            statements=[
+                iam.PolicyStatement(
+                    sid="AllowLambdaToAccessRecordBatchQueue",
+                    effect=iam.Effect.ALLOW,
+                    actions=[
+                        "sqs:SendMessage",
+                        "sqs:ReceiveMessage",
+                        "sqs:DeleteMessage",
+                        "sqs:ChangeMessageVisibility",
+                        "sqs:GetQueueAttributes",
+                        "sqs:GetQueueUrl",
+                    ],
+                    resources=[self.queue.queue_arn, self.reprocess_queue.queue_arn],
+                )
+            ]
+        )
+        return lambda_access_sqs_policy_document
+
+
 class SMSBackupRestoreStack(Stack):
     """AWS CDK Stack for sms-backup-restore processing resources."""
 
@@ -245,6 +383,72 @@ class SMSBackupRestoreStack(Stack):
         dynamodb_node = SMSBackupRestoreDynamoDB(
             scope=self, id="SMSBackupRestoreDynamoDB"
         )
+        sqs_node = SMSBackupRestoreSQS(scope=self, id="SMSBackupRestoreSQS")
+        writer_function_name = f"{self.stack_name}-writer"
+        writer_max_concurrency = int(
+            self.node.try_get_context("writer_max_concurrency") or 10
+        )
+        # Backups larger than the dedup memory budget spill sorted runs to /tmp
+        processing_ephemeral_storage_mib = (
+            self.node.try_get_context("processing_ephemeral_storage_mib") or 1024
+        )
+        writer_log_group_node = SMSBackupRestoreLogGroup(
+            scope=self,
+            id="SMSBackupRestoreWriterLogGroup",
+            function_name=writer_function_name,
+        )
+        restore_function_name = f"{self.stack_name}-restore"
+        restore_log_group_node = SMSBackupRestoreLogGroup(
+            scope=self,
+            id="SMSBackupRestoreRestoreLogGroup",
+            function_name=restore_function_name,
+        )
+        export_function_name = f"{self.stack_name}-export"
+        export_log_group_node = SMSBackupRestoreLogGroup(
+            scope=self,
+            id="SMSBackupRestoreExportLogGroup",
+            function_name=export_function_name,
+        )
+        search_function_name = f"{self.stack_name}-search"
+        search_log_group_node = SMSBackupRestoreLogGroup(
+            scope=self,
+            id="SMSBackupRestoreSearchLogGroup",
+            function_name=search_function_name,
+        )
+        search_merge_function_name = f"{self.stack_name}-search-merge"
+        reprocess_function_name = f"{self.stack_name}-reprocess"
+        reprocess_log_group_node = SMSBackupRestoreLogGroup(
+            scope=self,
+            id="SMSBackupRestoreReprocessLogGroup",
+            function_name=reprocess_function_name,
+        )
+        reprocess_worker_function_name = f"{self.stack_name}-reprocess-worker"
+        reprocess_worker_log_group_node = SMSBackupRestoreLogGroup(
+            scope=self,
+            id="SMSBackupRestoreReprocessWorkerLogGroup",
+            function_name=reprocess_worker_function_name,
+        )
+        diff_function_name = f"{self.stack_name}-diff"
+        diff_log_group_node = SMSBackupRestoreLogGroup(
+            scope=self,
+            id="SMSBackupRestoreDiffLogGroup",
+            function_name=diff_function_name,
+        )
+        # Backups processed at once by a reprocessing run
+        reprocess_max_concurrency = int(
+            self.node.try_get_context("reprocess_max_concurrency") or 2
+        )
+        search_merge_log_group_node = SMSBackupRestoreLogGroup(
+            scope=self,
+            id="SMSBackupRestoreSearchMergeLogGroup",
+            function_name=search_merge_function_name,
+        )
+        pack_gc_function_name = f"{self.stack_name}-pack-gc"
+        pack_gc_log_group_node = SMSBackupRestoreLogGroup(
+            scope=self,
+            id="SMSBackupRestorePackGCLogGroup",
+            function_name=pack_gc_function_name,
+        )
 
         lambda_iam_role = iam.Role(
             scope=self,
@@ -256,10 +460,35 @@ class SMSBackupRestoreStack(Stack):
             inline_policies={
                 "LambdaAccessS3": s3_bucket_node.access_policy_document,
                 "LambdaAccessDynamoDB": dynamodb_node.access_policy_document,
+                "LambdaAccessSQS": sqs_node.access_policy_document,
                 "LambdaCreatePutLog": log_group_node.access_policy_document,
+                "WriterLambdaCreatePutLog": writer_log_group_node.access_policy_document,
+                "RestoreLambdaCreatePutLog": restore_log_group_node.access_policy_document,
+                "ExportLambdaCreatePutLog": export_log_group_node.access_policy_document,
+                "SearchLambdaCreatePutLog": search_log_group_node.access_policy_document,
+                "SearchMergeLambdaCreatePutLog": search_merge_log_group_node.access_policy_document,
+                "ReprocessLambdaCreatePutLog": reprocess_log_group_node.access_policy_document,
+                "ReprocessWorkerLambdaCreatePutLog": reprocess_worker_log_group_node.access_policy_document,
+                "DiffLambdaCreatePutLog": diff_log_group_node.access_policy_document,
+                "PackGCLambdaCreatePutLog": pack_gc_log_group_node.access_policy_document,
             },
         )
 
+        processing_environment = {
+            "DYNAMODB_TABLE": dynamodb_node.dynamodb_table.table_name,
+            "BUCKET_NAME": s3_bucket_node.s3_bucket.bucket_name,
+            "IDEMPOTENCY_TABLE": dynamodb_node.idempotency_table.table_name,
+            "CONTACT_SUMMARY_TABLE": dynamodb_node.contact_summary_table.table_name,
+            "PART_INDEX_TABLE": dynamodb_node.part_index_table.table_name,
+            "RECORD_SINKS": "sqs",
+            "FANOUT_QUEUE_URL": sqs_node.queue.queue_url,
+            # 8 GB functions get about 4.6 vCPUs, one of them parsing
+            "VALIDATION_WORKERS": "4",
+            "MAX_WRITE_REQUEST_UNITS": str(dynamodb_node.max_write_request_units),
+            "POWERTOOLS_SERVICE_NAME": "sms-backup-restore",
+            "POWERTOOLS_METRICS_NAMESPACE": "sms-backup-restore",
+            "ENV": "prod",
+        }
         lambda_function = _lambda.DockerImageFunction(
             scope=self,
             id="BackupProcessingLambdaFunction",
@@ -268,25 +497,375 @@ class SMSBackupRestoreStack(Stack):
             role=lambda_iam_role,
             architecture=_lambda.Architecture.ARM_64,
             memory_size=8192,
-            ephemeral_storage_size=Size.mebibytes(1024),
+            ephemeral_storage_size=Size.mebibytes(
+                int(processing_ephemeral_storage_mib)
+            ),
             application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
             code=_lambda.DockerImageCode.from_ecr(ecr_repository_node.ecr_repository),
+            environment=processing_environment,
+            timeout=Duration.minutes(15),
+            tracing=_lambda.Tracing.PASS_THROUGH,
+            logging_format=_lambda.LoggingFormat.JSON,
+            log_group=log_group_node.log_group,
+        )
+
+        writer_lambda_function = _lambda.DockerImageFunction(
+            scope=self,
+            id="RecordBatchWriterLambdaFunction",
+            function_name=writer_function_name,
+            description="SMS Backup Restore record batch writer lambda",
+            role=lambda_iam_role,
+            architecture=_lambda.Architecture.ARM_64,
+            memory_size=1024,
+            ephemeral_storage_size=Size.mebibytes(1024),
+            application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
+            code=_lambda.DockerImageCode.from_ecr(
+                ecr_repository_node.ecr_repository,
+                cmd=["writer_function.handler"],
+            ),
+            environment={
+                "DYNAMODB_TABLE": dynamodb_node.dynamodb_table.table_name,
+                "BUCKET_NAME": s3_bucket_node.s3_bucket.bucket_name,
+                "CONTACT_SUMMARY_TABLE": (
+                    dynamodb_node.contact_summary_table.table_name
+                ),
+                "SEARCH_INDEX": "true",
+                # Each concurrent writer paces itself to its share of the cap
+                "MAX_WRITE_REQUEST_UNITS": str(
+                    dynamodb_node.max_write_request_units // writer_max_concurrency
+                ),
+                "POWERTOOLS_SERVICE_NAME": "sms-backup-restore-writer",
+                "POWERTOOLS_METRICS_NAMESPACE": "sms-backup-restore",
+                "ENV": "prod",
+            },
+            timeout=Duration.minutes(5),
+            tracing=_lambda.Tracing.PASS_THROUGH,
+            logging_format=_lambda.LoggingFormat.JSON,
+            log_group=writer_log_group_node.log_group,
+        )
+        writer_lambda_function.add_event_source(
+            lambda_event_sources.SqsEventSource(
+                queue=sqs_node.queue,
+                batch_size=10,
+                max_batching_window=Duration.seconds(5),
+                max_concurrency=writer_max_concurrency,
+                report_batch_item_failures=True,
+            )
+        )
+
+        # Invoked on demand with {"backup_type": "sms"|"calls", "address": ...}
+        restore_lambda_function = _lambda.DockerImageFunction(
+            scope=self,
+            id="BackupRestoreLambdaFunction",
+            function_name=restore_function_name,
+            description="SMS Backup Restore backup file restore lambda",
+            role=lambda_iam_role,
+            architecture=_lambda.Architecture.ARM_64,
+            memory_size=2048,
+            application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
+            code=_lambda.DockerImageCode.from_ecr(
+                ecr_repository_node.ecr_repository,
+                cmd=["restore_function.handler"],
+            ),
             environment={
                 "DYNAMODB_TABLE": dynamodb_node.dynamodb_table.table_name,
-                "POWERTOOLS_SERVICE_NAME": "sms-backup-restore",
+                "BUCKET_NAME": s3_bucket_node.s3_bucket.bucket_name,
+                "PART_INDEX_TABLE": dynamodb_node.part_index_table.table_name,
+                "POWERTOOLS_SERVICE_NAME": "sms-backup-restore-restore",
                 "POWERTOOLS_METRICS_NAMESPACE": "sms-backup-restore",
                 "ENV": "prod",
             },
             timeout=Duration.minutes(15),
             tracing=_lambda.Tracing.PASS_THROUGH,
             logging_format=_lambda.LoggingFormat.JSON,
-            log_group=log_group_node.log_group,
+            log_group=restore_log_group_node.log_group,
+        )
+
+        # Invoked on demand with {"format": "ndjson"|"parquet", "export_id": ...}
+        export_lambda_function = _lambda.DockerImageFunction(
+            scope=self,
+            id="TableExportLambdaFunction",
+            function_name=export_function_name,
+            description="SMS Backup Restore table export lambda",
+            role=lambda_iam_role,
+            architecture=_lambda.Architecture.ARM_64,
+            memory_size=2048,
+            application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
+            code=_lambda.DockerImageCode.from_ecr(
+                ecr_repository_node.ecr_repository,
+                cmd=["export_function.handler"],
+            ),
+            environment={
+                "DYNAMODB_TABLE": dynamodb_node.dynamodb_table.table_name,
+                "BUCKET_NAME": s3_bucket_node.s3_bucket.bucket_name,
+                # Leaves half of the read capacity to the other functions
+                "MAX_READ_REQUEST_UNITS": str(
+                    dynamodb_node.max_read_request_units // 2
+                ),
+                "POWERTOOLS_SERVICE_NAME": "sms-backup-restore-export",
+                "POWERTOOLS_METRICS_NAMESPACE": "sms-backup-restore",
+                "ENV": "prod",
+            },
+            timeout=Duration.minutes(15),
+            tracing=_lambda.Tracing.PASS_THROUGH,
+            logging_format=_lambda.LoggingFormat.JSON,
+            log_group=export_log_group_node.log_group,
+        )
+
+        # Invoked on demand with {"query": ..., "limit": 20}
+        search_lambda_function = _lambda.DockerImageFunction(
+            scope=self,
+            id="MessageSearchLambdaFunction",
+            function_name=search_function_name,
+            description="SMS Backup Restore message search lambda",
+            role=lambda_iam_role,
+            architecture=_lambda.Architecture.ARM_64,
+            memory_size=2048,
+            ephemeral_storage_size=Size.gibibytes(4),
+            application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
+            code=_lambda.DockerImageCode.from_ecr(
+                ecr_repository_node.ecr_repository,
+                cmd=["search_function.handler"],
+            ),
+            environment={
+                "BUCKET_NAME": s3_bucket_node.s3_bucket.bucket_name,
+                "POWERTOOLS_SERVICE_NAME": "sms-backup-restore-search",
+                "POWERTOOLS_METRICS_NAMESPACE": "sms-backup-restore",
+                "ENV": "prod",
+            },
+            timeout=Duration.seconds(30),
+            tracing=_lambda.Tracing.PASS_THROUGH,
+            logging_format=_lambda.LoggingFormat.JSON,
+            log_group=search_log_group_node.log_group,
+        )
+
+        # Merges must not overlap, hence a single concurrent execution
+        search_merge_lambda_function = _lambda.DockerImageFunction(
+            scope=self,
+            id="SearchSegmentMergeLambdaFunction",
+            function_name=search_merge_function_name,
+            description="SMS Backup Restore search segment merge lambda",
+            role=lambda_iam_role,
+            architecture=_lambda.Architecture.ARM_64,
+            memory_size=2048,
+            ephemeral_storage_size=Size.gibibytes(8),
+            reserved_concurrent_executions=1,
+            application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
+            code=_lambda.DockerImageCode.from_ecr(
+                ecr_repository_node.ecr_repository,
+                cmd=["search_function.merge_handler"],
+            ),
+            environment={
+                "BUCKET_NAME": s3_bucket_node.s3_bucket.bucket_name,
+                "POWERTOOLS_SERVICE_NAME": "sms-backup-restore-search-merge",
+                "POWERTOOLS_METRICS_NAMESPACE": "sms-backup-restore",
+                "ENV": "prod",
+            },
+            timeout=Duration.minutes(15),
+            tracing=_lambda.Tracing.PASS_THROUGH,
+            logging_format=_lambda.LoggingFormat.JSON,
+            log_group=search_merge_log_group_node.log_group,
+        )
+        events.Rule(
+            scope=self,
+            id="SearchSegmentMergeSchedule",
+            schedule=events.Schedule.rate(Duration.minutes(30)),
+            targets=[targets.LambdaFunction(handler=search_merge_lambda_function)],
+        )
+
+        # Collections must not overlap, hence a single concurrent execution
+        pack_gc_lambda_function = _lambda.DockerImageFunction(
+            scope=self,
+            id="PackGCLambdaFunction",
+            function_name=pack_gc_function_name,
+            description="SMS Backup Restore attachment pack collection lambda",
+            role=lambda_iam_role,
+            architecture=_lambda.Architecture.ARM_64,
+            memory_size=1024,
+            reserved_concurrent_executions=1,
+            application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
+            code=_lambda.DockerImageCode.from_ecr(
+                ecr_repository_node.ecr_repository,
+                cmd=["pack_gc_function.handler"],
+            ),
+            environment={
+                "PART_INDEX_TABLE": dynamodb_node.part_index_table.table_name,
+                "BUCKET_NAME": s3_bucket_node.s3_bucket.bucket_name,
+                "POWERTOOLS_SERVICE_NAME": "sms-backup-restore-pack-gc",
+                "POWERTOOLS_METRICS_NAMESPACE": "sms-backup-restore",
+                "ENV": "prod",
+            },
+            timeout=Duration.minutes(15),
+            tracing=_lambda.Tracing.PASS_THROUGH,
+            logging_format=_lambda.LoggingFormat.JSON,
+            log_group=pack_gc_log_group_node.log_group,
+        )
+        events.Rule(
+            scope=self,
+            id="PackGCSchedule",
+            schedule=events.Schedule.rate(Duration.days(1)),
+            targets=[targets.LambdaFunction(handler=pack_gc_lambda_function)],
         )
 
         s3_bucket_node.event_rule.add_target(
             targets.LambdaFunction(handler=lambda_function, retry_attempts=3)
         )
 
+        # Invoked on demand with {"prefix": ..., "dry_run": false}
+        _lambda.DockerImageFunction(
+            scope=self,
+            id="BackupReprocessLambdaFunction",
+            function_name=reprocess_function_name,
+            description="SMS Backup Restore backup reprocessing planner lambda",
+            role=lambda_iam_role,
+            architecture=_lambda.Architecture.ARM_64,
+            memory_size=512,
+            application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
+            code=_lambda.DockerImageCode.from_ecr(
+                ecr_repository_node.ecr_repository,
+                cmd=["reprocess_function.handler"],
+            ),
+            environment={
+                "BUCKET_NAME": s3_bucket_node.s3_bucket.bucket_name,
+                "REPROCESS_QUEUE_URL": sqs_node.reprocess_queue.queue_url,
+                "POWERTOOLS_SERVICE_NAME": "sms-backup-restore-reprocess",
+                "POWERTOOLS_METRICS_NAMESPACE": "sms-backup-restore",
+                "ENV": "prod",
+            },
+            timeout=Duration.minutes(5),
+            tracing=_lambda.Tracing.PASS_THROUGH,
+            logging_format=_lambda.LoggingFormat.JSON,
+            log_group=reprocess_log_group_node.log_group,
+        )
+        reprocess_worker_lambda_function = _lambda.DockerImageFunction(
+            scope=self,
+            id="BackupReprocessWorkerLambdaFunction",
+            function_name=reprocess_worker_function_name,
+            description="SMS Backup Restore backup reprocessing lambda",
+            role=lambda_iam_role,
+            architecture=_lambda.Architecture.ARM_64,
+            memory_size=8192,
+            ephemeral_storage_size=Size.mebibytes(
+                int(processing_ephemeral_storage_mib)
+            ),
+            application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
+            code=_lambda.DockerImageCode.from_ecr(
+                ecr_repository_node.ecr_repository,
+                cmd=["lambda_function.reprocess_handler"],
+            ),
+            environment={
+                **processing_environment,
+                # Concurrent workers share the table's write budget
+                "MAX_WRITE_REQUEST_UNITS": str(
+                    dynamodb_node.max_write_request_units // reprocess_max_concurrency
+                ),
+                "POWERTOOLS_SERVICE_NAME": "sms-backup-restore-reprocess-worker",
+            },
+            timeout=Duration.minutes(15),
+            tracing=_lambda.Tracing.PASS_THROUGH,
+            logging_format=_lambda.LoggingFormat.JSON,
+            log_group=reprocess_worker_log_group_node.log_group,
+        )
+        reprocess_worker_lambda_function.add_event_source(
+            lambda_event_sources.SqsEventSource(
+                queue=sqs_node.reprocess_queue,
+                batch_size=1,
+                max_concurrency=reprocess_max_concurrency,
+                report_batch_item_failures=True,
+            )
+        )
+
+        # Invoked on demand with {"old_key": ..., "new_key": ...}; both
+        # backups may spill sorted runs to /tmp
+        _lambda.DockerImageFunction(
+            scope=self,
+            id="BackupDiffLambdaFunction",
+            function_name=diff_function_name,
+            description="SMS Backup Restore backup diff lambda",
+            role=lambda_iam_role,
+            architecture=_lambda.Architecture.ARM_64,
+            memory_size=8192,
+            ephemeral_storage_size=Size.mebibytes(
+                2 * int(processing_ephemeral_storage_mib)
+            ),
+            application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
+            code=_lambda.DockerImageCode.from_ecr(
+                ecr_repository_node.ecr_repository,
+                cmd=["diff_function.handler"],
+            ),
+            environment={
+                **processing_environment,
+                "POWERTOOLS_SERVICE_NAME": "sms-backup-restore-diff",
+            },
+            timeout=Duration.minutes(15),
+            tracing=_lambda.Tracing.PASS_THROUGH,
+            logging_format=_lambda.LoggingFormat.JSON,
+            log_group=diff_log_group_node.log_group,
+        )
+
+        # Backups the Android app uploads to Google Drive are polled for when
+        # the name of a secret holding a service account key is configured
+        drive_credentials_secret = self.node.try_get_context("drive_credentials_secret")
+        if drive_credentials_secret:
+            drive_function_name = f"{self.stack_name}-drive"
+            drive_log_group_node = SMSBackupRestoreLogGroup(
+                scope=self,
+                id="SMSBackupRestoreDriveLogGroup",
+                function_name=drive_function_name,
+            )
+            lambda_iam_role.attach_inline_policy(
+                iam.Policy(
+                    scope=self,
+                    id="DriveLambdaCreatePutLog",
+                    document=drive_log_group_node.access_policy_document,
+                )
+            )
+            secretsmanager.Secret.from_secret_name_v2(
+                scope=self,
+                id="DriveCredentialsSecret",
+                secret_name=drive_credentials_secret,
+            ).grant_read(lambda_iam_role)
+            # Polls must not overlap, hence a single concurrent execution
+            drive_lambda_function = _lambda.DockerImageFunction(
+                scope=self,
+                id="DriveBackupLambdaFunction",
+                function_name=drive_function_name,
+                description="SMS Backup Restore Google Drive backup processing lambda",
+                role=lambda_iam_role,
+                architecture=_lambda.Architecture.ARM_64,
+                memory_size=8192,
+                ephemeral_storage_size=Size.mebibytes(
+                    int(processing_ephemeral_storage_mib)
+                ),
+                reserved_concurrent_executions=1,
+                application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
+                code=_lambda.DockerImageCode.from_ecr(
+                    ecr_repository_node.ecr_repository,
+                    cmd=["drive_function.handler"],
+                ),
+                environment={
+                    **processing_environment,
+                    "DRIVE_CREDENTIALS_SECRET": drive_credentials_secret,
+                    "DRIVE_FOLDER_ID": self.node.try_get_context("drive_folder_id")
+                    or "",
+                    "POWERTOOLS_SERVICE_NAME": "sms-backup-restore-drive",
+                },
+                timeout=Duration.minutes(15),
+                tracing=_lambda.Tracing.PASS_THROUGH,
+                logging_format=_lambda.LoggingFormat.JSON,
+                log_group=drive_log_group_node.log_group,
+            )
+            events.Rule(
+                scope=self,
+                id="DriveBackupPollSchedule",
+                schedule=events.Schedule.rate(
+                    Duration.minutes(
+                        int(self.node.try_get_context("drive_poll_minutes") or 15)
+                    )
+                ),
+                targets=[targets.LambdaFunction(handler=drive_lambda_function)],
+            )
+
         CfnOutput(
             self,
             id="SMSBackupRestoreBucketArn",
@@ -305,3 +884,33 @@ class SMSBackupRestoreStack(Stack):
             value=lambda_function.function_arn,
             description="Lambda Function ARN",
         )
+        CfnOutput(
+            self,
+            id="SMSBackupRestoreWriterLambdaArn",
+            value=writer_lambda_function.function_arn,
+            description="Writer Lambda Function ARN",
+        )
+        CfnOutput(
+            self,
+            id="SMSBackupRestoreRestoreLambdaArn",
+            value=restore_lambda_function.function_arn,
+            description="Restore Lambda Function ARN",
+        )
+        CfnOutput(
+            self,
+            id="SMSBackupRestoreExportLambdaArn",
+            value=export_lambda_function.function_arn,
+            description="Export Lambda Function ARN",
+        )
+        CfnOutput(
+            self,
+            id="SMSBackupRestoreSearchLambdaArn",
+            value=search_lambda_function.function_arn,
+            description="Search Lambda Function ARN",
+        )
+        CfnOutput(
+            self,
+            id="SMSBackupRestoreRecordBatchQueueUrl",
+            value=sqs_node.queue.queue_url,
+            description="Record Batch SQS Queue URL",
+        )
@@ -0,0 +1,178 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from aws_lambda_powertools import Logger
+from botocore.exceptions import ClientError
+from mypy_boto3_dynamodb.client import DynamoDBClient
+
+from item_serializer import Item, deserialize_item
+
+logger = Logger()
+
+# Counters incremented by each record of a type
+_COUNTERS = {
+    "SMS": ("messages", "sms_count"),
+    "MMS": ("messages", "mms_count"),
+    "Call": ("calls",),
+}
+# Latest timestamp attribute per record type
+_LATEST = {"SMS": "last_message_at", "MMS": "last_message_at", "Call": "last_call_at"}
+
+
+def _newer_condition(name: str) -> str:
+    """Condition that the item's `name` timestamp is missing or older."""
+    return f"(attribute_not_exists(#{name}) OR #{name} < :{name})"
+
+
+def contact_summary_key(address: str) -> Dict[str, Dict[str, str]]:
+    """Returns the primary key of an address's summary item."""
+    return {"address": {"S": address}}
+
+
+class ContactAggregates:
+    """
+    Maintains a summary item per contact address from newly written records.
+
+    Summaries live in their own table keyed by `address`, so they are neither
+    read back as records by scans, restores and exports nor concentrated on
+    one index partition.  Counts are merged in memory by `add_items` and applied by `flush` with
+    one `UpdateItem` per address: counters are incremented with `ADD` and the
+    latest message and call times are only moved forward.  Feeding it the same
+    record twice counts it twice, so only records whose conditional put
+    created them should be added.
+
+    Args:
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        table_name (str): Name of the contact summary table.
+        max_workers (int): Concurrent `UpdateItem` requests.
+    """
+
+    def __init__(
+        self,
+        dynamodb_client: DynamoDBClient,
+        table_name: str,
+        max_workers: int = 8,
+    ) -> None:
+        self._dynamodb_client = dynamodb_client
+        self._table_name = table_name
+        self._max_workers = max_workers
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+        self._latest: Dict[str, Dict[str, str]] = defaultdict(dict)
+
+    def add_items(self, items: Iterable[Item]) -> None:
+        """Merges newly written `AttributeValue` items into the pending counts."""
+        for item in items:
+            record_type = item["record_type"]["S"]
+            if record_type not in _COUNTERS:
+                continue
+            timestamp = item["timestamp"]["S"]
+            latest_attribute = _LATEST[record_type]
+            for address in item["address"]["L"]:
+                address = address["S"]
+                counters = self._counters[address]
+                for counter in _COUNTERS[record_type]:
+                    counters[counter] += 1
+                if record_type == "Call":
+                    counters["call_seconds"] += int(item["duration"]["N"])
+                latest = self._latest[address]
+                if timestamp > latest.get(latest_attribute, ""):
+                    latest[latest_attribute] = timestamp
+
+    def _update(self, address: str) -> None:
+        counters, latest = self._counters[address], self._latest[address]
+        names = {f"#{name}": name for name in (*counters, *latest)}
+        values = {f":{name}": {"N": str(value)} for name, value in counters.items()}
+        add = ", ".join(f"#{name} :{name}" for name in counters)
+        key = contact_summary_key(address)
+
+        if latest:
+            # Common case: this run's records are the contact's newest
+            sets = ", ".join(f"#{name} = :{name}" for name in latest)
+            try:
+                self._dynamodb_client.update_item(
+                    TableName=self._table_name,
+                    Key=key,
+                    UpdateExpression=f"SET {sets} ADD {add}",
+                    ConditionExpression=" AND ".join(
+                        _newer_condition(name) for name in latest
+                    ),
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues={
+                        **values,
+                        **{f":{k}": {"S": v} for k, v in latest.items()},
+                    },
+                )
+                return
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+
+        self._dynamodb_client.update_item(
+            TableName=self._table_name,
+            Key=key,
+            UpdateExpression=f"ADD {add}",
+            ExpressionAttributeNames={
+                k: v for k, v in names.items() if k[1:] not in latest
+            },
+            ExpressionAttributeValues=values,
+        )
+        for name, timestamp in latest.items():
+            try:
+                self._dynamodb_client.update_item(
+                    TableName=self._table_name,
+                    Key=key,
+                    UpdateExpression=f"SET #{name} = :{name}",
+                    ConditionExpression=_newer_condition(name),
+                    ExpressionAttributeNames={f"#{name}": name},
+                    ExpressionAttributeValues={f":{name}": {"S": timestamp}},
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+
+    def flush(self) -> int:
+        """Applies the pending counts, returning the number of contacts updated."""
+        addresses = list(self._counters)
+        if not addresses:
+            return 0
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            list(executor.map(self._update, addresses))
+        self._counters.clear()
+        self._latest.clear()
+        logger.debug(f"Updated the summaries of {len(addresses)} contacts")
+        return len(addresses)
+
+
+def _summary(item: Item) -> Dict[str, Any]:
+    summary = deserialize_item(item)
+    for name in ("messages", "sms_count", "mms_count", "calls", "call_seconds"):
+        summary.setdefault(name, 0)
+    summary["call_minutes"] = round(summary["call_seconds"] / 60, 1)
+    return summary
+
+
+def get_contact_summary(
+    dynamodb_client: DynamoDBClient, table_name: str, address: str
+) -> Optional[Dict[str, Any]]:
+    """Returns the summary of one (normalized) address, None if it has none."""
+    response = dynamodb_client.get_item(
+        TableName=table_name, Key=contact_summary_key(address)
+    )
+    return _summary(response["Item"]) if "Item" in response else None
+
+
+def list_contact_summaries(
+    dynamodb_client: DynamoDBClient, table_name: str
+) -> List[Dict[str, Any]]:
+    """Returns the summaries of every contact with a Scan of the summary table."""
+    kwargs = {"TableName": table_name}
+    summaries = []
+    while True:
+        response = dynamodb_client.scan(**kwargs)
+        summaries.extend(_summary(item) for item in response["Items"])
+        if "LastEvaluatedKey" not in response:
+            return summaries
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
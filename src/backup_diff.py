@@ -0,0 +1,111 @@
+from collections import Counter
+from typing import Iterable, Iterator, Optional, Tuple
+
+from aws_lambda_powertools import Logger
+
+from backup_processor import BackupRestoreProcessor
+from compact_records import Record
+from dedup import MAX_MEMORY_BYTES, Entry, RecordDeduplicator
+
+logger = Logger()
+
+ADDED = "added"
+REMOVED = "removed"
+
+# A record only in the new backup (added) or only in the old one (removed)
+Change = Tuple[str, str, Record]
+
+
+def merge_join(old: Iterable[Entry], new: Iterable[Entry]) -> Iterator[Change]:
+    """
+    Yields the records of two id-sorted streams that are in only one of them.
+
+    Args:
+        old (Iterable[Entry]): Unique (id, record) pairs in id order.
+        new (Iterable[Entry]): Unique (id, record) pairs in id order.
+
+    Yields:
+        Change: `(ADDED, id, record)` for ids only in `new` and
+            `(REMOVED, id, record)` for ids only in `old`, in id order.
+    """
+    old, new = iter(old), iter(new)
+    old_entry, new_entry = next(old, None), next(new, None)
+    while old_entry is not None and new_entry is not None:
+        if old_entry[0] == new_entry[0]:
+            old_entry, new_entry = next(old, None), next(new, None)
+        elif old_entry[0] < new_entry[0]:
+            yield REMOVED, *old_entry
+            old_entry = next(old, None)
+        else:
+            yield ADDED, *new_entry
+            new_entry = next(new, None)
+    while old_entry is not None:
+        yield REMOVED, *old_entry
+        old_entry = next(old, None)
+    while new_entry is not None:
+        yield ADDED, *new_entry
+        new_entry = next(new, None)
+
+
+class BackupDiffer:
+    """
+    Compares two backups by record id without ingesting either.
+
+    Each backup is parsed once into a `RecordDeduplicator`, which holds up
+    to `max_memory_bytes` of records and spills sorted runs to `tmp_dir`
+    past that, and the two id-sorted streams are merge-joined.  Ids are
+    content hashes, so an edited record shows as removed and added.  The
+    processor should not store parts, so attachments are only hashed.
+
+    Args:
+        processor (BackupRestoreProcessor): Parses and validates backups.
+        max_memory_bytes (int): Estimated size of the records per backup
+            buffered before spilling a run.
+        tmp_dir (Optional[str]): Directory for spilled runs.
+    """
+
+    def __init__(
+        self,
+        processor: BackupRestoreProcessor,
+        max_memory_bytes: int = MAX_MEMORY_BYTES,
+        tmp_dir: Optional[str] = None,
+    ) -> None:
+        self._processor = processor
+        self._max_memory_bytes = max_memory_bytes
+        self._tmp_dir = tmp_dir
+        # Changes per "added/<record type>" and "removed/<record type>"
+        self.counts: Counter = Counter()
+        self.unchanged = 0
+
+    def _records(self, bucket_name: str, backup_key: str) -> RecordDeduplicator:
+        records = RecordDeduplicator(
+            max_memory_bytes=self._max_memory_bytes, tmp_dir=self._tmp_dir
+        )
+        records.add(self._processor.process_backup(bucket_name, backup_key))
+        logger.info(f"Read {backup_key}, {records.runs_spilled} runs spilled")
+        return records
+
+    def diff(self, bucket_name: str, old_key: str, new_key: str) -> Iterator[Change]:
+        """
+        Yields the records added and removed between two backups.
+
+        Args:
+            bucket_name (str): Bucket the backups are stored in.
+            old_key (str): Key of the older backup.
+            new_key (str): Key of the newer backup.
+
+        Yields:
+            Change: The added and removed records, in id order.
+        """
+        with (
+            self._records(bucket_name, old_key) as old,
+            self._records(bucket_name, new_key) as new,
+        ):
+            added = 0
+            for change, record_id, record in merge_join(
+                old.sorted_items(), new.sorted_items()
+            ):
+                self.counts[f"{change}/{record.record_type}"] += 1
+                added += change == ADDED
+                yield change, record_id, record
+            self.unchanged = len(new) - added
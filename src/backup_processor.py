@@ -1,29 +1,102 @@
+import asyncio
 import base64
+from collections import defaultdict
+from concurrent.futures import Future
 from hashlib import sha256
-from typing import Any, Dict, List
+from itertools import batched
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
 
-import numpy as np
+from botocore.exceptions import ClientError
 from lxml import etree
 from lxml.etree import Element
 from mypy_boto3_dynamodb.service_resource import DynamoDBServiceResource
 from mypy_boto3_s3.client import S3Client
 from mypy_boto3_s3.service_resource import Bucket, S3ServiceResource
-from smart_open import s3 as smart_open_s3
 
-from schemas import MMS, SMS, Call, CorrespondenceBase
-from utils import replace_null_with_none
+from backup_sources import BackupSource, S3BackupSource
+from compact_records import CompactRecord
+from io_engine import AsyncIOEngine
+from part_extractor import (
+    EXTRACT_MIN_BASE64_BYTES,
+    EXTRACTED_PART_PREFIX,
+    PartDataExtractor,
+)
+from part_packs import PART_PREFIX, PartPacker
+from s3_reader import RangePrefetchingReader
+from shared_cache import SharedSetCache, part_namespace
+from validation_pool import (
+    CHUNK_RECORDS,
+    TAG_MODELS,
+    Snapshot,
+    ValidationPool,
+    validate_snapshot,
+)
+from warm_cache import TTLCache
 
 BUCKET_NAME = "sms-backup-restore"
+# MMS parts whose content stays inline in the record instead of `parts/`
+INLINE_PART_CONTENT_TYPES = ("application/smil", "text/plain")
+# Attribute values the backup app writes for missing values
+NULL_VALUES = ("null", "")
+
+
+def element_attributes(elem: Element) -> Dict[str, Optional[str]]:
+    """Copies an element's attributes, replacing null values with None."""
+    return {k: None if v in NULL_VALUES else v for k, v in elem.attrib.items()}
 
 
 class BackupRestoreProcessor:
-    """Class to handle streaming and processing of backup from S3"""
+    """
+    Class to handle streaming and processing of backup from S3
+
+    With an `io_engine`, MMS attachments are checked and uploaded on its
+    event loop while parsing continues; records are yielded before their
+    attachments are stored and `process_backup` waits for the uploads
+    before it returns.  With a `part_packer`, small attachments are appended
+    to pack objects instead.  With a `validation_pool`, records are
+    validated on its worker processes while this thread parses.  With
+    `readahead_chunks`, the backup is read with concurrent ranged GETs that
+    many chunks ahead of the parser rather than one sequential stream.
+    With `known_parts`, attachments stored by earlier invocations of a warm
+    container are not checked again, and with a `shared_cache`, neither are
+    attachments stored by concurrent workers; the attachments a backup
+    stored are shared in one update once it is parsed.  Without `store_parts`,
+    attachments are only hashed, for reading a backup without storing it.
+
+    Part data longer than `extract_min_bytes` of base64 is diverted from
+    the stream before lxml parses it (see `PartDataExtractor`) and uploaded
+    from a spooled file; None leaves all part data to the parser.
+    """
 
     def __init__(
-        self, s3_client: S3ServiceResource, s3_resource: DynamoDBServiceResource
+        self,
+        s3_client: S3ServiceResource,
+        s3_resource: DynamoDBServiceResource,
+        io_engine: Optional[AsyncIOEngine] = None,
+        part_packer: Optional[PartPacker] = None,
+        validation_pool: Optional[ValidationPool] = None,
+        readahead_chunks: int = 0,
+        known_parts: Optional[TTLCache] = None,
+        shared_cache: Optional[SharedSetCache] = None,
+        store_parts: bool = True,
+        extract_min_bytes: Optional[int] = EXTRACT_MIN_BASE64_BYTES,
     ) -> None:
         self._s3_client: S3Client = s3_client
         self._s3_resource: DynamoDBServiceResource = s3_resource
+        self._io_engine = io_engine
+        self._part_packer = part_packer
+        self._validation_pool = validation_pool
+        self._readahead_chunks = readahead_chunks
+        self._known_parts = known_parts
+        self._shared_cache = shared_cache
+        self._store_parts = store_parts
+        self._extract_min_bytes = extract_min_bytes
+        self._extractor: Optional[PartDataExtractor] = None
+        # Throughput of the last backup read with readahead, in bytes/s
+        self.read_bytes_per_second: Optional[float] = None
+        self._pending_uploads: List[Future] = []
+        # Parts stored by this backup, shared in one update once it is parsed
+        self._unshared_parts: List[Tuple[str, str]] = []
 
     def tag_object(
         self, bucket_name: str, object_key: str, tags: Dict[str, Any]
@@ -62,81 +135,262 @@ class BackupRestoreProcessor:
             str: The SHA-256 hash of the decoded part data, used as the object key.
         """
         data = base64.b64decode(part_data)
+        if not self._store_parts:
+            return sha256(data).hexdigest()
+        if self._part_packer is not None:
+            packed_sha256 = self._part_packer.add(data)
+            if packed_sha256 is not None:
+                return packed_sha256
         data_sha256 = sha256(data).hexdigest()
-        key = f"parts/{data_sha256}"
+        if (
+            self._known_parts is not None
+            and (bucket_name, data_sha256) in self._known_parts
+        ):
+            return data_sha256
+        key = f"{PART_PREFIX}/{data_sha256}"
+        if self._io_engine is not None:
+            self._pending_uploads.append(
+                self._io_engine.submit(
+                    self._upload_part_async(
+                        bucket_name, data_sha256, data, part_content_type
+                    ),
+                    size=len(data),
+                )
+            )
+            return data_sha256
+        if self._shared_part(bucket_name, data_sha256):
+            return data_sha256
         try:
-            self._s3_client.head_object(Bucket=bucket_name, Key=key)
+            response = self._s3_client.head_object(Bucket=bucket_name, Key=key)
+            # Earlier versions stored empty objects for parts
+            exists = response["ContentLength"] == len(data)
         except self._s3_client.exceptions.ClientError:
+            exists = False
+        if not exists:
             self._s3_client.put_object(
-                Bucket=bucket_name, Key=key, ContentType=part_content_type
+                Bucket=bucket_name, Key=key, Body=data, ContentType=part_content_type
+            )
+        self._remember_part(bucket_name, data_sha256)
+        return data_sha256
+
+    def store_extracted_part(
+        self, bucket_name: str, data_sha256: str, part_content_type: str
+    ) -> str:
+        """
+        Uploads a part diverted from the stream if it does not already exist.
+
+        The part is uploaded from its spooled file on the calling thread,
+        in multiple parts when large, then its file is closed.  Without
+        `store_parts`, the part is only dropped from the extractor.
+
+        Args:
+            bucket_name (str): The name of the S3 bucket.
+            data_sha256 (str): The SHA-256 hash the extractor left as data.
+            part_content_type (str): The content type of the part.
+
+        Returns:
+            str: The SHA-256 hash of the part data, used as the object key.
+        """
+        if not self._store_parts:
+            # A later duplicate of the part may have been dropped already
+            part = self._extractor.parts.pop(data_sha256, None)
+            if part is not None:
+                part.file.close()
+            return data_sha256
+        part = self._extractor.parts[data_sha256]
+        if part.stored:
+            return data_sha256
+        if (
+            self._known_parts is not None
+            and (bucket_name, data_sha256) in self._known_parts
+        ) or self._shared_part(bucket_name, data_sha256):
+            exists = True
+        else:
+            key = f"{PART_PREFIX}/{data_sha256}"
+            try:
+                response = self._s3_client.head_object(Bucket=bucket_name, Key=key)
+                exists = response["ContentLength"] == part.size
+            except self._s3_client.exceptions.ClientError:
+                exists = False
+        if not exists:
+            part.file.seek(0)
+            self._s3_client.upload_fileobj(
+                part.file,
+                bucket_name,
+                key,
+                ExtraArgs={"ContentType": part_content_type},
             )
+        self._remember_part(bucket_name, data_sha256)
+        part.stored = True
+        part.file.close()
         return data_sha256
 
-    def process_tag(self, bucket: Bucket, elem: Element) -> CorrespondenceBase:
-        """Processes XML tag.  Uploading object data for MMS parts."""
-        e_data = replace_null_with_none(dict(elem.attrib))
-
-        match elem.tag:
-            case "call":
-                return Call.model_validate(e_data)
-            case "sms":
-                return SMS.model_validate(e_data)
-            case "mms":
-                parts = [
-                    replace_null_with_none(dict(part.attrib))
-                    for part in elem.findall(".//part")
-                ]
-                parts1 = []
-                for part in parts:
-                    if part["ct"] not in ["application/smil", "text/plain"] and bool(
-                        part["data"]
-                    ):
-                        object_hash = self.upload_part_s3(
-                            bucket_name=bucket.name,
-                            part_data=part["data"],
-                            part_content_type=part["ct"],
-                        )
-                        part["data"] = object_hash
-                    parts1.append(part)
-
-                addrs = [
-                    replace_null_with_none(dict(addr.attrib))
-                    for addr in elem.findall(".//addr")
-                ]
-                e_data.update({"parts": parts1, "addrs": addrs})
-
-                return MMS.model_validate(e_data)
-            case _:
-                pass
-
-    def process_backup(self, bucket_name: str, backup_key: str) -> List[Dict[str, Any]]:
-        """Streams .xml backup file from S3 and uploads records to S3."""
-        fin: smart_open_s3.Reader = smart_open_s3.open(
-            bucket_name,
-            backup_key,
-            mode="rb",
-            defer_seek=True,
-            client=self._s3_client,
+    def _shared_part(self, bucket_name: str, data_sha256: str) -> bool:
+        """Returns whether a concurrent worker already stored a part."""
+        if self._shared_cache is None:
+            return False
+        [stored] = self._shared_cache.contains(
+            part_namespace(bucket_name), [data_sha256]
         )
-        seekable_reader = fin._raw_reader
+        if stored and self._known_parts is not None:
+            self._known_parts.put((bucket_name, data_sha256))
+        return stored
 
-        # Creates document parser with the buffered file
-        context = etree.iterparse(seekable_reader, recover=True, encoding="utf-8")
+    def _remember_part(self, bucket_name: str, data_sha256: str) -> None:
+        if self._known_parts is not None:
+            self._known_parts.put((bucket_name, data_sha256))
+        if self._shared_cache is not None:
+            self._unshared_parts.append((bucket_name, data_sha256))
 
-        # Skips to the children of interest
-        context = iter(context)
-        next(context)
+    def _share_parts(self) -> None:
+        """Adds the parts stored by this backup to the shared cache."""
+        unshared, self._unshared_parts = self._unshared_parts, []
+        by_bucket = defaultdict(list)
+        for bucket_name, data_sha256 in unshared:
+            by_bucket[bucket_name].append(data_sha256)
+        for bucket_name, part_hashes in by_bucket.items():
+            self._shared_cache.add(part_namespace(bucket_name), part_hashes)
 
-        bucket: Bucket = self._s3_resource.Bucket(bucket_name)
-        tag_data = {}
+    async def _upload_part_async(
+        self, bucket_name: str, data_sha256: str, data: bytes, content_type: str
+    ) -> None:
+        """`upload_part_s3` on the I/O engine's S3 client."""
+        # Looked up off the parser thread, without blocking the event loop
+        if await asyncio.to_thread(self._shared_part, bucket_name, data_sha256):
+            return
+        key = f"{PART_PREFIX}/{data_sha256}"
+        s3_client = await self._io_engine.client("s3")
+        try:
+            response = await s3_client.head_object(Bucket=bucket_name, Key=key)
+            exists = response["ContentLength"] == len(data)
+        except ClientError:
+            exists = False
+        if not exists:
+            await s3_client.put_object(
+                Bucket=bucket_name, Key=key, Body=data, ContentType=content_type
+            )
+        self._remember_part(bucket_name, data_sha256)
+
+    def _wait_for_uploads(self) -> None:
+        """Waits for submitted part uploads, raising the first failure."""
+        pending, self._pending_uploads = self._pending_uploads, []
+        for future in pending:
+            future.result()
+
+    def snapshot_tag(self, bucket: Bucket, elem: Element) -> Optional[Snapshot]:
+        """
+        Copies a record tag's attributes for validation.
+
+        MMS parts are uploaded here and their data replaced by its hash, so
+        snapshots only hold what `validate_snapshot` needs.
+        """
+        if elem.tag not in TAG_MODELS:
+            return None
+        e_data = element_attributes(elem)
+
+        if elem.tag == "mms":
+            parts = [element_attributes(part) for part in elem.findall(".//part")]
+            parts1 = []
+            for part in parts:
+                data = part.get("data")
+                if data is not None and data.startswith(EXTRACTED_PART_PREFIX):
+                    part["data"] = self.store_extracted_part(
+                        bucket_name=bucket.name,
+                        data_sha256=data[len(EXTRACTED_PART_PREFIX) :],
+                        part_content_type=part["ct"],
+                    )
+                elif part["ct"] not in INLINE_PART_CONTENT_TYPES and bool(data):
+                    object_hash = self.upload_part_s3(
+                        bucket_name=bucket.name,
+                        part_data=part["data"],
+                        part_content_type=part["ct"],
+                    )
+                    part["data"] = object_hash
+                parts1.append(part)
+
+            addrs = [element_attributes(addr) for addr in elem.findall(".//addr")]
+            e_data.update({"parts": parts1, "addrs": addrs})
+        return elem.tag, e_data
+
+    def process_tag(self, bucket: Bucket, elem: Element) -> Optional[CompactRecord]:
+        """
+        Processes XML tag.  Uploading object data for MMS parts.
+
+        The record is validated with its Pydantic model and carried on as a
+        `CompactRecord`; the model is not kept.
+        """
+        snapshot = self.snapshot_tag(bucket=bucket, elem=elem)
+        return validate_snapshot(snapshot) if snapshot is not None else None
+
+    def _snapshots(self, context: Any, bucket: Bucket) -> Iterator[Snapshot]:
         for _, elem in context:
-            tag_parsed = self.process_tag(elem=elem, bucket=bucket)
-            if isinstance(tag_parsed, CorrespondenceBase):
-                elem_processed = {"id": tag_parsed.hash(), **tag_parsed.model_dump()}
+            snapshot = self.snapshot_tag(elem=elem, bucket=bucket)
+            # Drops the parsed element and its processed siblings, which
+            # the parser otherwise keeps for the whole document
+            elem.clear(keep_tail=True)
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+            if snapshot is not None:
+                yield snapshot
 
-                tags = tag_data.get(elem.tag, [])
-                tags.append(elem_processed)
-                tag_data.update({elem.tag: tags})
+    def process_backup(
+        self,
+        bucket_name: str,
+        backup_key: str,
+        source: Optional[BackupSource] = None,
+    ) -> Iterator[CompactRecord]:
+        """
+        Streams .xml backup file and yields validated records.
+
+        Args:
+            bucket_name (str): Bucket attachments are stored in, and the
+                backup is read from unless a `source` is given.
+            backup_key (str): Identifies the backup in its source.
+            source (Optional[BackupSource]): Source the backup is streamed
+                from, `bucket_name` if None.
+        """
+        if source is None:
+            source = S3BackupSource(
+                self._s3_client, bucket_name, readahead_chunks=self._readahead_chunks
+            )
+        with source.open(backup_key) as reader:
+            yield from self._process_stream(bucket_name, reader)
 
-        fin.close()
-        return list(np.concatenate(list(tag_data.values())))
+    def _process_stream(
+        self, bucket_name: str, seekable_reader: BinaryIO
+    ) -> Iterator[CompactRecord]:
+        # Creates document parser with the buffered file, yielding only the
+        # record tags (skipping the first event dropped the first record)
+        if self._extract_min_bytes is not None:
+            self._extractor = PartDataExtractor(
+                seekable_reader, min_base64_bytes=self._extract_min_bytes
+            )
+        context = etree.iterparse(
+            seekable_reader if self._extractor is None else self._extractor,
+            recover=True,
+            encoding="utf-8",
+            tag=("call", "sms", "mms"),
+        )
+
+        bucket: Bucket = self._s3_resource.Bucket(bucket_name)
+        try:
+            snapshots = self._snapshots(context, bucket)
+            if self._validation_pool is None:
+                for snapshot in snapshots:
+                    yield validate_snapshot(snapshot)
+            else:
+                chunks = batched(snapshots, CHUNK_RECORDS)
+                for records in self._validation_pool.map(chunks):
+                    yield from records
+            # Records are yielded before their attachments are stored; the
+            # backup is only complete once this generator is exhausted
+            if self._part_packer is not None:
+                self._part_packer.flush()
+            self._wait_for_uploads()
+            self._share_parts()
+        finally:
+            if self._extractor is not None:
+                self._extractor.close()
+                self._extractor = None
+            if isinstance(seekable_reader, RangePrefetchingReader):
+                self.read_bytes_per_second = seekable_reader.bytes_per_second
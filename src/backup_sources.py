@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
+
+from mypy_boto3_s3.client import S3Client
+from smart_open import s3 as smart_open_s3
+
+from s3_reader import PrefetchingReader
+
+
+class BackupSource:
+    """Base class for the stores backup files are streamed from."""
+
+    name: str = "source"
+
+    @contextmanager
+    def open(self, backup_key: str) -> Iterator[BinaryIO]:
+        """
+        Opens a backup for reading.
+
+        Args:
+            backup_key (str): Identifies the backup in the source.
+
+        Yields:
+            BinaryIO: Raw reader of the backup's bytes, closed on exit.
+        """
+        raise NotImplementedError()
+        yield
+
+
+class S3BackupSource(BackupSource):
+    """
+    Streams backups from an S3 bucket.
+
+    With `readahead_chunks`, backups are read with concurrent ranged GETs
+    that many chunks ahead of the parser rather than one sequential stream.
+
+    Args:
+        s3_client (S3Client): S3 client.
+        bucket_name (str): Bucket the backups are stored in.
+        readahead_chunks (int): Ranged GETs issued ahead of the parser.
+    """
+
+    name = "s3"
+
+    def __init__(
+        self, s3_client: S3Client, bucket_name: str, readahead_chunks: int = 0
+    ) -> None:
+        self._s3_client = s3_client
+        self._bucket_name = bucket_name
+        self._readahead_chunks = readahead_chunks
+
+    @contextmanager
+    def open(self, backup_key: str) -> Iterator[BinaryIO]:
+        if self._readahead_chunks > 0:
+            with PrefetchingReader(
+                self._s3_client,
+                self._bucket_name,
+                backup_key,
+                readahead_chunks=self._readahead_chunks,
+            ) as reader:
+                yield reader
+            return
+        fin = smart_open_s3.open(
+            self._bucket_name,
+            backup_key,
+            mode="rb",
+            defer_seek=True,
+            client=self._s3_client,
+        )
+        try:
+            yield fin._raw_reader
+        finally:
+            fin.close()
@@ -0,0 +1,86 @@
+import time
+from typing import Any, Callable, Dict, Iterator, List
+
+from mypy_boto3_dynamodb.client import DynamoDBClient
+
+# Attempts at a batch request before its unprocessed part is given up on
+BATCH_MAX_ATTEMPTS = 10
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 5.0
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Returns the seconds to wait after failed attempt `attempt` (from 0)."""
+    return min(2**attempt * BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS)
+
+
+def batch_get_items(
+    dynamodb_client: DynamoDBClient,
+    request_items: Dict[str, Any],
+    max_attempts: int = BATCH_MAX_ATTEMPTS,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Iterator[Dict[str, List[Dict[str, Any]]]]:
+    """
+    Sends a `BatchGetItem` request, retrying its unprocessed keys.
+
+    Unprocessed keys are sent again after an exponential backoff, so a
+    throttled table is not polled in a busy loop.
+
+    Args:
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        request_items (Dict[str, Any]): The `RequestItems` of the request.
+        max_attempts (int): Calls made before giving up.
+        sleep (Callable[[float], None]): Waits the given seconds.
+
+    Yields:
+        Dict[str, List[Dict[str, Any]]]: The `Responses` of each call, by table.
+
+    Raises:
+        RuntimeError: If keys are still unprocessed after `max_attempts`.
+    """
+    for attempt in range(max_attempts):
+        response = dynamodb_client.batch_get_item(RequestItems=request_items)
+        yield response["Responses"]
+        request_items = response.get("UnprocessedKeys")
+        if not request_items:
+            return
+        if attempt + 1 < max_attempts:
+            sleep(backoff_seconds(attempt))
+    unprocessed = sum(len(table["Keys"]) for table in request_items.values())
+    raise RuntimeError(
+        f"Failed to read {unprocessed} keys after {max_attempts} attempts"
+    )
+
+
+def batch_write_items(
+    dynamodb_client: DynamoDBClient,
+    request_items: Dict[str, Any],
+    max_attempts: int = BATCH_MAX_ATTEMPTS,
+    sleep: Callable[[float], None] = time.sleep,
+) -> None:
+    """
+    Sends a `BatchWriteItem` request, retrying its unprocessed items.
+
+    Unprocessed items are sent again after an exponential backoff, as in
+    `batch_get_items`.
+
+    Args:
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        request_items (Dict[str, Any]): The `RequestItems` of the request.
+        max_attempts (int): Calls made before giving up.
+        sleep (Callable[[float], None]): Waits the given seconds.
+
+    Raises:
+        RuntimeError: If items are still unprocessed after `max_attempts`.
+    """
+    for attempt in range(max_attempts):
+        response = dynamodb_client.batch_write_item(RequestItems=request_items)
+        request_items = response.get("UnprocessedItems")
+        if not request_items:
+            return
+        if attempt + 1 < max_attempts:
+            sleep(backoff_seconds(attempt))
+    unprocessed = sum(len(items) for items in request_items.values())
+    raise RuntimeError(
+        f"Failed to write {unprocessed} items after {max_attempts} attempts"
+    )
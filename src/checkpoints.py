@@ -0,0 +1,84 @@
+import time
+from typing import Dict, Optional
+
+from aws_lambda_powertools import Logger
+from mypy_boto3_dynamodb.client import DynamoDBClient
+
+logger = Logger()
+
+CHECKPOINT_PREFIX = "checkpoint#"
+# Matches the expiry attribute of the Powertools idempotency records
+EXPIRATION_ATTRIBUTE = "expiration"
+CHECKPOINT_TTL_SECONDS = 7 * 24 * 60 * 60
+_SINK_ATTRIBUTE_PREFIX = "sink#"
+
+
+def backup_object_id(
+    bucket_name: str, object_key: str, etag: str, run_id: Optional[str] = None
+) -> str:
+    """Identifies one version of a backup object, within a reprocessing run."""
+    object_id = f"{bucket_name}/{object_key}#{etag}"
+    return f"{object_id}#{run_id}" if run_id else object_id
+
+
+class ProcessingCheckpoints:
+    """
+    Tracks how many records of a backup object each sink has committed.
+
+    Records of a backup are written in file order, so after a failure the
+    next attempt at the same object version skips the records a sink already
+    committed.  Checkpoints live in the idempotency table next to its
+    records and expire with them.
+
+    Args:
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        table_name (str): Table keyed by `id` with TTL on `expiration`.
+        ttl_seconds (int): Seconds an abandoned checkpoint is kept.
+    """
+
+    def __init__(
+        self,
+        dynamodb_client: DynamoDBClient,
+        table_name: str,
+        ttl_seconds: int = CHECKPOINT_TTL_SECONDS,
+    ) -> None:
+        self._dynamodb_client = dynamodb_client
+        self._table_name = table_name
+        self._ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _key(object_id: str) -> Dict[str, Dict[str, str]]:
+        return {"id": {"S": f"{CHECKPOINT_PREFIX}{object_id}"}}
+
+    def load(self, object_id: str) -> Dict[str, int]:
+        """Returns the records committed per sink name."""
+        response = self._dynamodb_client.get_item(
+            TableName=self._table_name, Key=self._key(object_id), ConsistentRead=True
+        )
+        return {
+            name[len(_SINK_ATTRIBUTE_PREFIX) :]: int(value["N"])
+            for name, value in response.get("Item", {}).items()
+            if name.startswith(_SINK_ATTRIBUTE_PREFIX)
+        }
+
+    def commit(self, object_id: str, sink_name: str, records: int) -> None:
+        """Records that a sink has committed the first `records` records."""
+        self._dynamodb_client.update_item(
+            TableName=self._table_name,
+            Key=self._key(object_id),
+            UpdateExpression="SET #sink = :records, #expiration = :expiration",
+            ExpressionAttributeNames={
+                "#sink": f"{_SINK_ATTRIBUTE_PREFIX}{sink_name}",
+                "#expiration": EXPIRATION_ATTRIBUTE,
+            },
+            ExpressionAttributeValues={
+                ":records": {"N": str(records)},
+                ":expiration": {"N": str(int(time.time()) + self._ttl_seconds)},
+            },
+        )
+
+    def clear(self, object_id: str) -> None:
+        """Removes the checkpoint of a fully processed object."""
+        self._dynamodb_client.delete_item(
+            TableName=self._table_name, Key=self._key(object_id)
+        )
@@ -0,0 +1,137 @@
+import sys
+from datetime import datetime
+from functools import cache
+from typing import Any, Dict, Iterable, Tuple, Union
+
+from schemas import RECORD_MODELS, CorrespondenceBase, Part
+
+# Fields whose values are mostly unique per record and are not interned;
+# the other strings (service centers, contact names, addresses, content
+# types, ...) repeat across a backup and share one copy each
+UNIQUE_FIELDS = frozenset(
+    ("body", "subject", "sub", "text", "data", "m_id", "tr_id", "cid", "cl", "name")
+)
+
+
+def _included_fields(model_cls: type) -> Tuple[str, ...]:
+    return tuple(
+        name
+        for name, field_info in model_cls.model_fields.items()
+        if not field_info.exclude
+    )
+
+
+@cache
+def record_fields(record_type: str) -> Tuple[str, ...]:
+    """Returns the serialized fields of a record type, in model order."""
+    return _included_fields(RECORD_MODELS[record_type])
+
+
+@cache
+def _field_indexes(record_type: str) -> Dict[str, int]:
+    return {name: i for i, name in enumerate(record_fields(record_type))}
+
+
+PART_FIELDS = _included_fields(Part)
+
+
+def _compact_value(name: str, value: Any) -> Any:
+    if type(value) is str and name not in UNIQUE_FIELDS:
+        return sys.intern(value)
+    return value
+
+
+def _dump_value(value: Any) -> Any:
+    return value.isoformat() if type(value) is datetime else value
+
+
+class CompactRecord:
+    """
+    Slotted representation of a validated record carried through the pipeline.
+
+    Pydantic models validate records at the parsing boundary; each is then
+    reduced to its id, record type and a tuple of its serialized fields'
+    values, ordered as `record_fields(record_type)`.  Addresses are a sorted
+    tuple and MMS parts tuples of values ordered as `PART_FIELDS`, sorted by
+    `seq`.  Repeated strings are interned.  Records expose the `hash`,
+    `record_type`, `address` and `model_dump` of the models they replace.
+
+    Args:
+        record_id (str): The record's id, its model's `hash()`.
+        record_type (str): The record's `record_type`.
+        values (Tuple[Any, ...]): Values of the record type's fields.
+    """
+
+    __slots__ = ("record_id", "record_type", "values")
+
+    def __init__(
+        self, record_id: str, record_type: str, values: Tuple[Any, ...]
+    ) -> None:
+        self.record_id = record_id
+        self.record_type = record_type
+        self.values = values
+
+    @classmethod
+    def from_model(cls, record: CorrespondenceBase) -> "CompactRecord":
+        """Compacts a validated record model."""
+        record_type = record.record_type
+        model_values = record.__dict__
+        values = []
+        for name in record_fields(record_type):
+            value = model_values[name]
+            if name == "address":
+                value = tuple(sys.intern(v) for v in sorted(value))
+            elif name == "parts":
+                value = tuple(
+                    tuple(
+                        _compact_value(field, part.__dict__[field])
+                        for field in PART_FIELDS
+                    )
+                    for part in sorted(
+                        value, key=lambda part: (part.seq is None, part.seq or 0)
+                    )
+                )
+            else:
+                value = _compact_value(name, value)
+            values.append(value)
+        return cls(record.hash(), sys.intern(record_type), tuple(values))
+
+    def __getstate__(self) -> Tuple[str, str, Tuple[Any, ...]]:
+        return self.record_id, self.record_type, self.values
+
+    def __setstate__(self, state: Tuple[str, str, Tuple[Any, ...]]) -> None:
+        self.record_id, self.record_type, self.values = state
+
+    def hash(self) -> str:
+        """Returns the record's id."""
+        return self.record_id
+
+    def field(self, name: str) -> Any:
+        """Returns the value of a field."""
+        return self.values[_field_indexes(self.record_type)[name]]
+
+    @property
+    def address(self) -> Tuple[str, ...]:
+        return self.field("address")
+
+    def items(self) -> Iterable[Tuple[str, Any]]:
+        """Yields the (field name, value) pairs of the record."""
+        return zip(record_fields(self.record_type), self.values)
+
+    def model_dump(self) -> Dict[str, Any]:
+        """Returns the same dict as the model's `model_dump()`."""
+        dumped: Dict[str, Any] = {}
+        for name, value in self.items():
+            if name == "address":
+                value = list(value)
+            elif name == "parts":
+                value = [dict(zip(PART_FIELDS, part)) for part in value]
+            else:
+                value = _dump_value(value)
+            dumped[name] = value
+        dumped["record_type"] = self.record_type
+        return dumped
+
+
+# Records as yielded by the backup processor or built from models in tests
+Record = Union[CorrespondenceBase, CompactRecord]
@@ -0,0 +1,256 @@
+import base64
+import heapq
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from aws_lambda_powertools import Logger
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3.client import S3Client
+
+from item_serializer import (
+    THREAD_ATTRIBUTE,
+    THREAD_INDEX_NAME,
+    THREAD_SHARDS,
+    Item,
+    deserialize_item,
+    load_spilled_item,
+    thread_address,
+)
+from schemas import ensure_phone_number_sorted_list
+
+logger = Logger()
+
+# Shard positions of a page cursor; None marks an exhausted shard
+ShardPositions = Tuple[Tuple[int, Optional[Tuple[Tuple[str, str], ...]]], ...]
+
+
+class ConversationPage:
+    """A page of a conversation's records and the cursor to the next page."""
+
+    def __init__(self, records: List[Dict[str, Any]], next_cursor: Optional[str]):
+        self.records = records
+        self.next_cursor = next_cursor
+
+
+def encode_cursor(positions: ShardPositions) -> Optional[str]:
+    """Encodes per-shard positions as an opaque cursor, None when exhausted."""
+    if all(position is None for _, position in positions):
+        return None
+    payload = [[shard, position] for shard, position in positions]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> ShardPositions:
+    """Decodes a cursor into per-shard positions, starting every shard if None."""
+    if cursor is None:
+        return tuple((shard, ()) for shard in range(THREAD_SHARDS))
+    payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return tuple(
+        (shard, None if position is None else tuple(map(tuple, position)))
+        for shard, position in payload
+    )
+
+
+class ConversationQuery:
+    """
+    Reads a conversation's records in pages from the thread index.
+
+    Each page queries the conversation's shards in parallel, merges them by
+    `timestamp` and remembers how far each shard was consumed in the cursor.
+    Pages are kept in an LRU cache for `cache_ttl` seconds.
+
+    Args:
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        table_name (str): Name of the DynamoDB table.
+        cache_size (int): Maximum number of cached pages.
+        cache_ttl (float): Seconds a cached page is served for.
+        s3_client (Optional[S3Client]): S3 client loading items spilled to
+            S3; their placeholders are returned if None.
+    """
+
+    def __init__(
+        self,
+        dynamodb_client: DynamoDBClient,
+        table_name: str,
+        cache_size: int = 256,
+        cache_ttl: float = 60.0,
+        s3_client: Optional[S3Client] = None,
+    ) -> None:
+        self._dynamodb_client = dynamodb_client
+        self._table_name = table_name
+        self._cache_size = cache_size
+        self._cache_ttl = cache_ttl
+        self._s3_client = s3_client
+        self._cache: OrderedDict[Tuple, Tuple[float, ConversationPage]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=THREAD_SHARDS)
+
+    def _load(self, item: Item) -> Item:
+        if self._s3_client is None:
+            return item
+        return load_spilled_item(self._s3_client, item)
+
+    def get_page(
+        self,
+        address: Union[str, Iterable[str]],
+        cursor: Optional[str] = None,
+        page_size: int = 50,
+        newest_first: bool = True,
+    ) -> ConversationPage:
+        """
+        Returns a page of the conversation with `address`.
+
+        Args:
+            address (Union[str, Iterable[str]]): The contact's number, or all
+                numbers of a group conversation (`~` separated or a list).
+            cursor (Optional[str]): `next_cursor` of the previous page.
+            page_size (int): Number of records per page.
+            newest_first (bool): Whether pages run from the newest record.
+
+        Returns:
+            ConversationPage: The records and the cursor of the next page.
+        """
+        thread = thread_address(ensure_phone_number_sorted_list(address))
+        cache_key = (thread, cursor, page_size, newest_first)
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None and now - cached[0] < self._cache_ttl:
+                self._cache.move_to_end(cache_key)
+                return cached[1]
+
+        page = self._query_page(thread, cursor, page_size, newest_first)
+        with self._cache_lock:
+            self._cache[cache_key] = (now, page)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return page
+
+    def invalidate(self) -> None:
+        """Drops all cached pages."""
+        with self._cache_lock:
+            self._cache.clear()
+
+    def _query_shard(
+        self,
+        thread: str,
+        shard: int,
+        position: Tuple[Tuple[str, str], ...],
+        page_size: int,
+        newest_first: bool,
+    ) -> Tuple[List[Item], bool]:
+        """Returns up to `page_size` items of a shard and whether it has more."""
+        kwargs = {
+            "TableName": self._table_name,
+            "IndexName": THREAD_INDEX_NAME,
+            "KeyConditionExpression": "#thread = :thread",
+            "ExpressionAttributeNames": {"#thread": THREAD_ATTRIBUTE},
+            "ExpressionAttributeValues": {":thread": {"S": f"{thread}#{shard}"}},
+            "ScanIndexForward": not newest_first,
+            "Limit": page_size,
+        }
+        if position:
+            kwargs["ExclusiveStartKey"] = {k: {"S": v} for k, v in position}
+        response = self._dynamodb_client.query(**kwargs)
+        return response["Items"], "LastEvaluatedKey" in response
+
+    def _query_page(
+        self, thread: str, cursor: Optional[str], page_size: int, newest_first: bool
+    ) -> ConversationPage:
+        positions = [(s, p) for s, p in decode_cursor(cursor) if p is not None]
+        results = self._executor.map(
+            lambda sp: self._query_shard(thread, sp[0], sp[1], page_size, newest_first),
+            positions,
+        )
+        shard_items = {}
+        for (shard, _), (items, has_more) in zip(positions, results):
+            shard_items[shard] = (items, has_more)
+
+        # Merge the shards by timestamp, taking one page across all of them
+        merged = heapq.merge(
+            *[
+                [(item["timestamp"]["S"], shard, i) for i, item in enumerate(items)]
+                for shard, (items, _) in shard_items.items()
+            ],
+            reverse=newest_first,
+        )
+        consumed = {shard: 0 for shard in shard_items}
+        page_items = []
+        for _, shard, i in merged:
+            if len(page_items) == page_size:
+                break
+            page_items.append(shard_items[shard][0][i])
+            consumed[shard] = i + 1
+
+        next_positions = []
+        for shard, position in decode_cursor(cursor):
+            if shard not in shard_items:
+                next_positions.append((shard, position))
+                continue
+            items, has_more = shard_items[shard]
+            if consumed[shard] == len(items) and not has_more:
+                next_positions.append((shard, None))
+            elif consumed[shard] == 0:
+                next_positions.append((shard, position))
+            else:
+                last = items[consumed[shard] - 1]
+                key_attributes = ("id", "timestamp", THREAD_ATTRIBUTE)
+                next_positions.append(
+                    (shard, tuple((k, last[k]["S"]) for k in key_attributes))
+                )
+        return ConversationPage(
+            records=[deserialize_item(self._load(item)) for item in page_items],
+            next_cursor=encode_cursor(tuple(next_positions)),
+        )
+
+    def count(
+        self,
+        address: Union[str, Iterable[str]],
+        record_types: Optional[Iterable[str]] = None,
+    ) -> int:
+        """Counts a conversation's records, optionally of some record types."""
+        thread = thread_address(ensure_phone_number_sorted_list(address))
+        kwargs: Dict[str, Any] = {
+            "TableName": self._table_name,
+            "IndexName": THREAD_INDEX_NAME,
+            "Select": "COUNT",
+            "KeyConditionExpression": "#thread = :thread",
+            "ExpressionAttributeNames": {"#thread": THREAD_ATTRIBUTE},
+        }
+        if record_types is not None:
+            values = {f":type{i}": {"S": t} for i, t in enumerate(record_types)}
+            kwargs["FilterExpression"] = f"record_type IN ({', '.join(values)})"
+            kwargs["ExpressionAttributeValues"] = values
+
+        def count_shard(shard: int) -> int:
+            shard_kwargs = dict(kwargs)
+            shard_kwargs["ExpressionAttributeValues"] = {
+                **kwargs.get("ExpressionAttributeValues", {}),
+                ":thread": {"S": f"{thread}#{shard}"},
+            }
+            count = 0
+            while True:
+                response = self._dynamodb_client.query(**shard_kwargs)
+                count += response["Count"]
+                if "LastEvaluatedKey" not in response:
+                    return count
+                shard_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        return sum(self._executor.map(count_shard, range(THREAD_SHARDS)))
+
+    def iter_records(
+        self, address: Union[str, Iterable[str]], page_size: int = 100, **kwargs
+    ) -> Iterable[Dict[str, Any]]:
+        """Yields every record of a conversation, paging through the index."""
+        cursor = None
+        while True:
+            page = self.get_page(address, cursor=cursor, page_size=page_size, **kwargs)
+            yield from page.records
+            if page.next_cursor is None:
+                return
+            cursor = page.next_cursor
@@ -0,0 +1,245 @@
+import heapq
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from collections import Counter
+from operator import itemgetter
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aws_lambda_powertools import Logger
+from pydantic import BaseModel
+
+from compact_records import CompactRecord, Record
+
+logger = Logger()
+
+# Estimated size of the records held in memory before a sorted run is spilled
+MAX_MEMORY_BYTES = 256 * 1024 * 1024
+# Approximate bookkeeping per buffered record: its dict slot, id and instance
+RECORD_OVERHEAD_BYTES = 300
+# Runs merged at once, keeping open file handles well below Lambda's limit
+MAX_MERGE_FAN_IN = 64
+
+Entry = Tuple[str, Record]
+# A spilled record's id, type and offset in the records file
+RunEntry = Tuple[str, str, int]
+
+
+def _value_size(value: Any) -> int:
+    if isinstance(value, (tuple, list, frozenset)):
+        return sys.getsizeof(value) + sum(_value_size(v) for v in value)
+    if isinstance(value, BaseModel):
+        # MMS parts of records not yet compacted
+        return sys.getsizeof(value) + _value_size(tuple(value.__dict__.values()))
+    return sys.getsizeof(value)
+
+
+def record_size(record: Record) -> int:
+    """Estimates the memory a buffered record takes, MMS part data included."""
+    values = (
+        record.values
+        if isinstance(record, CompactRecord)
+        else tuple(record.__dict__.values())
+    )
+    return RECORD_OVERHEAD_BYTES + _value_size(values)
+
+
+def _write_run(path: str, entries: Iterable[RunEntry]) -> int:
+    written = 0
+    with open(path, "wb") as run:
+        for entry in entries:
+            pickle.dump(entry, run, protocol=pickle.HIGHEST_PROTOCOL)
+            written += 1
+    return written
+
+
+def _read_run(run: BinaryIO) -> Iterator[RunEntry]:
+    while True:
+        try:
+            yield pickle.load(run)
+        except EOFError:
+            return
+
+
+def _merge_unique(runs: List[BinaryIO]) -> Iterator[RunEntry]:
+    """Merges runs sorted by id, yielding the first entry of each id."""
+    last_id = None
+    for entry in heapq.merge(*(_read_run(run) for run in runs), key=itemgetter(0)):
+        if entry[0] != last_id:
+            last_id = entry[0]
+            yield entry
+
+
+class RecordDeduplicator:
+    """
+    Deduplicates backup records by id with bounded memory.
+
+    Records are kept in an in-memory `{id: record}` dict until their
+    estimated size (see `record_size`) reaches `max_memory_bytes`; past
+    that, the dict is sorted by id, its records are appended to a records
+    file in `tmp_dir` (Lambda ephemeral storage) and only their ids, types
+    and offsets are spilled to a run file.  Unique ids are then produced by
+    a k-way merge of the runs, which drops ids repeated within and across
+    runs, and their records are read back from the records file.  Backups
+    that fit in memory keep their file order; spilled ones are produced in
+    id order.  Either order is the same on every iteration and every
+    attempt, which checkpointed writes rely on.
+
+    Args:
+        max_memory_bytes (int): Estimated size of the records buffered
+            before spilling a run.
+        tmp_dir (Optional[str]): Directory for the spilled files, the system
+            temporary directory if None.
+        max_merge_fan_in (int): Runs merged at once.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = MAX_MEMORY_BYTES,
+        tmp_dir: Optional[str] = None,
+        max_merge_fan_in: int = MAX_MERGE_FAN_IN,
+    ) -> None:
+        self._max_memory_bytes = max_memory_bytes
+        self._tmp_dir = tmp_dir
+        self._max_merge_fan_in = max_merge_fan_in
+        self._records: Dict[str, Record] = {}
+        self._buffered_bytes = 0
+        self._work_dir: Optional[str] = None
+        self._records_file: Optional[BinaryIO] = None
+        self._runs: List[str] = []
+        self._run_files = 0
+        self._length: Optional[int] = None
+        self._record_counts: Optional[Counter] = None
+        self.runs_spilled = 0
+
+    def add(self, records: Iterable[Record]) -> None:
+        """Adds records, spilling a sorted run whenever the buffer is full."""
+        for record in records:
+            record_id = record.hash()
+            if record_id in self._records:
+                continue
+            self._records[record_id] = record
+            self._buffered_bytes += record_size(record)
+            if self._buffered_bytes >= self._max_memory_bytes:
+                self._spill()
+        if self._runs and self._records:
+            self._spill()
+
+    def _path(self, name: str) -> str:
+        if self._work_dir is None:
+            self._work_dir = tempfile.mkdtemp(prefix="dedup-", dir=self._tmp_dir)
+        return os.path.join(self._work_dir, name)
+
+    def _run_path(self) -> str:
+        self._run_files += 1
+        return self._path(f"{self._run_files:06d}.run")
+
+    def _spill(self) -> None:
+        if self._records_file is None:
+            self._records_file = open(self._path("records"), "wb")
+        records_file = self._records_file
+        entries = []
+        for record_id, record in sorted(self._records.items(), key=itemgetter(0)):
+            entries.append((record_id, record.record_type, records_file.tell()))
+            pickle.dump(record, records_file, protocol=pickle.HIGHEST_PROTOCOL)
+        records_file.flush()
+        path = self._run_path()
+        written = _write_run(path, entries)
+        self._records.clear()
+        self._buffered_bytes = 0
+        self._runs.append(path)
+        self.runs_spilled += 1
+        logger.info(f"Spilled a run of {written} records to {path}")
+        if len(self._runs) >= self._max_merge_fan_in:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Merges the runs into one, bounding the runs a final merge opens."""
+        runs, self._runs = self._runs, []
+        path = self._run_path()
+        files = [open(run, "rb") for run in runs]
+        try:
+            written = _write_run(path, _merge_unique(files))
+        finally:
+            for run in files:
+                run.close()
+        for run in runs:
+            os.remove(run)
+        self._runs.append(path)
+        logger.info(f"Merged {len(runs)} runs into {written} records at {path}")
+
+    def _run_entries(self) -> Iterator[RunEntry]:
+        """Yields the id, type and offset of each unique spilled record."""
+        files = [open(run, "rb") for run in self._runs]
+        try:
+            yield from _merge_unique(files)
+        finally:
+            for run in files:
+                run.close()
+
+    def __iter__(self) -> Iterator[Entry]:
+        """Yields the unique (id, record) pairs."""
+        length, record_counts = 0, Counter()
+        if not self._runs:
+            for record_id, record in self._records.items():
+                length += 1
+                record_counts[record.record_type] += 1
+                yield record_id, record
+        else:
+            with open(self._path("records"), "rb") as records_file:
+                for record_id, record_type, offset in self._run_entries():
+                    length += 1
+                    record_counts[record_type] += 1
+                    records_file.seek(offset)
+                    yield record_id, pickle.load(records_file)
+        self._length, self._record_counts = length, record_counts
+
+    def sorted_items(self) -> Iterator[Entry]:
+        """Yields the unique (id, record) pairs in id order."""
+        if not self._runs:
+            yield from sorted(self._records.items(), key=itemgetter(0))
+        else:
+            yield from self
+
+    def _count(self) -> None:
+        # Spilled records are counted from the runs, without reading them
+        if self._length is None:
+            length, record_counts = 0, Counter()
+            for _, record_type, _ in self._run_entries():
+                length += 1
+                record_counts[record_type] += 1
+            self._length, self._record_counts = length, record_counts
+
+    def __len__(self) -> int:
+        """Number of unique records."""
+        if not self._runs:
+            return len(self._records)
+        self._count()
+        return self._length
+
+    def record_counts(self) -> Counter:
+        """Unique records per record type."""
+        if not self._runs:
+            return Counter(record.record_type for record in self._records.values())
+        self._count()
+        return self._record_counts
+
+    def close(self) -> None:
+        """Removes the spilled files."""
+        self._records.clear()
+        self._buffered_bytes = 0
+        self._runs = []
+        if self._records_file is not None:
+            self._records_file.close()
+            self._records_file = None
+        if self._work_dir is not None:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
+
+    def __enter__(self) -> "RecordDeduplicator":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
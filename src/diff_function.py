@@ -0,0 +1,91 @@
+import os
+from typing import Any, Dict, List
+
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+from backup_diff import ADDED, BackupDiffer
+from backup_processor import BackupRestoreProcessor
+from processing import (
+    BUCKET_NAME,
+    DEDUP_MEMORY_BYTES,
+    ENV,
+    READAHEAD_CHUNKS,
+    s3_client,
+    s3_resource,
+    validation_pool,
+)
+
+# Initialize AWS Lambda Powertools components
+tracer = Tracer()
+logger = Logger()
+metrics = Metrics(namespace="sms-backup-restore")
+
+# Changed records returned per side, the rest are only counted
+DIFF_RECORD_LIMIT = int(os.environ.get("DIFF_RECORD_LIMIT", "100"))
+
+
+def diff_backups(
+    old_key: str, new_key: str, limit: int = DIFF_RECORD_LIMIT
+) -> Dict[str, Any]:
+    """
+    Compares two backups in the bucket without storing their records.
+
+    Attachments are hashed but not uploaded, so records of either backup
+    compare as they would be stored.
+
+    Args:
+        old_key (str): Key of the older backup.
+        new_key (str): Key of the newer backup.
+        limit (int): Added and removed records returned per side.
+
+    Returns:
+        Dict[str, Any]: Counts of the added, removed and unchanged records
+            and the first `limit` added and removed records.
+    """
+    processor = BackupRestoreProcessor(
+        s3_client=s3_client,
+        s3_resource=s3_resource,
+        validation_pool=validation_pool,
+        readahead_chunks=READAHEAD_CHUNKS,
+        store_parts=False,
+    )
+    differ = BackupDiffer(processor, max_memory_bytes=DEDUP_MEMORY_BYTES)
+    records: Dict[str, List[Dict[str, Any]]] = {"added": [], "removed": []}
+    for change, _, record in differ.diff(BUCKET_NAME, old_key, new_key):
+        if len(records[change]) < limit:
+            records[change].append(record.model_dump())
+
+    added = sum(n for k, n in differ.counts.items() if k.startswith(f"{ADDED}/"))
+    removed = differ.counts.total() - added
+    logger.info(
+        f"{old_key} -> {new_key}: {added} added, {removed} removed, "
+        f"{differ.unchanged} unchanged"
+    )
+    metrics.add_metric(name="RecordsAdded", unit=MetricUnit.Count, value=added)
+    metrics.add_metric(name="RecordsRemoved", unit=MetricUnit.Count, value=removed)
+    return {
+        "added": added,
+        "removed": removed,
+        "unchanged": differ.unchanged,
+        "by_type": dict(differ.counts),
+        "records": records,
+    }
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> Dict[str, Any]:
+    """
+    Lambda function to compare two backups.
+
+    The event names the backups as `old_key` and `new_key`, and optionally
+    how many changed records to return as `limit`.
+    """
+
+    metrics.add_dimension(name="environment", value=ENV)
+
+    return diff_backups(
+        event["old_key"], event["new_key"], event.get("limit", DIFF_RECORD_LIMIT)
+    )
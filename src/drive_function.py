@@ -0,0 +1,107 @@
+import os
+from typing import Any, Dict, Optional
+
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities import parameters
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+import drive_source
+from drive_source import (
+    ChangeTokenStore,
+    DriveBackupSource,
+    DriveClient,
+    new_backup_files,
+    service_account_token_provider,
+)
+from processing import (
+    BUCKET_NAME,
+    ENV,
+    IDEMPOTENCY_TABLE,
+    READAHEAD_CHUNKS,
+    dynamodb_client,
+    idempotency_config,
+    process_backup_object,
+    publish_cache_metrics,
+)
+
+# Initialize AWS Lambda Powertools components
+tracer = Tracer()
+logger = Logger()
+metrics = Metrics(namespace="sms-backup-restore")
+
+# Secrets Manager secret holding the JSON key of a service account the
+# backup folder is shared with
+DRIVE_CREDENTIALS_SECRET = os.environ.get("DRIVE_CREDENTIALS_SECRET")
+# Folder the Android app uploads backups to, any folder if unset
+DRIVE_FOLDER_ID = os.environ.get("DRIVE_FOLDER_ID") or None
+DRIVE_API_URL = os.environ.get("DRIVE_API_URL", drive_source.DRIVE_API_URL)
+
+if not IDEMPOTENCY_TABLE:
+    raise ValueError("Drive polling requires IDEMPOTENCY_TABLE")
+change_tokens = ChangeTokenStore(dynamodb_client, IDEMPOTENCY_TABLE)
+_drive_client: Optional[DriveClient] = None
+
+
+def drive_client() -> DriveClient:
+    """Returns the Drive client, reading the credentials on first use."""
+    global _drive_client
+    if _drive_client is None:
+        info = parameters.get_secret(DRIVE_CREDENTIALS_SECRET, transform="json")
+        _drive_client = DriveClient(
+            service_account_token_provider(info), base_url=DRIVE_API_URL
+        )
+    return _drive_client
+
+
+def poll_drive(client: DriveClient) -> Dict[str, Any]:
+    """
+    Processes the backups added to Drive since the last poll.
+
+    The first poll only records where the change list starts.  The page
+    token is saved once every new backup is processed, so a failed poll is
+    retried from the same changes; backups it already processed return
+    their idempotent result.
+
+    Returns:
+        Dict[str, Any]: The number of backups processed.
+    """
+    page_token = change_tokens.load()
+    if page_token is None:
+        change_tokens.save(client.start_page_token())
+        logger.info("Started tracking Drive changes")
+        return {"backups": 0}
+
+    changes, next_page_token = client.changes(page_token)
+    backups = new_backup_files(changes, folder_id=DRIVE_FOLDER_ID)
+    logger.info(f"{len(backups)} new backups in {len(changes)} Drive changes")
+    source = DriveBackupSource(client, readahead_chunks=max(READAHEAD_CHUNKS, 1))
+    for backup in backups:
+        result = process_backup_object(
+            backup={
+                "bucket": BUCKET_NAME,
+                "key": backup["id"],
+                "etag": backup["headRevisionId"],
+                "name": backup["name"],
+            },
+            source=source,
+        )
+        logger.info(f"Backup {backup['name']} from Drive: {result}")
+    change_tokens.save(next_page_token)
+    metrics.add_metric(
+        name="DriveBackupsFound", unit=MetricUnit.Count, value=len(backups)
+    )
+    return {"backups": len(backups)}
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> Dict[str, Any]:
+    """Lambda function to process backups uploaded to Google Drive"""
+
+    metrics.add_dimension(name="environment", value=ENV)
+    idempotency_config.register_lambda_context(context)
+
+    result = poll_drive(drive_client())
+    publish_cache_metrics()
+    return result
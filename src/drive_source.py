@@ -0,0 +1,301 @@
+import http.client
+import json
+import re
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import IncompleteReadError
+from mypy_boto3_dynamodb.client import DynamoDBClient
+
+from backup_sources import BackupSource
+from s3_reader import MAX_RANGE_ATTEMPTS, READ_CHUNK_BYTES, RangePrefetchingReader
+
+DRIVE_API_URL = "https://www.googleapis.com"
+DRIVE_READONLY_SCOPE = "https://www.googleapis.com/auth/drive.readonly"
+DRIVE_REQUEST_TIMEOUT_SECONDS = 60
+DRIVE_READAHEAD_CHUNKS = 4
+FILE_FIELDS = "id,name,mimeType,size,headRevisionId,parents,trashed"
+CHANGES_PAGE_SIZE = 1000
+# Names the Android app gives the backups it uploads
+BACKUP_NAME_PATTERN = re.compile(r"^(sms|calls)-.*\.xml$")
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+CHANGE_TOKEN_PREFIX = "drive-changes#"
+
+
+class DriveTransientError(ConnectionError):
+    """A Drive request failed in a way worth retrying."""
+
+
+class DriveClient:
+    """
+    Minimal Drive v3 REST client for downloading backups and polling changes.
+
+    Requests are plain HTTPS calls authorized with a bearer token, so ranges
+    of a file can be downloaded concurrently and the client can be pointed
+    at a local stand-in with `base_url`.
+
+    Args:
+        token_provider (Callable[[], str]): Returns a valid access token.
+        base_url (str): Root URL of the Drive API.
+        timeout (float): Seconds a request may take.
+    """
+
+    def __init__(
+        self,
+        token_provider: Callable[[], str],
+        base_url: str = DRIVE_API_URL,
+        timeout: float = DRIVE_REQUEST_TIMEOUT_SECONDS,
+    ) -> None:
+        self._token_provider = token_provider
+        self._base_url = base_url.rstrip("/")
+        self._timeout = timeout
+
+    def _request(
+        self,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> bytes:
+        url = f"{self._base_url}/drive/v3/{path}"
+        if params:
+            url = f"{url}?{urllib.parse.urlencode(params)}"
+        request = urllib.request.Request(
+            url,
+            headers={
+                "Authorization": f"Bearer {self._token_provider()}",
+                **(headers or {}),
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self._timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code in TRANSIENT_STATUS_CODES:
+                raise DriveTransientError(f"{e.code} from {path}") from e
+            raise
+        except urllib.error.URLError as e:
+            raise DriveTransientError(f"{e.reason} from {path}") from e
+
+    def _get_json(self, path: str, params: Dict[str, str]) -> Dict[str, Any]:
+        return json.loads(self._request(path, {**params, "supportsAllDrives": "true"}))
+
+    def get_file(self, file_id: str) -> Dict[str, Any]:
+        """Returns a file's metadata."""
+        quoted = urllib.parse.quote(file_id, safe="")
+        return self._get_json(f"files/{quoted}", {"fields": FILE_FIELDS})
+
+    def get_range(self, file_id: str, revision_id: str, start: int, end: int) -> bytes:
+        """Returns bytes `start` to `end` inclusive of a file revision."""
+        file_id = urllib.parse.quote(file_id, safe="")
+        revision_id = urllib.parse.quote(revision_id, safe="")
+        return self._request(
+            f"files/{file_id}/revisions/{revision_id}",
+            {"alt": "media"},
+            {"Range": f"bytes={start}-{end}"},
+        )
+
+    def start_page_token(self) -> str:
+        """Returns the token of the next change made in the Drive."""
+        return self._get_json("changes/startPageToken", {})["startPageToken"]
+
+    def changes(self, page_token: str) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Lists the changes made since a page token.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], str]: The changes, oldest first, and
+                the token to list the following changes from.
+        """
+        changes = []
+        while True:
+            response = self._get_json(
+                "changes",
+                {
+                    "pageToken": page_token,
+                    "pageSize": str(CHANGES_PAGE_SIZE),
+                    "includeItemsFromAllDrives": "true",
+                    "fields": (
+                        "nextPageToken,newStartPageToken,"
+                        f"changes(fileId,removed,file({FILE_FIELDS}))"
+                    ),
+                },
+            )
+            changes.extend(response.get("changes", []))
+            if "newStartPageToken" in response:
+                return changes, response["newStartPageToken"]
+            page_token = response["nextPageToken"]
+
+
+def new_backup_files(
+    changes: List[Dict[str, Any]], folder_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Returns the latest version of the backup files among Drive changes.
+
+    Args:
+        changes (List[Dict[str, Any]]): Changes, oldest first.
+        folder_id (Optional[str]): Folder the backups are uploaded to, any
+            folder if None.
+
+    Returns:
+        List[Dict[str, Any]]: Metadata of the added or updated backups.
+    """
+    files: Dict[str, Dict[str, Any]] = {}
+    for change in changes:
+        file = change.get("file")
+        if change.get("removed") or file is None or file.get("trashed"):
+            files.pop(change["fileId"], None)
+            continue
+        if not BACKUP_NAME_PATTERN.match(file["name"]):
+            continue
+        if folder_id is not None and folder_id not in file.get("parents", []):
+            continue
+        # A file changed several times is processed once, at its last version
+        files.pop(file["id"], None)
+        files[file["id"]] = file
+    return list(files.values())
+
+
+class DriveReader(RangePrefetchingReader):
+    """
+    Reads a Drive file with concurrent ranged media downloads.
+
+    Ranges are downloaded from the file's head revision when the reader is
+    opened, so a backup replaced mid-read is read at one version.
+
+    Args:
+        client (DriveClient): Drive client.
+        file_id (str): The file's id.
+        chunk_size (int): Bytes per ranged download.
+        readahead_chunks (int): Ranges downloaded ahead of the consumer.
+        max_attempts (int): Attempts per range.
+    """
+
+    retryable_errors = (
+        ConnectionError,
+        TimeoutError,
+        http.client.IncompleteRead,
+        IncompleteReadError,
+    )
+
+    def __init__(
+        self,
+        client: DriveClient,
+        file_id: str,
+        chunk_size: int = READ_CHUNK_BYTES,
+        readahead_chunks: int = DRIVE_READAHEAD_CHUNKS,
+        max_attempts: int = MAX_RANGE_ATTEMPTS,
+    ) -> None:
+        self._client = client
+        self._file_id = file_id
+        metadata = client.get_file(file_id)
+        self._revision_id: str = metadata["headRevisionId"]
+        super().__init__(
+            metadata["name"],
+            int(metadata["size"]),
+            chunk_size=chunk_size,
+            readahead_chunks=readahead_chunks,
+            max_attempts=max_attempts,
+        )
+
+    def _get_range(self, start: int, end: int) -> bytes:
+        return self._client.get_range(self._file_id, self._revision_id, start, end)
+
+
+class DriveBackupSource(BackupSource):
+    """
+    Streams backups the Android app uploaded to Google Drive, by file id.
+
+    Args:
+        client (DriveClient): Drive client.
+        chunk_size (int): Bytes per ranged download.
+        readahead_chunks (int): Ranges downloaded ahead of the parser.
+    """
+
+    name = "drive"
+
+    def __init__(
+        self,
+        client: DriveClient,
+        chunk_size: int = READ_CHUNK_BYTES,
+        readahead_chunks: int = DRIVE_READAHEAD_CHUNKS,
+    ) -> None:
+        self._client = client
+        self._chunk_size = chunk_size
+        self._readahead_chunks = readahead_chunks
+
+    @contextmanager
+    def open(self, backup_key: str) -> Iterator[DriveReader]:
+        with DriveReader(
+            self._client,
+            backup_key,
+            chunk_size=self._chunk_size,
+            readahead_chunks=self._readahead_chunks,
+        ) as reader:
+            yield reader
+
+
+class ChangeTokenStore:
+    """
+    Keeps the Drive change page token polling resumes from.
+
+    The token lives in the idempotency table next to the processing
+    checkpoints and, unlike them, does not expire.
+
+    Args:
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        table_name (str): Table keyed by `id`.
+        name (str): Distinguishes the tokens of several pollers.
+    """
+
+    def __init__(
+        self, dynamodb_client: DynamoDBClient, table_name: str, name: str = "default"
+    ) -> None:
+        self._dynamodb_client = dynamodb_client
+        self._table_name = table_name
+        self._key = {"id": {"S": f"{CHANGE_TOKEN_PREFIX}{name}"}}
+
+    def load(self) -> Optional[str]:
+        """Returns the stored page token, None before the first poll."""
+        response = self._dynamodb_client.get_item(
+            TableName=self._table_name, Key=self._key, ConsistentRead=True
+        )
+        return response.get("Item", {}).get("page_token", {}).get("S")
+
+    def save(self, page_token: str) -> None:
+        """Stores the page token the next poll resumes from."""
+        self._dynamodb_client.put_item(
+            TableName=self._table_name,
+            Item={**self._key, "page_token": {"S": page_token}},
+        )
+
+
+def service_account_token_provider(info: Dict[str, Any]) -> Callable[[], str]:
+    """
+    Returns a provider of read-only Drive access tokens for a service account.
+
+    Args:
+        info (Dict[str, Any]): The service account's JSON key.
+    """
+    # The Google auth libraries are only needed to poll Drive
+    from google.auth.transport.requests import Request
+    from google.oauth2 import service_account
+
+    credentials = service_account.Credentials.from_service_account_info(
+        info, scopes=[DRIVE_READONLY_SCOPE]
+    )
+
+    lock = threading.Lock()
+
+    def token() -> str:
+        # Ranges are downloaded from several threads
+        with lock:
+            if not credentials.valid:
+                credentials.refresh(Request())
+            return credentials.token
+
+    return token
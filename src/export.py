@@ -0,0 +1,325 @@
+import base64
+import gzip
+import io
+import json
+import time
+import typing
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from aws_lambda_powertools import Logger
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3.client import S3Client
+from pydantic import BaseModel
+
+from item_serializer import (
+    THREAD_ATTRIBUTE,
+    Item,
+    deserialize_item,
+    load_spilled_item,
+)
+from rate_control import TokenBucket
+from schemas import RECORD_MODELS
+from table_scan import ParallelTableScanner
+from write_diff import DIGEST_ATTRIBUTE
+
+logger = Logger()
+
+EXPORT_PREFIX = "exports"
+EXPORT_FORMATS = {"ndjson": "ndjson.gz", "parquet": "parquet"}
+# Item attributes that are not fields of the record models
+_KEY_ATTRIBUTES = ("id", THREAD_ATTRIBUTE, DIGEST_ATTRIBUTE)
+
+
+def _json_default(value: Any) -> Any:
+    """Encodes the values `json` cannot: binary as base64 and sets as lists."""
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def _arrow_type(pa: Any, annotation: Any) -> Any:
+    """Maps a model field annotation onto the Arrow type of its item value."""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Annotated:
+        return _arrow_type(pa, args[0])
+    if origin is typing.Union:
+        return _arrow_type(pa, next(a for a in args if a is not type(None)))
+    if origin in (frozenset, set, list, tuple):
+        return pa.list_(_arrow_type(pa, args[0]))
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return pa.struct(
+            [
+                (name, _arrow_type(pa, field.annotation))
+                for name, field in annotation.model_fields.items()
+                if not field.exclude
+            ]
+        )
+    if annotation is bool:
+        return pa.bool_()
+    if annotation is int:
+        return pa.int64()
+    # Strings and datetimes, which items store as ISO 8601 strings
+    return pa.string()
+
+
+def arrow_schema(pa: Any, record_type: str) -> Any:
+    """Returns the Arrow schema of the items of a record type."""
+    model_cls = RECORD_MODELS[record_type]
+    fields = [(name, pa.string()) for name in _KEY_ATTRIBUTES]
+    fields += [
+        (name, _arrow_type(pa, field.annotation))
+        for name, field in model_cls.model_fields.items()
+        if not field.exclude
+    ]
+    fields += [(name, pa.string()) for name in model_cls.model_computed_fields]
+    return pa.schema(fields)
+
+
+class SegmentCheckpoint:
+    """Progress of one scan segment, saved after each flushed file set."""
+
+    def __init__(
+        self,
+        segment: int,
+        exclusive_start_key: Optional[Item] = None,
+        done: bool = False,
+        files: int = 0,
+        rows: int = 0,
+    ) -> None:
+        self.segment = segment
+        self.exclusive_start_key = exclusive_start_key
+        self.done = done
+        self.files = files
+        self.rows = rows
+
+    def to_json(self) -> str:
+        return json.dumps(self.__dict__)
+
+    @classmethod
+    def from_json(cls, data: str) -> "SegmentCheckpoint":
+        return cls(**json.loads(data))
+
+
+class ExportResult:
+    """Summary of an export run."""
+
+    def __init__(self, export_id: str, checkpoints: List[SegmentCheckpoint]) -> None:
+        self.export_id = export_id
+        self.rows = sum(c.rows for c in checkpoints)
+        self.files = sum(c.files for c in checkpoints)
+        self.complete = all(c.done for c in checkpoints)
+
+
+class TableExporter:
+    """
+    Exports the table to S3 as NDJSON or Parquet with a parallel `Scan`.
+
+    Every segment is scanned by its own worker, paced together below
+    `max_read_request_units`.  Rows are partitioned by `record_type` into
+    `exports/{export_id}/record_type={type}/segment={n}-{seq}.{ext}` files of
+    up to `rows_per_file` rows.  After each flush the segment's
+    `LastEvaluatedKey` is checkpointed under `_checkpoints/`, so an export
+    interrupted at any point resumes where it left off; file keys are
+    deterministic, so a flush repeated after a crash overwrites its files.
+
+    Args:
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        s3_client (S3Client): S3 client for the exported files.
+        table_name (str): Name of the DynamoDB table.
+        bucket_name (str): Bucket the export is written to.
+        export_id (str): Identifies the export; reusing it resumes it.
+        output_format (str): `ndjson` (gzip compressed) or `parquet`.
+        total_segments (int): Number of segments scanned in parallel.
+        max_read_request_units (Optional[float]): Read capacity units per
+            second the export may consume, unlimited if None.
+        rows_per_file (int): Rows buffered per segment before a flush.
+        page_size (Optional[int]): `Limit` of each `Scan` page.
+    """
+
+    def __init__(
+        self,
+        dynamodb_client: DynamoDBClient,
+        s3_client: S3Client,
+        table_name: str,
+        bucket_name: str,
+        export_id: str,
+        output_format: str = "ndjson",
+        total_segments: int = 8,
+        max_read_request_units: Optional[float] = None,
+        rows_per_file: int = 50000,
+        page_size: Optional[int] = None,
+    ) -> None:
+        if output_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {output_format}")
+        self._s3_client = s3_client
+        self._bucket_name = bucket_name
+        self._export_id = export_id
+        self._output_format = output_format
+        self._rows_per_file = rows_per_file
+        self._scan_kwargs = {"Limit": page_size} if page_size else {}
+        self._prefix = f"{EXPORT_PREFIX}/{export_id}"
+        self._scanner = ParallelTableScanner(
+            dynamodb_client,
+            table_name,
+            total_segments=total_segments,
+            read_limiter=(
+                TokenBucket(rate=max_read_request_units)
+                if max_read_request_units
+                else None
+            ),
+        )
+        self._pa = self._pq = None
+        if output_format == "parquet":
+            # pyarrow is only needed for Parquet exports
+            import pyarrow
+            import pyarrow.parquet
+
+            self._pa, self._pq = pyarrow, pyarrow.parquet
+
+    def _checkpoint_key(self, segment: int) -> str:
+        return f"{self._prefix}/_checkpoints/segment={segment:04d}.json"
+
+    def _load_checkpoint(self, segment: int) -> SegmentCheckpoint:
+        try:
+            response = self._s3_client.get_object(
+                Bucket=self._bucket_name, Key=self._checkpoint_key(segment)
+            )
+        except self._s3_client.exceptions.NoSuchKey:
+            return SegmentCheckpoint(segment)
+        return SegmentCheckpoint.from_json(response["Body"].read())
+
+    def _save_checkpoint(self, checkpoint: SegmentCheckpoint) -> None:
+        self._s3_client.put_object(
+            Bucket=self._bucket_name,
+            Key=self._checkpoint_key(checkpoint.segment),
+            Body=checkpoint.to_json(),
+        )
+
+    def _check_manifest(self) -> None:
+        """Records the export's settings, refusing to resume with others."""
+        manifest = {
+            "format": self._output_format,
+            "total_segments": self._scanner.total_segments,
+        }
+        key = f"{self._prefix}/_export.json"
+        try:
+            response = self._s3_client.get_object(Bucket=self._bucket_name, Key=key)
+        except self._s3_client.exceptions.NoSuchKey:
+            manifest["started_at"] = datetime.now().isoformat()
+            self._s3_client.put_object(
+                Bucket=self._bucket_name, Key=key, Body=json.dumps(manifest)
+            )
+            return
+        stored = json.loads(response["Body"].read())
+        if any(stored[k] != v for k, v in manifest.items()):
+            raise ValueError(
+                f"Export {self._export_id} was started with {stored}, "
+                f"cannot resume it with {manifest}"
+            )
+
+    def _encode(self, record_type: str, rows: List[Dict[str, Any]]) -> bytes:
+        """Encodes rows as one file of the export format."""
+        if self._output_format == "ndjson":
+            lines = b"".join(
+                json.dumps(row, default=_json_default, separators=(",", ":")).encode()
+                + b"\n"
+                for row in rows
+            )
+            return gzip.compress(lines)
+
+        if record_type in RECORD_MODELS:
+            table = self._pa.Table.from_pylist(
+                rows, schema=arrow_schema(self._pa, record_type)
+            )
+        else:
+            table = self._pa.Table.from_pylist(rows)
+        buffer = io.BytesIO()
+        self._pq.write_table(table, buffer, compression="zstd")
+        return buffer.getvalue()
+
+    def _flush(
+        self, checkpoint: SegmentCheckpoint, rows: Dict[str, List[Dict[str, Any]]]
+    ) -> None:
+        extension = EXPORT_FORMATS[self._output_format]
+        for record_type, record_rows in sorted(rows.items()):
+            key = (
+                f"{self._prefix}/record_type={record_type}/"
+                f"segment={checkpoint.segment:04d}-{checkpoint.files:05d}.{extension}"
+            )
+            self._s3_client.put_object(
+                Bucket=self._bucket_name,
+                Key=key,
+                Body=self._encode(record_type, record_rows),
+            )
+            checkpoint.files += 1
+            checkpoint.rows += len(record_rows)
+
+    def _export_segment(
+        self, segment: int, deadline: Optional[float]
+    ) -> SegmentCheckpoint:
+        """Exports a segment from its checkpoint until it ends or time is up."""
+        checkpoint = self._load_checkpoint(segment)
+        if checkpoint.done:
+            return checkpoint
+
+        rows: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        buffered = 0
+        for response in self._scanner.scan_segment(
+            segment,
+            exclusive_start_key=checkpoint.exclusive_start_key,
+            **self._scan_kwargs,
+        ):
+            for item in response["Items"]:
+                row = deserialize_item(load_spilled_item(self._s3_client, item))
+                rows[row.get("record_type", "other")].append(row)
+            buffered += len(response["Items"])
+
+            last_evaluated_key = response.get("LastEvaluatedKey")
+            out_of_time = deadline is not None and time.monotonic() >= deadline
+            if (
+                last_evaluated_key is None
+                or buffered >= self._rows_per_file
+                or out_of_time
+            ):
+                self._flush(checkpoint, rows)
+                checkpoint.exclusive_start_key = last_evaluated_key
+                checkpoint.done = last_evaluated_key is None
+                self._save_checkpoint(checkpoint)
+                rows.clear()
+                buffered = 0
+                if out_of_time:
+                    break
+        return checkpoint
+
+    def export(self, time_budget: Optional[float] = None) -> ExportResult:
+        """
+        Runs (or resumes) the export.
+
+        Args:
+            time_budget (Optional[float]): Seconds after which segments stop
+                at their next page and checkpoint, leaving the export to be
+                resumed.  Runs to completion if None.
+
+        Returns:
+            ExportResult: Rows and files exported so far and whether every
+                segment is done.
+        """
+        self._check_manifest()
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        segments = range(self._scanner.total_segments)
+        with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+            checkpoints = list(
+                executor.map(lambda s: self._export_segment(s, deadline), segments)
+            )
+        result = ExportResult(self._export_id, checkpoints)
+        logger.info(
+            f"Export {self._export_id}: {result.rows} rows in {result.files} files, "
+            f"{sum(c.done for c in checkpoints)}/{len(segments)} segments done"
+        )
+        return result
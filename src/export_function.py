@@ -0,0 +1,68 @@
+import os
+from datetime import datetime, timezone
+
+import boto3
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3 import S3Client
+
+from export import TableExporter
+
+# Initialize AWS Lambda Powertools components
+tracer = Tracer()
+logger = Logger()
+metrics = Metrics(namespace="sms-backup-restore")
+
+# Initialize AWS clients
+s3_client: S3Client = boto3.client("s3")
+dynamodb_client: DynamoDBClient = boto3.client("dynamodb")
+
+DYNAMODB_TABLE = os.environ.get("DYNAMODB_TABLE", "sms-backup-restore")
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "sms-backup-restore")
+ENV = os.environ.get("ENV", "prod")
+# Share of the table's read request units an export may consume
+MAX_READ_REQUEST_UNITS = float(os.environ.get("MAX_READ_REQUEST_UNITS", "500"))
+# Time kept in reserve to flush and checkpoint before the function times out
+CHECKPOINT_RESERVE_SECONDS = 60
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> dict:
+    """
+    Lambda function to export the table to S3.
+
+    The event may set the `export_id` (invoking again with the returned
+    `export_id` resumes an incomplete export), the `format` (`ndjson` or
+    `parquet`) and `total_segments`.
+    """
+
+    metrics.add_dimension(name="environment", value=ENV)
+
+    export_id = event.get("export_id") or datetime.now(timezone.utc).strftime(
+        "%Y-%m-%d_%H-%M-%S"
+    )
+    exporter = TableExporter(
+        dynamodb_client=dynamodb_client,
+        s3_client=s3_client,
+        table_name=DYNAMODB_TABLE,
+        bucket_name=BUCKET_NAME,
+        export_id=export_id,
+        output_format=event.get("format", "ndjson"),
+        total_segments=int(event.get("total_segments", 8)),
+        max_read_request_units=MAX_READ_REQUEST_UNITS,
+    )
+    time_budget = (
+        context.get_remaining_time_in_millis() / 1000 - CHECKPOINT_RESERVE_SECONDS
+    )
+    result = exporter.export(time_budget=max(0, time_budget))
+    metrics.add_metric(name="RecordsExported", unit=MetricUnit.Count, value=result.rows)
+
+    return {
+        "export_id": export_id,
+        "complete": result.complete,
+        "rows": result.rows,
+        "files": result.files,
+    }
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from contextlib import AsyncExitStack
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+T = TypeVar("T")
+
+IO_ENGINE_THREADS = "threads"
+IO_ENGINE_ASYNCIO = "asyncio"
+IO_ENGINES = (IO_ENGINE_THREADS, IO_ENGINE_ASYNCIO)
+# Bytes carried by submitted coroutines that have not completed yet
+MAX_PENDING_BYTES = 256 * 1024 * 1024
+
+
+class AsyncIOEngine:
+    """
+    Runs aiobotocore calls on an event loop in a background thread.
+
+    Synchronous code such as the backup parser hands coroutines to the loop
+    with `submit` and carries on, so hundreds of S3 and DynamoDB requests are
+    multiplexed over one pool of connections instead of being made one at a
+    time.  Submitted coroutines queue on the loop and at most `max_in_flight`
+    of them run at once; `submit` itself only blocks while the coroutines
+    pending carry more than `max_pending_bytes`, which keeps the parser from
+    buffering a whole backup ahead of its uploads without waiting on each
+    upload.
+
+    Args:
+        region_name (Optional[str]): Region of the clients, the session's
+            default if None.
+        max_pool_connections (int): Connections pooled per client.
+        max_in_flight (int): Submitted coroutines running at once.
+        max_pending_bytes (int): Bytes of submitted coroutines that have not
+            completed before `submit` waits.
+        endpoint_urls (Optional[Dict[str, str]]): Endpoint per service name,
+            e.g. for local S3 and DynamoDB.
+    """
+
+    def __init__(
+        self,
+        region_name: Optional[str] = None,
+        max_pool_connections: int = 256,
+        max_in_flight: int = 256,
+        max_pending_bytes: int = MAX_PENDING_BYTES,
+        endpoint_urls: Optional[Dict[str, str]] = None,
+    ) -> None:
+        # aiobotocore is only needed when the asyncio engine is selected
+        from aiobotocore.config import AioConfig
+        from aiobotocore.session import get_session
+
+        self._session = get_session()
+        self._config = AioConfig(max_pool_connections=max_pool_connections)
+        self._region_name = region_name
+        self._endpoint_urls = endpoint_urls or {}
+        self._clients: Dict[str, Any] = {}
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._max_pending_bytes = max_pending_bytes
+        self._pending_bytes = 0
+        self._pending = threading.Condition()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="io-engine", daemon=True
+        )
+        self._thread.start()
+        self._exit_stack = AsyncExitStack()
+        self._clients_lock = asyncio.Lock()
+
+    async def client(self, service_name: str) -> Any:
+        """Returns the engine's aiobotocore client of a service."""
+        async with self._clients_lock:
+            if service_name not in self._clients:
+                self._clients[service_name] = (
+                    await self._exit_stack.enter_async_context(
+                        self._session.create_client(
+                            service_name,
+                            region_name=self._region_name,
+                            endpoint_url=self._endpoint_urls.get(service_name),
+                            config=self._config,
+                        )
+                    )
+                )
+            return self._clients[service_name]
+
+    def submit(self, coroutine: Awaitable[T], size: int = 0) -> "Future[T]":
+        """
+        Queues a coroutine on the loop without waiting for it to start.
+
+        Args:
+            coroutine (Awaitable[T]): The coroutine to run.
+            size (int): Bytes the coroutine holds until it completes, e.g. the
+                body it uploads.
+
+        Returns:
+            Future[T]: The coroutine's result.
+        """
+        with self._pending:
+            # A coroutine larger than the budget still runs once nothing is
+            self._pending.wait_for(
+                lambda: not self._pending_bytes
+                or self._pending_bytes + size <= self._max_pending_bytes
+            )
+            self._pending_bytes += size
+        future = asyncio.run_coroutine_threadsafe(
+            self._run_in_slot(coroutine), self._loop
+        )
+        future.add_done_callback(lambda _: self._release(size))
+        return future
+
+    async def _run_in_slot(self, coroutine: Awaitable[T]) -> T:
+        async with self._in_flight:
+            return await coroutine
+
+    def _release(self, size: int) -> None:
+        with self._pending:
+            self._pending_bytes -= size
+            self._pending.notify_all()
+
+    def run(self, coroutine: Awaitable[T]) -> T:
+        """Runs a coroutine on the loop and returns its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def close(self) -> None:
+        """Closes the clients and stops the loop."""
+        self.run(self._exit_stack.aclose())
+        self._clients.clear()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def build_io_engine(io_engine: str, **kwargs) -> Optional[AsyncIOEngine]:
+    """Returns the engine named by `IO_ENGINE`, None for the threaded path."""
+    if io_engine not in IO_ENGINES:
+        raise ValueError(f"Unknown I/O engine {io_engine}, expected {IO_ENGINES}")
+    if io_engine == IO_ENGINE_THREADS:
+        return None
+    logger.info("Using the asyncio I/O engine")
+    return AsyncIOEngine(**kwargs)
@@ -0,0 +1,354 @@
+import gzip
+import json
+import zlib
+from datetime import datetime
+from functools import cache
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Type
+
+import zstandard
+from pydantic import BaseModel
+
+from compact_records import PART_FIELDS, CompactRecord, Record
+from schemas import MMS, CorrespondenceBase
+from write_diff import DIGEST_ATTRIBUTE
+
+AttributeValue = Dict[str, Any]
+Item = Dict[str, AttributeValue]
+
+NULL: AttributeValue = {"NULL": True}
+
+# Partition key of the thread index: the conversation's addresses and a shard
+THREAD_ATTRIBUTE = "thread"
+THREAD_INDEX_NAME = "thread-timestamp-index"
+THREAD_SHARDS = 4
+
+# Attributes stored compressed once their encoded value exceeds the threshold
+COMPRESSIBLE_ATTRIBUTES = ("body", "parts", "subject", "sub")
+COMPRESSION_THRESHOLD_BYTES = 1024
+# Compressed values are binary prefixed with a marker (not valid UTF-8 text)
+# and the codec's id
+COMPRESSION_MARKER = b"\xc0"
+ZLIB_CODEC = b"z"
+ZSTD_CODEC = b"s"
+# Items estimated above this are stored in S3, leaving room under 400 KB
+SPILL_THRESHOLD_BYTES = 350 * 1024
+SPILL_ATTRIBUTE = "spilled"
+SPILL_PREFIX = "items"
+# Attributes kept on the placeholder item of a spilled item
+_SPILL_KEPT_ATTRIBUTES = (
+    "id",
+    "timestamp",
+    THREAD_ATTRIBUTE,
+    "record_type",
+    "address",
+    DIGEST_ATTRIBUTE,
+)
+
+
+def thread_address(address: Iterable[str]) -> str:
+    """Returns the normalized conversation key for a set of addresses."""
+    return "~".join(sorted(address))
+
+
+def thread_key(address: Iterable[str], record_id: str) -> str:
+    """
+    Returns the thread index partition key of a record.
+
+    Records of a conversation are spread over `THREAD_SHARDS` partitions by
+    their id so heavy contacts do not concentrate writes on one partition.
+    """
+    shard = int(record_id[:8], 16) % THREAD_SHARDS
+    return f"{thread_address(address)}#{shard}"
+
+
+def _encode_str(value: str) -> AttributeValue:
+    return {"S": value}
+
+
+def _encode_int(value: int) -> AttributeValue:
+    return {"N": str(value)}
+
+
+def _encode_bool(value: bool) -> AttributeValue:
+    return {"BOOL": value}
+
+
+def _encode_datetime(value: datetime) -> AttributeValue:
+    return {"S": value.isoformat()}
+
+
+def _encode_none(value: None) -> AttributeValue:
+    return NULL
+
+
+def _encode_str_set(value: frozenset) -> AttributeValue:
+    """Encodes a set of strings as a sorted list, matching `model_dump()`."""
+    return {"L": [{"S": v} for v in sorted(value)]}
+
+
+_VALUE_ENCODERS: Dict[type, Callable[[Any], AttributeValue]] = {
+    str: _encode_str,
+    int: _encode_int,
+    bool: _encode_bool,
+    datetime: _encode_datetime,
+    type(None): _encode_none,
+}
+
+
+def encode_value(value: Any) -> AttributeValue:
+    """Encodes a plain python value as a low-level `AttributeValue`."""
+    encoder = _VALUE_ENCODERS.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+    if isinstance(value, dict):
+        return {"M": {k: encode_value(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {"L": [encode_value(v) for v in value]}
+    if isinstance(value, (set, frozenset)):
+        return {"L": [encode_value(v) for v in sorted(value)]}
+    if isinstance(value, (bytes, bytearray)):
+        return {"B": bytes(value)}
+    raise TypeError(f"Unsupported type {type(value)} for value {value!r}")
+
+
+def _encode_parts(parts: frozenset) -> AttributeValue:
+    """Encodes MMS parts sorted by `seq`, matching `MMS.model_dump()`."""
+    ordered = sorted(parts, key=lambda part: (part.seq is None, part.seq or 0))
+    return {"L": [{"M": serialize_model(part)} for part in ordered]}
+
+
+# Fields whose custom pydantic serializers are mirrored by a dedicated encoder
+_FIELD_ENCODERS: Dict[Tuple[type, str], Callable[[Any], AttributeValue]] = {
+    (CorrespondenceBase, "address"): _encode_str_set,
+    (MMS, "parts"): _encode_parts,
+}
+
+
+@cache
+def field_plan(
+    model_cls: Type[BaseModel],
+) -> Tuple[Tuple[Tuple[str, Callable[[Any], AttributeValue]], ...], Item]:
+    """
+    Returns the cached serialization plan of a model class.
+
+    The plan lists the included fields with their encoder and the constant
+    `AttributeValue`s of computed fields such as `record_type`.
+    """
+    fields: List[Tuple[str, Callable[[Any], AttributeValue]]] = []
+    for name, field_info in model_cls.model_fields.items():
+        if field_info.exclude:
+            continue
+        encoder = encode_value
+        for (owner, field_name), field_encoder in _FIELD_ENCODERS.items():
+            if field_name == name and issubclass(model_cls, owner):
+                encoder = field_encoder
+        fields.append((name, encoder))
+
+    # Computed fields of the models are constants per class
+    constants: Item = {}
+    for name in model_cls.model_computed_fields:
+        constants[name] = encode_value(getattr(model_cls, name).fget(None))
+    return tuple(fields), constants
+
+
+def serialize_model(model: BaseModel) -> Item:
+    """Serializes a model to a map of `AttributeValue`s in one pass."""
+    fields, constants = field_plan(type(model))
+    values = model.__dict__
+    item = {name: encoder(values[name]) for name, encoder in fields}
+    item.update(constants)
+    return item
+
+
+def _encode_compact_parts(parts: Tuple[Tuple[Any, ...], ...]) -> AttributeValue:
+    return {
+        "L": [
+            {"M": {name: encode_value(v) for name, v in zip(PART_FIELDS, part)}}
+            for part in parts
+        ]
+    }
+
+
+def serialize_compact_record(record: CompactRecord) -> Item:
+    """Serializes a compact record's fields like `serialize_model`."""
+    item = {
+        name: (_encode_compact_parts(value) if name == "parts" else encode_value(value))
+        for name, value in record.items()
+    }
+    item["record_type"] = {"S": record.record_type}
+    return item
+
+
+def serialize_record(record_id: str, record: Record) -> Item:
+    """
+    Serializes a record to a low-level DynamoDB item keyed by its `id`.
+
+    Produces the same attributes as `TypeSerializer` over
+    `{"id": ..., **model_dump()}` without building the intermediate dicts or
+    `Decimal`s, plus the `thread` key of the thread index.
+
+    Args:
+        record_id (str): The record's id.
+        record (Record): The validated record, compact or a model.
+
+    Returns:
+        Item: The item as a map of `AttributeValue`s.
+    """
+    if isinstance(record, CompactRecord):
+        item = serialize_compact_record(record)
+    else:
+        item = serialize_model(record)
+    item["id"] = {"S": record_id}
+    item[THREAD_ATTRIBUTE] = {"S": thread_key(record.address, record_id)}
+    return item
+
+
+def deserialize_value(value: AttributeValue) -> Any:
+    """Decodes a low-level `AttributeValue` into a plain python value."""
+    ((type_key, data),) = value.items()
+    match type_key:
+        case "S":
+            return data
+        case "N":
+            return float(data) if "." in data or "e" in data.lower() else int(data)
+        case "BOOL":
+            return data
+        case "NULL":
+            return None
+        case "M":
+            return {k: deserialize_value(v) for k, v in data.items()}
+        case "L":
+            return [deserialize_value(v) for v in data]
+        case "B":
+            if bytes(data[:1]) == COMPRESSION_MARKER:
+                return deserialize_value(decompress_value(bytes(data)))
+            return data
+        case "SS" | "BS":
+            return set(data)
+        case "NS":
+            return {deserialize_value({"N": v}) for v in data}
+        case _:
+            raise TypeError(f"Unsupported AttributeValue type {type_key}")
+
+
+def deserialize_item(item: Item) -> Dict[str, Any]:
+    """Decodes a low-level DynamoDB item into a plain python dict."""
+    return {k: deserialize_value(v) for k, v in item.items()}
+
+
+def compress_value(value: AttributeValue, codec: bytes = ZSTD_CODEC) -> bytes:
+    """
+    Compresses an `AttributeValue` into marked binary.
+
+    Args:
+        value (AttributeValue): The value, without binary members.
+        codec (bytes): `ZSTD_CODEC` or `ZLIB_CODEC`.
+
+    Returns:
+        bytes: The marker, the codec and the compressed JSON of the value.
+    """
+    data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    if codec == ZLIB_CODEC:
+        return COMPRESSION_MARKER + ZLIB_CODEC + zlib.compress(data)
+    if codec == ZSTD_CODEC:
+        return COMPRESSION_MARKER + ZSTD_CODEC + zstandard.compress(data)
+    raise ValueError(f"Unknown compression codec {codec!r}")
+
+
+def decompress_value(data: bytes) -> AttributeValue:
+    """Decompresses a value compressed by `compress_value`."""
+    codec, payload = data[1:2], data[2:]
+    if codec == ZLIB_CODEC:
+        return json.loads(zlib.decompress(payload))
+    if codec == ZSTD_CODEC:
+        return json.loads(zstandard.decompress(payload))
+    raise ValueError(f"Unknown compression codec {codec!r}")
+
+
+def value_size(value: AttributeValue) -> int:
+    """Estimates the stored size of an `AttributeValue` as DynamoDB counts it."""
+    ((type_key, data),) = value.items()
+    match type_key:
+        case "S":
+            return len(data.encode("utf-8"))
+        case "N":
+            return len(data) // 2 + 1
+        case "B":
+            return len(data)
+        case "M":
+            return 3 + sum(len(k) + value_size(v) + 1 for k, v in data.items())
+        case "L":
+            return 3 + sum(value_size(v) + 1 for v in data)
+        case "SS" | "BS" | "NS":
+            return sum(len(v) for v in data)
+    return 1
+
+
+def item_size(item: Item) -> int:
+    """Estimates the stored size of an item."""
+    return sum(len(k.encode("utf-8")) + value_size(v) for k, v in item.items())
+
+
+def compress_item(item: Item, threshold: int = COMPRESSION_THRESHOLD_BYTES) -> Item:
+    """
+    Returns the item with its large text attributes compressed.
+
+    Only `COMPRESSIBLE_ATTRIBUTES` larger than `threshold` are compressed,
+    and only when that makes them smaller; the item itself is returned if
+    none is.  `deserialize_item` decompresses them transparently.
+    """
+    compressed = item
+    for name in COMPRESSIBLE_ATTRIBUTES:
+        value = item.get(name)
+        if value is None or value_size(value) <= threshold:
+            continue
+        data = compress_value(value)
+        if len(data) < value_size(value):
+            if compressed is item:
+                compressed = dict(item)
+            compressed[name] = {"B": data}
+    return compressed
+
+
+def spill_key(item: Item) -> str:
+    """Returns the S3 key a spilled item is stored at."""
+    return f"{SPILL_PREFIX}/{item['id']['S']}/{item['timestamp']['S']}.json.gz"
+
+
+def spill_item(s3_client: Any, bucket_name: str, item: Item) -> Item:
+    """
+    Stores an (uncompressed) item in S3 and returns its placeholder.
+
+    The placeholder keeps the key, index and digest attributes so the item
+    is still found by queries and diffs, and points to the stored item.
+    """
+    key = spill_key(item)
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=key,
+        Body=gzip.compress(json.dumps(item, separators=(",", ":")).encode("utf-8")),
+        ContentType="application/json",
+        ContentEncoding="gzip",
+    )
+    placeholder = {
+        name: value for name, value in item.items() if name in _SPILL_KEPT_ATTRIBUTES
+    }
+    placeholder[SPILL_ATTRIBUTE] = {
+        "M": {"bucket": {"S": bucket_name}, "key": {"S": key}}
+    }
+    return placeholder
+
+
+def load_spilled_item(s3_client: Any, item: Item) -> Item:
+    """Returns the full item of a spilled placeholder, other items as is."""
+    if SPILL_ATTRIBUTE not in item:
+        return item
+    pointer = item[SPILL_ATTRIBUTE]["M"]
+    response = s3_client.get_object(
+        Bucket=pointer["bucket"]["S"], Key=pointer["key"]["S"]
+    )
+    body = response["Body"].read()
+    # S3 clients may already have undone the gzip content encoding
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    return json.loads(body)
@@ -1,85 +1,50 @@
-import os
-import re
-from collections import Counter
-from itertools import batched
+import json
 
-import boto3
 from aws_lambda_powertools import Logger, Metrics, Tracer
-from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.batch import (
+    BatchProcessor,
+    EventType,
+    process_partial_response,
+)
 from aws_lambda_powertools.utilities.data_classes import (
     S3EventBridgeNotificationEvent,
     event_source,
 )
+from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from mypy_boto3_dynamodb.service_resource import DynamoDBServiceResource
-from mypy_boto3_s3 import S3Client
-from mypy_boto3_s3.service_resource import S3ServiceResource
 
-from backup_processor import BackupRestoreProcessor
+from processing import (
+    ENV,
+    idempotency_config,
+    process_backup_object,
+    publish_cache_metrics,
+)
+from restore import RESTORE_PREFIX
 
 # Initialize AWS Lambda Powertools components
 tracer = Tracer()
 logger = Logger()
 metrics = Metrics(namespace="sms-backup-restore")
 
-# Initialize AWS clients
-s3_client: S3Client = boto3.client("s3")
-s3_resource: S3ServiceResource = boto3.resource("s3")
-dynamodb_resource: DynamoDBServiceResource = boto3.resource("dynamodb")
-
-DYNAMODB_TABLE = os.environ.get("DYNAMODB_TABLE", "sms-backup-restore")
-ENV = os.environ.get("ENV", "prod")
 
-
-def process_s3_backup(event: S3EventBridgeNotificationEvent):
+def process_s3_backup(event: S3EventBridgeNotificationEvent) -> None:
     """Process S3 backup event"""
 
     bucket_name = event.detail.bucket.name
     object_key = event.detail.object.key
-    backup_type_patt = re.compile(r"\b(calls|sms)\b")
-    backup_type = backup_type_patt.search(object_key).group(0)
-
-    logger.info(f"Received event for object: {object_key} in {bucket_name}")
-
-    metrics.add_metric(name="ProcessBackup", unit=MetricUnit.Count, value=1)
-    metrics.add_metric(name=backup_type, unit=MetricUnit.Count, value=1)
-
-    backup_processor = BackupRestoreProcessor(
-        s3_client=s3_client, s3_resource=s3_resource
-    )
-
-    logger.info(f"Processing s3://{bucket_name}/{object_key}")
-    backup_processor.tag_object(
-        bucket_name=bucket_name,
-        object_key=object_key,
-        tags={"processed": "STARTED"},
+    if object_key.startswith(f"{RESTORE_PREFIX}/"):
+        logger.info(f"Skipping restored backup s3://{bucket_name}/{object_key}")
+        return
+
+    result = process_backup_object(
+        backup={
+            "bucket": bucket_name,
+            "key": object_key,
+            "etag": event.detail.object.etag,
+            "size": event.detail.object.size,
+        }
     )
-    processed_backup = backup_processor.process_backup(
-        bucket_name=bucket_name, backup_key=object_key
-    )
-    logger.info(f"Processed backup located at s3://{bucket_name}/{object_key}")
-    records = {r["id"]: r for r in processed_backup}
-
-    logger.info(f"Writing {len(records)} records")
-    batches = list(batched(records.values(), 25))
-    for batch in batches:
-        put_requests = [{"PutRequest": {"Item": e}} for e in batch]
-        dynamodb_resource.batch_write_item(
-            RequestItems={"sms-backup-restore": put_requests}
-        )
-
-    tags = {"processed": "COMPLETE", "record_count": len(records)}
-    backup_processor.tag_object(
-        bucket_name=bucket_name, object_key=object_key, tags=tags
-    )
-
-    record_counts = Counter([r["record_type"] for _, r in records.items()])
-    for record_type, count in record_counts.items():
-        metrics.add_metric(
-            name=f"RecordType/{record_type}",
-            unit=MetricUnit.Count,
-            value=count,
-        )
+    logger.info(f"Backup s3://{bucket_name}/{object_key}: {result}")
 
 
 @tracer.capture_lambda_handler
@@ -89,5 +54,36 @@ def handler(event: S3EventBridgeNotificationEvent, context: LambdaContext) -> No
     """Lambda function to handle S3 events"""
 
     metrics.add_dimension(name="environment", value=ENV)
+    idempotency_config.register_lambda_context(context)
 
     process_s3_backup(event)
+    publish_cache_metrics()
+
+
+reprocess_batch_processor = BatchProcessor(event_type=EventType.SQS)
+
+
+@tracer.capture_method
+def reprocess_record_handler(record: SQSRecord) -> None:
+    """Processes one backup enqueued by a reprocessing run."""
+    backup = json.loads(record.body)
+    result = process_backup_object(backup=backup)
+    logger.info(f"Reprocessed s3://{backup['bucket']}/{backup['key']}: {result}")
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def reprocess_handler(event: dict, context: LambdaContext) -> dict:
+    """Lambda function to process backups from the reprocessing queue"""
+
+    metrics.add_dimension(name="environment", value=ENV)
+    idempotency_config.register_lambda_context(context)
+
+    response = process_partial_response(
+        event=event,
+        record_handler=reprocess_record_handler,
+        processor=reprocess_batch_processor,
+        context=context,
+    )
+    publish_cache_metrics()
+    return response
@@ -0,0 +1,41 @@
+import os
+
+import boto3
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3 import S3Client
+
+from part_packs import collect_orphaned_packs
+
+# Initialize AWS Lambda Powertools components
+tracer = Tracer()
+logger = Logger()
+metrics = Metrics(namespace="sms-backup-restore")
+
+# Initialize AWS clients
+s3_client: S3Client = boto3.client("s3")
+dynamodb_client: DynamoDBClient = boto3.client("dynamodb")
+
+PART_INDEX_TABLE = os.environ.get("PART_INDEX_TABLE", "sms-backup-restore-part-index")
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "sms-backup-restore")
+ENV = os.environ.get("ENV", "prod")
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> dict:
+    """
+    Lambda function to delete orphaned attachment packs, run on a schedule.
+    """
+
+    metrics.add_dimension(name="environment", value=ENV)
+
+    deleted = collect_orphaned_packs(
+        s3_client, dynamodb_client, PART_INDEX_TABLE, BUCKET_NAME
+    )
+    metrics.add_metric(
+        name="OrphanedPacksDeleted", unit=MetricUnit.Count, value=deleted
+    )
+    return {"deleted": deleted}
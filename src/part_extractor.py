@@ -0,0 +1,229 @@
+import binascii
+import io
+import re
+import tempfile
+from hashlib import sha256
+from typing import BinaryIO, Dict, Optional
+
+# Stands in for the data of an extracted part, followed by its SHA-256 hash;
+# ":" is not a base64 character, so no part data starts with it
+EXTRACTED_PART_PREFIX = "extracted:"
+# Part data up to this many base64 bytes is left for the parser, larger data
+# is never packed (see MAX_PACKED_PART_BYTES) and is diverted
+EXTRACT_MIN_BASE64_BYTES = 1024 * 1024
+# Decoded bytes of a part kept in memory before it spills to a file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+READ_CHUNK_BYTES = 256 * 1024
+
+_PART_TAG = b"<part"
+_TAG_NAME_END = b" \t\r\n/>"
+_TAG_DELIMITER = re.compile(rb'[">]')
+_DATA_ATTRIBUTE = re.compile(rb"(?:^|\s)data\s*=\s*$")
+_WHITESPACE = b" \t\r\n"
+# Bytes of a tag kept to recognize an attribute name split across reads
+_MAX_ATTRIBUTE_TEXT = 32
+
+_TEXT, _TAG, _VALUE, _DATA = range(4)
+
+
+class ExtractedPart:
+    """
+    An MMS part's data, decoded and hashed as it is diverted from a backup.
+
+    Args:
+        tmp_dir (Optional[str]): Directory the data spills to.
+    """
+
+    def __init__(self, tmp_dir: Optional[str] = None) -> None:
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, dir=tmp_dir)
+        self.size = 0
+        self.sha256: Optional[str] = None
+        # Set once the part is stored, after which its data is discarded
+        self.stored = False
+        self._hash = sha256()
+        self._pending = b""
+
+    def write_base64(self, data: bytes) -> None:
+        """Decodes base64 data, keeping a partial quantum for the next write."""
+        data = self._pending + data.translate(None, _WHITESPACE)
+        end = len(data) - len(data) % 4
+        self._pending = data[end:]
+        self._write(binascii.a2b_base64(data[:end]))
+
+    def finish(self) -> str:
+        """Decodes the rest of the data and returns its SHA-256 hash."""
+        if self._pending:
+            # Raises on missing padding, as decoding the whole value does
+            self._write(binascii.a2b_base64(self._pending))
+            self._pending = b""
+        self.sha256 = self._hash.hexdigest()
+        return self.sha256
+
+    def _write(self, decoded: bytes) -> None:
+        self._hash.update(decoded)
+        self.file.write(decoded)
+        self.size += len(decoded)
+
+
+class PartDataExtractor(io.RawIOBase):
+    """
+    Diverts large MMS part data from a backup stream before it is parsed.
+
+    lxml materializes every attribute value as one string, and its buffers
+    hold the raw value too, so a 100 MB video costs several times that in
+    memory.  The raw bytes are scanned for the `data="..."` attribute of
+    `<part` elements; values longer than `min_base64_bytes` are decoded and
+    hashed as they stream through into an `ExtractedPart`, and the parser
+    reads `EXTRACTED_PART_PREFIX` followed by the hash in their place.
+    Memory then depends on `min_base64_bytes`, not on the attachment size.
+
+    Extracted parts are kept in `parts` by hash until the extractor is
+    closed.  Only double-quoted values are recognized, as the backup app
+    writes them.
+
+    Args:
+        raw (BinaryIO): The backup stream, which is not closed.
+        min_base64_bytes (int): Longest part data left for the parser.
+        chunk_size (int): Bytes read from `raw` at a time.
+        tmp_dir (Optional[str]): Directory extracted parts spill to.
+    """
+
+    def __init__(
+        self,
+        raw: BinaryIO,
+        min_base64_bytes: int = EXTRACT_MIN_BASE64_BYTES,
+        chunk_size: int = READ_CHUNK_BYTES,
+        tmp_dir: Optional[str] = None,
+    ) -> None:
+        super().__init__()
+        self._raw = raw
+        self._min_base64_bytes = min_base64_bytes
+        self._chunk_size = chunk_size
+        self._tmp_dir = tmp_dir
+        self._state = _TEXT
+        self._unscanned = b""
+        self._output = bytearray()
+        # Tag bytes since the last attribute value
+        self._attribute_text = b""
+        # Part data held until it is known to be long enough to extract
+        self._data = bytearray()
+        self._part: Optional[ExtractedPart] = None
+        self._eof = False
+        self.parts: Dict[str, ExtractedPart] = {}
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: bytearray) -> int:
+        while not self._output and not self._eof:
+            chunk = self._raw.read(self._chunk_size)
+            self._eof = not chunk
+            self._scan(self._unscanned + chunk)
+        size = min(len(buffer), len(self._output))
+        buffer[:size] = self._output[:size]
+        del self._output[:size]
+        return size
+
+    def close(self) -> None:
+        for part in self.parts.values():
+            part.file.close()
+        if self._part is not None:
+            self._part.file.close()
+        super().close()
+
+    def _scan(self, data: bytes) -> None:
+        """Moves scanned bytes to the output, keeping an undecided tail."""
+        self._unscanned = b""
+        while data:
+            if self._state == _TEXT:
+                data = self._scan_text(data)
+            elif self._state == _TAG:
+                data = self._scan_tag(data)
+            elif self._state == _VALUE:
+                data = self._scan_value(data)
+            else:
+                data = self._scan_data(data)
+        if self._eof:
+            # A truncated backup ends inside part data, left for the parser
+            # to recover from
+            self._output += self._unscanned + self._data
+            self._unscanned = b""
+            self._data.clear()
+
+    def _scan_text(self, data: bytes) -> bytes:
+        start = data.find(_PART_TAG)
+        if start == -1:
+            # Keeps what may be the start of a part tag
+            end = len(data) if self._eof else max(len(data) - len(_PART_TAG), 0)
+            self._output += data[:end]
+            self._unscanned = data[end:]
+            return b""
+        name_end = start + len(_PART_TAG)
+        if name_end == len(data) and not self._eof:
+            self._output += data[:start]
+            self._unscanned = data[start:]
+            return b""
+        self._output += data[:name_end]
+        # `<parts>` is not a part element
+        if name_end < len(data) and data[name_end] in _TAG_NAME_END:
+            self._state = _TAG
+            self._attribute_text = b""
+        return data[name_end:]
+
+    def _scan_tag(self, data: bytes) -> bytes:
+        match = _TAG_DELIMITER.search(data)
+        if match is None:
+            self._output += data
+            self._attribute_text = (self._attribute_text + data)[-_MAX_ATTRIBUTE_TEXT:]
+            return b""
+        end = match.end()
+        self._output += data[:end]
+        if match.group() == b">":
+            self._state = _TEXT
+        elif _DATA_ATTRIBUTE.search(
+            (self._attribute_text + data[: end - 1])[-_MAX_ATTRIBUTE_TEXT:]
+        ):
+            self._state = _DATA
+        else:
+            self._state = _VALUE
+        return data[end:]
+
+    def _scan_value(self, data: bytes) -> bytes:
+        end = data.find(b'"')
+        if end == -1:
+            self._output += data
+            return b""
+        self._output += data[: end + 1]
+        self._state = _TAG
+        self._attribute_text = b""
+        return data[end + 1 :]
+
+    def _scan_data(self, data: bytes) -> bytes:
+        end = data.find(b'"')
+        value = data if end == -1 else data[:end]
+        if self._part is not None:
+            self._part.write_base64(value)
+        else:
+            self._data += value
+            if len(self._data) > self._min_base64_bytes:
+                self._part = ExtractedPart(self._tmp_dir)
+                self._part.write_base64(bytes(self._data))
+                self._data.clear()
+        if end == -1:
+            return b""
+
+        if self._part is not None:
+            part_hash = self._part.finish()
+            if part_hash in self.parts:
+                self._part.file.close()
+            else:
+                self.parts[part_hash] = self._part
+            self._output += f"{EXTRACTED_PART_PREFIX}{part_hash}".encode()
+            self._part = None
+        else:
+            self._output += self._data
+            self._data.clear()
+        self._output += b'"'
+        self._state = _TAG
+        self._attribute_text = b""
+        return data[end + 1 :]
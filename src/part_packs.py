@@ -0,0 +1,344 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from itertools import batched
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aws_lambda_powertools import Logger
+from botocore.exceptions import ClientError
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3.client import S3Client
+
+from batch_requests import batch_get_items, batch_write_items
+from shared_cache import SharedSetCache, part_namespace
+from warm_cache import TTLCache
+
+logger = Logger()
+
+PACK_PREFIX = "packs"
+PACK_SUFFIX = ".pack"
+PART_PREFIX = "parts"
+# Parts up to this size are packed, larger ones stay standalone objects
+MAX_PACKED_PART_BYTES = 256 * 1024
+MAX_PACK_BYTES = 32 * 1024 * 1024
+BATCH_GET_ITEM_MAX_KEYS = 100
+BATCH_WRITE_ITEM_MAX_ITEMS = 25
+DELETE_OBJECTS_MAX_KEYS = 1000
+# Concurrent HEAD requests for parts that may be stored standalone
+STANDALONE_HEAD_WORKERS = 16
+# Packs younger than this may still be waiting for their index items
+PACK_GC_MIN_AGE = timedelta(days=1)
+
+
+def part_index_key(part_hash: str) -> Dict[str, Dict[str, str]]:
+    """Returns the primary key of a part's pack index item."""
+    return {"part": {"S": part_hash}}
+
+
+class PartPacker:
+    """
+    Appends small MMS parts to pack objects instead of one object per part.
+
+    Parts are buffered in memory and written as `packs/{id}.pack` once
+    `max_pack_bytes` are buffered or on `flush`.  Each packed part gets an
+    item in the `index_table` (keyed by its SHA-256 hash) holding its pack
+    key, offset and length, written after the pack so readers never find a
+    part before its bytes.  Records keep referencing parts by content hash
+    only, so their content digests do not depend on where a part was stored.
+    Parts already indexed by an earlier run, or stored standalone under
+    `parts/` before packing was enabled, are not packed again; with
+    `known_parts`, parts
+    stored by earlier invocations of a warm container are not even looked
+    up, and with a `shared_cache`, neither are parts other workers stored.
+
+    Args:
+        s3_client (S3Client): S3 client for the packs.
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        index_table (str): Table holding the pack index items.
+        bucket_name (str): Bucket the packs are stored in.
+        max_part_bytes (int): Largest part that is packed.
+        max_pack_bytes (int): Size at which a pack is written.
+        known_parts (Optional[TTLCache]): Cache of `(bucket, sha256)` of
+            parts already stored.
+        shared_cache (Optional[SharedSetCache]): Cache of the parts stored
+            by concurrent workers.
+    """
+
+    def __init__(
+        self,
+        s3_client: S3Client,
+        dynamodb_client: DynamoDBClient,
+        index_table: str,
+        bucket_name: str,
+        max_part_bytes: int = MAX_PACKED_PART_BYTES,
+        max_pack_bytes: int = MAX_PACK_BYTES,
+        known_parts: Optional[TTLCache] = None,
+        shared_cache: Optional[SharedSetCache] = None,
+    ) -> None:
+        self._s3_client = s3_client
+        self._dynamodb_client = dynamodb_client
+        self._index_table = index_table
+        self._bucket_name = bucket_name
+        self._max_part_bytes = max_part_bytes
+        self._max_pack_bytes = max_pack_bytes
+        self._known_parts = known_parts
+        self._shared_cache = shared_cache
+        self._parts: Dict[str, bytes] = {}
+        self._buffered = 0
+        self._seen: set = set()
+        self.packs_written = 0
+        self.parts_packed = 0
+
+    def add(self, data: bytes) -> Optional[str]:
+        """
+        Buffers a part for packing.
+
+        Returns:
+            Optional[str]: The part's SHA-256 hash, None if it is too large to
+                pack and must be stored standalone.
+        """
+        if len(data) > self._max_part_bytes:
+            return None
+        part_hash = sha256(data).hexdigest()
+        if part_hash in self._seen:
+            return part_hash
+        if (
+            self._known_parts is not None
+            and (self._bucket_name, part_hash) in self._known_parts
+        ):
+            self._seen.add(part_hash)
+            return part_hash
+        self._seen.add(part_hash)
+        self._parts[part_hash] = data
+        self._buffered += len(data)
+        if self._buffered >= self._max_pack_bytes:
+            self.flush()
+        return part_hash
+
+    def _indexed(self, part_hashes: List[str]) -> set:
+        """Returns the hashes that already have a pack index item."""
+        indexed = set()
+        for chunk in batched(part_hashes, BATCH_GET_ITEM_MAX_KEYS):
+            request_items = {
+                self._index_table: {
+                    "Keys": [part_index_key(h) for h in chunk],
+                    "ProjectionExpression": "part",
+                }
+            }
+            for responses in batch_get_items(self._dynamodb_client, request_items):
+                indexed.update(
+                    item["part"]["S"] for item in responses.get(self._index_table, [])
+                )
+        return indexed
+
+    def _stored_standalone(self, parts: Dict[str, bytes]) -> set:
+        """
+        Returns the hashes of the parts already stored under `parts/`.
+
+        Only parts no cache or index item accounts for are checked, with
+        concurrent HEAD requests.
+        """
+
+        def stored(part: Tuple[str, bytes]) -> bool:
+            part_hash, data = part
+            try:
+                response = self._s3_client.head_object(
+                    Bucket=self._bucket_name, Key=f"{PART_PREFIX}/{part_hash}"
+                )
+            except ClientError:
+                return False
+            # Earlier versions stored empty objects for parts
+            return response["ContentLength"] == len(data)
+
+        if not parts:
+            return set()
+        with ThreadPoolExecutor(
+            max_workers=min(len(parts), STANDALONE_HEAD_WORKERS)
+        ) as executor:
+            found = executor.map(stored, parts.items())
+            return {part_hash for part_hash, s in zip(parts, found) if s}
+
+    def _write_index(self, items: List[Dict]) -> None:
+        for chunk in batched(items, BATCH_WRITE_ITEM_MAX_ITEMS):
+            batch_write_items(
+                self._dynamodb_client,
+                {self._index_table: [{"PutRequest": {"Item": item}} for item in chunk]},
+            )
+
+    def _remember(self, part_hashes: Iterable[str], share: bool = True) -> None:
+        part_hashes = list(part_hashes)
+        if self._known_parts is not None:
+            for part_hash in part_hashes:
+                self._known_parts.put((self._bucket_name, part_hash))
+        if share and self._shared_cache is not None and part_hashes:
+            self._shared_cache.add(part_namespace(self._bucket_name), part_hashes)
+
+    def _shared(self, part_hashes: List[str]) -> set:
+        """Returns the hashes concurrent workers already stored."""
+        if self._shared_cache is None:
+            return set()
+        found = self._shared_cache.contains(
+            part_namespace(self._bucket_name), part_hashes
+        )
+        return {h for h, stored in zip(part_hashes, found) if stored}
+
+    def flush(self) -> Optional[str]:
+        """Writes the buffered parts as a pack, returning its key."""
+        parts, self._parts, self._buffered = self._parts, {}, 0
+        if not parts:
+            return None
+        shared = self._shared(list(parts))
+        self._remember(shared, share=False)
+        indexed = self._indexed([h for h in parts if h not in shared])
+        self._remember(indexed)
+        parts = {
+            h: data for h, data in parts.items() if h not in indexed and h not in shared
+        }
+        standalone = self._stored_standalone(parts)
+        self._remember(standalone)
+        parts = {h: data for h, data in parts.items() if h not in standalone}
+        if not parts:
+            return None
+
+        key = f"{PACK_PREFIX}/{uuid.uuid4().hex}{PACK_SUFFIX}"
+        offset = 0
+        index_items = []
+        for part_hash, data in parts.items():
+            index_items.append(
+                {
+                    **part_index_key(part_hash),
+                    "pack": {"S": key},
+                    "offset": {"N": str(offset)},
+                    "length": {"N": str(len(data))},
+                }
+            )
+            offset += len(data)
+        self._s3_client.put_object(
+            Bucket=self._bucket_name, Key=key, Body=b"".join(parts.values())
+        )
+        self._write_index(index_items)
+        self._remember(parts)
+        self.packs_written += 1
+        self.parts_packed += len(parts)
+        logger.info(f"Packed {len(parts)} parts ({offset} bytes) into {key}")
+        return key
+
+
+class PartReader:
+    """
+    Reads MMS part bodies stored standalone or in packs.
+
+    Packed parts are located with their index items, looked up in batches,
+    and read with ranged GETs; other parts are read from `parts/{sha256}`.
+    Without an `index_table`, all parts are read from `parts/`.
+
+    Args:
+        s3_client (S3Client): S3 client for the parts.
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        index_table (Optional[str]): Table holding the pack index items.
+        bucket_name (str): Bucket the parts are stored in.
+    """
+
+    def __init__(
+        self,
+        s3_client: S3Client,
+        dynamodb_client: DynamoDBClient,
+        index_table: Optional[str],
+        bucket_name: str,
+    ) -> None:
+        self._s3_client = s3_client
+        self._dynamodb_client = dynamodb_client
+        self._index_table = index_table
+        self._bucket_name = bucket_name
+
+    def locate(self, part_hashes: List[str]) -> Dict[str, Tuple[str, int, int]]:
+        """Returns the (pack key, offset, length) of the packed parts."""
+        locations = {}
+        if self._index_table is None:
+            return locations
+        for chunk in batched(dict.fromkeys(part_hashes), BATCH_GET_ITEM_MAX_KEYS):
+            request_items = {
+                self._index_table: {"Keys": [part_index_key(h) for h in chunk]}
+            }
+            for responses in batch_get_items(self._dynamodb_client, request_items):
+                for item in responses.get(self._index_table, []):
+                    locations[item["part"]["S"]] = (
+                        item["pack"]["S"],
+                        int(item["offset"]["N"]),
+                        int(item["length"]["N"]),
+                    )
+        return locations
+
+    def read(
+        self, part_hash: str, location: Optional[Tuple[str, int, int]] = None
+    ) -> Optional[bytes]:
+        """Reads a part body, None if it is missing."""
+        if location is not None:
+            key, offset, length = location
+            kwargs = {"Range": f"bytes={offset}-{offset + length - 1}"}
+        else:
+            key, kwargs = f"{PART_PREFIX}/{part_hash}", {}
+        try:
+            response = self._s3_client.get_object(
+                Bucket=self._bucket_name, Key=key, **kwargs
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            logger.warning(f"Attachment {part_hash} is missing from {key}")
+            return None
+        return response["Body"].read()
+
+
+def collect_orphaned_packs(
+    s3_client: S3Client,
+    dynamodb_client: DynamoDBClient,
+    index_table: str,
+    bucket_name: str,
+    min_age: timedelta = PACK_GC_MIN_AGE,
+    now: Optional[datetime] = None,
+) -> int:
+    """
+    Deletes the packs no index item points to.
+
+    A pack is orphaned when a flush failed before writing its index items,
+    or when every part in it was also packed by a concurrent worker whose
+    index items replaced its own.  Packs younger than `min_age` are kept, as
+    their flush may still be writing their index items.
+
+    Args:
+        s3_client (S3Client): S3 client for the packs.
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        index_table (str): Table holding the pack index items.
+        bucket_name (str): Bucket the packs are stored in.
+        min_age (timedelta): Age below which packs are kept.
+        now (Optional[datetime]): Current time, defaults to the clock.
+
+    Returns:
+        int: The number of packs deleted.
+    """
+    referenced = set()
+    pages = dynamodb_client.get_paginator("scan").paginate(
+        TableName=index_table, ProjectionExpression="pack"
+    )
+    for page in pages:
+        referenced.update(item["pack"]["S"] for item in page["Items"])
+    cutoff = (now or datetime.now(timezone.utc)) - min_age
+    orphaned = [
+        obj["Key"]
+        for page in s3_client.get_paginator("list_objects_v2").paginate(
+            Bucket=bucket_name, Prefix=f"{PACK_PREFIX}/"
+        )
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(PACK_SUFFIX)
+        and obj["Key"] not in referenced
+        and obj["LastModified"] < cutoff
+    ]
+    for chunk in batched(orphaned, DELETE_OBJECTS_MAX_KEYS):
+        s3_client.delete_objects(
+            Bucket=bucket_name,
+            Delete={"Objects": [{"Key": key} for key in chunk], "Quiet": True},
+        )
+    logger.info(f"Deleted {len(orphaned)} orphaned packs")
+    return len(orphaned)
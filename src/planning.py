@@ -0,0 +1,279 @@
+import re
+from typing import Dict, NamedTuple, Optional
+
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3 import S3Client
+
+# How records are validated: on the parsing thread or on the validation pool
+INLINE = "inline"
+PARALLEL = "parallel"
+# Direct DynamoDB writes are handed to the writer functions instead
+FANOUT = "fanout"
+
+THROUGHPUT_PREFIX = "throughput#"
+# Bytes read from the start of a backup to find its root element's count
+ROOT_PREFIX_BYTES = 4096
+ROOT_COUNT_PATTERN = re.compile(rb"<(?:smses|calls)\b[^>]*?\bcount=\"(\d+)\"")
+# Conservative rates assumed until a validation mode has history
+DEFAULT_RECORDS_PER_SECOND = {INLINE: 2000.0, PARALLEL: 6000.0}
+DEFAULT_BYTES_PER_SECOND = {INLINE: 10e6, PARALLEL: 30e6}
+# Weight of the latest run in the moving averages
+HISTORY_WEIGHT = 0.3
+# Backups with fewer records are validated inline, as the pool's pipes
+# cost more than they save
+PARALLEL_MIN_RECORDS = 5000
+# Share of the remaining time a plan may use
+BUDGET_FRACTION = 0.8
+
+
+class BackupTooLargeError(Exception):
+    """Raised for a backup whose parsing alone is not expected to fit the budget."""
+
+
+class BackupSize(NamedTuple):
+    """A backup's record count from its root element and its size in bytes."""
+
+    record_count: Optional[int]
+    size_bytes: Optional[int]
+
+
+class Throughput(NamedTuple):
+    """Parsing and validation rates of one validation mode."""
+
+    records_per_second: float
+    bytes_per_second: float
+
+
+class ExecutionPlan(NamedTuple):
+    """
+    How a backup is processed, chosen before processing starts.
+
+    Args:
+        size (BackupSize): The backup's record count and size.
+        validation (str): `INLINE` or `PARALLEL`.
+        fan_out (bool): Whether direct DynamoDB writes go to the fan-out
+            queue instead.
+        parse_seconds (Optional[float]): Estimated parsing time, None for a
+            backup of unknown size.
+        estimated_seconds (Optional[float]): Estimated parsing and writing
+            time, None for a backup of unknown size.
+        budget_seconds (float): Time the plan may use.
+    """
+
+    size: BackupSize
+    validation: str
+    fan_out: bool
+    parse_seconds: Optional[float]
+    estimated_seconds: Optional[float]
+    budget_seconds: float
+
+    @property
+    def strategy(self) -> str:
+        return FANOUT if self.fan_out else self.validation
+
+    @property
+    def fits(self) -> bool:
+        """Whether the backup is expected to be processed within the budget."""
+        return (
+            self.estimated_seconds is None
+            or self.estimated_seconds <= self.budget_seconds
+        )
+
+    @property
+    def parse_fits(self) -> bool:
+        """
+        Whether the backup is expected to be parsed within the budget.
+
+        Retries parse a backup from its start, so one that does not is never
+        processed.
+        """
+        return self.parse_seconds is None or self.parse_seconds <= self.budget_seconds
+
+
+def read_backup_size(
+    s3_client: S3Client,
+    bucket_name: str,
+    object_key: str,
+    size_bytes: Optional[int] = None,
+) -> BackupSize:
+    """
+    Reads a backup's record count from the `count` attribute of its root.
+
+    Only the first `ROOT_PREFIX_BYTES` are fetched; the object's size comes
+    from the response when the caller does not know it.
+
+    Args:
+        s3_client (S3Client): S3 client.
+        bucket_name (str): Bucket the backup is stored in.
+        object_key (str): Key of the backup.
+        size_bytes (Optional[int]): Size of the object, e.g. from its event.
+
+    Returns:
+        BackupSize: The count, None if the root has none, and the size.
+    """
+    response = s3_client.get_object(
+        Bucket=bucket_name, Key=object_key, Range=f"bytes=0-{ROOT_PREFIX_BYTES - 1}"
+    )
+    prefix = response["Body"].read()
+    if size_bytes is None:
+        # "bytes 0-4095/<size>", absent when the object is not larger
+        content_range = response.get("ContentRange")
+        size_bytes = (
+            int(content_range.rsplit("/", 1)[1])
+            if content_range
+            else response["ContentLength"]
+        )
+    match = ROOT_COUNT_PATTERN.search(prefix)
+    return BackupSize(int(match.group(1)) if match else None, size_bytes)
+
+
+def estimate_seconds(size: BackupSize, throughput: Throughput) -> Optional[float]:
+    """Estimates parsing time from whichever of the counts is known."""
+    estimates = []
+    if size.record_count is not None:
+        estimates.append(size.record_count / throughput.records_per_second)
+    if size.size_bytes is not None:
+        estimates.append(size.size_bytes / throughput.bytes_per_second)
+    return max(estimates, default=None)
+
+
+def plan_execution(
+    size: BackupSize,
+    history: Dict[str, Throughput],
+    budget_seconds: float,
+    parallel: bool,
+    fan_out: bool,
+    write_units_per_second: Optional[float],
+) -> ExecutionPlan:
+    """
+    Chooses how to process a backup from its size and past throughput.
+
+    Small backups are validated inline and others on the validation pool.
+    When parsing and then writing at the table's write budget is not
+    expected to fit the budget, direct DynamoDB writes are handed to the
+    fan-out queue so only parsing has to.
+
+    Args:
+        size (BackupSize): The backup's record count and size.
+        history (Dict[str, Throughput]): Past throughput per validation mode.
+        budget_seconds (float): Time left for processing.
+        parallel (bool): Whether a validation pool is available.
+        fan_out (bool): Whether the fan-out queue is available.
+        write_units_per_second (Optional[float]): Write units/s of direct
+            DynamoDB writes, None if records are not written directly.
+
+    Returns:
+        ExecutionPlan: The chosen plan.
+    """
+    budget_seconds *= BUDGET_FRACTION
+    validation = (
+        PARALLEL
+        if parallel
+        and (size.record_count is None or size.record_count >= PARALLEL_MIN_RECORDS)
+        else INLINE
+    )
+    throughput = history.get(validation) or Throughput(
+        DEFAULT_RECORDS_PER_SECOND[validation], DEFAULT_BYTES_PER_SECOND[validation]
+    )
+    parse_seconds = estimate_seconds(size, throughput)
+    if parse_seconds is None:
+        return ExecutionPlan(size, validation, False, None, None, budget_seconds)
+
+    write_seconds = 0.0
+    if write_units_per_second and size.record_count is not None:
+        # One write unit per record, fewer when unchanged items are skipped
+        write_seconds = size.record_count / write_units_per_second
+    if fan_out and write_seconds and parse_seconds + write_seconds > budget_seconds:
+        return ExecutionPlan(
+            size, validation, True, parse_seconds, parse_seconds, budget_seconds
+        )
+    return ExecutionPlan(
+        size,
+        validation,
+        False,
+        parse_seconds,
+        parse_seconds + write_seconds,
+        budget_seconds,
+    )
+
+
+class ThroughputHistory:
+    """
+    Keeps moving averages of the parsing throughput of past backups.
+
+    The averages live in one item of the idempotency table, next to the
+    processing checkpoints, with one attribute per validation mode.
+
+    Args:
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        table_name (str): Table keyed by `id`.
+        weight (float): Weight of the latest backup in the averages.
+    """
+
+    def __init__(
+        self,
+        dynamodb_client: DynamoDBClient,
+        table_name: str,
+        weight: float = HISTORY_WEIGHT,
+    ) -> None:
+        self._dynamodb_client = dynamodb_client
+        self._table_name = table_name
+        self._weight = weight
+        self._key = {"id": {"S": f"{THROUGHPUT_PREFIX}processing"}}
+
+    def load(self) -> Dict[str, Throughput]:
+        """Returns the average throughput per validation mode with history."""
+        response = self._dynamodb_client.get_item(
+            TableName=self._table_name, Key=self._key
+        )
+        return {
+            validation: Throughput(
+                float(value["M"]["records_per_second"]["N"]),
+                float(value["M"]["bytes_per_second"]["N"]),
+            )
+            for validation, value in response.get("Item", {}).items()
+            if validation in (INLINE, PARALLEL)
+        }
+
+    def record(
+        self, validation: str, record_count: int, size_bytes: int, seconds: float
+    ) -> Throughput:
+        """
+        Folds the throughput of a processed backup into the average.
+
+        Concurrent updates may overwrite each other, losing one sample.
+
+        Args:
+            validation (str): Validation mode the backup was processed with.
+            record_count (int): Records parsed.
+            size_bytes (int): Bytes parsed.
+            seconds (float): Time parsing took.
+
+        Returns:
+            Throughput: The new average.
+        """
+        seconds = max(seconds, 1e-3)
+        latest = Throughput(record_count / seconds, size_bytes / seconds)
+        previous = self.load().get(validation)
+        if previous is not None:
+            latest = Throughput(
+                *(
+                    self._weight * new + (1 - self._weight) * old
+                    for new, old in zip(latest, previous)
+                )
+            )
+        self._dynamodb_client.update_item(
+            TableName=self._table_name,
+            Key=self._key,
+            UpdateExpression="SET #validation = :throughput",
+            ExpressionAttributeNames={"#validation": validation},
+            ExpressionAttributeValues={
+                ":throughput": {
+                    "M": {
+                        "records_per_second": {"N": str(latest.records_per_second)},
+                        "bytes_per_second": {"N": str(latest.bytes_per_second)},
+                    }
+                }
+            },
+        )
+        return latest
@@ -0,0 +1,522 @@
+import os
+import re
+import time
+from collections import Counter
+from itertools import batched, islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import boto3
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.idempotency import (
+    DynamoDBPersistenceLayer,
+    IdempotencyConfig,
+    idempotent_function,
+)
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3 import S3Client
+from mypy_boto3_s3.service_resource import S3ServiceResource
+
+from backup_processor import BackupRestoreProcessor
+from backup_sources import BackupSource
+from checkpoints import ProcessingCheckpoints, backup_object_id
+from compact_records import CompactRecord, Record
+from dedup import MAX_MEMORY_BYTES, RecordDeduplicator
+from io_engine import IO_ENGINE_THREADS, build_io_engine
+from part_packs import PartPacker
+from planning import (
+    PARALLEL,
+    BackupTooLargeError,
+    ExecutionPlan,
+    ThroughputHistory,
+    plan_execution,
+    read_backup_size,
+)
+from shared_cache import build_shared_cache
+from sinks import DynamoDBSink, RecordSink, SQSSink, build_sinks
+from validation_pool import build_validation_pool
+from warm_cache import cache_registry, part_hashes, record_digests
+
+# Initialize AWS Lambda Powertools components
+logger = Logger()
+metrics = Metrics(namespace="sms-backup-restore")
+
+# Initialize AWS clients
+s3_client: S3Client = boto3.client("s3")
+s3_resource: S3ServiceResource = boto3.resource("s3")
+dynamodb_client: DynamoDBClient = boto3.client("dynamodb")
+sqs_client = boto3.client("sqs")
+
+DYNAMODB_TABLE = os.environ.get("DYNAMODB_TABLE", "sms-backup-restore")
+ENV = os.environ.get("ENV", "prod")
+RECORD_SINKS = os.environ.get("RECORD_SINKS", "dynamodb")
+KAFKA_BOOTSTRAP_SERVERS = os.environ.get("KAFKA_BOOTSTRAP_SERVERS")
+KAFKA_TOPIC = os.environ.get("KAFKA_TOPIC", "sms-backup-restore-records")
+KAFKA_COMPRESSION_TYPE = os.environ.get("KAFKA_COMPRESSION_TYPE", "gzip")
+FANOUT_QUEUE_URL = os.environ.get("FANOUT_QUEUE_URL")
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "sms-backup-restore")
+SKIP_UNCHANGED = os.environ.get("SKIP_UNCHANGED", "true").lower() == "true"
+# Table of per-contact summaries updated from new records, unset to keep none
+CONTACT_SUMMARY_TABLE = os.environ.get("CONTACT_SUMMARY_TABLE")
+SEARCH_INDEX = os.environ.get("SEARCH_INDEX", "false").lower() == "true"
+MAX_WRITE_REQUEST_UNITS = float(os.environ.get("MAX_WRITE_REQUEST_UNITS", "1000"))
+# Time assumed available for planning outside of a Lambda invocation
+LAMBDA_TIMEOUT_SECONDS = 15 * 60
+# `asyncio` multiplexes attachment uploads and DynamoDB writes on one event loop
+IO_ENGINE = os.environ.get("IO_ENGINE", IO_ENGINE_THREADS)
+# Small MMS attachments are appended to pack objects rather than stored alone
+PACK_PARTS = os.environ.get("PACK_PARTS", "true").lower() == "true"
+# Table locating packed attachments, required for packing
+PART_INDEX_TABLE = os.environ.get("PART_INDEX_TABLE")
+# Processing is idempotent per object version when an idempotency table is set
+IDEMPOTENCY_TABLE = os.environ.get("IDEMPOTENCY_TABLE")
+IDEMPOTENCY_TTL_SECONDS = 30 * 24 * 60 * 60
+# Records written per sink between checkpoints
+CHECKPOINT_RECORDS = 5000
+# Records parsed before they are enqueued, ten SQS batches of 100 records
+STREAM_CHUNK_RECORDS = 1000
+# Estimated size of the unique records held in memory before sorted runs
+# are spilled to /tmp
+DEDUP_MEMORY_BYTES = (
+    int(os.environ.get("DEDUP_MEMORY_MB", str(MAX_MEMORY_BYTES // 1024 // 1024)))
+    * 1024
+    * 1024
+)
+# Ranged GETs issued ahead of the parser, 0 to read one sequential stream
+READAHEAD_CHUNKS = int(os.environ.get("READAHEAD_CHUNKS", "4"))
+# Memory budget of the caches kept across warm invocations, 0 disables them
+WARM_CACHE_MB = int(os.environ.get("WARM_CACHE_MB", "256"))
+# Worker processes validating records while the handler parses, 0 for none
+VALIDATION_WORKERS = int(os.environ.get("VALIDATION_WORKERS", "0"))
+# Cache of stored parts and records shared by concurrent workers, e.g.
+# redis://host:6379/0; unset to use only the warm container's caches
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL")
+
+cache_registry.resize(WARM_CACHE_MB * 1024 * 1024)
+shared_cache = build_shared_cache(SHARED_CACHE_URL)
+
+# Forked before the I/O engine starts its thread
+validation_pool = build_validation_pool(VALIDATION_WORKERS)
+io_engine = build_io_engine(IO_ENGINE)
+
+record_sinks = build_sinks(
+    sink_names=RECORD_SINKS,
+    dynamodb_client=dynamodb_client,
+    dynamodb_table=DYNAMODB_TABLE,
+    kafka_bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+    kafka_topic=KAFKA_TOPIC,
+    kafka_compression_type=KAFKA_COMPRESSION_TYPE,
+    skip_unchanged=SKIP_UNCHANGED,
+    max_write_request_units=MAX_WRITE_REQUEST_UNITS,
+    contact_summary_table=CONTACT_SUMMARY_TABLE,
+    search_index=SEARCH_INDEX,
+    sqs_client=sqs_client,
+    sqs_queue_url=FANOUT_QUEUE_URL,
+    s3_client=s3_client,
+    bucket_name=BUCKET_NAME,
+    io_engine=io_engine,
+    recent_digests=record_digests,
+    shared_cache=shared_cache,
+)
+
+idempotency_config = IdempotencyConfig(
+    # A reprocessing run's id is part of the key; other keys keep the hash
+    # of [bucket, key, etag]
+    event_key_jmespath="[bucket, key, etag, run][?@ != `null`]",
+    expires_after_seconds=IDEMPOTENCY_TTL_SECONDS,
+)
+checkpoints: Optional[ProcessingCheckpoints] = (
+    ProcessingCheckpoints(dynamodb_client, IDEMPOTENCY_TABLE)
+    if IDEMPOTENCY_TABLE
+    else None
+)
+throughput_history: Optional[ThroughputHistory] = (
+    ThroughputHistory(dynamodb_client, IDEMPOTENCY_TABLE) if IDEMPOTENCY_TABLE else None
+)
+_fanout_sinks: Optional[List[RecordSink]] = None
+
+
+def fanout_sinks() -> List[RecordSink]:
+    """Returns the record sinks with DynamoDB writes sent to the fan-out queue."""
+    global _fanout_sinks
+    if _fanout_sinks is None:
+        _fanout_sinks = build_sinks(
+            sink_names=SQSSink.name,
+            dynamodb_client=dynamodb_client,
+            dynamodb_table=DYNAMODB_TABLE,
+            sqs_client=sqs_client,
+            sqs_queue_url=FANOUT_QUEUE_URL,
+            s3_client=s3_client,
+            bucket_name=BUCKET_NAME,
+        ) + [sink for sink in record_sinks if sink.name != DynamoDBSink.name]
+    return _fanout_sinks
+
+
+def plan_backup(
+    bucket_name: str, object_key: str, size_bytes: Optional[int] = None
+) -> ExecutionPlan:
+    """
+    Plans the processing of a backup in the bucket before it starts.
+
+    The estimate and the chosen plan are emitted as metrics, and a backup
+    not expected to finish before the invocation times out is logged.
+
+    Raises:
+        BackupTooLargeError: If parsing the backup alone is not expected to
+            finish in time, as every retry would time out parsing it again.
+    """
+    size = read_backup_size(s3_client, bucket_name, object_key, size_bytes)
+    context = idempotency_config.lambda_context
+    budget_seconds = (
+        context.get_remaining_time_in_millis() / 1000
+        if context is not None
+        else LAMBDA_TIMEOUT_SECONDS
+    )
+    direct_writes = any(sink.name == DynamoDBSink.name for sink in record_sinks)
+    plan = plan_execution(
+        size,
+        throughput_history.load() if throughput_history is not None else {},
+        budget_seconds,
+        parallel=validation_pool is not None,
+        fan_out=bool(FANOUT_QUEUE_URL)
+        and not any(sink.name == SQSSink.name for sink in record_sinks),
+        write_units_per_second=MAX_WRITE_REQUEST_UNITS if direct_writes else None,
+    )
+    logger.info(
+        f"Planned s3://{bucket_name}/{object_key}: {size.record_count} records, "
+        f"{size.size_bytes} bytes, {plan.estimated_seconds} of "
+        f"{plan.budget_seconds:.0f} seconds, {plan.strategy}"
+    )
+    if size.record_count is not None:
+        metrics.add_metric(
+            name="EstimatedRecords", unit=MetricUnit.Count, value=size.record_count
+        )
+    if plan.estimated_seconds is not None:
+        metrics.add_metric(
+            name="EstimatedSeconds",
+            unit=MetricUnit.Seconds,
+            value=plan.estimated_seconds,
+        )
+    metrics.add_metric(
+        name=f"ExecutionPlan/{plan.strategy}", unit=MetricUnit.Count, value=1
+    )
+    if not plan.fits:
+        metrics.add_metric(name="PlanExceedsBudget", unit=MetricUnit.Count, value=1)
+    if not plan.parse_fits:
+        raise BackupTooLargeError(
+            f"Parsing s3://{bucket_name}/{object_key} is estimated to take "
+            f"{plan.parse_seconds:.0f} seconds, more than the "
+            f"{plan.budget_seconds:.0f} seconds it may use"
+        )
+    if not plan.fits:
+        logger.warning(
+            f"s3://{bucket_name}/{object_key} is not expected to finish in time, "
+            "a retry parses it again and resumes its writes from checkpoints"
+        )
+    return plan
+
+
+def publish_sink_metrics(sink: RecordSink, written: int, resumed: int) -> None:
+    """Adds the metrics of a sink that has written a backup's records."""
+    metrics.add_metric(
+        name=f"RecordsWritten/{sink.name}", unit=MetricUnit.Count, value=written
+    )
+    metrics.add_metric(
+        name=f"RecordsResumed/{sink.name}", unit=MetricUnit.Count, value=resumed
+    )
+    for metric_name, unit, value in sink.metrics():
+        metrics.add_metric(name=f"{metric_name}/{sink.name}", unit=unit, value=value)
+
+
+def record_throughput(
+    plan: Optional[ExecutionPlan], record_count: int, parse_seconds: float
+) -> None:
+    """
+    Adds a planned backup's parsing throughput to the history.
+
+    The rate is taken from the root's `count`, the records parsed, as the
+    records left after deduplication may be fewer; `record_count` is only
+    used for a backup whose root has none.
+    """
+    if plan is None or throughput_history is None:
+        return
+    throughput = throughput_history.record(
+        plan.validation,
+        (
+            plan.size.record_count
+            if plan.size.record_count is not None
+            else record_count
+        ),
+        plan.size.size_bytes,
+        parse_seconds,
+    )
+    metrics.add_metric(
+        name="ParseThroughput",
+        unit=MetricUnit.CountPerSecond,
+        value=throughput.records_per_second,
+    )
+
+
+def publish_parse_metrics(
+    backup_processor: BackupRestoreProcessor, part_packer: Optional[PartPacker]
+) -> None:
+    """Adds the metrics of reading a backup and storing its attachments."""
+    if backup_processor.read_bytes_per_second is not None:
+        metrics.add_metric(
+            name="BackupReadThroughput",
+            unit=MetricUnit.BytesPerSecond,
+            value=backup_processor.read_bytes_per_second,
+        )
+    if part_packer is not None:
+        metrics.add_metric(
+            name="PartsPacked", unit=MetricUnit.Count, value=part_packer.parts_packed
+        )
+        metrics.add_metric(
+            name="PartPacks", unit=MetricUnit.Count, value=part_packer.packs_written
+        )
+
+
+def write_records(
+    records: RecordDeduplicator,
+    object_id: str,
+    committed: Dict[str, int],
+    sinks: List[RecordSink],
+) -> None:
+    """
+    Writes records to every sink in checkpointed chunks.
+
+    Side outputs such as search segments are flushed once per sink when all
+    its chunks are written, not per chunk.
+
+    Args:
+        records (RecordDeduplicator): Unique records, in the same order on
+            every attempt.
+        object_id (str): Identifies the backup object version.
+        committed (Dict[str, int]): Records each sink committed in an earlier
+            attempt, which are skipped.
+        sinks (List[RecordSink]): Sinks the records are written to.
+    """
+    for sink in sinks:
+        start = committed.get(sink.name, 0)
+        if start:
+            logger.info(f"Resuming {sink.name} after {start} committed records")
+        written, end = 0, start
+        for chunk in batched(islice(records, start, None), CHECKPOINT_RECORDS):
+            written += sink.write(chunk)
+            end += len(chunk)
+            if checkpoints is not None:
+                checkpoints.commit(object_id, sink.name, end)
+        sink.flush()
+        publish_sink_metrics(sink, written, start)
+
+
+def stream_records(
+    records: Iterable[Tuple[str, Record]],
+    object_id: str,
+    committed: Dict[str, int],
+    sinks: List[RecordSink],
+) -> Counter:
+    """
+    Writes records to every sink in checkpointed chunks as they are parsed.
+
+    Each chunk is deduplicated by id and handed to the sinks as soon as it
+    fills, so enqueueing overlaps parsing.  Ids repeated across chunks are
+    written again, which the writers absorb as unchanged items.  Records are
+    parsed in the same order on every attempt, so chunks a sink committed in
+    an earlier attempt are skipped.  Records are counted by a
+    `RecordDeduplicator` of their ids, so a repeat is counted once however
+    far apart the chunks holding it are.
+
+    Args:
+        records (Iterable[Tuple[str, Record]]): Records in parsing order.
+        object_id (str): Identifies the backup object version.
+        committed (Dict[str, int]): Records each sink committed in an earlier
+            attempt, which are skipped.
+        sinks (List[RecordSink]): Sinks the records are written to.
+
+    Returns:
+        Counter: The unique records per record type.
+    """
+    for sink in sinks:
+        if committed.get(sink.name):
+            logger.info(f"Resuming {sink.name} after {committed[sink.name]} records")
+    written = Counter()
+    end = 0
+    with RecordDeduplicator(max_memory_bytes=DEDUP_MEMORY_BYTES) as record_ids:
+        for chunk in batched(records, STREAM_CHUNK_RECORDS):
+            unique = dict(chunk)
+            end += len(chunk)
+            # Only ids and types are kept for counting
+            record_ids.add(
+                CompactRecord(record_id, record.record_type, ())
+                for record_id, record in unique.items()
+            )
+            for sink in sinks:
+                if end <= committed.get(sink.name, 0):
+                    continue
+                written[sink.name] += sink.write(unique.items())
+                if checkpoints is not None:
+                    checkpoints.commit(object_id, sink.name, end)
+        for sink in sinks:
+            sink.flush()
+            publish_sink_metrics(sink, written[sink.name], committed.get(sink.name, 0))
+        return record_ids.record_counts()
+
+
+def process_backup_object(
+    backup: Dict[str, str], source: Optional[BackupSource] = None
+) -> Dict[str, Any]:
+    """
+    Processes one version of a backup object.
+
+    Args:
+        backup (Dict[str, str]): The object's `bucket`, `key` and `etag`,
+            and its file `name` when it is read from another `source`.  A
+            `run` id processes an object again within a reprocessing run.
+            Its `size`, when known, saves a request when planning.
+        source (Optional[BackupSource]): Source the backup is read by `key`
+            from, the S3 bucket if None; attachments are still stored in
+            the bucket.
+
+    Returns:
+        Dict[str, Any]: The number of records processed.
+    """
+    bucket_name, object_key = backup["bucket"], backup["key"]
+    object_id = backup_object_id(
+        bucket_name, object_key, backup["etag"], backup.get("run")
+    )
+
+    backup_type_patt = re.compile(r"\b(calls|sms)\b")
+    backup_type = backup_type_patt.search(backup.get("name", object_key)).group(0)
+
+    logger.info(f"Received event for object: {object_key} in {bucket_name}")
+
+    metrics.add_metric(name="ProcessBackup", unit=MetricUnit.Count, value=1)
+    metrics.add_metric(name=backup_type, unit=MetricUnit.Count, value=1)
+
+    part_packer = (
+        PartPacker(
+            s3_client,
+            dynamodb_client,
+            PART_INDEX_TABLE,
+            bucket_name,
+            known_parts=part_hashes,
+            shared_cache=shared_cache,
+        )
+        if PACK_PARTS and PART_INDEX_TABLE
+        else None
+    )
+    # Backups in the bucket are sized up front to choose how to process them
+    plan = (
+        plan_backup(bucket_name, object_key, backup.get("size"))
+        if source is None
+        else None
+    )
+    backup_processor = BackupRestoreProcessor(
+        s3_client=s3_client,
+        s3_resource=s3_resource,
+        io_engine=io_engine,
+        part_packer=part_packer,
+        validation_pool=(
+            validation_pool if plan is None or plan.validation == PARALLEL else None
+        ),
+        readahead_chunks=READAHEAD_CHUNKS,
+        known_parts=part_hashes,
+        shared_cache=shared_cache,
+    )
+
+    # Only backups stored in the bucket are tagged with their progress
+    location = (
+        f"s3://{bucket_name}/{object_key}"
+        if source is None
+        else f"{source.name}:{object_key} ({backup.get('name')})"
+    )
+    logger.info(f"Processing {location}")
+    if source is None:
+        backup_processor.tag_object(
+            bucket_name=bucket_name,
+            object_key=object_key,
+            tags={"processed": "STARTED"},
+        )
+    processed_backup = backup_processor.process_backup(
+        bucket_name=bucket_name, backup_key=object_key, source=source
+    )
+    sinks = fanout_sinks() if plan is not None and plan.fan_out else record_sinks
+    committed = checkpoints.load(object_id) if checkpoints is not None else {}
+    started = time.monotonic()
+    if any(sink.name == SQSSink.name for sink in sinks):
+        # Batches are enqueued while the backup is still being parsed
+        logger.info(f"Streaming records of {location}")
+        record_counts = stream_records(
+            ((record.hash(), record) for record in processed_backup),
+            object_id,
+            committed,
+            sinks,
+        )
+        record_count = sum(record_counts.values())
+        record_throughput(plan, record_count, time.monotonic() - started)
+        publish_parse_metrics(backup_processor, part_packer)
+    else:
+        with RecordDeduplicator(max_memory_bytes=DEDUP_MEMORY_BYTES) as records:
+            records.add(processed_backup)
+            record_count = len(records)
+            record_throughput(plan, record_count, time.monotonic() - started)
+            publish_parse_metrics(backup_processor, part_packer)
+            metrics.add_metric(
+                name="DedupRunsSpilled",
+                unit=MetricUnit.Count,
+                value=records.runs_spilled,
+            )
+            logger.info(f"Writing {record_count} records")
+            write_records(records, object_id, committed, sinks)
+            record_counts = records.record_counts()
+    logger.info(f"Processed backup located at {location}")
+
+    if source is None:
+        tags = {"processed": "COMPLETE", "record_count": record_count}
+        backup_processor.tag_object(
+            bucket_name=bucket_name, object_key=object_key, tags=tags
+        )
+
+    for record_type, count in record_counts.items():
+        metrics.add_metric(
+            name=f"RecordType/{record_type}",
+            unit=MetricUnit.Count,
+            value=count,
+        )
+    if checkpoints is not None:
+        checkpoints.clear(object_id)
+    return {"record_count": record_count}
+
+
+def idempotent_processing(
+    function: Callable, dynamodb_client: DynamoDBClient, table_name: str
+) -> Callable:
+    """
+    Makes a function of a `backup` idempotent per object version.
+
+    Retries and duplicate uploads of a processed object version return the
+    stored result; a failed attempt leaves its checkpoint to resume from.
+    """
+    return idempotent_function(
+        data_keyword_argument="backup",
+        config=idempotency_config,
+        persistence_store=DynamoDBPersistenceLayer(
+            table_name=table_name, boto3_client=dynamodb_client
+        ),
+    )(function)
+
+
+if IDEMPOTENCY_TABLE:
+    process_backup_object = idempotent_processing(
+        process_backup_object, dynamodb_client, IDEMPOTENCY_TABLE
+    )
+
+
+def publish_cache_metrics() -> None:
+    """Adds and resets the metrics of the warm-container and shared caches."""
+    for metric_name, unit, value in cache_registry.metrics():
+        metrics.add_metric(name=metric_name, unit=unit, value=value)
+    if shared_cache is not None:
+        for metric_name, unit, value in shared_cache.metrics():
+            metrics.add_metric(name=metric_name, unit=unit, value=value)
@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Tuple
+
+from aws_lambda_powertools import Logger
+
+from batch_requests import backoff_seconds
+
+logger = Logger()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `rate` tokens per second.
+
+    Time is read from `clock` and waited out with `sleep`, or `async_sleep`
+    on an event loop.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        async_sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self._rate = rate
+        self._capacity = capacity or rate
+        self._tokens = self._capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._async_sleep = async_sleep
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill()
+            self._rate = rate
+            self._capacity = rate
+            self._tokens = min(self._tokens, self._capacity)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated_at) * self._rate
+        )
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float) -> float:
+        """Takes `tokens` if available, else returns the seconds to wait."""
+        with self._lock:
+            self._refill()
+            # Requests larger than the bucket are let through once it is full
+            needed = min(tokens, self._capacity)
+            if self._tokens >= needed:
+                self._tokens -= tokens
+                return 0.0
+            return (needed - self._tokens) / self._rate
+
+    def acquire(self, tokens: float) -> None:
+        """Blocks until `tokens` are available and takes them."""
+        while wait := self.try_acquire(tokens):
+            self._sleep(wait)
+
+    async def acquire_async(self, tokens: float) -> None:
+        """Waits without blocking the event loop until `tokens` are taken."""
+        while wait := self.try_acquire(tokens):
+            await self._async_sleep(wait)
+
+    def settle(self, tokens: float) -> None:
+        """Takes (or returns, if negative) tokens without blocking."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._capacity, self._tokens - tokens)
+
+
+class AdaptiveWriteRateController:
+    """
+    AIMD controller pacing DynamoDB writes to stay just under a WCU cap.
+
+    Consumed write capacity reported through `ReturnConsumedCapacity` is
+    tracked over a sliding one second window.  While writes are not
+    throttled the allowed rate and concurrency grow additively each second;
+    a throttle halves both.
+
+    Args:
+        max_write_request_units (float): The table's write request unit cap.
+        target_utilization (float): Fraction of the cap to aim for.
+        max_concurrency (int): Upper bound on concurrent batch writes.
+        clock (Callable[[], float]): Returns the current time in seconds.
+        sleep (Callable[[float], None]): Waits the given seconds.
+        async_sleep (Callable[[float], Awaitable[None]]): Waits the given
+            seconds on an event loop.
+    """
+
+    def __init__(
+        self,
+        max_write_request_units: float = 1000,
+        target_utilization: float = 0.9,
+        max_concurrency: int = 16,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        async_sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self._target_rate = max_write_request_units * target_utilization
+        self._min_rate = min(25.0, self._target_rate)
+        self._increase_step = max(1.0, self._target_rate * 0.05)
+        self._max_concurrency = max_concurrency
+        self._concurrency = max(1, max_concurrency // 4)
+        self._clock = clock
+        self._sleep = sleep
+        self._async_sleep = async_sleep
+        self._bucket = TokenBucket(
+            rate=self._target_rate / 2,
+            clock=clock,
+            sleep=sleep,
+            async_sleep=async_sleep,
+        )
+        self._consumed: Deque[Tuple[float, float]] = deque()
+        self._adjusted_at = clock()
+        self._throttled = False
+        self._lock = threading.Lock()
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency
+
+    @property
+    def concurrency(self) -> int:
+        """The number of batch writes allowed in flight."""
+        return self._concurrency
+
+    @property
+    def allowed_rate(self) -> float:
+        """The write capacity units per second writes are paced at."""
+        return self._bucket.rate
+
+    def current_rate(self) -> float:
+        """Consumed write capacity units per second over the last second."""
+        with self._lock:
+            self._expire(self._clock())
+            return sum(units for _, units in self._consumed)
+
+    def _expire(self, now: float) -> None:
+        while self._consumed and self._consumed[0][0] <= now - 1.0:
+            self._consumed.popleft()
+
+    def acquire(self, estimated_units: float) -> None:
+        """Blocks until a write estimated at `estimated_units` may be sent."""
+        self._bucket.acquire(estimated_units)
+
+    async def acquire_async(self, estimated_units: float) -> None:
+        """Waits on the event loop until a write may be sent."""
+        await self._bucket.acquire_async(estimated_units)
+
+    def record(self, estimated_units: float, consumed_units: float) -> None:
+        """Records the capacity a write consumed, correcting its estimate."""
+        self._bucket.settle(consumed_units - estimated_units)
+        now = self._clock()
+        with self._lock:
+            self._consumed.append((now, consumed_units))
+            self._expire(now)
+            self._adjust(now)
+
+    def throttled(self) -> None:
+        """Multiplicatively backs off after a throttled or unprocessed write."""
+        with self._lock:
+            self._throttled = True
+            self._bucket.rate = max(self._min_rate, self._bucket.rate / 2)
+            self._concurrency = max(1, self._concurrency // 2)
+            self._adjusted_at = self._clock()
+        logger.debug(
+            f"Write throttled, pacing at {self._bucket.rate:.0f} WCU/s "
+            f"with concurrency {self._concurrency}"
+        )
+
+    def backoff(self, attempt: int) -> None:
+        """Waits out the exponential backoff after failed attempt `attempt`."""
+        self._sleep(backoff_seconds(attempt))
+
+    async def backoff_async(self, attempt: int) -> None:
+        """`backoff` on the event loop."""
+        await self._async_sleep(backoff_seconds(attempt))
+
+    def _adjust(self, now: float) -> None:
+        """Additively increases rate and concurrency once per second."""
+        if now - self._adjusted_at < 1.0:
+            return
+        if not self._throttled:
+            self._bucket.rate = min(
+                self._target_rate, self._bucket.rate + self._increase_step
+            )
+            self._concurrency = min(self._max_concurrency, self._concurrency + 1)
+        self._throttled = False
+        self._adjusted_at = now
@@ -0,0 +1,193 @@
+import json
+import posixpath
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import batched
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from aws_lambda_powertools import Logger
+from mypy_boto3_s3.client import S3Client
+
+from restore import RESTORE_PREFIX
+
+if TYPE_CHECKING:
+    # The sqs stubs are not part of the runtime image
+    from mypy_boto3_sqs.client import SQSClient
+
+logger = Logger()
+
+# Names the Android app gives its backups, with the backup's local time
+BACKUP_NAME_PATTERN = re.compile(r"^(?P<type>sms|calls)-(?P<date>\d{14})?.*\.xml$")
+BACKUP_DATE_FORMAT = "%Y%m%d%H%M%S"
+PROCESSED_COMPLETE = "COMPLETE"
+SQS_MAX_BATCH_ENTRIES = 10
+
+
+class BackupObject:
+    """
+    A backup in the bucket with the progress tags processing left on it.
+
+    Args:
+        key (str): The object's key.
+        etag (str): The object's ETag.
+        last_modified (datetime): When the object was uploaded.
+        tags (Dict[str, str]): The object's tags.
+    """
+
+    def __init__(
+        self, key: str, etag: str, last_modified: datetime, tags: Dict[str, str]
+    ) -> None:
+        self.key = key
+        self.etag = etag
+        self.last_modified = last_modified
+        self.tags = tags
+        self._match = BACKUP_NAME_PATTERN.match(posixpath.basename(key))
+
+    @property
+    def backup_type(self) -> str:
+        return self._match.group("type")
+
+    @property
+    def backup_date(self) -> datetime:
+        """When the backup was taken, its upload time if not in its name."""
+        if self._match.group("date"):
+            return datetime.strptime(
+                self._match.group("date"), BACKUP_DATE_FORMAT
+            ).replace(tzinfo=timezone.utc)
+        return self.last_modified
+
+    @property
+    def group(self) -> Tuple[str, str]:
+        """Backups of a type uploaded to one folder, each superseding the last."""
+        return posixpath.dirname(self.key), self.backup_type
+
+    @property
+    def record_count(self) -> Optional[int]:
+        """Records found when the backup was last processed, None if never."""
+        if self.tags.get("processed") != PROCESSED_COMPLETE:
+            return None
+        return int(self.tags["record_count"])
+
+
+def list_backups(
+    s3_client: S3Client, bucket_name: str, prefix: str = "", max_workers: int = 16
+) -> List[BackupObject]:
+    """
+    Lists the backups in a bucket with their tags.
+
+    Args:
+        s3_client (S3Client): S3 client.
+        bucket_name (str): The bucket.
+        prefix (str): Only lists backups under this prefix.
+        max_workers (int): Concurrent `GetObjectTagging` calls.
+
+    Returns:
+        List[BackupObject]: The backups, restored files excluded.
+    """
+    objects = [
+        obj
+        for page in s3_client.get_paginator("list_objects_v2").paginate(
+            Bucket=bucket_name, Prefix=prefix
+        )
+        for obj in page.get("Contents", [])
+        if BACKUP_NAME_PATTERN.match(posixpath.basename(obj["Key"]))
+        and not obj["Key"].startswith(f"{RESTORE_PREFIX}/")
+    ]
+
+    def tags(key: str) -> Dict[str, str]:
+        response = s3_client.get_object_tagging(Bucket=bucket_name, Key=key)
+        return {tag["Key"]: tag["Value"] for tag in response["TagSet"]}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        object_tags = executor.map(tags, [obj["Key"] for obj in objects])
+        return [
+            BackupObject(obj["Key"], obj["ETag"], obj["LastModified"], obj_tags)
+            for obj, obj_tags in zip(objects, object_tags)
+        ]
+
+
+def covering_set(backups: List[BackupObject]) -> List[BackupObject]:
+    """
+    Selects the backups whose records cover every backup's, newest first.
+
+    Each backup the app uploads holds every message still on the phone, so
+    the newest backup of a group supersedes the older ones.  An older
+    backup is still kept when it held more records than every newer backup
+    kept, as messages deleted from the phone are only in older backups.
+    Counts come from the `record_count` tag of completed processing; a
+    backup without one was never fully processed, so its records may be in
+    no other backup and it is always kept.
+
+    Args:
+        backups (List[BackupObject]): Backups to select from.
+
+    Returns:
+        List[BackupObject]: The selected backups, newest first.
+    """
+    groups: Dict[Tuple[str, str], List[BackupObject]] = {}
+    for backup in sorted(backups, key=lambda b: b.backup_date, reverse=True):
+        groups.setdefault(backup.group, []).append(backup)
+
+    selected = []
+    for group_backups in groups.values():
+        newest, *older = group_backups
+        selected.append(newest)
+        most_records = newest.record_count or 0
+        for backup in older:
+            if backup.record_count is None:
+                selected.append(backup)
+            elif backup.record_count > most_records:
+                selected.append(backup)
+                most_records = backup.record_count
+    return sorted(selected, key=lambda b: b.backup_date, reverse=True)
+
+
+def enqueue_backups(
+    sqs_client: "SQSClient",
+    queue_url: str,
+    bucket_name: str,
+    backups: List[BackupObject],
+    run_id: str,
+) -> int:
+    """
+    Sends backups to the reprocessing queue, in order.
+
+    Each message is the `backup` argument of `process_backup_object`,
+    carrying the run id so objects processed before are processed again.
+
+    Returns:
+        int: The number of backups enqueued.
+    """
+    for chunk in batched(enumerate(backups), SQS_MAX_BATCH_ENTRIES):
+        entries = [
+            {
+                "Id": str(i),
+                "MessageBody": json.dumps(
+                    {
+                        "bucket": bucket_name,
+                        "key": backup.key,
+                        "etag": backup.etag,
+                        "run": run_id,
+                    }
+                ),
+            }
+            for i, backup in chunk
+        ]
+        response = sqs_client.send_message_batch(QueueUrl=queue_url, Entries=entries)
+        if response.get("Failed"):
+            raise RuntimeError(f"Failed to enqueue backups: {response['Failed']}")
+    logger.info(f"Enqueued {len(backups)} backups for reprocessing run {run_id}")
+    return len(backups)
+
+
+def plan_summary(backups: List[BackupObject]) -> List[Dict[str, Any]]:
+    """Describes the selected backups for the caller of a reprocessing run."""
+    return [
+        {
+            "key": backup.key,
+            "backup_date": backup.backup_date.isoformat(),
+            "record_count": backup.record_count,
+        }
+        for backup in backups
+    ]
@@ -0,0 +1,60 @@
+import os
+import uuid
+
+import boto3
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from mypy_boto3_s3 import S3Client
+
+from reprocess import covering_set, enqueue_backups, list_backups, plan_summary
+
+# Initialize AWS Lambda Powertools components
+tracer = Tracer()
+logger = Logger()
+metrics = Metrics(namespace="sms-backup-restore")
+
+# Initialize AWS clients
+s3_client: S3Client = boto3.client("s3")
+sqs_client = boto3.client("sqs")
+
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "sms-backup-restore")
+REPROCESS_QUEUE_URL = os.environ.get("REPROCESS_QUEUE_URL")
+ENV = os.environ.get("ENV", "prod")
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> dict:
+    """
+    Lambda function to reprocess the historical backups in the bucket.
+
+    Backups under the event's `prefix` are listed, and the newest backups
+    covering the records of all of them are enqueued newest first for the
+    reprocessing function, whose concurrency bounds how many are processed
+    at once.  With `dry_run`, the selected backups are only returned.  A
+    `run_id` resumes a run, its backups already processed are skipped.
+    """
+
+    metrics.add_dimension(name="environment", value=ENV)
+
+    run_id = event.get("run_id") or uuid.uuid4().hex
+    backups = list_backups(s3_client, BUCKET_NAME, prefix=event.get("prefix", ""))
+    selected = covering_set(backups)
+    logger.info(f"Selected {len(selected)} of {len(backups)} backups to reprocess")
+    metrics.add_metric(name="BackupsListed", unit=MetricUnit.Count, value=len(backups))
+    metrics.add_metric(
+        name="BackupsSelected", unit=MetricUnit.Count, value=len(selected)
+    )
+
+    enqueued = 0
+    if not event.get("dry_run"):
+        enqueued = enqueue_backups(
+            sqs_client, REPROCESS_QUEUE_URL, BUCKET_NAME, selected, run_id
+        )
+    return {
+        "run_id": run_id,
+        "listed": len(backups),
+        "enqueued": enqueued,
+        "backups": plan_summary(selected),
+    }
@@ -0,0 +1,398 @@
+import base64
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import batched
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from aws_lambda_powertools import Logger
+from lxml import etree
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3.client import S3Client
+
+from backup_processor import INLINE_PART_CONTENT_TYPES
+from conversations import ConversationQuery
+from item_serializer import THREAD_ATTRIBUTE, deserialize_item, load_spilled_item
+from part_packs import PartReader
+from schemas import RECORD_MODELS, Part
+from table_scan import ParallelTableScanner
+from write_diff import DIGEST_ATTRIBUTE
+
+logger = Logger()
+
+RESTORE_PREFIX = "restores"
+READABLE_DATE_FORMAT = "%b %d, %Y %I:%M:%S %p"
+# Root tag and record types of each backup file type
+BACKUP_TYPES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "sms": ("smses", ("SMS", "MMS")),
+    "calls": ("calls", ("Call",)),
+}
+# Item attributes that are not backup attributes or are written separately
+_ITEM_ATTRIBUTES = {
+    "id",
+    "address",
+    "timestamp",
+    "record_type",
+    "parts",
+    THREAD_ATTRIBUTE,
+    DIGEST_ATTRIBUTE,
+}
+# A multiple of 3 bytes so chunks base64 encode without padding
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+MULTIPART_MIN_PART_SIZE = 16 * 1024 * 1024
+XML_DECLARATION = b"<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>\n"
+
+
+def _xml_value(value: Any) -> str:
+    """Formats a record value the way backup files spell it."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return str(int(value))
+    return str(value)
+
+
+def _epoch_millis(value: str) -> str:
+    return str(int(datetime.fromisoformat(value).timestamp() * 1000))
+
+
+def record_attributes(record: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Maps a stored record back onto the attributes of its backup XML tag.
+
+    Attributes the models drop (such as `toa` or MMS contact names) are
+    written as `null` or `(Unknown)`, as the app does for missing values.
+
+    Args:
+        record (Dict[str, Any]): The deserialized DynamoDB item.
+
+    Returns:
+        Dict[str, str]: The tag's attributes.
+    """
+    timestamp = datetime.fromisoformat(record["timestamp"])
+    address_attribute = "number" if record["record_type"] == "Call" else "address"
+    attributes = {
+        address_attribute: "~".join(record["address"]),
+        "date": _epoch_millis(record["timestamp"]),
+    }
+    for name, value in record.items():
+        if name in _ITEM_ATTRIBUTES:
+            continue
+        if name == "date_sent" and value is not None:
+            attributes[name] = _epoch_millis(value)
+        else:
+            attributes[name] = _xml_value(value)
+    # Fields excluded from the items are still required attributes
+    for name in RECORD_MODELS[record["record_type"]].model_fields:
+        if name not in _ITEM_ATTRIBUTES:
+            attributes.setdefault(name, "null")
+    attributes["readable_date"] = timestamp.strftime(READABLE_DATE_FORMAT)
+    if attributes.get("contact_name", "null") == "null":
+        attributes["contact_name"] = "(Unknown)"
+    return attributes
+
+
+def part_attributes(part: Dict[str, Any], with_data: bool) -> Dict[str, str]:
+    """Maps a stored MMS part back onto its `part` tag's attributes."""
+    attributes = {k: _xml_value(v) for k, v in part.items() if k != "data" or with_data}
+    for name in Part.model_fields:
+        if name != "data" or with_data:
+            attributes.setdefault(name, "null")
+    return attributes
+
+
+def start_tag(tag: str, attributes: Dict[str, str]) -> bytes:
+    """Serializes the start tag of an element with escaped attributes."""
+    return etree.tostring(etree.Element(tag, attributes))[: -len(b"/>")] + b">"
+
+
+def empty_tag(tag: str, attributes: Dict[str, str]) -> bytes:
+    """Serializes an element without content."""
+    return etree.tostring(etree.Element(tag, attributes))
+
+
+def stored_part_hash(part: Dict[str, Any]) -> Optional[str]:
+    """Returns the `parts/` object hash of an MMS part stored in S3."""
+    if part.get("ct") in INLINE_PART_CONTENT_TYPES or not part.get("data"):
+        return None
+    return part["data"]
+
+
+class DeferredHeadUpload:
+    """
+    S3 multipart upload of a file whose head is only known at the end.
+
+    Written bytes are uploaded in parts from part 2 on, except for the first
+    `part_size` bytes, which are held back; `close` uploads the head and those
+    bytes as part 1.  Memory is bounded by about two parts whatever the size
+    of the file, and a file smaller than a part is stored with one
+    `PutObject`.
+
+    Args:
+        s3_client (S3Client): S3 client for the upload.
+        bucket_name (str): Bucket of the file.
+        key (str): Key of the file.
+        part_size (int): Size of the parts uploaded, at least 5 MiB.
+    """
+
+    def __init__(
+        self,
+        s3_client: S3Client,
+        bucket_name: str,
+        key: str,
+        part_size: int = MULTIPART_MIN_PART_SIZE,
+    ) -> None:
+        self._s3_client = s3_client
+        self._bucket_name = bucket_name
+        self._key = key
+        self._part_size = part_size
+        self._buffer = bytearray()
+        self._held: Optional[bytes] = None
+        self._upload_id: Optional[str] = None
+        self._parts: List[Dict[str, Any]] = []
+
+    def write(self, data: bytes) -> None:
+        """Appends bytes after the head."""
+        self._buffer += data
+        if len(self._buffer) < self._part_size:
+            return
+        if self._held is None:
+            self._held = bytes(self._buffer)
+        else:
+            self._upload_part(len(self._parts) + 2, bytes(self._buffer))
+        self._buffer.clear()
+
+    def _upload_part(self, part_number: int, body: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self._s3_client.create_multipart_upload(
+                Bucket=self._bucket_name, Key=self._key
+            )["UploadId"]
+        response = self._s3_client.upload_part(
+            Bucket=self._bucket_name,
+            Key=self._key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        self._parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+
+    def close(self, head: bytes) -> None:
+        """Stores the file with `head` before the bytes written."""
+        if self._held is None:
+            self._s3_client.put_object(
+                Bucket=self._bucket_name, Key=self._key, Body=head + self._buffer
+            )
+            return
+        if self._buffer:
+            self._upload_part(len(self._parts) + 2, bytes(self._buffer))
+        self._upload_part(1, head + self._held)
+        self._s3_client.complete_multipart_upload(
+            Bucket=self._bucket_name,
+            Key=self._key,
+            UploadId=self._upload_id,
+            MultipartUpload={
+                "Parts": sorted(self._parts, key=lambda p: p["PartNumber"])
+            },
+        )
+
+    def abort(self) -> None:
+        """Discards the parts uploaded so far."""
+        if self._upload_id is not None:
+            self._s3_client.abort_multipart_upload(
+                Bucket=self._bucket_name, Key=self._key, UploadId=self._upload_id
+            )
+
+
+class BackupRestorer:
+    """
+    Regenerates SMS Backup & Restore XML files from the table.
+
+    Records are read with a parallel scan, or from the thread index when
+    restoring a single conversation, serialized tag by tag and streamed into
+    an S3 multipart upload.  The root element's `count` is the number of
+    records written, so the head of the file is uploaded last (see
+    `DeferredHeadUpload`) rather than counted with a scan of its own.  MMS
+    attachments are fetched from `parts/` or their packs up to
+    `prefetch_parts` ahead of the writer and base64 encoded in chunks as they
+    are written, so memory is bounded by the prefetch window rather than the
+    size of the archive.  Packed parts are located a page of `prefetch_parts`
+    records at a time, with batched index lookups.
+
+    Args:
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        s3_client (S3Client): S3 client for parts and the restored file.
+        table_name (str): Name of the DynamoDB table.
+        bucket_name (str): Bucket holding `parts/` and the restored file.
+        part_index_table (Optional[str]): Table locating the packed parts.
+        total_segments (int): Parallel scan segments.
+        prefetch_parts (int): Attachments fetched ahead of the writer.
+    """
+
+    def __init__(
+        self,
+        dynamodb_client: DynamoDBClient,
+        s3_client: S3Client,
+        table_name: str,
+        bucket_name: str,
+        part_index_table: Optional[str] = None,
+        total_segments: int = 8,
+        prefetch_parts: int = 16,
+    ) -> None:
+        self._dynamodb_client = dynamodb_client
+        self._s3_client = s3_client
+        self._table_name = table_name
+        self._bucket_name = bucket_name
+        self._prefetch_parts = prefetch_parts
+        self._part_reader = PartReader(
+            s3_client, dynamodb_client, part_index_table, bucket_name
+        )
+        self._scanner = ParallelTableScanner(
+            dynamodb_client, table_name, total_segments=total_segments
+        )
+
+    @staticmethod
+    def _record_type_filter(record_types: Tuple[str, ...]) -> Dict[str, Any]:
+        values = {f":type{i}": {"S": t} for i, t in enumerate(record_types)}
+        return {
+            "FilterExpression": f"record_type IN ({', '.join(values)})",
+            "ExpressionAttributeValues": values,
+        }
+
+    def iter_records(
+        self, backup_type: str, address: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Yields the deserialized records of `backup_type`."""
+        _, record_types = BACKUP_TYPES[backup_type]
+        if address is not None:
+            query = ConversationQuery(
+                self._dynamodb_client,
+                self._table_name,
+                cache_size=0,
+                s3_client=self._s3_client,
+            )
+            for record in query.iter_records(address, newest_first=False):
+                if record["record_type"] in record_types:
+                    yield record
+            return
+        for item in self._scanner.scan(**self._record_type_filter(record_types)):
+            yield deserialize_item(load_spilled_item(self._s3_client, item))
+
+    def restore(
+        self, backup_type: str, output_key: str, address: Optional[str] = None
+    ) -> int:
+        """
+        Writes a backup file of `backup_type` to `output_key` in the bucket.
+
+        Args:
+            backup_type (str): `sms` (SMS and MMS) or `calls`.
+            output_key (str): Key of the restored XML file.
+            address (Optional[str]): Restores only this conversation.
+
+        Returns:
+            int: The number of records written.
+        """
+        if backup_type not in BACKUP_TYPES:
+            raise ValueError(f"Unknown backup type {backup_type}")
+        root_tag, _ = BACKUP_TYPES[backup_type]
+        logger.info(f"Restoring to s3://{self._bucket_name}/{output_key}")
+
+        written = 0
+        pending: Deque[Tuple[Dict[str, Any], Dict[str, Future]]] = deque()
+        prefetched = 0
+        upload = DeferredHeadUpload(self._s3_client, self._bucket_name, output_key)
+        try:
+            with ThreadPoolExecutor(max_workers=self._prefetch_parts) as executor:
+                records = self.iter_records(backup_type, address=address)
+                for page in batched(records, self._prefetch_parts):
+                    page_hashes, locations = self._locate_parts(page)
+                    for record, part_hashes in zip(page, page_hashes):
+                        futures = {
+                            h: executor.submit(
+                                self._part_reader.read, h, locations.get(h)
+                            )
+                            for h in part_hashes
+                        }
+                        pending.append((record, futures))
+                        prefetched += len(futures)
+                        while pending and (
+                            len(pending) > self._prefetch_parts
+                            or prefetched > self._prefetch_parts
+                        ):
+                            record, futures = pending.popleft()
+                            self._write_record(upload, record, futures)
+                            prefetched -= len(futures)
+                            written += 1
+                while pending:
+                    record, futures = pending.popleft()
+                    self._write_record(upload, record, futures)
+                    written += 1
+            upload.write(f"</{root_tag}>\n".encode())
+
+            root_attributes = {
+                "count": str(written),
+                "backup_set": str(uuid.uuid4()),
+                "backup_date": str(int(datetime.now(timezone.utc).timestamp() * 1000)),
+                "type": "full",
+            }
+            upload.close(XML_DECLARATION + start_tag(root_tag, root_attributes))
+        except BaseException:
+            upload.abort()
+            raise
+        return written
+
+    def _locate_parts(
+        self, records: Tuple[Dict[str, Any], ...]
+    ) -> Tuple[List[set], Dict[str, Tuple[str, int, int]]]:
+        """Returns each record's stored part hashes and the packed ones' locations."""
+        page_hashes = [
+            {
+                part_hash
+                for part in record.get("parts", [])
+                if (part_hash := stored_part_hash(part))
+            }
+            for record in records
+        ]
+        part_hashes = [h for hashes in page_hashes for h in hashes]
+        return page_hashes, (
+            self._part_reader.locate(part_hashes) if part_hashes else {}
+        )
+
+    def _write_record(
+        self,
+        out: DeferredHeadUpload,
+        record: Dict[str, Any],
+        part_bodies: Dict[str, Future],
+    ) -> None:
+        """Writes one record's tag, streaming its attachments' data."""
+        tag = record["record_type"].lower()
+        if tag != "mms":
+            out.write(empty_tag(tag, record_attributes(record)))
+            return
+
+        out.write(start_tag(tag, record_attributes(record)) + b"<parts>")
+        for part in record.get("parts", []):
+            part_hash = stored_part_hash(part)
+            attributes = part_attributes(part, with_data=part_hash is None)
+            body = part_bodies[part_hash].result() if part_hash else None
+            if body is None:
+                out.write(empty_tag("part", attributes))
+            else:
+                self._write_part_data(out, attributes, body)
+        out.write(b"</parts><addrs>")
+        # Only the addresses are stored; 151 marks a recipient
+        for address in record["address"]:
+            out.write(
+                empty_tag("addr", {"address": address, "type": "151", "charset": "106"})
+            )
+        out.write(f"</addrs></{tag}>".encode())
+
+    @staticmethod
+    def _write_part_data(
+        out: DeferredHeadUpload, attributes: Dict[str, str], body: bytes
+    ) -> None:
+        """Writes a `part` tag, base64 encoding its data in chunks."""
+        out.write(empty_tag("part", attributes)[: -len(b"/>")] + b' data="')
+        for offset in range(0, len(body), BASE64_CHUNK_SIZE):
+            out.write(base64.b64encode(body[offset : offset + BASE64_CHUNK_SIZE]))
+        out.write(b'"/>')
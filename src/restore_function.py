@@ -0,0 +1,59 @@
+import os
+from datetime import datetime, timezone
+
+import boto3
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3 import S3Client
+
+from restore import RESTORE_PREFIX, BackupRestorer
+
+# Initialize AWS Lambda Powertools components
+tracer = Tracer()
+logger = Logger()
+metrics = Metrics(namespace="sms-backup-restore")
+
+# Initialize AWS clients
+s3_client: S3Client = boto3.client("s3")
+dynamodb_client: DynamoDBClient = boto3.client("dynamodb")
+
+DYNAMODB_TABLE = os.environ.get("DYNAMODB_TABLE", "sms-backup-restore")
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "sms-backup-restore")
+PART_INDEX_TABLE = os.environ.get("PART_INDEX_TABLE")
+ENV = os.environ.get("ENV", "prod")
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> dict:
+    """
+    Lambda function to restore a backup file from the table.
+
+    The event selects the `backup_type` (`sms` or `calls`), optionally a
+    single conversation's `address` and the `output_key` of the file, which
+    defaults to a timestamped key under `restores/`.
+    """
+
+    metrics.add_dimension(name="environment", value=ENV)
+
+    backup_type = event.get("backup_type", "sms")
+    address = event.get("address")
+    output_key = event.get("output_key") or (
+        f"{RESTORE_PREFIX}/{backup_type}-"
+        f"{datetime.now(timezone.utc):%Y-%m-%d_%H-%M-%S}.xml"
+    )
+
+    restorer = BackupRestorer(
+        dynamodb_client=dynamodb_client,
+        s3_client=s3_client,
+        table_name=DYNAMODB_TABLE,
+        bucket_name=BUCKET_NAME,
+        part_index_table=PART_INDEX_TABLE,
+    )
+    restored = restorer.restore(backup_type, output_key, address=address)
+    logger.info(f"Restored {restored} records to s3://{BUCKET_NAME}/{output_key}")
+    metrics.add_metric(name="RecordsRestored", unit=MetricUnit.Count, value=restored)
+
+    return {"bucket": BUCKET_NAME, "key": output_key, "count": restored}
@@ -0,0 +1,185 @@
+import io
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Tuple, Type
+
+from aws_lambda_powertools import Logger
+from botocore.exceptions import ConnectionError as BotoConnectionError
+from botocore.exceptions import HTTPClientError, IncompleteReadError
+from mypy_boto3_s3.client import S3Client
+
+logger = Logger()
+
+READ_CHUNK_BYTES = 8 * 1024 * 1024
+READAHEAD_CHUNKS = 4
+MAX_RANGE_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 0.2
+# Failures of a range's connection or body stream, retried with a new GET
+RETRYABLE_ERRORS = (
+    BotoConnectionError,
+    HTTPClientError,
+    IncompleteReadError,
+    ConnectionError,
+)
+
+
+class RangePrefetchingReader(io.RawIOBase):
+    """
+    Reads an object with concurrent ranged requests ahead of the consumer.
+
+    The object is split into `chunk_size` ranges, and up to
+    `readahead_chunks` of the next ranges are fetched on threads while the
+    consumer reads the current one, so at most
+    `(readahead_chunks + 1) * chunk_size` bytes are buffered.  A range whose
+    connection resets is fetched again.  Subclasses fetch one range with
+    `_get_range` and list the errors worth retrying in `retryable_errors`.
+
+    Args:
+        name (str): Names the object in logs.
+        size (int): The object's size in bytes.
+        chunk_size (int): Bytes per ranged request.
+        readahead_chunks (int): Ranges fetched ahead of the consumer.
+        max_attempts (int): Attempts per range.
+    """
+
+    retryable_errors: Tuple[Type[BaseException], ...] = RETRYABLE_ERRORS
+
+    def __init__(
+        self,
+        name: str,
+        size: int,
+        chunk_size: int = READ_CHUNK_BYTES,
+        readahead_chunks: int = READAHEAD_CHUNKS,
+        max_attempts: int = MAX_RANGE_ATTEMPTS,
+    ) -> None:
+        super().__init__()
+        self._name = name
+        self.size = size
+        self._chunk_size = chunk_size
+        self._readahead_chunks = max(readahead_chunks, 1)
+        self._max_attempts = max_attempts
+        self._next_offset = 0
+        self._pending: Deque[Future] = deque()
+        self._buffer = memoryview(b"")
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._readahead_chunks, thread_name_prefix="s3-readahead"
+        )
+        self.bytes_read = 0
+        self.retries = 0
+        self._started = time.perf_counter()
+        self._fill()
+
+    def _get_range(self, start: int, end: int) -> bytes:
+        """Returns bytes `start` to `end` inclusive of the object."""
+        raise NotImplementedError()
+
+    def _fetch(self, start: int, end: int) -> bytes:
+        """Fetches bytes `start` to `end` inclusive, retrying failed streams."""
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                data = self._get_range(start, end)
+                if len(data) != end - start + 1:
+                    raise IncompleteReadError(
+                        actual_bytes=len(data), expected_bytes=end - start + 1
+                    )
+                return data
+            except self.retryable_errors as e:
+                if attempt == self._max_attempts:
+                    raise
+                self.retries += 1
+                logger.warning(
+                    f"Retrying bytes {start}-{end} of {self._name} after {e!r}"
+                )
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+    def _fill(self) -> None:
+        """Schedules ranges until `readahead_chunks` are pending."""
+        while (
+            len(self._pending) < self._readahead_chunks
+            and self._next_offset < self.size
+        ):
+            end = min(self._next_offset + self._chunk_size, self.size) - 1
+            self._pending.append(
+                self._executor.submit(self._fetch, self._next_offset, end)
+            )
+            self._next_offset = end + 1
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            if not self._pending:
+                return 0
+            self._buffer = memoryview(self._pending.popleft().result())
+            self._fill()
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self.bytes_read += size
+        return size
+
+    @property
+    def bytes_per_second(self) -> float:
+        """Average throughput since the reader was opened."""
+        elapsed = time.perf_counter() - self._started
+        return self.bytes_read / elapsed if elapsed > 0 else 0.0
+
+    def close(self) -> None:
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+            self._buffer = memoryview(b"")
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        super().close()
+
+
+class PrefetchingReader(RangePrefetchingReader):
+    """
+    Reads an S3 object with concurrent ranged GETs ahead of the consumer.
+
+    The ranges are fetched on threads sharing `s3_client`'s connection pool.
+    Every range is requested with the object's ETag, so an object replaced
+    mid-read fails instead of mixing versions.
+
+    Args:
+        s3_client (S3Client): S3 client whose connections are reused.
+        bucket_name (str): The object's bucket.
+        key (str): The object's key.
+        chunk_size (int): Bytes per ranged GET.
+        readahead_chunks (int): Ranges fetched ahead of the consumer.
+        max_attempts (int): Attempts per range.
+    """
+
+    def __init__(
+        self,
+        s3_client: S3Client,
+        bucket_name: str,
+        key: str,
+        chunk_size: int = READ_CHUNK_BYTES,
+        readahead_chunks: int = READAHEAD_CHUNKS,
+        max_attempts: int = MAX_RANGE_ATTEMPTS,
+    ) -> None:
+        self._s3_client = s3_client
+        self._bucket_name = bucket_name
+        self._key = key
+        response = s3_client.head_object(Bucket=bucket_name, Key=key)
+        self._etag: str = response["ETag"]
+        super().__init__(
+            key,
+            response["ContentLength"],
+            chunk_size=chunk_size,
+            readahead_chunks=readahead_chunks,
+            max_attempts=max_attempts,
+        )
+
+    def _get_range(self, start: int, end: int) -> bytes:
+        response = self._s3_client.get_object(
+            Bucket=self._bucket_name,
+            Key=self._key,
+            Range=f"bytes={start}-{end}",
+            IfMatch=self._etag,
+        )
+        return response["Body"].read()
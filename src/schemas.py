@@ -9,6 +9,7 @@ from pydantic import (
     BeforeValidator,
     Field,
     PlainSerializer,
+    ValidationInfo,
     computed_field,
     field_serializer,
     field_validator,
@@ -16,6 +17,10 @@ from pydantic import (
 )
 from typing_extensions import Annotated
 
+# Validation context key of a cache of normalized phone numbers, with the
+# `get` and `put` of a `TTLCache`
+PHONE_NUMBER_CACHE_CONTEXT = "phone_numbers"
+
 StringSerializedDatetime = Annotated[
     datetime, PlainSerializer(lambda x: x.isoformat(), return_type=str)
 ]
@@ -28,8 +33,21 @@ def replace_unknown_contact_name_null(v: Optional[str]) -> Optional[str]:
     return match.group() if match else None
 
 
-def phone_number_validator(v: str) -> str:
+def _phone_number_cache(info: ValidationInfo) -> Any:
+    return (info.context or {}).get(PHONE_NUMBER_CACHE_CONTEXT)
+
+
+def phone_number_validator(v: str, phone_numbers: Any = None) -> str:
     """Attempt to validate phone number or format."""
+    # Contacts repeat throughout a backup and across warm invocations
+    cached = (
+        phone_numbers.get(v)
+        if phone_numbers is not None and isinstance(v, str)
+        else None
+    )
+    if cached is not None:
+        return cached
+    raw = v
     try:
         phome_numbers = phonenumbers.parse(v, region="US")
         v = phonenumbers.format_number(
@@ -37,20 +55,30 @@ def phone_number_validator(v: str) -> str:
         )
     except phonenumbers.phonenumberutil.NumberParseException:
         v = v.strip() if isinstance(v, str) else None
+    if phone_numbers is not None and isinstance(raw, str) and v is not None:
+        phone_numbers.put(raw, v)
     return v
 
 
-def ensure_phone_number_sorted_list(value: Any) -> List[str]:
+def ensure_phone_number_sorted_list(value: Any, phone_numbers: Any = None) -> List[str]:
     if isinstance(value, str):
         return sorted(
-            [phone_number_validator(v) for v in value.split("~") if len(v) > 0]
+            [
+                phone_number_validator(v, phone_numbers)
+                for v in value.split("~")
+                if len(v) > 0
+            ]
         )
     elif isinstance(value, list):
-        return sorted([phone_number_validator(v) for v in value])
+        return sorted([phone_number_validator(v, phone_numbers) for v in value])
     else:
         return []
 
 
+def _validate_addresses(value: Any, info: ValidationInfo) -> List[str]:
+    return ensure_phone_number_sorted_list(value, _phone_number_cache(info))
+
+
 class HashableBaseModel(BaseModel):
     """Base model that enforces hashability."""
 
@@ -63,7 +91,7 @@ class CorrespondenceBase(HashableBaseModel):
     """Base model for correspondence records like SMS, MMS, and Calls."""
 
     timestamp: StringSerializedDatetime = Field(validation_alias="date")
-    address: Annotated[FrozenSet[str], BeforeValidator(ensure_phone_number_sorted_list)]
+    address: Annotated[FrozenSet[str], BeforeValidator(_validate_addresses)]
 
     @model_validator(mode="before")
     @classmethod
@@ -117,8 +145,8 @@ class CorrespondenceBase(HashableBaseModel):
 
     @field_serializer("address", when_used="always")
     def serialize_address_frozenset(self, address: FrozenSet[str]) -> List[str]:
-        """Returns address FrozenSet as list"""
-        return list(address)
+        """Returns address FrozenSet as a sorted list"""
+        return sorted(address)
 
 
 class SMS(CorrespondenceBase):
@@ -155,7 +183,13 @@ class SMS(CorrespondenceBase):
         return replace_unknown_contact_name_null(v)
 
     def hash(self):
-        hash_values = type(self), self.address, self.timestamp, self.type, self.body
+        hash_values = (
+            type(self),
+            "~".join(sorted(self.address)),
+            self.timestamp,
+            self.type,
+            self.body,
+        )
         hash_string = "".join([str(v) for v in hash_values])
         return sha256(hash_string.encode("utf-8")).hexdigest()
 
@@ -279,14 +313,14 @@ class MMS(CorrespondenceBase):
         return sorted(parts)
 
     @field_serializer("parts", when_used="always")
-    def serialize_parts_frozenset(self, parts: FrozenSet[str]) -> List[str]:
-        """Return parts FrozenSet as a list"""
-        return list(parts)
+    def serialize_parts_frozenset(self, parts: FrozenSet[Part]) -> List[Part]:
+        """Return parts FrozenSet as a list sorted by `seq`"""
+        return sorted(parts, key=lambda part: (part.seq is None, part.seq or 0))
 
     def hash(self):
         hash_values = (
             type(self),
-            "~".join(self.address),
+            "~".join(sorted(self.address)),
             self.timestamp,
             self.msg_box,
             self.m_id,
@@ -312,9 +346,9 @@ class Address(HashableBaseModel):
 
     @field_validator("address", mode="before")
     @classmethod
-    def validate_address(cls, v: str) -> List[str]:
+    def validate_address(cls, v: str, info: ValidationInfo) -> List[str]:
         """Replace contact name `(Unknown)` with `Null`."""
-        return phone_number_validator(v)
+        return phone_number_validator(v, _phone_number_cache(info))
 
     class Config:
         """Address Validator Config"""
@@ -362,6 +396,20 @@ class Call(CorrespondenceBase):
         return data
 
     def hash(self):
-        hash_values = type(self), self.address, self.timestamp, self.duration, self.type
+        hash_values = (
+            type(self),
+            "~".join(sorted(self.address)),
+            self.timestamp,
+            self.duration,
+            self.type,
+        )
         hash_string = "".join([str(v) for v in hash_values])
         return sha256(hash_string.encode("utf-8")).hexdigest()
+
+
+# Record models by their `record_type`
+RECORD_MODELS: Dict[str, type[CorrespondenceBase]] = {
+    "SMS": SMS,
+    "MMS": MMS,
+    "Call": Call,
+}
@@ -0,0 +1,52 @@
+import os
+
+import boto3
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from mypy_boto3_s3 import S3Client
+
+from search_index import SearchIndex, merge_segments
+
+# Initialize AWS Lambda Powertools components
+tracer = Tracer()
+logger = Logger()
+metrics = Metrics(namespace="sms-backup-restore")
+
+# Initialize AWS clients
+s3_client: S3Client = boto3.client("s3")
+
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "sms-backup-restore")
+ENV = os.environ.get("ENV", "prod")
+
+# Kept across invocations so warm containers reuse downloaded segments
+search_index = SearchIndex(s3_client, BUCKET_NAME)
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> dict:
+    """
+    Lambda function to search message text.
+
+    The event holds the `query`, whose terms must all occur in a message, and
+    optionally the `limit` of hits returned.
+    """
+
+    metrics.add_dimension(name="environment", value=ENV)
+
+    hits = search_index.search(event["query"], limit=int(event.get("limit", 20)))
+    metrics.add_metric(name="SearchHits", unit=MetricUnit.Count, value=len(hits))
+    return {"hits": hits}
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def merge_handler(event: dict, context: LambdaContext) -> dict:
+    """Lambda function to merge small search index segments, run on a schedule"""
+
+    metrics.add_dimension(name="environment", value=ENV)
+
+    merges = merge_segments(s3_client, BUCKET_NAME)
+    metrics.add_metric(name="SearchSegmentMerges", unit=MetricUnit.Count, value=merges)
+    return {"merges": merges}
@@ -0,0 +1,602 @@
+import heapq
+import itertools
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from aws_lambda_powertools import Logger
+from mypy_boto3_s3.client import S3Client
+
+from item_serializer import Item, deserialize_item
+
+logger = Logger()
+
+SEARCH_PREFIX = "search"
+SEGMENT_PREFIX = f"{SEARCH_PREFIX}/segments"
+SEGMENT_SUFFIX = ".sqlite"
+# Number of segments of a level merged into one segment of the next level
+MERGE_FAN_IN = 10
+MMAP_SIZE = 256 * 1024 * 1024
+# FTS5's default BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Record ids looked up per query when checking newer segments
+SHADOW_LOOKUP_BATCH = 500
+_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+_QUERY_OPERATORS = re.compile(r"\b(?:AND|OR|NOT|NEAR)\b")
+
+# Documents are stored once; the FTS5 table indexes them as external content
+_SEGMENT_SCHEMA = """
+CREATE TABLE documents (
+    rowid INTEGER PRIMARY KEY,
+    record_id TEXT NOT NULL UNIQUE,
+    record_type TEXT NOT NULL,
+    address TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE messages USING fts5(
+    body,
+    content='documents',
+    content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+"""
+_DOCUMENT_COLUMNS = "record_id, record_type, address, timestamp, body"
+
+
+def searchable_text(record: Dict[str, Any]) -> Optional[str]:
+    """Returns the text of an SMS body or an MMS subject and text parts."""
+    match record.get("record_type"):
+        case "SMS":
+            return record.get("body") or None
+        case "MMS":
+            texts = [record.get("sub")]
+            texts += [
+                part.get("text")
+                for part in record.get("parts", [])
+                if part.get("ct") == "text/plain"
+            ]
+            return "\n".join(t for t in texts if t) or None
+    return None
+
+
+def segment_key(level: int, created_at: Optional[datetime] = None) -> str:
+    """Returns a new segment key; keys of a level sort by creation time."""
+    created_at = created_at or datetime.now(timezone.utc)
+    return (
+        f"{SEGMENT_PREFIX}/{level}/{created_at:%Y%m%d%H%M%S%f}-"
+        f"{uuid.uuid4().hex[:8]}{SEGMENT_SUFFIX}"
+    )
+
+
+def _segment_level(key: str) -> int:
+    return int(key[len(SEGMENT_PREFIX) + 1 :].split("/", 1)[0])
+
+
+def _segment_created_at(key: str) -> str:
+    return key.rsplit("/", 1)[1].split("-", 1)[0]
+
+
+def list_segments(s3_client: S3Client, bucket_name: str) -> List[str]:
+    """Lists segment keys from oldest to newest."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    keys = [
+        obj["Key"]
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{SEGMENT_PREFIX}/")
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(SEGMENT_SUFFIX)
+    ]
+    return sorted(keys, key=_segment_created_at)
+
+
+def _create_segment(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    connection.executescript(_SEGMENT_SCHEMA)
+    return connection
+
+
+def _finish_segment(connection: sqlite3.Connection) -> None:
+    """Builds the full-text index and compacts the segment file."""
+    connection.execute("INSERT INTO messages(messages) VALUES ('rebuild')")
+    connection.execute("INSERT INTO messages(messages) VALUES ('optimize')")
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.close()
+
+
+class SearchIndexer:
+    """
+    Builds full-text index segments from written records.
+
+    Documents are collected in a local SQLite database and uploaded as a new
+    level 0 segment by `flush`.  Segments are immutable; `merge_segments`
+    combines them in the background.
+
+    Args:
+        s3_client (S3Client): S3 client for the segments.
+        bucket_name (str): Bucket the segments are stored in.
+        tmp_dir (Optional[str]): Directory for the segment being built.
+    """
+
+    def __init__(
+        self, s3_client: S3Client, bucket_name: str, tmp_dir: Optional[str] = None
+    ) -> None:
+        self._s3_client = s3_client
+        self._bucket_name = bucket_name
+        self._tmp_dir = tmp_dir
+        self._path: Optional[str] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._documents = 0
+        # Built segments not uploaded yet
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+
+    def add_items(self, items: Iterable[Item]) -> int:
+        """Adds the searchable `AttributeValue` items, returning how many."""
+        rows: List[Tuple[str, ...]] = []
+        for item in items:
+            record = deserialize_item(item)
+            text = searchable_text(record)
+            if text is None:
+                continue
+            rows.append(
+                (
+                    record["id"],
+                    record["record_type"],
+                    "~".join(record["address"]),
+                    record["timestamp"],
+                    text,
+                )
+            )
+        if not rows:
+            return 0
+        with self._lock:
+            if self._connection is None:
+                fd, self._path = tempfile.mkstemp(
+                    suffix=SEGMENT_SUFFIX, dir=self._tmp_dir
+                )
+                os.close(fd)
+                os.unlink(self._path)
+                self._connection = _create_segment(self._path)
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO documents ({_DOCUMENT_COLUMNS}) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._documents += len(rows)
+        return len(rows)
+
+    def flush(self) -> List[str]:
+        """
+        Uploads the documents added so far as a segment.
+
+        Segments that fail to upload are kept and retried by the next flush,
+        so documents are not lost to a transient S3 error.
+
+        Returns:
+            List[str]: Keys of the segments uploaded.
+        """
+        with self._lock:
+            if self._connection is not None:
+                _finish_segment(self._connection)
+                logger.debug(f"Built a search segment of {self._documents} documents")
+                self._pending.append(self._path)
+                self._connection, self._path, self._documents = None, None, 0
+            pending, self._pending = self._pending, []
+
+        keys = []
+        for i, path in enumerate(pending):
+            key = segment_key(level=0)
+            try:
+                self._s3_client.upload_file(path, self._bucket_name, key)
+            except Exception:
+                with self._lock:
+                    self._pending.extend(pending[i:])
+                raise
+            os.unlink(path)
+            keys.append(key)
+            logger.info(f"Uploaded search segment {key}")
+        return keys
+
+
+def merge_segments(
+    s3_client: S3Client,
+    bucket_name: str,
+    fan_in: int = MERGE_FAN_IN,
+    tmp_dir: Optional[str] = None,
+) -> int:
+    """
+    Merges the oldest `fan_in` segments of each level into the next level.
+
+    A record indexed in several segments keeps its newest document.  Merged
+    segments are deleted once the merged one is uploaded; searches that
+    listed them before simply read the same documents twice.  Merges must
+    not run concurrently.
+
+    Returns:
+        int: The number of merges performed.
+    """
+    merges = 0
+    level = 0
+    while True:
+        segments = list_segments(s3_client, bucket_name)
+        if not segments or level > max(_segment_level(k) for k in segments):
+            return merges
+        level_segments = [k for k in segments if _segment_level(k) == level]
+        if len(level_segments) < fan_in:
+            level += 1
+            continue
+
+        inputs = level_segments[:fan_in]
+        with tempfile.TemporaryDirectory(dir=tmp_dir) as work_dir:
+            merged_path = os.path.join(work_dir, f"merged{SEGMENT_SUFFIX}")
+            connection = _create_segment(merged_path)
+            # Newest first, so older documents of the same record are ignored
+            for i, key in enumerate(reversed(inputs)):
+                input_path = os.path.join(work_dir, f"{i}{SEGMENT_SUFFIX}")
+                s3_client.download_file(bucket_name, key, input_path)
+                connection.execute("ATTACH DATABASE ? AS segment", (input_path,))
+                connection.execute(
+                    f"INSERT OR IGNORE INTO documents ({_DOCUMENT_COLUMNS}) "
+                    f"SELECT {_DOCUMENT_COLUMNS} FROM segment.documents"
+                )
+                connection.commit()
+                connection.execute("DETACH DATABASE segment")
+                os.unlink(input_path)
+            _finish_segment(connection)
+
+            created_at = datetime.strptime(
+                _segment_created_at(inputs[-1]), "%Y%m%d%H%M%S%f"
+            )
+            merged_key = segment_key(level + 1, created_at=created_at)
+            s3_client.upload_file(merged_path, bucket_name, merged_key)
+        s3_client.delete_objects(
+            Bucket=bucket_name,
+            Delete={"Objects": [{"Key": key} for key in inputs]},
+        )
+        logger.info(f"Merged {len(inputs)} level {level} segments into {merged_key}")
+        merges += 1
+
+
+def match_expression(query: str) -> str:
+    """Quotes each term of a free text query for FTS5, all terms required."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into terms the way the segments' `unicode61` tokenizer does."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return _TOKEN_PATTERN.findall(
+        "".join(c for c in text if not unicodedata.combining(c))
+    )
+
+
+def query_terms(query: str, raw: bool = False) -> List[str]:
+    """Returns the distinct terms a query is scored on."""
+    if raw:
+        query = _QUERY_OPERATORS.sub(" ", query)
+    return sorted(set(tokenize(query)))
+
+
+def bm25(
+    text: str,
+    idf: Dict[str, float],
+    average_length: float,
+    k1: float = BM25_K1,
+    b: float = BM25_B,
+) -> float:
+    """Scores a document's text for the query terms weighted by `idf`."""
+    tokens = tokenize(text)
+    frequencies = Counter(tokens)
+    norm = k1 * (1 - b + b * len(tokens) / average_length)
+    return sum(
+        weight * frequencies[term] * (k1 + 1) / (frequencies[term] + norm)
+        for term, weight in idf.items()
+        if frequencies[term]
+    )
+
+
+def inverse_document_frequency(documents: int, matching: int) -> float:
+    """FTS5's BM25 IDF, kept slightly positive for terms in most documents."""
+    return max(math.log((documents - matching + 0.5) / (matching + 0.5)), 1e-6)
+
+
+class SearchIndex:
+    """
+    Searches the full-text index segments in the bucket.
+
+    Segments are downloaded to `cache_dir` the first time a search needs
+    them, opened read-only with memory mapping and queried in parallel.
+    Hits are ranked by BM25 with term IDFs computed over all segments, so
+    scores are comparable across segments, and a document shadowed by a newer
+    segment indexing the same record is dropped.  The best `limit` matches of
+    each segment by its own BM25 are rescored first; since a document's score
+    is bounded by its segment score times the largest ratio of global to
+    segment IDF, a second read only fetches the matches that can still enter
+    the best `limit`.  The segment list is refreshed every `refresh_interval` seconds, dropping
+    segments merged away since.
+
+    Args:
+        s3_client (S3Client): S3 client for the segments.
+        bucket_name (str): Bucket the segments are stored in.
+        cache_dir (Optional[str]): Local directory segments are cached in.
+        refresh_interval (float): Seconds between segment list refreshes.
+        max_workers (int): Segments downloaded and searched in parallel.
+    """
+
+    def __init__(
+        self,
+        s3_client: S3Client,
+        bucket_name: str,
+        cache_dir: Optional[str] = None,
+        refresh_interval: float = 60.0,
+        max_workers: int = 8,
+    ) -> None:
+        self._s3_client = s3_client
+        self._bucket_name = bucket_name
+        self._cache_dir = cache_dir or os.path.join(
+            tempfile.gettempdir(), "search-segments"
+        )
+        os.makedirs(self._cache_dir, exist_ok=True)
+        self._refresh_interval = refresh_interval
+        self._refreshed_at: Optional[float] = None
+        self._segments: List[str] = []
+        self._connections: Dict[str, sqlite3.Connection] = {}
+        # Documents and tokens per segment, which never change
+        self._sizes: Dict[str, Tuple[int, int]] = {}
+        # Breaks ties between hits of equal score in the heap
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def refresh(self) -> None:
+        """Re-lists the segments, closing those that were merged away."""
+        segments = list_segments(self._s3_client, self._bucket_name)
+        with self._lock:
+            for key in set(self._connections) - set(segments):
+                self._connections.pop(key).close()
+                self._sizes.pop(key, None)
+                path = self._local_path(key)
+                if os.path.exists(path):
+                    os.unlink(path)
+            self._segments = segments
+            self._refreshed_at = time.monotonic()
+
+    def _local_path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key.replace("/", "_"))
+
+    def _connection(self, key: str) -> sqlite3.Connection:
+        """Downloads and opens a segment on first use."""
+        with self._lock:
+            connection = self._connections.get(key)
+        if connection is not None:
+            return connection
+
+        path = self._local_path(key)
+        if not os.path.exists(path):
+            partial_path = f"{path}.{uuid.uuid4().hex}.partial"
+            self._s3_client.download_file(self._bucket_name, key, partial_path)
+            os.replace(partial_path, path)
+        connection = sqlite3.connect(
+            f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False
+        )
+        connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        # Per-term document counts, in the connection's temporary schema
+        connection.execute(
+            "CREATE VIRTUAL TABLE temp.vocabulary "
+            "USING fts5vocab(main, 'messages', 'row')"
+        )
+        [(documents,)] = connection.execute("SELECT count(*) FROM documents")
+        [(tokens,)] = connection.execute(
+            "SELECT coalesce(sum(cnt), 0) FROM temp.vocabulary"
+        )
+        with self._lock:
+            self._sizes.setdefault(key, (documents, tokens))
+            return self._connections.setdefault(key, connection)
+
+    def _matching(self, key: str, terms: List[str]) -> Counter:
+        """Returns the number of a segment's documents containing each term."""
+        matching = Counter()
+        for term in terms:
+            for (count,) in self._connection(key).execute(
+                "SELECT doc FROM temp.vocabulary WHERE term = ?", (term,)
+            ):
+                matching[term] = count
+        return matching
+
+    def _page(
+        self,
+        key: str,
+        expression: str,
+        size: Optional[int] = None,
+        min_score: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns a segment's matches best first by its own BM25.
+
+        Args:
+            key (str): Key of the segment.
+            expression (str): FTS5 match expression.
+            size (Optional[int]): Number of matches returned, all if None.
+            min_score (Optional[float]): Lowest local score returned.
+        """
+        rows = self._connection(key).execute(
+            f"""
+            SELECT d.rowid, d.record_id, d.record_type, d.address, d.timestamp,
+                d.body, bm25(messages)
+            FROM messages JOIN documents d ON d.rowid = messages.rowid
+            WHERE messages MATCH ?
+            {"" if min_score is None else "AND bm25(messages) <= ?"}
+            ORDER BY bm25(messages)
+            LIMIT ?
+            """,
+            (
+                expression,
+                *(() if min_score is None else (-min_score,)),
+                -1 if size is None else size,
+            ),
+        )
+        return [
+            {
+                "rowid": rowid,
+                "id": record_id,
+                "record_type": record_type,
+                "address": address.split("~"),
+                "timestamp": timestamp,
+                "body": body,
+                "score": -score,
+            }
+            for rowid, record_id, record_type, address, timestamp, body, score in rows
+        ]
+
+    def _indexed(self, key: str, record_ids: List[str]) -> Set[str]:
+        """Returns the ids among `record_ids` a segment has documents for."""
+        connection = self._connection(key)
+        indexed = set()
+        for start in range(0, len(record_ids), SHADOW_LOOKUP_BATCH):
+            batch = record_ids[start : start + SHADOW_LOOKUP_BATCH]
+            indexed.update(
+                record_id
+                for (record_id,) in connection.execute(
+                    "SELECT record_id FROM documents WHERE record_id IN "
+                    f"({', '.join('?' * len(batch))})",
+                    batch,
+                )
+            )
+        return indexed
+
+    def _snippet(self, key: str, expression: str, rowid: int) -> str:
+        [(snippet,)] = self._connection(key).execute(
+            """
+            SELECT snippet(messages, 0, '[', ']', '...', 12) FROM messages
+            WHERE messages MATCH ? AND rowid = ?
+            """,
+            (expression, rowid),
+        )
+        return snippet
+
+    def search(
+        self, query: str, limit: int = 20, raw: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns the best matching messages across all segments.
+
+        Args:
+            query (str): Terms that must all occur, or an FTS5 query if `raw`.
+            limit (int): Maximum number of hits.
+            raw (bool): Whether `query` is passed to FTS5 as is.
+
+        Returns:
+            List[Dict[str, Any]]: Hits with the record `id`, `record_type`,
+                `address`, `timestamp`, a `snippet` and a relevance `score`.
+        """
+        if (
+            self._refreshed_at is None
+            or time.monotonic() - self._refreshed_at >= self._refresh_interval
+        ):
+            self.refresh()
+        expression = query if raw else match_expression(query)
+        if not expression:
+            return []
+
+        segments = list(self._segments)
+        terms = query_terms(query, raw=raw)
+        matching = list(
+            self._executor.map(lambda key: self._matching(key, terms), segments)
+        )
+        documents = sum(self._sizes[key][0] for key in segments)
+        if not documents:
+            return []
+        idf = {
+            term: inverse_document_frequency(
+                documents, sum(counts[term] for counts in matching)
+            )
+            for term in terms
+        }
+        # A segment's global score is at most its local score times the
+        # largest ratio of a term's global to local IDF; without known terms,
+        # e.g. raw prefix queries, it is read to the end
+        bounds = []
+        for key, counts in zip(segments, matching):
+            segment_documents, _ = self._sizes[key]
+            bounds.append(
+                max(
+                    (
+                        idf[term]
+                        / inverse_document_frequency(segment_documents, counts[term])
+                        for term in terms
+                        if counts[term]
+                    ),
+                    default=math.inf,
+                )
+            )
+
+        best: List[Tuple[float, int, str, Dict[str, Any]]] = []
+        pages = list(
+            self._executor.map(lambda key: self._page(key, expression, limit), segments)
+        )
+        # Only segments whose first page was full can hold more hits
+        floors = [page[-1]["score"] if len(page) == limit else None for page in pages]
+        ranked = [{hit["rowid"] for hit in page} for page in pages]
+        for i, page in enumerate(pages):
+            self._rank(segments, i, page, idf, best, limit)
+
+        # The matches whose bound reaches the `limit`th best score so far
+        threshold = best[0][0] if len(best) >= limit else 0.0
+        remaining = [
+            i
+            for i, floor in enumerate(floors)
+            if floor is not None and bounds[i] * floor > threshold
+        ]
+        pages = self._executor.map(
+            lambda i: self._page(
+                segments[i], expression, min_score=threshold / bounds[i]
+            ),
+            remaining,
+        )
+        for i, page in zip(remaining, pages):
+            page = [hit for hit in page if hit["rowid"] not in ranked[i]]
+            self._rank(segments, i, page, idf, best, limit)
+
+        hits = []
+        for _, _, key, hit in sorted(best, reverse=True):
+            hit["snippet"] = self._snippet(key, expression, hit.pop("rowid"))
+            hits.append(hit)
+        return hits
+
+    def _rank(
+        self,
+        segments: List[str],
+        i: int,
+        page: List[Dict[str, Any]],
+        idf: Dict[str, float],
+        best: List[Tuple[float, int, str, Dict[str, Any]]],
+        limit: int,
+    ) -> None:
+        """Rescores a page of segment `i` and keeps the `limit` best hits."""
+        key = segments[i]
+        shadowed: Set[str] = set()
+        record_ids = [hit["id"] for hit in page]
+        for newer in segments[i + 1 :]:
+            shadowed |= self._indexed(newer, record_ids)
+        documents, tokens = self._sizes[key]
+        for hit in page:
+            if hit["id"] in shadowed:
+                continue
+            hit["score"] = bm25(hit.pop("body"), idf, max(tokens, 1) / documents)
+            entry = (hit["score"], next(self._sequence), key, hit)
+            if len(best) < limit:
+                heapq.heappush(best, entry)
+            else:
+                heapq.heappushpop(best, entry)
@@ -0,0 +1,187 @@
+import threading
+import time
+from itertools import batched
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import redis
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import MetricUnit
+
+from warm_cache import TTLCache
+
+logger = Logger()
+
+SHARED_CACHE_TTL_SECONDS = 60 * 60
+SHARED_CACHE_KEY_PREFIX = "sms-backup-restore"
+# Members sent per SMISMEMBER or SADD command of a pipeline
+PIPELINE_BATCH_SIZE = 1000
+IN_PROCESS_MAX_BYTES = 64 * 1024 * 1024
+
+
+def part_namespace(bucket_name: str) -> str:
+    """Namespace of the attachment hashes stored in a bucket."""
+    return f"parts:{bucket_name}"
+
+
+def record_namespace(table_name: str) -> str:
+    """Namespace of the records stored in a table."""
+    return f"records:{table_name}"
+
+
+def record_member(record_id: str, timestamp: str, digest: str) -> str:
+    """Member recording that a record is stored with a content digest."""
+    return f"{record_id}#{timestamp}#{digest}"
+
+
+class SharedSetCache:
+    """
+    Sets of members shared by concurrent workers, e.g. attachment hashes
+    and record digests already stored.
+
+    The cache is advisory: a member it does not know about is checked
+    against S3 or DynamoDB as before, so backends may drop members and
+    errors are logged rather than raised.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hits = 0
+
+    def _contains(self, namespace: str, members: List[str]) -> List[bool]:
+        raise NotImplementedError()
+
+    def add(self, namespace: str, members: Iterable[str]) -> None:
+        """Adds members to a namespace's set."""
+        raise NotImplementedError()
+
+    def contains(self, namespace: str, members: Iterable[str]) -> List[bool]:
+        """Returns whether each member is in a namespace's set."""
+        members = list(members)
+        if not members:
+            return []
+        found = self._contains(namespace, members)
+        with self._lock:
+            self._lookups += len(members)
+            self._hits += sum(found)
+        return found
+
+    def metrics(self) -> List[Tuple[str, MetricUnit, float]]:
+        """Returns and resets the hit rate metrics of the cache."""
+        with self._lock:
+            lookups, hits, self._lookups, self._hits = self._lookups, self._hits, 0, 0
+        hit_rate = 100.0 * hits / lookups if lookups else 0.0
+        return [
+            ("SharedCacheHitRate", MetricUnit.Percent, hit_rate),
+            ("SharedCacheLookups", MetricUnit.Count, lookups),
+        ]
+
+
+class InProcessSetCache(SharedSetCache):
+    """
+    Shared set cache for the workers of one process, backed by a TTL cache.
+
+    Args:
+        ttl_seconds (float): Seconds a member is kept after it was added.
+        max_bytes (int): Estimated size the members are kept under.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = SHARED_CACHE_TTL_SECONDS,
+        max_bytes: int = IN_PROCESS_MAX_BYTES,
+    ) -> None:
+        super().__init__()
+        self._members = TTLCache("SharedSet", ttl_seconds, max_bytes)
+
+    def _contains(self, namespace: str, members: List[str]) -> List[bool]:
+        return [(namespace, member) in self._members for member in members]
+
+    def add(self, namespace: str, members: Iterable[str]) -> None:
+        for member in members:
+            self._members.put((namespace, member))
+
+
+class RedisSetCache(SharedSetCache):
+    """
+    Shared set cache in Redis, one sorted set per namespace.
+
+    Each member is scored with the time it expires, `ttl_seconds` after it
+    was last added, so members expire on their own even while others keep
+    being added to the set.  Lookups are sent as a pipeline of `ZMSCORE`
+    commands of `batch_size` members and only find unexpired members.
+    Additions are sent as a pipeline of `ZADD` commands followed by a
+    `ZREMRANGEBYSCORE` trimming the expired members and an `EXPIRE` of the
+    idle set, so each call is one round trip.
+
+    Args:
+        client (redis.Redis): Redis client.
+        ttl_seconds (int): Seconds a member is kept after it was added.
+        key_prefix (str): Prefix of the sets' keys.
+        batch_size (int): Members per command.
+        clock (Callable[[], float]): Clock shared by the workers, in seconds.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        ttl_seconds: int = SHARED_CACHE_TTL_SECONDS,
+        key_prefix: str = SHARED_CACHE_KEY_PREFIX,
+        batch_size: int = PIPELINE_BATCH_SIZE,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        super().__init__()
+        self._redis = client
+        self._ttl_seconds = ttl_seconds
+        self._key_prefix = key_prefix
+        self._batch_size = batch_size
+        self._clock = clock
+
+    def _key(self, namespace: str) -> str:
+        return f"{self._key_prefix}:{namespace}"
+
+    def _contains(self, namespace: str, members: List[str]) -> List[bool]:
+        key = self._key(namespace)
+        now = self._clock()
+        pipeline = self._redis.pipeline(transaction=False)
+        for chunk in batched(members, self._batch_size):
+            pipeline.zmscore(key, chunk)
+        try:
+            results = pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Shared cache lookup failed: {e!r}")
+            return [False] * len(members)
+        return [
+            expires is not None and expires > now
+            for result in results
+            for expires in result
+        ]
+
+    def add(self, namespace: str, members: Iterable[str]) -> None:
+        key = self._key(namespace)
+        now = self._clock()
+        pipeline = self._redis.pipeline(transaction=False)
+        added = False
+        for chunk in batched(members, self._batch_size):
+            pipeline.zadd(key, dict.fromkeys(chunk, now + self._ttl_seconds))
+            added = True
+        if not added:
+            return
+        pipeline.zremrangebyscore(key, "-inf", now)
+        pipeline.expire(key, self._ttl_seconds)
+        try:
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Shared cache update failed: {e!r}")
+
+
+def build_shared_cache(url: Optional[str]) -> Optional[SharedSetCache]:
+    """Returns the shared cache at `SHARED_CACHE_URL`, None if unset."""
+    if not url:
+        return None
+    if url == "memory://":
+        return InProcessSetCache()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        logger.info("Using the Redis shared cache")
+        return RedisSetCache(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported shared cache URL {url}")
@@ -0,0 +1,679 @@
+import asyncio
+import json
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import batched
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import MetricUnit
+from botocore.exceptions import ClientError
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3.client import S3Client
+
+from aggregates import ContactAggregates
+from compact_records import Record
+from io_engine import AsyncIOEngine
+from item_serializer import (
+    COMPRESSION_THRESHOLD_BYTES,
+    SPILL_THRESHOLD_BYTES,
+    Item,
+    compress_item,
+    item_size,
+    serialize_record,
+    spill_item,
+)
+from rate_control import AdaptiveWriteRateController
+from search_index import SearchIndexer
+from shared_cache import SharedSetCache
+from warm_cache import TTLCache
+from write_diff import DIGEST_ATTRIBUTE, WriteSkipDiffer, content_digest
+
+if TYPE_CHECKING:
+    # The sqs stubs are not part of the runtime image
+    from mypy_boto3_sqs.client import SQSClient
+
+logger = Logger()
+
+DYNAMODB_BATCH_SIZE = 25
+# Number of items diffed against the table per round of BatchGetItem calls
+DIFF_CHUNK_SIZE = 1000
+DYNAMODB_MAX_WRITE_ATTEMPTS = 10
+DYNAMODB_THROTTLING_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
+SQS_MAX_PAYLOAD_BYTES = 256 * 1024
+SQS_MAX_BATCH_ENTRIES = 10
+# Record batches larger than this are offloaded to S3 and referenced by pointer
+SQS_OFFLOAD_THRESHOLD_BYTES = 200 * 1024
+RECORD_BATCH_PREFIX = "batches"
+
+
+def consumed_units(response: Dict[str, Any]) -> float:
+    """Returns the write units a DynamoDB response reports consumed."""
+    consumed = response.get("ConsumedCapacity", [])
+    if isinstance(consumed, dict):
+        return consumed.get("CapacityUnits", 0)
+    return sum(c.get("CapacityUnits", 0) for c in consumed)
+
+
+def throttled_response(
+    error: ClientError, request_items: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Treats a throttled request as a response leaving all of its items
+    unprocessed, re-raising any other error.
+    """
+    if error.response["Error"]["Code"] not in DYNAMODB_THROTTLING_ERROR_CODES:
+        raise error
+    return {"UnprocessedItems": request_items}
+
+
+def to_item(record_id: str, record: Record) -> Dict[str, Any]:
+    """Returns the item representation of a record keyed by its `id`."""
+    return {"id": record_id, **record.model_dump()}
+
+
+class RecordSink:
+    """Base class for destinations of processed backup records."""
+
+    name: str = "sink"
+
+    def write(self, records: Iterable[Tuple[str, Record]]) -> int:
+        """
+        Writes records to the sink.
+
+        Args:
+            records (Iterable[Tuple[str, Record]]): Pairs of record
+                id and validated record.
+
+        Returns:
+            int: The number of records written.
+        """
+        raise NotImplementedError()
+
+    def metrics(self) -> List[Tuple[str, MetricUnit, float]]:
+        """Returns and resets the (name, unit, value) metrics of the sink."""
+        return []
+
+    def flush(self) -> None:
+        """Completes side outputs buffered across writes."""
+
+    def close(self) -> None:
+        """Flushes and releases any resources held by the sink."""
+        self.flush()
+
+    def __enter__(self) -> "RecordSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class DynamoDBSink(RecordSink):
+    """
+    Writes records to DynamoDB with `BatchWriteItem` on the low-level client.
+
+    Records are serialized straight to `AttributeValue` maps and each item
+    carries a content digest.  When `skip_unchanged` is set, items are diffed
+    against the table in chunks and only new or modified items are written.
+    With a `contact_summary_table`, new items are put one by one on the
+    condition that their `id` does not exist yet, and only those the put
+    created update the per-contact summaries, so a record written by
+    concurrent workers is counted once.  Written items are added to
+    `search_indexer`, whose segment is uploaded by `flush`.
+
+    Text attributes larger than `compression_threshold` bytes are stored
+    compressed, and items that would still exceed DynamoDB's item size limit
+    are stored in `bucket_name` with a placeholder item pointing to them.
+
+    With an `io_engine`, batches are sent concurrently from its event loop
+    instead of a thread pool, under the same rate controller.  With
+    `recent_digests`, the digests of written items are cached so a warm
+    container skips them without a lookup when they come again unchanged,
+    and with a `shared_cache`, so do concurrent workers.
+    """
+
+    name = "dynamodb"
+
+    def __init__(
+        self,
+        dynamodb_client: DynamoDBClient,
+        table_name: str,
+        skip_unchanged: bool = True,
+        rate_controller: Optional[AdaptiveWriteRateController] = None,
+        contact_summary_table: Optional[str] = None,
+        search_indexer: Optional[SearchIndexer] = None,
+        compression_threshold: Optional[int] = COMPRESSION_THRESHOLD_BYTES,
+        s3_client: Optional[S3Client] = None,
+        bucket_name: Optional[str] = None,
+        io_engine: Optional[AsyncIOEngine] = None,
+        recent_digests: Optional[TTLCache] = None,
+        shared_cache: Optional[SharedSetCache] = None,
+    ) -> None:
+        self._dynamodb_client = dynamodb_client
+        self._table_name = table_name
+        self._differ = (
+            WriteSkipDiffer(
+                dynamodb_client,
+                table_name,
+                recent_digests=recent_digests,
+                shared_cache=shared_cache,
+            )
+            if skip_unchanged
+            else None
+        )
+        # Summaries are only kept when new records can be told from rewrites
+        self._aggregates = (
+            ContactAggregates(dynamodb_client, contact_summary_table)
+            if skip_unchanged and contact_summary_table
+            else None
+        )
+        self._search_indexer = search_indexer
+        self._compression_threshold = compression_threshold
+        self._s3_client = s3_client
+        self._bucket_name = bucket_name
+        self._io_engine = io_engine
+        self._rate_controller = rate_controller or AdaptiveWriteRateController()
+        self._counts = Counter()
+        self._counts_lock = threading.Lock()
+
+    def metrics(self) -> List[Tuple[str, MetricUnit, float]]:
+        counts, self._counts = self._counts, Counter()
+        return [
+            ("RecordsNew", MetricUnit.Count, counts["new"]),
+            ("RecordsModified", MetricUnit.Count, counts["modified"]),
+            ("RecordsSkipped", MetricUnit.Count, counts["unchanged"]),
+            ("WriteThrottles", MetricUnit.Count, counts["throttled"]),
+            ("ContactSummariesUpdated", MetricUnit.Count, counts["summaries"]),
+            ("SearchDocumentsIndexed", MetricUnit.Count, counts["indexed"]),
+            ("ItemsCompressed", MetricUnit.Count, counts["compressed"]),
+            ("ItemsSpilled", MetricUnit.Count, counts["spilled"]),
+            (
+                "ConsumedWriteCapacityRate",
+                MetricUnit.CountPerSecond,
+                self._rate_controller.current_rate(),
+            ),
+            (
+                "AllowedWriteCapacityRate",
+                MetricUnit.CountPerSecond,
+                self._rate_controller.allowed_rate,
+            ),
+        ]
+
+    def write(self, records: Iterable[Tuple[str, Record]]) -> int:
+        return self.write_items(
+            serialize_record(record_id, record) for record_id, record in records
+        )
+
+    def write_items(self, items: Iterable[Item]) -> int:
+        """Writes `AttributeValue` items, returning the number written."""
+        written = 0
+        try:
+            for chunk in batched(items, DIFF_CHUNK_SIZE):
+                for item in chunk:
+                    item[DIGEST_ATTRIBUTE] = {"S": content_digest(item)}
+                if self._differ is None:
+                    written += self._batch_write(chunk)
+                    self._index(chunk)
+                    continue
+                write_diff = self._differ.diff(list(chunk))
+                new, unchanged = write_diff.new, write_diff.unchanged
+                if self._aggregates is not None:
+                    new = self._put_new(new)
+                    unchanged += len(write_diff.new) - len(new)
+                    self._aggregates.add_items(new)
+                    changed = new + write_diff.modified
+                    written += len(new) + self._batch_write(write_diff.modified)
+                else:
+                    changed = write_diff.changed
+                    written += self._batch_write(changed)
+                self._counts.update(
+                    new=len(new), modified=len(write_diff.modified), unchanged=unchanged
+                )
+                self._differ.remember(changed)
+                self._index(changed)
+        finally:
+            # Counts records of the chunks written, even if a later one failed
+            if self._aggregates is not None:
+                self._counts.update(summaries=self._aggregates.flush())
+        return written
+
+    def _index(self, items: Iterable[Item]) -> None:
+        if self._search_indexer is not None:
+            self._counts.update(indexed=self._search_indexer.add_items(items))
+
+    def flush(self) -> None:
+        if self._search_indexer is not None:
+            self._search_indexer.flush()
+
+    def _storable(self, item: Item) -> Item:
+        """Compresses an item, or spills it to S3 if it is still too large."""
+        if self._compression_threshold is not None:
+            stored = compress_item(item, threshold=self._compression_threshold)
+            if stored is not item:
+                self._counts.update(compressed=1)
+        else:
+            stored = item
+        if item_size(stored) <= SPILL_THRESHOLD_BYTES:
+            return stored
+        if self._s3_client is None or self._bucket_name is None:
+            raise ValueError(
+                f"Item {item['id']['S']} exceeds the DynamoDB item size limit "
+                "and no bucket is configured to spill it to"
+            )
+        self._counts.update(spilled=1)
+        return spill_item(self._s3_client, self._bucket_name, item)
+
+    def _batch_write(self, items: Iterable[Item]) -> int:
+        """Writes items in batches of 25, paced by the rate controller."""
+        if self._io_engine is not None:
+            return self._io_engine.run(
+                self._batch_write_async([self._storable(item) for item in items])
+            )
+        written = 0
+        in_flight = set()
+        controller = self._rate_controller
+        with ThreadPoolExecutor(max_workers=controller.max_concurrency) as executor:
+            for batch in batched(items, DYNAMODB_BATCH_SIZE):
+                while len(in_flight) >= controller.concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    written += sum(future.result() for future in done)
+                put_requests = [
+                    {"PutRequest": {"Item": self._storable(item)}} for item in batch
+                ]
+                in_flight.add(executor.submit(self._write_batch, put_requests))
+            written += sum(future.result() for future in in_flight)
+        return written
+
+    def _put_new(self, items: List[Item]) -> List[Item]:
+        """
+        Puts items on the condition that they do not exist yet.
+
+        Returns the items the puts created; the others were written by a
+        concurrent worker since they were diffed.
+        """
+        controller = self._rate_controller
+        with ThreadPoolExecutor(max_workers=controller.max_concurrency) as executor:
+            created = list(
+                executor.map(
+                    self._put_if_absent, [self._storable(item) for item in items]
+                )
+            )
+        return [item for item, put in zip(items, created) if put]
+
+    def _put_if_absent(self, item: Item) -> bool:
+        """Puts one item unless its `id` exists, retrying throttled requests."""
+        for attempt in range(DYNAMODB_MAX_WRITE_ATTEMPTS):
+            self._rate_controller.acquire(1)
+            try:
+                response = self._dynamodb_client.put_item(
+                    TableName=self._table_name,
+                    Item=item,
+                    ConditionExpression="attribute_not_exists(id)",
+                    ReturnConsumedCapacity="TOTAL",
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                    self._rate_controller.record(1, 1)
+                    return False
+                self._settle(1, throttled_response(e, {self._table_name: [item]}))
+                self._rate_controller.backoff(attempt)
+                continue
+            self._rate_controller.record(1, consumed_units(response))
+            return True
+        raise RuntimeError(
+            f"Failed to write item {item['id']['S']} "
+            f"after {DYNAMODB_MAX_WRITE_ATTEMPTS} attempts"
+        )
+
+    def _write_batch(self, put_requests: List[Dict[str, Any]]) -> int:
+        """
+        Writes one batch, retrying unprocessed items and throttled requests.
+
+        Capacity is estimated at one write unit per item before sending and
+        corrected with the `ConsumedCapacity` returned by DynamoDB; the
+        attempts are settled by `_settle`, shared with `_write_batch_async`.
+        """
+        request_items = {self._table_name: put_requests}
+        for attempt in range(DYNAMODB_MAX_WRITE_ATTEMPTS):
+            estimated_units = len(request_items[self._table_name])
+            self._rate_controller.acquire(estimated_units)
+            try:
+                response = self._dynamodb_client.batch_write_item(
+                    RequestItems=request_items, ReturnConsumedCapacity="TOTAL"
+                )
+            except ClientError as e:
+                response = throttled_response(e, request_items)
+            request_items = self._settle(estimated_units, response)
+            if not request_items:
+                return len(put_requests)
+            self._rate_controller.backoff(attempt)
+        raise self._write_failure(request_items)
+
+    async def _batch_write_async(self, items: List[Item]) -> int:
+        """`_batch_write` with concurrent batches on the I/O engine's loop."""
+        dynamodb_client = await self._io_engine.client("dynamodb")
+        written = 0
+        in_flight = set()
+        controller = self._rate_controller
+        for batch in batched(items, DYNAMODB_BATCH_SIZE):
+            while len(in_flight) >= controller.concurrency:
+                done, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+                written += sum(task.result() for task in done)
+            put_requests = [{"PutRequest": {"Item": item}} for item in batch]
+            in_flight.add(
+                asyncio.create_task(
+                    self._write_batch_async(dynamodb_client, put_requests)
+                )
+            )
+        if in_flight:
+            written += sum(await asyncio.gather(*in_flight))
+        return written
+
+    async def _write_batch_async(
+        self, dynamodb_client: Any, put_requests: List[Dict[str, Any]]
+    ) -> int:
+        """`_write_batch` on an aiobotocore client."""
+        request_items = {self._table_name: put_requests}
+        for attempt in range(DYNAMODB_MAX_WRITE_ATTEMPTS):
+            estimated_units = len(request_items[self._table_name])
+            await self._rate_controller.acquire_async(estimated_units)
+            try:
+                response = await dynamodb_client.batch_write_item(
+                    RequestItems=request_items, ReturnConsumedCapacity="TOTAL"
+                )
+            except ClientError as e:
+                response = throttled_response(e, request_items)
+            request_items = self._settle(estimated_units, response)
+            if not request_items:
+                return len(put_requests)
+            await self._rate_controller.backoff_async(attempt)
+        raise self._write_failure(request_items)
+
+    def _settle(
+        self, estimated_units: int, response: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Records the capacity an attempt consumed and backs off if it left
+        items unprocessed.
+
+        Returns:
+            Optional[Dict[str, Any]]: The `RequestItems` left to retry.
+        """
+        self._rate_controller.record(estimated_units, consumed_units(response))
+        request_items = response.get("UnprocessedItems")
+        if request_items:
+            self._throttled()
+        return request_items
+
+    def _throttled(self) -> None:
+        with self._counts_lock:
+            self._counts.update(throttled=1)
+        self._rate_controller.throttled()
+
+    def _write_failure(self, request_items: Dict[str, Any]) -> RuntimeError:
+        return RuntimeError(
+            f"Failed to write {len(request_items[self._table_name])} items "
+            f"after {DYNAMODB_MAX_WRITE_ATTEMPTS} attempts"
+        )
+
+
+class KafkaSink(RecordSink):
+    """
+    Publishes records to a Kafka (or Redpanda) topic keyed by record id.
+
+    Produce calls are batched by the producer using `batch_size` and
+    `linger_ms`, compressed with `compression_type` and bounded by
+    `max_in_flight_requests_per_connection`.
+    """
+
+    name = "kafka"
+
+    def __init__(
+        self,
+        bootstrap_servers: str,
+        topic: str,
+        compression_type: str = "gzip",
+        batch_size: int = 256 * 1024,
+        linger_ms: int = 50,
+        max_in_flight_requests: int = 5,
+        producer: Optional[Any] = None,
+    ) -> None:
+        self._topic = topic
+        if producer is None:
+            # kafka-python is only needed when the Kafka sink is enabled
+            from kafka import KafkaProducer
+
+            producer = KafkaProducer(
+                bootstrap_servers=bootstrap_servers.split(","),
+                compression_type=compression_type,
+                batch_size=batch_size,
+                linger_ms=linger_ms,
+                max_in_flight_requests_per_connection=max_in_flight_requests,
+                acks="all",
+                retries=5,
+                key_serializer=str.encode,
+                value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+            )
+        self._producer = producer
+
+    def write(self, records: Iterable[Tuple[str, Record]]) -> int:
+        futures = [
+            self._producer.send(
+                self._topic, key=record_id, value=to_item(record_id, record)
+            )
+            for record_id, record in records
+        ]
+        self._producer.flush()
+        for future in futures:
+            # Raises the underlying KafkaError if a produce request failed
+            future.get(timeout=0)
+        return len(futures)
+
+    def close(self) -> None:
+        self._producer.flush()
+        self._producer.close()
+
+
+class SQSSink(RecordSink):
+    """
+    Enqueues record batches to SQS for the writer function to consume.
+
+    Each message carries up to `batch_records` items already serialized to
+    `AttributeValue` maps.  Batches whose payload
+    exceeds `SQS_OFFLOAD_THRESHOLD_BYTES` are stored under `batches/` in the
+    bucket and the message carries a pointer to the object instead.
+    """
+
+    name = "sqs"
+
+    def __init__(
+        self,
+        sqs_client: "SQSClient",
+        queue_url: str,
+        s3_client: S3Client,
+        bucket_name: str,
+        batch_records: int = 100,
+    ) -> None:
+        self._sqs_client = sqs_client
+        self._queue_url = queue_url
+        self._s3_client = s3_client
+        self._bucket_name = bucket_name
+        self._batch_records = batch_records
+
+    def _encode_batch(self, run_id: str, seq: int, items: List[Item]) -> str:
+        """Returns the message body for a batch, offloading it to S3 if large."""
+        body = json.dumps({"records": items})
+        if len(body.encode("utf-8")) <= SQS_OFFLOAD_THRESHOLD_BYTES:
+            return body
+
+        key = f"{RECORD_BATCH_PREFIX}/{run_id}/{seq:08d}.json"
+        self._s3_client.put_object(
+            Bucket=self._bucket_name,
+            Key=key,
+            Body=body.encode("utf-8"),
+            ContentType="application/json",
+        )
+        return json.dumps({"s3": {"bucket": self._bucket_name, "key": key}})
+
+    def _send_entries(self, entries: List[Dict[str, str]]) -> None:
+        response = self._sqs_client.send_message_batch(
+            QueueUrl=self._queue_url, Entries=entries
+        )
+        if response.get("Failed"):
+            raise RuntimeError(
+                f"Failed to enqueue record batches: {response['Failed']}"
+            )
+
+    def write(self, records: Iterable[Tuple[str, Record]]) -> int:
+        run_id = str(uuid.uuid4())
+        written = 0
+        entries: List[Dict[str, str]] = []
+        entries_size = 0
+        for seq, batch in enumerate(batched(records, self._batch_records)):
+            items = [serialize_record(record_id, record) for record_id, record in batch]
+            body = self._encode_batch(run_id=run_id, seq=seq, items=items)
+            body_size = len(body.encode("utf-8"))
+            if entries and (
+                len(entries) == SQS_MAX_BATCH_ENTRIES
+                or entries_size + body_size > SQS_MAX_PAYLOAD_BYTES
+            ):
+                self._send_entries(entries)
+                entries, entries_size = [], 0
+            entries.append({"Id": str(seq), "MessageBody": body})
+            entries_size += body_size
+            written += len(items)
+        if entries:
+            self._send_entries(entries)
+        return written
+
+
+def load_record_batch(s3_client: S3Client, body: str) -> List[Item]:
+    """
+    Loads the items of a record batch enqueued by `SQSSink`.
+
+    Args:
+        s3_client (S3Client): Client used to fetch batches offloaded to S3.
+        body (str): The SQS message body.
+
+    Returns:
+        List[Item]: The `AttributeValue` items in the batch.
+    """
+    payload = json.loads(body)
+    if "s3" in payload:
+        response = s3_client.get_object(
+            Bucket=payload["s3"]["bucket"], Key=payload["s3"]["key"]
+        )
+        payload = json.loads(response["Body"].read())
+    return payload["records"]
+
+
+def build_sinks(
+    sink_names: str,
+    dynamodb_client: DynamoDBClient,
+    dynamodb_table: str,
+    kafka_bootstrap_servers: Optional[str] = None,
+    kafka_topic: Optional[str] = None,
+    kafka_compression_type: str = "gzip",
+    skip_unchanged: bool = True,
+    max_write_request_units: float = 1000,
+    contact_summary_table: Optional[str] = None,
+    search_index: bool = False,
+    sqs_client: Optional["SQSClient"] = None,
+    sqs_queue_url: Optional[str] = None,
+    s3_client: Optional[S3Client] = None,
+    bucket_name: Optional[str] = None,
+    io_engine: Optional[AsyncIOEngine] = None,
+    recent_digests: Optional[TTLCache] = None,
+    shared_cache: Optional[SharedSetCache] = None,
+) -> List[RecordSink]:
+    """
+    Builds the record sinks named in a comma separated list.
+
+    Args:
+        sink_names (str): Comma separated sink names, e.g. `dynamodb,kafka`.
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        dynamodb_table (str): Name of the DynamoDB table.
+        kafka_bootstrap_servers (Optional[str]): Comma separated Kafka brokers.
+        kafka_topic (Optional[str]): Topic records are published to.
+        kafka_compression_type (str): Producer compression codec.
+        skip_unchanged (bool): Whether DynamoDB skips unchanged items.
+        max_write_request_units (float): Write units/s DynamoDB writes stay under.
+        contact_summary_table (Optional[str]): Table DynamoDB keeps contact
+            summaries in, none are kept if None.
+        search_index (bool): Whether DynamoDB writes are indexed for search.
+        sqs_client (Optional[SQSClient]): SQS client for the fan-out queue.
+        sqs_queue_url (Optional[str]): URL of the fan-out queue.
+        s3_client (Optional[S3Client]): S3 client for offloaded batches,
+            search segments and spilled items.
+        bucket_name (Optional[str]): Bucket offloaded batches, search
+            segments and spilled items are stored in.
+        io_engine (Optional[AsyncIOEngine]): Event loop DynamoDB writes are
+            sent from, a thread pool if None.
+        recent_digests (Optional[TTLCache]): Cache of the digests DynamoDB
+            wrote recently.
+        shared_cache (Optional[SharedSetCache]): Cache of the digests
+            concurrent workers wrote.
+
+    Returns:
+        List[RecordSink]: The configured sinks.
+    """
+    sinks: List[RecordSink] = []
+    for sink_name in [s.strip() for s in sink_names.split(",") if s.strip()]:
+        match sink_name:
+            case DynamoDBSink.name:
+                sinks.append(
+                    DynamoDBSink(
+                        dynamodb_client,
+                        dynamodb_table,
+                        skip_unchanged=skip_unchanged,
+                        rate_controller=AdaptiveWriteRateController(
+                            max_write_request_units=max_write_request_units
+                        ),
+                        contact_summary_table=contact_summary_table,
+                        search_indexer=(
+                            SearchIndexer(s3_client, bucket_name)
+                            if search_index
+                            else None
+                        ),
+                        s3_client=s3_client,
+                        bucket_name=bucket_name,
+                        io_engine=io_engine,
+                        recent_digests=recent_digests,
+                        shared_cache=shared_cache,
+                    )
+                )
+            case KafkaSink.name:
+                if not kafka_bootstrap_servers or not kafka_topic:
+                    raise ValueError(
+                        "Kafka sink requires KAFKA_BOOTSTRAP_SERVERS and KAFKA_TOPIC"
+                    )
+                sinks.append(
+                    KafkaSink(
+                        bootstrap_servers=kafka_bootstrap_servers,
+                        topic=kafka_topic,
+                        compression_type=kafka_compression_type,
+                    )
+                )
+            case SQSSink.name:
+                if not sqs_queue_url:
+                    raise ValueError("SQS sink requires FANOUT_QUEUE_URL")
+                sinks.append(
+                    SQSSink(
+                        sqs_client=sqs_client,
+                        queue_url=sqs_queue_url,
+                        s3_client=s3_client,
+                        bucket_name=bucket_name,
+                    )
+                )
+            case _:
+                raise ValueError(f"Unknown record sink: {sink_name}")
+    logger.info(f"Configured record sinks: {[s.name for s in sinks]}")
+    return sinks
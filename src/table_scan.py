@@ -0,0 +1,162 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional
+
+from mypy_boto3_dynamodb.client import DynamoDBClient
+
+from item_serializer import Item
+from rate_control import TokenBucket
+
+# Marks a segment that has been scanned to the end
+_SEGMENT_DONE = object()
+
+
+class ParallelTableScanner:
+    """
+    Reads a DynamoDB table with a segmented parallel `Scan`.
+
+    Each segment is scanned by its own worker thread; pages are handed to the
+    consumer through a bounded queue, so at most `max_pending_pages` pages are
+    held in memory regardless of the table's size.  With a `read_limiter`
+    every page is paid for with the read capacity it consumed, pacing the
+    segments together below the limiter's rate.
+
+    Args:
+        dynamodb_client (DynamoDBClient): Low-level DynamoDB client.
+        table_name (str): Name of the DynamoDB table.
+        total_segments (int): Number of segments scanned in parallel.
+        max_pending_pages (int): Pages buffered ahead of the consumer.
+        read_limiter (Optional[TokenBucket]): Read capacity units per second
+            shared by all segments.
+    """
+
+    def __init__(
+        self,
+        dynamodb_client: DynamoDBClient,
+        table_name: str,
+        total_segments: int = 8,
+        max_pending_pages: int = 16,
+        read_limiter: Optional[TokenBucket] = None,
+    ) -> None:
+        self._dynamodb_client = dynamodb_client
+        self._table_name = table_name
+        self._total_segments = total_segments
+        self._max_pending_pages = max_pending_pages
+        self._read_limiter = read_limiter
+
+    @property
+    def total_segments(self) -> int:
+        return self._total_segments
+
+    def _scan_kwargs(self, segment: int, **scan_kwargs: Any) -> Dict[str, Any]:
+        return {
+            "TableName": self._table_name,
+            "Segment": segment,
+            "TotalSegments": self._total_segments,
+            **scan_kwargs,
+        }
+
+    def _scan(self, **kwargs: Any) -> Dict[str, Any]:
+        """Sends one `Scan` request, paced by the read limiter."""
+        if self._read_limiter is None:
+            return self._dynamodb_client.scan(**kwargs)
+        response = self._dynamodb_client.scan(ReturnConsumedCapacity="TOTAL", **kwargs)
+        self._read_limiter.acquire(response["ConsumedCapacity"]["CapacityUnits"])
+        return response
+
+    def scan_segment(
+        self,
+        segment: int,
+        exclusive_start_key: Optional[Item] = None,
+        **scan_kwargs: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the `Scan` responses of one segment.
+
+        Args:
+            segment (int): The segment to scan.
+            exclusive_start_key (Optional[Item]): `LastEvaluatedKey` of the
+                last page already read, to resume a segment.
+            **scan_kwargs: Additional `Scan` parameters.
+
+        Returns:
+            Iterator[Dict[str, Any]]: Responses with `Items` and, except for
+                the last page, `LastEvaluatedKey`.
+        """
+        kwargs = self._scan_kwargs(segment, **scan_kwargs)
+        if exclusive_start_key:
+            kwargs["ExclusiveStartKey"] = exclusive_start_key
+        while True:
+            response = self._scan(**kwargs)
+            yield response
+            if "LastEvaluatedKey" not in response:
+                return
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def scan(self, **scan_kwargs: Any) -> Iterator[Item]:
+        """
+        Yields the items of every segment as their pages arrive.
+
+        Args:
+            **scan_kwargs: Additional `Scan` parameters such as
+                `FilterExpression` and `ExpressionAttributeValues`.
+
+        Returns:
+            Iterator[Item]: Low-level items in no particular order.
+        """
+        pages: queue.Queue = queue.Queue(maxsize=self._max_pending_pages)
+        stopped = threading.Event()
+
+        def put(page: Any) -> bool:
+            while not stopped.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def scan_worker(segment: int) -> None:
+            try:
+                for response in self.scan_segment(segment, **scan_kwargs):
+                    if not put(response["Items"]):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(_SEGMENT_DONE)
+
+        executor = ThreadPoolExecutor(max_workers=self._total_segments)
+        for segment in range(self._total_segments):
+            executor.submit(scan_worker, segment)
+        try:
+            remaining = self._total_segments
+            while remaining:
+                page = pages.get()
+                if page is _SEGMENT_DONE:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            # Releases workers blocked on a full queue when the consumer stops
+            stopped.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def count(self, **scan_kwargs: Any) -> int:
+        """Counts the (matching) items with a parallel `Select=COUNT` scan."""
+
+        def count_segment(segment: int) -> int:
+            kwargs = self._scan_kwargs(segment, Select="COUNT", **scan_kwargs)
+            count = 0
+            while True:
+                response = self._scan(**kwargs)
+                count += response["Count"]
+                if "LastEvaluatedKey" not in response:
+                    return count
+                kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        with ThreadPoolExecutor(max_workers=self._total_segments) as executor:
+            return sum(executor.map(count_segment, range(self._total_segments)))
@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import traceback
+from multiprocessing.connection import Connection, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aws_lambda_powertools import Logger
+
+from compact_records import CompactRecord
+from schemas import MMS, PHONE_NUMBER_CACHE_CONTEXT, SMS, Call
+from warm_cache import phone_numbers
+
+logger = Logger()
+
+# Record models by their backup XML tag
+TAG_MODELS = {"call": Call, "sms": SMS, "mms": MMS}
+# Records validated per chunk sent to a worker
+CHUNK_RECORDS = 500
+
+# A record's XML tag and its attributes, with MMS parts and addresses
+Snapshot = Tuple[str, Dict[str, Any]]
+
+
+def validate_snapshot(snapshot: Snapshot) -> CompactRecord:
+    """Validates a record snapshot with its model and compacts it."""
+    tag, attributes = snapshot
+    record = TAG_MODELS[tag].model_validate(
+        attributes, context={PHONE_NUMBER_CACHE_CONTEXT: phone_numbers}
+    )
+    return CompactRecord.from_model(record)
+
+
+def validate_chunk(chunk: Iterable[Snapshot]) -> List[CompactRecord]:
+    """Validates a chunk of record snapshots."""
+    return [validate_snapshot(snapshot) for snapshot in chunk]
+
+
+def _worker(connection: Connection) -> None:
+    """Validates chunks received on a pipe until it receives None."""
+    while True:
+        chunk = connection.recv()
+        if chunk is None:
+            return
+        try:
+            result = (True, validate_chunk(chunk))
+        except Exception:
+            result = (False, traceback.format_exc())
+        connection.send(result)
+
+
+class ValidationPool:
+    """
+    Validates record snapshots on worker processes.
+
+    The parsing thread sends chunks of snapshots over pipes to `workers`
+    processes, each validating, hashing and compacting one chunk at a time,
+    so at most `workers` chunks are in flight and parsing waits for a free
+    worker.  Chunks complete in any order but are yielded in the order they
+    were sent, keeping record order the same on every attempt.
+
+    Workers use pipes rather than `ProcessPoolExecutor`, whose semaphores
+    need `/dev/shm`, which Lambda does not provide.  They are forked when the
+    pool is created, before other threads start, and reused across
+    invocations; dead workers are replaced.
+
+    Args:
+        workers (int): Worker processes.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self._workers = workers
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context(
+            "fork" if "fork" in methods else "spawn"
+        )
+        self._processes: List[Optional[Tuple[Any, Connection]]] = [None] * workers
+        self._ensure_started()
+
+    def _start(self, index: int) -> Tuple[Any, Connection]:
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker, args=(child,), name=f"validation-{index}", daemon=True
+        )
+        process.start()
+        child.close()
+        self._processes[index] = (process, parent)
+        return process, parent
+
+    def _ensure_started(self) -> List[Connection]:
+        connections = []
+        for index, worker in enumerate(self._processes):
+            if worker is None or not worker[0].is_alive():
+                worker = self._start(index)
+            connections.append(worker[1])
+        return connections
+
+    def map(self, chunks: Iterable[List[Snapshot]]) -> Iterator[List[CompactRecord]]:
+        """Validates chunks of snapshots, yielding their records in order."""
+        idle = self._ensure_started()
+        busy: Dict[Connection, int] = {}
+        completed: Dict[int, List[CompactRecord]] = {}
+        chunks = iter(chunks)
+        sent = next_seq = 0
+        exhausted = False
+        try:
+            while True:
+                while idle and not exhausted and sent - next_seq < self._workers:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    connection = idle.pop()
+                    connection.send(chunk)
+                    busy[connection] = sent
+                    sent += 1
+                if not busy:
+                    break
+                for connection in wait(list(busy)):
+                    seq = busy.pop(connection)
+                    try:
+                        ok, result = connection.recv()
+                    except EOFError:
+                        raise RuntimeError("A validation worker exited unexpectedly")
+                    if not ok:
+                        raise RuntimeError(f"Record validation failed:\n{result}")
+                    completed[seq] = result
+                    idle.append(connection)
+                while next_seq in completed:
+                    yield completed.pop(next_seq)
+                    next_seq += 1
+        finally:
+            # Leaves no results pending for the next call
+            for connection in busy:
+                try:
+                    connection.recv()
+                except (EOFError, OSError):
+                    pass
+
+    def close(self) -> None:
+        """Stops the workers."""
+        for index, worker in enumerate(self._processes):
+            if worker is None:
+                continue
+            process, connection = worker
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            self._processes[index] = None
+
+
+def build_validation_pool(workers: int) -> Optional[ValidationPool]:
+    """Returns a pool of `workers` processes, None to validate in-thread."""
+    if workers <= 0:
+        return None
+    workers = min(workers, os.cpu_count() or 1)
+    logger.info(f"Validating records on {workers} worker processes")
+    return ValidationPool(workers)
@@ -0,0 +1,170 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+from aws_lambda_powertools.metrics import MetricUnit
+
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+# Approximate bookkeeping per entry: the ordered dict slot and expiry tuple
+ENTRY_OVERHEAD_BYTES = 120
+
+_MISSING = object()
+
+
+def _entry_size(key: Hashable, value: Any) -> int:
+    size = ENTRY_OVERHEAD_BYTES + sys.getsizeof(value)
+    if isinstance(key, tuple):
+        return size + sum(sys.getsizeof(k) for k in key)
+    return size + sys.getsizeof(key)
+
+
+class TTLCache:
+    """
+    Least recently used cache whose entries expire after `ttl_seconds`.
+
+    Entries are evicted oldest first once their estimated size exceeds
+    `max_bytes`.  Lookups count hits and misses, reported and reset by
+    `metrics`.  Safe to share between threads.
+
+    Args:
+        name (str): Name used in metric names.
+        ttl_seconds (float): Seconds an entry is served after it was put.
+        max_bytes (int): Estimated size the entries are kept under.
+        clock (Callable[[], float]): Monotonic clock, in seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl_seconds: float,
+        max_bytes: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self._ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the value of a key, `default` if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            self._misses += 1
+            return default
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def put(self, key: Hashable, value: Any = True) -> None:
+        """Stores a value, evicting the least recently used entries."""
+        size = _entry_size(key, value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self._ttl_seconds, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def metrics(self) -> List[Tuple[str, MetricUnit, float]]:
+        """Returns and resets the hit rate and size metrics of the cache."""
+        with self._lock:
+            hits, misses, self._hits, self._misses = self._hits, self._misses, 0, 0
+            entries, size = len(self._entries), self._bytes
+        lookups = hits + misses
+        hit_rate = 100.0 * hits / lookups if lookups else 0.0
+        return [
+            (f"CacheHitRate/{self.name}", MetricUnit.Percent, hit_rate),
+            (f"CacheLookups/{self.name}", MetricUnit.Count, lookups),
+            (f"CacheEntries/{self.name}", MetricUnit.Count, entries),
+            (f"CacheBytes/{self.name}", MetricUnit.Bytes, size),
+        ]
+
+
+class CacheRegistry:
+    """
+    Caches kept at module level, so they survive warm Lambda invocations.
+
+    Each cache is given a share of the registry's memory budget, and
+    resizing the budget resizes the caches.
+
+    Args:
+        max_bytes (int): Estimated size all caches are kept under.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self._max_bytes = max_bytes
+        self._caches: Dict[str, Tuple[TTLCache, float]] = {}
+        self._lock = threading.Lock()
+
+    def cache(self, name: str, ttl_seconds: float, share: float) -> TTLCache:
+        """Returns the named cache, creating it with a share of the budget."""
+        with self._lock:
+            if name not in self._caches:
+                cache = TTLCache(name, ttl_seconds, int(self._max_bytes * share))
+                self._caches[name] = (cache, share)
+            return self._caches[name][0]
+
+    def resize(self, max_bytes: int) -> None:
+        """Changes the memory budget shared by the caches."""
+        with self._lock:
+            self._max_bytes = max_bytes
+            for cache, share in self._caches.values():
+                cache.max_bytes = int(max_bytes * share)
+
+    def metrics(self) -> List[Tuple[str, MetricUnit, float]]:
+        """Returns and resets the metrics of every cache."""
+        return [
+            metric for cache, _ in self._caches.values() for metric in cache.metrics()
+        ]
+
+    def clear(self) -> None:
+        for cache, _ in self._caches.values():
+            cache.clear()
+
+
+# Shared by the modules of a Lambda container
+cache_registry = CacheRegistry()
+
+PHONE_NUMBER_CACHE = "PhoneNumbers"
+PART_HASH_CACHE = "PartHashes"
+RECORD_DIGEST_CACHE = "RecordDigests"
+# A cached digest skips a write without reading the item, which workers on
+# other containers may have rewritten since, so digests are only trusted
+# for as long as a retry or the next batch of the same backup takes
+RECORD_DIGEST_TTL_SECONDS = 60
+
+# Normalized phone numbers never change; attachments are re-checked after
+# their TTL in case they were removed
+phone_numbers = cache_registry.cache(
+    PHONE_NUMBER_CACHE, ttl_seconds=24 * 60 * 60, share=0.1
+)
+part_hashes = cache_registry.cache(PART_HASH_CACHE, ttl_seconds=60 * 60, share=0.2)
+record_digests = cache_registry.cache(
+    RECORD_DIGEST_CACHE, ttl_seconds=RECORD_DIGEST_TTL_SECONDS, share=0.7
+)
@@ -0,0 +1,183 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from itertools import batched
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aws_lambda_powertools import Logger
+from mypy_boto3_dynamodb.client import DynamoDBClient
+
+from batch_requests import batch_get_items
+from shared_cache import SharedSetCache, record_member, record_namespace
+from warm_cache import TTLCache
+
+logger = Logger()
+
+DIGEST_ATTRIBUTE = "digest"
+BATCH_GET_ITEM_MAX_KEYS = 100
+
+
+def content_digest(item: Dict[str, Any]) -> str:
+    """Computes a SHA-256 digest of an item's content, excluding the digest."""
+    content = {k: v for k, v in item.items() if k != DIGEST_ATTRIBUTE}
+    content_json = json.dumps(
+        content, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return sha256(content_json.encode("utf-8")).hexdigest()
+
+
+class WriteDiff:
+    """Result of comparing candidate items with the items already stored."""
+
+    def __init__(
+        self,
+        new: List[Dict[str, Any]],
+        modified: List[Dict[str, Any]],
+        unchanged: int,
+    ) -> None:
+        self.new = new
+        self.modified = modified
+        self.unchanged = unchanged
+
+    @property
+    def changed(self) -> List[Dict[str, Any]]:
+        """Items that need to be written."""
+        return self.new + self.modified
+
+
+class WriteSkipDiffer:
+    """
+    Drops items that are already stored unchanged.
+
+    Candidate keys are looked up with parallel `BatchGetItem` calls projecting
+    only the key attributes and the stored content digest, which is far
+    cheaper than rewriting every item of a cumulative backup.  With
+    `recent_digests`, items whose digest matches one this container stored
+    or read recently are not looked up at all; writers `remember` the items
+    they wrote.  With a `shared_cache`, the remaining items are checked
+    against the digests other workers stored before they are looked up.
+    Unprocessed keys are looked up again after an exponential backoff.
+    """
+
+    def __init__(
+        self,
+        dynamodb_client: DynamoDBClient,
+        table_name: str,
+        max_workers: int = 8,
+        recent_digests: Optional[TTLCache] = None,
+        shared_cache: Optional[SharedSetCache] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self._dynamodb_client = dynamodb_client
+        self._table_name = table_name
+        self._max_workers = max_workers
+        self._recent_digests = recent_digests
+        self._shared_cache = shared_cache
+        self._shared_namespace = record_namespace(table_name)
+        self._sleep = sleep
+
+    def _cache_key(self, key: Tuple[str, str]) -> Tuple[str, str, str]:
+        return (self._table_name, *key)
+
+    def remember(self, items: List[Dict[str, Any]], share: bool = True) -> None:
+        """Records the digests of items stored in the table."""
+        if self._recent_digests is not None:
+            for item in items:
+                key = (item["id"]["S"], item["timestamp"]["S"])
+                self._recent_digests.put(
+                    self._cache_key(key), item[DIGEST_ATTRIBUTE]["S"]
+                )
+        if share and self._shared_cache is not None and items:
+            self._shared_cache.add(
+                self._shared_namespace, [self._shared_member(item) for item in items]
+            )
+
+    @staticmethod
+    def _shared_member(item: Dict[str, Any]) -> str:
+        return record_member(
+            item["id"]["S"], item["timestamp"]["S"], item[DIGEST_ATTRIBUTE]["S"]
+        )
+
+    def _get_digests(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        """Returns the stored digests of up to 100 (id, timestamp) keys."""
+        request_items = {
+            self._table_name: {
+                "Keys": [
+                    {"id": {"S": record_id}, "timestamp": {"S": timestamp}}
+                    for record_id, timestamp in keys
+                ],
+                "ProjectionExpression": "id, #ts, #digest",
+                "ExpressionAttributeNames": {
+                    "#ts": "timestamp",
+                    "#digest": DIGEST_ATTRIBUTE,
+                },
+            }
+        }
+        digests = {}
+        for responses in batch_get_items(
+            self._dynamodb_client, request_items, sleep=self._sleep
+        ):
+            for item in responses.get(self._table_name, []):
+                key = (item["id"]["S"], item["timestamp"]["S"])
+                digests[key] = item.get(DIGEST_ATTRIBUTE, {}).get("S")
+        return digests
+
+    def diff(self, items: List[Dict[str, Any]]) -> WriteDiff:
+        """
+        Splits items into new, modified and unchanged.
+
+        Args:
+            items (List[Dict[str, Any]]): `AttributeValue` items carrying a
+                `digest` attribute.
+
+        Returns:
+            WriteDiff: The new and modified items and the unchanged count.
+        """
+        keys = [(item["id"]["S"], item["timestamp"]["S"]) for item in items]
+        stored_digests: Dict[Tuple[str, str], str] = {}
+        if self._recent_digests is not None:
+            for key, item in zip(keys, items):
+                digest = self._recent_digests.get(self._cache_key(key))
+                if digest == item[DIGEST_ATTRIBUTE]["S"]:
+                    stored_digests[key] = digest
+        if self._shared_cache is not None:
+            pending = [
+                (key, item)
+                for key, item in zip(keys, items)
+                if key not in stored_digests
+            ]
+            found = self._shared_cache.contains(
+                self._shared_namespace,
+                [self._shared_member(item) for _, item in pending],
+            )
+            for (key, item), stored in zip(pending, found):
+                if stored:
+                    stored_digests[key] = item[DIGEST_ATTRIBUTE]["S"]
+        lookup_keys = [key for key in keys if key not in stored_digests]
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            for digests in executor.map(
+                self._get_digests, batched(lookup_keys, BATCH_GET_ITEM_MAX_KEYS)
+            ):
+                stored_digests.update(digests)
+
+        # Only digests read from the table are news to the shared cache
+        looked_up = set(lookup_keys)
+        new, modified, unchanged, unchanged_read = [], [], [], []
+        for key, item in zip(keys, items):
+            if key not in stored_digests:
+                new.append(item)
+            elif stored_digests[key] != item[DIGEST_ATTRIBUTE]["S"]:
+                modified.append(item)
+            elif key in looked_up:
+                unchanged_read.append(item)
+            else:
+                unchanged.append(item)
+        self.remember(unchanged, share=False)
+        self.remember(unchanged_read)
+        unchanged = len(unchanged) + len(unchanged_read)
+        logger.debug(
+            f"Write diff: {len(new)} new, {len(modified)} modified, "
+            f"{unchanged} unchanged"
+        )
+        return WriteDiff(new=new, modified=modified, unchanged=unchanged)
@@ -0,0 +1,95 @@
+import os
+
+import boto3
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.batch import (
+    BatchProcessor,
+    EventType,
+    process_partial_response,
+)
+from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from mypy_boto3_dynamodb.client import DynamoDBClient
+from mypy_boto3_s3 import S3Client
+
+from rate_control import AdaptiveWriteRateController
+from search_index import SearchIndexer
+from shared_cache import build_shared_cache
+from sinks import DynamoDBSink, load_record_batch
+from warm_cache import cache_registry, record_digests
+
+# Initialize AWS Lambda Powertools components
+tracer = Tracer()
+logger = Logger()
+metrics = Metrics(namespace="sms-backup-restore")
+processor = BatchProcessor(event_type=EventType.SQS)
+
+# Initialize AWS clients
+s3_client: S3Client = boto3.client("s3")
+dynamodb_client: DynamoDBClient = boto3.client("dynamodb")
+
+DYNAMODB_TABLE = os.environ.get("DYNAMODB_TABLE", "sms-backup-restore")
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "sms-backup-restore")
+ENV = os.environ.get("ENV", "prod")
+SKIP_UNCHANGED = os.environ.get("SKIP_UNCHANGED", "true").lower() == "true"
+# Table of per-contact summaries updated from new records, unset to keep none
+CONTACT_SUMMARY_TABLE = os.environ.get("CONTACT_SUMMARY_TABLE")
+SEARCH_INDEX = os.environ.get("SEARCH_INDEX", "false").lower() == "true"
+# Share of the table's write request units available to each writer instance
+MAX_WRITE_REQUEST_UNITS = float(os.environ.get("MAX_WRITE_REQUEST_UNITS", "100"))
+# Memory budget of the caches kept across warm invocations, 0 disables them
+WARM_CACHE_MB = int(os.environ.get("WARM_CACHE_MB", "128"))
+# Cache of stored records shared by concurrent writers, e.g. redis://host:6379/0
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL")
+
+cache_registry.resize(WARM_CACHE_MB * 1024 * 1024)
+shared_cache = build_shared_cache(SHARED_CACHE_URL)
+
+dynamodb_sink = DynamoDBSink(
+    dynamodb_client,
+    DYNAMODB_TABLE,
+    skip_unchanged=SKIP_UNCHANGED,
+    rate_controller=AdaptiveWriteRateController(
+        max_write_request_units=MAX_WRITE_REQUEST_UNITS
+    ),
+    contact_summary_table=CONTACT_SUMMARY_TABLE,
+    search_indexer=SearchIndexer(s3_client, BUCKET_NAME) if SEARCH_INDEX else None,
+    s3_client=s3_client,
+    bucket_name=BUCKET_NAME,
+    recent_digests=record_digests,
+    shared_cache=shared_cache,
+)
+
+
+@tracer.capture_method
+def record_handler(record: SQSRecord) -> None:
+    """Writes one enqueued record batch to DynamoDB."""
+    items = load_record_batch(s3_client=s3_client, body=record.body)
+    written = dynamodb_sink.write_items(items)
+    metrics.add_metric(name="RecordsWritten", unit=MetricUnit.Count, value=written)
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def handler(event: dict, context: LambdaContext) -> dict:
+    """Lambda function to write record batches from the fan-out queue"""
+
+    metrics.add_dimension(name="environment", value=ENV)
+
+    response = process_partial_response(
+        event=event,
+        record_handler=record_handler,
+        processor=processor,
+        context=context,
+    )
+    # One search segment per invocation rather than per record batch
+    dynamodb_sink.flush()
+    for metric_name, unit, value in dynamodb_sink.metrics():
+        metrics.add_metric(name=metric_name, unit=unit, value=value)
+    for metric_name, unit, value in cache_registry.metrics():
+        metrics.add_metric(name=metric_name, unit=unit, value=value)
+    if shared_cache is not None:
+        for metric_name, unit, value in shared_cache.metrics():
+            metrics.add_metric(name=metric_name, unit=unit, value=value)
+    return response
@@ -0,0 +1,295 @@
+import base64
+import os
+from datetime import datetime, timedelta
+
+import boto3
+import pytest
+from moto import mock_aws
+from moto.server import ThreadedMotoServer
+
+from backup_processor import NULL_VALUES
+from schemas import MMS, SMS, Call
+
+ATTACHMENT = bytes(range(256)) * 1000
+
+SMS_BACKUP = f"""<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>
+<smses count="3" backup_set="b1" backup_date="1700000300000" type="full">
+  <sms protocol="0" address="+15551234567" date="1700000000000" type="1"
+    subject="null" body="Dinner &amp; a movie?" toa="null" sc_toa="null"
+    service_center="+12063130004" read="1" status="-1" locked="0" date_sent="0"
+    sub_id="1" readable_date="Nov 14, 2023 10:13:20 PM" contact_name="Alice" />
+  <sms protocol="0" address="+15557654321" date="1700000060000" type="2"
+    subject="null" body="On my way" toa="null" sc_toa="null"
+    service_center="null" read="1" status="-1" locked="0" date_sent="0"
+    sub_id="1" readable_date="Nov 14, 2023 10:14:20 PM" contact_name="(Unknown)" />
+  <mms date="1700000200000" rr="null" sub="null"
+    ct_t="application/vnd.wap.multipart.related" read_status="null" seen="1"
+    msg_box="1" address="+15551234567~+15557654321" sub_cs="null" resp_st="null"
+    retr_st="null" d_tm="null" text_only="0" exp="null" locked="0" m_id="mms-1"
+    st="null" retr_txt_cs="null" retr_txt="null" creator="null" date_sent="0"
+    read="1" m_size="256000" rpt_a="null" ct_cls="null" pri="null" sub_id="1"
+    tr_id="null" resp_txt="null" ct_l="null" m_cls="personal" d_rpt="null" v="18"
+    m_type="132" readable_date="Nov 14, 2023 10:16:40 PM" contact_name="Alice, Bob">
+    <parts>
+      <part seq="0" ct="text/plain" name="null" chset="106" cd="null" fn="null"
+        cid="&lt;text&gt;" cl="text.txt" ctt_s="null" ctt_t="null"
+        text="Look at this" />
+      <part seq="1" ct="image/png" name="image.png" chset="null" cd="null"
+        fn="null" cid="&lt;image&gt;" cl="image.png" ctt_s="null" ctt_t="null"
+        text="null" data="{base64.b64encode(ATTACHMENT).decode()}" />
+    </parts>
+    <addrs>
+      <addr address="+15551234567" type="137" charset="106" />
+      <addr address="+15557654321" type="151" charset="106" />
+    </addrs>
+  </mms>
+</smses>
+"""
+
+
+def sms_attributes(address: str, minute: int) -> dict:
+    """Returns the backup attributes of an SMS sent `minute` minutes in."""
+    sent_at = datetime(2023, 11, 14, 22, 13, 20) + timedelta(minutes=minute)
+    return {
+        "protocol": "0",
+        "address": address,
+        "date": str(1700000000000 + minute * 60000),
+        "type": "1",
+        "subject": "null",
+        "body": f"message at minute {minute}",
+        "toa": "null",
+        "sc_toa": "null",
+        "service_center": "null",
+        "read": "1",
+        "status": "-1",
+        "locked": "0",
+        "date_sent": "0",
+        "sub_id": "1",
+        "readable_date": sent_at.strftime("%b %d, %Y %I:%M:%S %p"),
+        "contact_name": "(Unknown)",
+    }
+
+
+@pytest.fixture
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_SECURITY_TOKEN"] = "testing"
+    os.environ["AWS_SESSION_TOKEN"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+
+@pytest.fixture
+def moto_server(aws_credentials):
+    """Endpoint URL of an in-process moto server, for aiobotocore clients."""
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def dynamodb_table(aws_credentials):
+    with mock_aws():
+        dynamodb_resource = boto3.resource("dynamodb", region_name="us-east-1")
+        dynamodb_resource.create_table(
+            TableName="sms-backup-restore",
+            KeySchema=[
+                {"AttributeName": "id", "KeyType": "HASH"},
+                {"AttributeName": "timestamp", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "id", "AttributeType": "S"},
+                {"AttributeName": "timestamp", "AttributeType": "S"},
+                {"AttributeName": "thread", "AttributeType": "S"},
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "thread-timestamp-index",
+                    "KeySchema": [
+                        {"AttributeName": "thread", "KeyType": "HASH"},
+                        {"AttributeName": "timestamp", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                }
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield dynamodb_resource
+
+
+@pytest.fixture
+def contact_summary_table(dynamodb_table) -> str:
+    """Name of the contact summary table, keyed by address."""
+    dynamodb_table.create_table(
+        TableName="sms-backup-restore-contact-summaries",
+        KeySchema=[{"AttributeName": "address", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "address", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return "sms-backup-restore-contact-summaries"
+
+
+@pytest.fixture
+def part_index_table(dynamodb_table) -> str:
+    """Name of the pack index table, keyed by part hash."""
+    dynamodb_table.create_table(
+        TableName="sms-backup-restore-part-index",
+        KeySchema=[{"AttributeName": "part", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "part", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return "sms-backup-restore-part-index"
+
+
+@pytest.fixture
+def dynamodb_client(dynamodb_table):
+    return boto3.client("dynamodb", region_name="us-east-1")
+
+
+@pytest.fixture
+def attachment() -> bytes:
+    """Binary MMS attachment carried by `sms_backup`."""
+    return ATTACHMENT
+
+
+@pytest.fixture
+def sms_backup() -> str:
+    """Backup of two SMS and an MMS with a text and an image part."""
+    return SMS_BACKUP
+
+
+@pytest.fixture
+def backup_bucket(dynamodb_table, sms_backup):
+    """S3 client for the bucket holding `sms_backup` as `sms-backup.xml`."""
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket="sms-backup-restore")
+    s3_client.put_object(
+        Bucket="sms-backup-restore", Key="sms-backup.xml", Body=sms_backup
+    )
+    return s3_client
+
+
+@pytest.fixture
+def make_sms():
+    """Factory of validated SMS records sent to `address` at `minute`."""
+
+    def make(address: str, minute: int) -> SMS:
+        return SMS.model_validate(sms_attributes(address, minute))
+
+    return make
+
+
+@pytest.fixture
+def make_sms_snapshot():
+    """Factory of the `("sms", attributes)` snapshots the parser hands on."""
+
+    def make(address: str, minute: int) -> tuple:
+        attributes = sms_attributes(address, minute)
+        return "sms", {
+            k: None if v in NULL_VALUES else v for k, v in attributes.items()
+        }
+
+    return make
+
+
+@pytest.fixture
+def sms_record() -> SMS:
+    return SMS.model_validate(
+        {
+            "protocol": "0",
+            "address": "+15551234567",
+            "date": "1700000000000",
+            "type": "1",
+            "subject": "null",
+            "body": "Are we still on for dinner tonight?",
+            "toa": "null",
+            "sc_toa": "null",
+            "service_center": "+12063130004",
+            "read": "1",
+            "status": "-1",
+            "locked": "0",
+            "date_sent": "0",
+            "sub_id": "1",
+            "readable_date": "Nov 14, 2023 10:13:20 PM",
+            "contact_name": "Alice",
+        }
+    )
+
+
+@pytest.fixture
+def call_record() -> Call:
+    return Call.model_validate(
+        {
+            "number": "5551234567",
+            "duration": "125",
+            "date": "1700000100000",
+            "type": "2",
+            "presentation": "1",
+            "subscription_id": "1",
+            "subscription_component_name": None,
+            "readable_date": "Nov 14, 2023 10:15:00 PM",
+            "contact_name": "Alice",
+        }
+    )
+
+
+@pytest.fixture
+def mms_record() -> MMS:
+    return MMS.model_validate(
+        {
+            "address": "+15551234567~+15557654321",
+            "date": "1700000200000",
+            "rr": None,
+            "sub": None,
+            "ct_t": "application/vnd.wap.multipart.related",
+            "read_status": None,
+            "seen": "1",
+            "msg_box": "1",
+            "sub_cs": None,
+            "resp_st": None,
+            "retr_st": None,
+            "d_tm": None,
+            "text_only": "1",
+            "exp": None,
+            "locked": "0",
+            "m_id": "mms-0001",
+            "st": None,
+            "retr_txt_cs": None,
+            "retr_txt": None,
+            "creator": "com.google.android.apps.messaging",
+            "date_sent": "0",
+            "read": "1",
+            "m_size": "512",
+            "rpt_a": None,
+            "ct_cls": None,
+            "pri": None,
+            "sub_id": "1",
+            "tr_id": None,
+            "resp_txt": None,
+            "ct_l": None,
+            "m_cls": None,
+            "d_rpt": None,
+            "v": None,
+            "m_type": "132",
+            "readable_date": "Nov 14, 2023 10:16:40 PM",
+            "parts": [
+                {
+                    "seq": "0",
+                    "ct": "text/plain",
+                    "name": None,
+                    "chset": "106",
+                    "cd": None,
+                    "fn": None,
+                    "cid": None,
+                    "cl": "txt000.txt",
+                    "ctt_s": None,
+                    "ctt_t": None,
+                    "text": "See you at seven",
+                    "data": None,
+                }
+            ],
+        }
+    )
@@ -0,0 +1,72 @@
+from aggregates import get_contact_summary, list_contact_summaries
+from sinks import DynamoDBSink
+from write_diff import WriteDiff
+
+
+def test_summaries_count_new_records_once(
+    dynamodb_client,
+    contact_summary_table,
+    sms_record,
+    call_record,
+    mms_record,
+    make_sms,
+):
+    sink = DynamoDBSink(
+        dynamodb_client,
+        "sms-backup-restore",
+        contact_summary_table=contact_summary_table,
+    )
+    records = [(r.hash(), r) for r in (sms_record, call_record, mms_record)]
+
+    sink.write(records)
+    sink.write(records)
+    summaries = {
+        s["address"]: s
+        for s in list_contact_summaries(dynamodb_client, contact_summary_table)
+    }
+    assert summaries.keys() == {"+15551234567", "+15557654321"}
+    alice = summaries["+15551234567"]
+    assert (alice["messages"], alice["sms_count"], alice["mms_count"]) == (2, 1, 1)
+    assert (alice["calls"], alice["call_seconds"], alice["call_minutes"]) == (
+        1,
+        125,
+        2.1,
+    )
+    assert alice["last_message_at"] == mms_record.timestamp.isoformat()
+    assert alice["last_call_at"] == call_record.timestamp.isoformat()
+    assert summaries["+15557654321"]["messages"] == 1
+    assert summaries["+15557654321"]["calls"] == 0
+
+    # An older message from a later backup counts without moving the latest time
+    older = make_sms("+15551234567", -60)
+    sink.write([(older.hash(), older)])
+    alice = get_contact_summary(dynamodb_client, contact_summary_table, "+15551234567")
+    assert alice["messages"] == 3
+    assert alice["last_message_at"] == mms_record.timestamp.isoformat()
+    assert ("ContactSummariesUpdated", "Count", 3) in [
+        (name, unit.value, value) for name, unit, value in sink.metrics()
+    ]
+    # Summaries are not records of the main table
+    assert dynamodb_client.scan(TableName="sms-backup-restore")["Count"] == 4
+
+
+def test_records_put_concurrently_are_counted_once(
+    dynamodb_client, contact_summary_table, sms_record
+):
+    def sink():
+        return DynamoDBSink(
+            dynamodb_client,
+            "sms-backup-restore",
+            contact_summary_table=contact_summary_table,
+        )
+
+    first, second = sink(), sink()
+    # Both writers diffed the record before either wrote it
+    second._differ.diff = lambda items: WriteDiff(items, [], 0)
+    first.write([(sms_record.hash(), sms_record)])
+    assert second.write([(sms_record.hash(), sms_record)]) == 0
+
+    alice = get_contact_summary(dynamodb_client, contact_summary_table, "+15551234567")
+    assert alice["messages"] == 1
+    counts = {name: value for name, _, value in second.metrics()}
+    assert (counts["RecordsNew"], counts["RecordsSkipped"]) == (0, 1)
@@ -0,0 +1,51 @@
+import boto3
+import pytest
+
+from backup_diff import ADDED, REMOVED, BackupDiffer, merge_join
+from backup_processor import BackupRestoreProcessor
+
+
+def test_merge_join_yields_ids_in_one_stream():
+    old = [("a", 1), ("c", 3), ("d", 4)]
+    new = [("b", 2), ("c", 3), ("e", 5), ("f", 6)]
+
+    assert list(merge_join(old, new)) == [
+        (REMOVED, "a", 1),
+        (ADDED, "b", 2),
+        (REMOVED, "d", 4),
+        (ADDED, "e", 5),
+        (ADDED, "f", 6),
+    ]
+
+
+@pytest.mark.parametrize("max_memory_bytes", [1024**2, 1])
+def test_backups_are_diffed_without_storing_parts(
+    backup_bucket, sms_backup, tmp_path, max_memory_bytes
+):
+    s3_client = backup_bucket
+    s3_client.put_object(Bucket="sms-backup-restore", Key="old.xml", Body=sms_backup)
+    s3_client.put_object(
+        Bucket="sms-backup-restore",
+        Key="new.xml",
+        Body=sms_backup.replace("On my way", "Running late"),
+    )
+    processor = BackupRestoreProcessor(
+        s3_client=s3_client,
+        s3_resource=boto3.resource("s3", region_name="us-east-1"),
+        store_parts=False,
+    )
+    differ = BackupDiffer(
+        processor, max_memory_bytes=max_memory_bytes, tmp_dir=str(tmp_path)
+    )
+
+    changes = [
+        (change, record.model_dump()["body"])
+        for change, _, record in differ.diff("sms-backup-restore", "old.xml", "new.xml")
+    ]
+
+    assert sorted(changes) == [(ADDED, "Running late"), (REMOVED, "On my way")]
+    assert differ.counts == {"added/SMS": 1, "removed/SMS": 1}
+    assert differ.unchanged == 2
+    assert "Contents" not in s3_client.list_objects_v2(
+        Bucket="sms-backup-restore", Prefix="parts/"
+    )
@@ -0,0 +1,100 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from checkpoints import ProcessingCheckpoints, backup_object_id
+from sinks import DynamoDBSink
+
+
+@pytest.fixture
+def checkpoints(dynamodb_table, dynamodb_client):
+    dynamodb_client.create_table(
+        TableName="sms-backup-restore-idempotency",
+        KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return ProcessingCheckpoints(dynamodb_client, "sms-backup-restore-idempotency")
+
+
+def test_checkpoints_track_each_sink_per_object_version(checkpoints, dynamodb_client):
+    object_id = backup_object_id("sms-backup-restore", "sms.xml", "etag-1")
+    assert checkpoints.load(object_id) == {}
+
+    checkpoints.commit(object_id, "dynamodb", 5000)
+    checkpoints.commit(object_id, "dynamodb", 10000)
+    checkpoints.commit(object_id, "kafka", 5000)
+    assert checkpoints.load(object_id) == {"dynamodb": 10000, "kafka": 5000}
+    # A new upload of the object starts over
+    assert (
+        checkpoints.load(backup_object_id("sms-backup-restore", "sms.xml", "2")) == {}
+    )
+
+    item = dynamodb_client.get_item(
+        TableName="sms-backup-restore-idempotency",
+        Key={"id": {"S": f"checkpoint#{object_id}"}},
+    )["Item"]
+    assert int(item["expiration"]["N"]) > time.time()
+
+    checkpoints.clear(object_id)
+    assert checkpoints.load(object_id) == {}
+
+
+def test_retry_resumes_after_the_committed_chunks(
+    checkpoints, dynamodb_client, make_sms, monkeypatch
+):
+    import processing
+
+    monkeypatch.setattr(processing, "checkpoints", checkpoints)
+    monkeypatch.setattr(processing, "CHECKPOINT_RECORDS", 10)
+    object_id = backup_object_id("sms-backup-restore", "sms.xml", "etag-1")
+    records = [(r.hash(), r) for r in (make_sms("+15551234567", i) for i in range(25))]
+    sink = DynamoDBSink(dynamodb_client, "sms-backup-restore", skip_unchanged=False)
+    write = sink.write
+    written = []
+
+    def write_then_fail(chunk):
+        if len(written) == 20:
+            raise RuntimeError("Lambda timed out")
+        written.extend(record_id for record_id, _ in chunk)
+        return write(chunk)
+
+    monkeypatch.setattr(sink, "write", write_then_fail)
+    with pytest.raises(RuntimeError):
+        processing.write_records(records, object_id, {}, [sink])
+    committed = checkpoints.load(object_id)
+    assert committed == {"dynamodb": 20}
+
+    written.clear()
+    processing.write_records(records, object_id, committed, [sink])
+
+    assert written == [record_id for record_id, _ in records[20:]]
+    assert dynamodb_client.scan(TableName="sms-backup-restore")["Count"] == 25
+
+
+def test_duplicate_events_of_an_object_version_short_circuit(
+    checkpoints, dynamodb_client
+):
+    import processing
+
+    processed = []
+
+    def process_backup_object(backup):
+        processed.append(backup["etag"])
+        return {"record_count": 3}
+
+    process = processing.idempotent_processing(
+        process_backup_object, dynamodb_client, "sms-backup-restore-idempotency"
+    )
+    processing.idempotency_config.register_lambda_context(
+        SimpleNamespace(get_remaining_time_in_millis=lambda: 60000)
+    )
+    backup = {"bucket": "sms-backup-restore", "key": "sms.xml", "size": 10}
+
+    for _ in range(2):
+        assert process(backup={**backup, "etag": "etag-1"}) == {"record_count": 3}
+    assert processed == ["etag-1"]
+    # A new upload of the object is processed
+    process(backup={**backup, "etag": "etag-2"})
+    assert processed == ["etag-1", "etag-2"]
@@ -0,0 +1,48 @@
+import pytest
+
+from conversations import ConversationQuery
+from sinks import DynamoDBSink
+
+
+@pytest.fixture
+def conversation_table(dynamodb_client, call_record, make_sms):
+    records = [make_sms("+15551234567", i) for i in range(23)]
+    records += [make_sms("+15550000000", i) for i in range(5)]
+    records.append(call_record)
+    DynamoDBSink(dynamodb_client, "sms-backup-restore").write(
+        (r.hash(), r) for r in records
+    )
+    return dynamodb_client
+
+
+def test_get_page_walks_thread_newest_first(conversation_table):
+    query = ConversationQuery(conversation_table, "sms-backup-restore")
+
+    pages, cursor = [], None
+    while True:
+        page = query.get_page("(555) 123-4567", cursor=cursor, page_size=5)
+        pages.append(page.records)
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+
+    records = [r for page in pages for r in page]
+    timestamps = [r["timestamp"] for r in records]
+    assert [len(page) for page in pages[:4]] == [5, 5, 5, 5]
+    # 23 messages and the call share the thread with +15551234567
+    assert len(records) == 24 == len({r["id"] for r in records})
+    sms_timestamps = [r["timestamp"] for r in records if r["record_type"] == "SMS"]
+    assert sms_timestamps == sorted(sms_timestamps, reverse=True)
+    assert timestamps[0] == max(timestamps)
+
+
+def test_get_page_is_cached(conversation_table):
+    query = ConversationQuery(conversation_table, "sms-backup-restore")
+
+    first = query.get_page("+15550000000", page_size=10)
+    assert query.get_page("+15550000000", page_size=10) is first
+    assert [r["body"] for r in first.records][0] == "message at minute 4"
+    assert first.next_cursor is None
+
+    query.invalidate()
+    assert query.get_page("+15550000000", page_size=10) is not first
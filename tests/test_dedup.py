@@ -0,0 +1,59 @@
+import base64
+import os
+
+import pytest
+
+from dedup import RecordDeduplicator, record_size
+
+
+@pytest.mark.parametrize("budget_records", [1000, 7, 3])
+def test_deduplicator_drops_repeated_ids_at_any_budget(
+    tmp_path, make_sms, budget_records
+):
+    # Every message appears twice, the repeats far apart in the backup
+    records = [make_sms(f"+1555{i % 7:07d}", i) for i in range(50)] * 2
+    expected = {r.hash(): r for r in records}
+
+    with RecordDeduplicator(
+        max_memory_bytes=budget_records * record_size(records[0]),
+        tmp_dir=str(tmp_path),
+        max_merge_fan_in=4,
+    ) as deduplicator:
+        deduplicator.add(records)
+        unique = list(deduplicator)
+        assert len(deduplicator) == 50
+        assert dict(unique) == expected
+        # Iterating again yields the same order for checkpointed writes
+        assert [record_id for record_id, _ in deduplicator] == [
+            record_id for record_id, _ in unique
+        ]
+        assert deduplicator.record_counts() == {"SMS": 50}
+        if budget_records < 50:
+            assert deduplicator.runs_spilled > 0
+        else:
+            assert [record_id for record_id, _ in unique] == list(expected)
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_large_records_spill_by_size_and_runs_hold_only_ids(
+    tmp_path, make_sms, mms_record, attachment
+):
+    small = [make_sms("+15551234567", i) for i in range(4)]
+    parts = type(mms_record.parts)(
+        part.model_copy(update={"data": base64.b64encode(attachment).decode()})
+        for part in mms_record.parts
+    )
+    large = mms_record.model_copy(update={"parts": parts})
+
+    with RecordDeduplicator(
+        max_memory_bytes=5 * record_size(small[0]), tmp_dir=str(tmp_path)
+    ) as deduplicator:
+        # The MMS alone is over the budget five SMS fit in
+        deduplicator.add([large] + small)
+        assert deduplicator.runs_spilled == 2
+        [work_dir] = tmp_path.iterdir()
+        run_bytes = sum(run.stat().st_size for run in work_dir.glob("*.run"))
+        assert run_bytes * 100 < (work_dir / "records").stat().st_size
+        assert deduplicator.record_counts() == {"SMS": 4, "MMS": 1}
+        assert dict(deduplicator)[large.hash()] == large
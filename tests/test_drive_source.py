@@ -0,0 +1,158 @@
+import json
+import re
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import pytest
+
+from backup_processor import BackupRestoreProcessor
+from drive_source import DriveBackupSource, DriveClient, new_backup_files
+
+BACKUP_FILE = {
+    "id": "file-1",
+    "name": "sms-20231114221320.xml",
+    "mimeType": "text/xml",
+    "headRevisionId": "rev-2",
+    "parents": ["backups"],
+}
+CHANGE_PAGES = {
+    "1": {
+        "nextPageToken": "2",
+        "changes": [
+            {"fileId": "file-1", "removed": False, "file": BACKUP_FILE},
+            {
+                "fileId": "notes",
+                "removed": False,
+                "file": {"id": "notes", "name": "notes.txt", "parents": ["backups"]},
+            },
+        ],
+    },
+    "2": {
+        "newStartPageToken": "3",
+        "changes": [
+            {
+                "fileId": "file-2",
+                "removed": False,
+                "file": {
+                    "id": "file-2",
+                    "name": "calls-20231114221320.xml",
+                    "parents": ["backups"],
+                    "trashed": True,
+                },
+            },
+            {
+                "fileId": "file-3",
+                "removed": False,
+                "file": {
+                    "id": "file-3",
+                    "name": "sms-20231001000000.xml",
+                    "parents": ["elsewhere"],
+                },
+            },
+        ],
+    },
+}
+
+
+class DriveStandIn(BaseHTTPRequestHandler):
+    """Serves the Drive v3 calls the client makes from the fixtures above."""
+
+    # Content of the backup file and the metadata of every file
+    backup: bytes = b""
+    files: dict = {}
+    # Ranges whose first download fails
+    failed_ranges: set = set()
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, headers=()) -> None:
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        assert self.headers["Authorization"] == "Bearer test-token"
+        if url.path == "/drive/v3/changes/startPageToken":
+            return self._send(200, json.dumps({"startPageToken": "1"}).encode())
+        if url.path == "/drive/v3/changes":
+            return self._send(
+                200, json.dumps(CHANGE_PAGES[query["pageToken"]]).encode()
+            )
+        media = re.fullmatch(r"/drive/v3/files/([^/]+)/revisions/rev-2", url.path)
+        if media and query.get("alt") == "media":
+            byte_range = self.headers["Range"]
+            if byte_range not in self.failed_ranges:
+                self.failed_ranges.add(byte_range)
+                return self._send(503, b"")
+            start, end = map(int, byte_range.removeprefix("bytes=").split("-"))
+            return self._send(
+                206,
+                self.backup[start : end + 1],
+                [("Content-Range", f"bytes {start}-{end}/{len(self.backup)}")],
+            )
+        metadata = re.fullmatch(r"/drive/v3/files/([^/]+)", url.path)
+        if metadata and metadata.group(1) in self.files:
+            return self._send(200, json.dumps(self.files[metadata.group(1)]).encode())
+        self._send(404, b"")
+
+
+@pytest.fixture
+def drive_client(sms_backup):
+    DriveStandIn.backup = sms_backup.encode()
+    DriveStandIn.files = {
+        "file-1": {**BACKUP_FILE, "size": str(len(DriveStandIn.backup))}
+    }
+    DriveStandIn.failed_ranges = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DriveStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield DriveClient(
+        lambda: "test-token", base_url=f"http://127.0.0.1:{server.server_port}"
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def test_drive_backup_streams_into_the_parser(
+    drive_client, aws_credentials, dynamodb_client, monkeypatch
+):
+    monkeypatch.setattr("s3_reader.RETRY_BACKOFF_SECONDS", 0)
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket="sms-backup-restore")
+    processor = BackupRestoreProcessor(
+        s3_client=s3_client, s3_resource=boto3.resource("s3", region_name="us-east-1")
+    )
+    source = DriveBackupSource(drive_client, chunk_size=4096, readahead_chunks=3)
+
+    records = list(
+        processor.process_backup("sms-backup-restore", "file-1", source=source)
+    )
+
+    assert [r.record_type for r in records] == ["SMS", "SMS", "MMS"]
+    # Every range failed once and was downloaded again
+    assert len(DriveStandIn.failed_ranges) == -(-len(DriveStandIn.backup) // 4096)
+    assert processor.read_bytes_per_second > 0
+    # Attachments are still stored in the bucket
+    keys = s3_client.list_objects_v2(Bucket="sms-backup-restore")["Contents"]
+    assert [obj["Key"].split("/")[0] for obj in keys] == ["parts"]
+
+
+def test_changes_yield_only_new_backups(drive_client):
+    assert drive_client.start_page_token() == "1"
+
+    changes, next_page_token = drive_client.changes("1")
+
+    assert next_page_token == "3"
+    assert len(changes) == 4
+    assert [f["id"] for f in new_backup_files(changes)] == ["file-1", "file-3"]
+    assert [f["id"] for f in new_backup_files(changes, folder_id="backups")] == [
+        "file-1"
+    ]
@@ -0,0 +1,106 @@
+import gzip
+import io
+import json
+
+import boto3
+import pytest
+
+from export import TableExporter
+from sinks import DynamoDBSink
+
+
+@pytest.fixture
+def export_resources(dynamodb_client, call_record, mms_record, make_sms):
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket="sms-backup-restore")
+    records = [make_sms(f"+1555000{i:04d}", i) for i in range(40)]
+    records += [call_record, mms_record]
+    DynamoDBSink(dynamodb_client, "sms-backup-restore").write(
+        (r.hash(), r) for r in records
+    )
+    yield s3_client, {r.hash(): r for r in records}
+
+
+def read_ndjson_export(s3_client, export_id):
+    rows = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(
+        Bucket="sms-backup-restore", Prefix=f"exports/{export_id}/record_type="
+    ):
+        for obj in page.get("Contents", []):
+            body = s3_client.get_object(Bucket="sms-backup-restore", Key=obj["Key"])
+            lines = gzip.decompress(body["Body"].read()).splitlines()
+            rows.extend(json.loads(line) for line in lines)
+    return rows
+
+
+def test_export_ndjson_resumes_from_checkpoints(dynamodb_client, export_resources):
+    s3_client, records = export_resources
+    exporter = TableExporter(
+        dynamodb_client,
+        s3_client,
+        "sms-backup-restore",
+        "sms-backup-restore",
+        export_id="test",
+        total_segments=3,
+        rows_per_file=5,
+        page_size=5,
+    )
+
+    # With no time left every segment stops after its first page
+    first = exporter.export(time_budget=0)
+    assert not first.complete and 0 < first.rows < len(records)
+
+    result = exporter.export()
+    assert result.complete and result.rows == len(records)
+    rows = read_ndjson_export(s3_client, "test")
+    assert sorted(r["id"] for r in rows) == sorted(records)
+    call = next(r for r in rows if r["record_type"] == "Call")
+    assert call["address"] == ["+15551234567"] and call["duration"] == 125
+
+    with pytest.raises(ValueError):
+        TableExporter(
+            dynamodb_client,
+            s3_client,
+            "sms-backup-restore",
+            "sms-backup-restore",
+            export_id="test",
+            total_segments=4,
+        ).export()
+
+
+def test_export_parquet(dynamodb_client, export_resources):
+    pq = pytest.importorskip("pyarrow.parquet")
+    s3_client, records = export_resources
+    exporter = TableExporter(
+        dynamodb_client,
+        s3_client,
+        "sms-backup-restore",
+        "sms-backup-restore",
+        export_id="parquet",
+        output_format="parquet",
+        total_segments=2,
+    )
+
+    assert exporter.export().rows == len(records)
+    objects = s3_client.list_objects_v2(
+        Bucket="sms-backup-restore", Prefix="exports/parquet/record_type=MMS/"
+    )["Contents"]
+    body = s3_client.get_object(Bucket="sms-backup-restore", Key=objects[0]["Key"])
+    table = pq.read_table(io.BytesIO(body["Body"].read()))
+    assert table.num_rows == 1 and table.column("parts").to_pylist()[0][0]["seq"] == 0
+
+
+def test_export_paces_reads(dynamodb_client, export_resources):
+    s3_client, records = export_resources
+    exporter = TableExporter(
+        dynamodb_client,
+        s3_client,
+        "sms-backup-restore",
+        "sms-backup-restore",
+        export_id="paced",
+        total_segments=2,
+        max_read_request_units=1000,
+    )
+
+    assert exporter.export().rows == len(records)
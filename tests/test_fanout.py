@@ -0,0 +1,133 @@
+import json
+
+import boto3
+import pytest
+
+import sinks
+from sinks import SQSSink, load_record_batch
+
+
+@pytest.fixture
+def fanout_resources(dynamodb_table):
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket="sms-backup-restore")
+    sqs_client = boto3.client("sqs", region_name="us-east-1")
+    queue_url = sqs_client.create_queue(QueueName="record-batches")["QueueUrl"]
+    yield s3_client, sqs_client, queue_url
+
+
+def receive_all(sqs_client, queue_url):
+    messages = []
+    while True:
+        response = sqs_client.receive_message(
+            QueueUrl=queue_url, MaxNumberOfMessages=10
+        )
+        if not response.get("Messages"):
+            return messages
+        messages.extend(response["Messages"])
+
+
+def to_sqs_event(messages):
+    return {
+        "Records": [
+            {
+                "messageId": m["MessageId"],
+                "receiptHandle": m["ReceiptHandle"],
+                "body": m["Body"],
+                "attributes": {},
+                "messageAttributes": {},
+                "md5OfBody": m["MD5OfBody"],
+                "eventSource": "aws:sqs",
+                "eventSourceARN": "arn:aws:sqs:us-east-1:123456789012:record-batches",
+                "awsRegion": "us-east-1",
+            }
+            for m in messages
+        ]
+    }
+
+
+def test_sqs_sink_batches_records(fanout_resources, sms_record, call_record):
+    s3_client, sqs_client, queue_url = fanout_resources
+    records = [(r.hash(), r) for r in (sms_record, call_record)] * 3
+    sink = SQSSink(sqs_client, queue_url, s3_client, "sms-backup-restore", 2)
+
+    assert sink.write(records) == 6
+    messages = receive_all(sqs_client, queue_url)
+    assert len(messages) == 3
+    items = [i for m in messages for i in load_record_batch(s3_client, m["Body"])]
+    assert sorted(i["id"]["S"] for i in items) == sorted(r for r, _ in records)
+
+
+def test_sqs_sink_offloads_large_batches(
+    fanout_resources, monkeypatch, sms_record, mms_record
+):
+    s3_client, sqs_client, queue_url = fanout_resources
+    monkeypatch.setattr(sinks, "SQS_OFFLOAD_THRESHOLD_BYTES", 64)
+    records = [(r.hash(), r) for r in (sms_record, mms_record)]
+    sink = SQSSink(sqs_client, queue_url, s3_client, "sms-backup-restore")
+
+    sink.write(records)
+    (message,) = receive_all(sqs_client, queue_url)
+    assert json.loads(message["Body"])["s3"]["key"].startswith("batches/")
+    items = load_record_batch(s3_client, message["Body"])
+    assert [i["record_type"]["S"] for i in items] == ["SMS", "MMS"]
+
+
+def test_records_are_enqueued_while_parsing(fanout_resources, monkeypatch, make_sms):
+    import processing
+
+    s3_client, sqs_client, queue_url = fanout_resources
+    monkeypatch.setattr(processing, "STREAM_CHUNK_RECORDS", 10)
+    sink = SQSSink(sqs_client, queue_url, s3_client, "sms-backup-restore", 5)
+    records = [make_sms("+15551234567", i) for i in range(24)]
+    enqueued = []
+
+    def parse():
+        for i, record in enumerate(records):
+            if i % 10 == 0:
+                attributes = sqs_client.get_queue_attributes(
+                    QueueUrl=queue_url, AttributeNames=["ApproximateNumberOfMessages"]
+                )["Attributes"]
+                enqueued.append(int(attributes["ApproximateNumberOfMessages"]))
+            yield record.hash(), record
+        # Repeated within its chunk, and across chunks
+        yield records[-1].hash(), records[-1]
+        yield records[3].hash(), records[3]
+
+    # The first chunk was committed by an earlier attempt
+    record_counts = processing.stream_records(parse(), "object", {"sqs": 10}, [sink])
+
+    assert enqueued == [0, 0, 2]
+    assert record_counts == {"SMS": 24}
+    items = [
+        i["id"]["S"]
+        for m in receive_all(sqs_client, queue_url)
+        for i in load_record_batch(s3_client, m["Body"])
+    ]
+    # A repeat in a later chunk is enqueued again but counted once
+    assert sorted(items) == sorted(r.hash() for r in records[10:] + records[3:4])
+
+
+def test_writer_reports_partial_batch_failures(
+    fanout_resources, sms_record, call_record
+):
+    s3_client, sqs_client, queue_url = fanout_resources
+    sink = SQSSink(sqs_client, queue_url, s3_client, "sms-backup-restore", 1)
+    sink.write([(r.hash(), r) for r in (sms_record, call_record)])
+    sqs_client.send_message(
+        QueueUrl=queue_url,
+        MessageBody=json.dumps({"s3": {"bucket": "sms-backup-restore", "key": "x"}}),
+    )
+    messages = receive_all(sqs_client, queue_url)
+
+    import writer_function
+
+    response = writer_function.handler(to_sqs_event(messages), None)
+
+    assert response["batchItemFailures"] == [
+        {"itemIdentifier": messages[-1]["MessageId"]}
+    ]
+    table = boto3.resource("dynamodb", region_name="us-east-1").Table(
+        "sms-backup-restore"
+    )
+    assert table.scan()["Count"] == 2
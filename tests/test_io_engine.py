@@ -0,0 +1,236 @@
+import asyncio
+import base64
+import threading
+from hashlib import sha256
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+
+from backup_processor import BackupRestoreProcessor
+from io_engine import AsyncIOEngine
+from rate_control import AdaptiveWriteRateController
+from shared_cache import InProcessSetCache, part_namespace
+from sinks import DynamoDBSink
+from warm_cache import TTLCache
+
+
+@pytest.fixture
+def io_engine(moto_server):
+    engine = AsyncIOEngine(
+        region_name="us-east-1",
+        max_in_flight=2,
+        endpoint_urls={"s3": moto_server, "dynamodb": moto_server},
+    )
+    yield engine
+    engine.close()
+
+
+async def new_event():
+    return asyncio.Event()
+
+
+def test_submit_queues_coroutines_beyond_the_running_ones(io_engine):
+    release = io_engine.run(new_event())
+    running = []
+    peak = 0
+
+    async def task(i):
+        nonlocal peak
+        running.append(i)
+        peak = max(peak, len(running))
+        await release.wait()
+        running.remove(i)
+        return i
+
+    # Only two run at once, yet none of the submits waits for a slot
+    futures = [io_engine.submit(task(i)) for i in range(5)]
+    assert not any(future.done() for future in futures)
+    io_engine._loop.call_soon_threadsafe(release.set)
+    assert [future.result(timeout=5) for future in futures] == list(range(5))
+    assert peak == 2
+
+
+def test_submit_waits_while_pending_bytes_exceed_the_budget(moto_server):
+    engine = AsyncIOEngine(region_name="us-east-1", max_pending_bytes=10)
+    release = engine.run(new_event())
+    try:
+        first = engine.submit(release.wait(), size=6)
+        submitted = threading.Event()
+
+        def submit_second():
+            engine.submit(asyncio.sleep(0), size=6).result()
+            submitted.set()
+
+        thread = threading.Thread(target=submit_second)
+        thread.start()
+        thread.join(timeout=0.05)
+        assert thread.is_alive() and not submitted.is_set()
+
+        engine._loop.call_soon_threadsafe(release.set)
+        first.result(timeout=5)
+        thread.join(timeout=5)
+        assert submitted.is_set()
+    finally:
+        engine.close()
+
+
+def test_parts_are_uploaded_on_the_engine(io_engine, moto_server, attachment):
+    s3_client = boto3.client("s3", region_name="us-east-1", endpoint_url=moto_server)
+    s3_client.create_bucket(Bucket="sms-backup-restore")
+    # Stored by an earlier run, so only checked
+    stored = bytes(100)
+    s3_client.put_object(
+        Bucket="sms-backup-restore",
+        Key=f"parts/{sha256(stored).hexdigest()}",
+        Body=stored,
+        ContentType="text/plain",
+    )
+    known_parts = TTLCache("KnownParts", ttl_seconds=60, max_bytes=1 << 20)
+    processor = BackupRestoreProcessor(
+        s3_client=s3_client,
+        s3_resource=boto3.resource(
+            "s3", region_name="us-east-1", endpoint_url=moto_server
+        ),
+        io_engine=io_engine,
+        known_parts=known_parts,
+    )
+
+    hashes = [
+        processor.upload_part_s3(
+            "sms-backup-restore", base64.b64encode(data).decode(), "image/png"
+        )
+        for data in (attachment, stored)
+    ]
+    processor._wait_for_uploads()
+
+    uploaded = s3_client.get_object(
+        Bucket="sms-backup-restore", Key=f"parts/{hashes[0]}"
+    )
+    assert uploaded["Body"].read() == attachment
+    assert uploaded["ContentType"] == "image/png"
+    existing = s3_client.head_object(
+        Bucket="sms-backup-restore", Key=f"parts/{hashes[1]}"
+    )
+    assert existing["ContentType"] == "text/plain"
+    assert all(("sms-backup-restore", h) in known_parts for h in hashes)
+
+
+class RecordingSetCache(InProcessSetCache):
+    def __init__(self):
+        super().__init__()
+        self.lookup_threads = set()
+        self.additions = []
+
+    def _contains(self, namespace, members):
+        self.lookup_threads.add(threading.current_thread())
+        return super()._contains(namespace, members)
+
+    def add(self, namespace, members):
+        members = list(members)
+        self.additions.append(members)
+        super().add(namespace, members)
+
+
+def test_shared_parts_are_checked_off_the_parser_thread(io_engine, moto_server):
+    s3_client = boto3.client("s3", region_name="us-east-1", endpoint_url=moto_server)
+    s3_client.create_bucket(Bucket="sms-backup-restore")
+    shared_cache = RecordingSetCache()
+    shared_cache.add(part_namespace("sms-backup-restore"), [sha256(b"a").hexdigest()])
+    processor = BackupRestoreProcessor(
+        s3_client=s3_client,
+        s3_resource=None,
+        io_engine=io_engine,
+        shared_cache=shared_cache,
+    )
+
+    for data in (b"a", b"b", b"c"):
+        processor.upload_part_s3(
+            "sms-backup-restore", base64.b64encode(data).decode(), "image/png"
+        )
+    processor._wait_for_uploads()
+    processor._share_parts()
+
+    assert threading.main_thread() not in shared_cache.lookup_threads
+    # The uploaded parts are shared in one update
+    [_, added] = shared_cache.additions
+    assert sorted(added) == sorted(sha256(d).hexdigest() for d in (b"b", b"c"))
+
+
+def test_dynamodb_sink_writes_on_the_engine(io_engine, moto_server, make_sms):
+    dynamodb_client = boto3.client(
+        "dynamodb", region_name="us-east-1", endpoint_url=moto_server
+    )
+    dynamodb_client.create_table(
+        TableName="sms-backup-restore",
+        KeySchema=[
+            {"AttributeName": "id", "KeyType": "HASH"},
+            {"AttributeName": "timestamp", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "id", "AttributeType": "S"},
+            {"AttributeName": "timestamp", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    sink = DynamoDBSink(dynamodb_client, "sms-backup-restore", io_engine=io_engine)
+    records = [make_sms("+15551234567", i) for i in range(60)]
+
+    assert sink.write((r.hash(), r) for r in records) == 60
+    assert sink.write((r.hash(), r) for r in records) == 0
+    assert dynamodb_client.scan(TableName="sms-backup-restore")["Count"] == 60
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ThrottlingClient:
+    """Async DynamoDB client throttling, then leaving one item unprocessed."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def batch_write_item(self, RequestItems, ReturnConsumedCapacity):
+        self.requests.append(RequestItems)
+        [(table_name, put_requests)] = RequestItems.items()
+        if len(self.requests) == 1:
+            raise ClientError(
+                {"Error": {"Code": "ThrottlingException"}}, "BatchWriteItem"
+            )
+        consumed = [{"TableName": table_name, "CapacityUnits": len(put_requests)}]
+        if len(self.requests) == 2:
+            return {
+                "UnprocessedItems": {table_name: put_requests[:1]},
+                "ConsumedCapacity": consumed,
+            }
+        return {"ConsumedCapacity": consumed}
+
+
+def test_write_batch_async_retries_throttled_and_unprocessed_items():
+    clock = FakeClock()
+    sink = DynamoDBSink(
+        None,
+        "sms-backup-restore",
+        skip_unchanged=False,
+        rate_controller=AdaptiveWriteRateController(
+            clock=clock, async_sleep=clock.sleep
+        ),
+    )
+    client = ThrottlingClient()
+    put_requests = [{"PutRequest": {"Item": {"id": {"S": str(i)}}}} for i in range(3)]
+
+    assert asyncio.run(sink._write_batch_async(client, put_requests)) == 3
+    assert [len(r["sms-backup-restore"]) for r in client.requests] == [3, 3, 1]
+    assert clock.sleeps == [0.05, 0.1]
+    counts = {name: value for name, _, value in sink.metrics()}
+    assert counts["WriteThrottles"] == 2
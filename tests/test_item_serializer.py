@@ -0,0 +1,96 @@
+import base64
+import pickle
+import random
+
+import boto3
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+
+from compact_records import CompactRecord
+from conversations import ConversationQuery
+from item_serializer import (
+    COMPRESSION_MARKER,
+    THREAD_ATTRIBUTE,
+    ZLIB_CODEC,
+    ZSTD_CODEC,
+    compress_item,
+    compress_value,
+    deserialize_item,
+    deserialize_value,
+    serialize_record,
+)
+from sinks import DynamoDBSink, to_item
+
+
+@pytest.mark.parametrize("record_fixture", ["sms_record", "call_record", "mms_record"])
+def test_serialize_record_matches_type_serializer(record_fixture, request):
+    record = request.getfixturevalue(record_fixture)
+    item = to_item(record.hash(), record)
+    type_serializer = TypeSerializer()
+
+    serialized = serialize_record(record.hash(), record)
+    thread = serialized.pop(THREAD_ATTRIBUTE)["S"]
+
+    assert serialized == {k: type_serializer.serialize(v) for k, v in item.items()}
+    assert deserialize_item(serialized) == item
+    assert thread.startswith("~".join(sorted(record.address)) + "#")
+
+
+@pytest.mark.parametrize("record_fixture", ["sms_record", "call_record", "mms_record"])
+def test_compact_record_serializes_like_its_model(record_fixture, request):
+    record = request.getfixturevalue(record_fixture)
+    compact = CompactRecord.from_model(record)
+
+    assert compact.hash() == record.hash()
+    assert compact.record_type == record.record_type
+    assert compact.model_dump() == record.model_dump()
+    assert serialize_record(compact.hash(), compact) == serialize_record(
+        record.hash(), record
+    )
+    restored = pickle.loads(pickle.dumps(compact))
+    assert restored.model_dump() == compact.model_dump()
+
+
+def test_compressed_attributes_round_trip(sms_record, mms_record):
+    item = serialize_record(mms_record.hash(), mms_record)
+    assert compress_item(item) is item
+
+    long_sms = sms_record.model_copy(update={"body": "See you at dinner. " * 200})
+    item = serialize_record(long_sms.hash(), long_sms)
+    compressed = compress_item(item)
+    assert compressed["body"].keys() == {"B"}
+    assert compressed["body"]["B"][:2] == COMPRESSION_MARKER + ZSTD_CODEC
+    assert len(compressed["body"]["B"]) < 200
+    assert compressed["address"] == item["address"]
+    assert deserialize_item(compressed) == deserialize_item(item)
+
+    # Values written with zlib before zstandard was a dependency still decode
+    zlib_body = {"B": compress_value(item["body"], codec=ZLIB_CODEC)}
+    assert deserialize_value(zlib_body) == long_sms.body
+
+
+def test_sink_spills_oversized_items(dynamodb_client, sms_record):
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket="sms-backup-restore")
+    sink = DynamoDBSink(
+        dynamodb_client,
+        "sms-backup-restore",
+        s3_client=s3_client,
+        bucket_name="sms-backup-restore",
+    )
+    # Random text does not compress below the item size limit
+    body = base64.b64encode(random.Random(0).randbytes(450 * 1024)).decode()
+    large = sms_record.model_copy(update={"body": body})
+    sink.write([(large.hash(), large)])
+    assert ("ItemsSpilled", 1) in [(n, v) for n, _, v in sink.metrics()]
+
+    query = ConversationQuery(dynamodb_client, "sms-backup-restore")
+    [placeholder] = query.get_page("+15551234567").records
+    assert "body" not in placeholder
+    query = ConversationQuery(
+        dynamodb_client, "sms-backup-restore", s3_client=s3_client
+    )
+    [record] = query.get_page("+15551234567").records
+    assert record["body"] == body
+    # Unchanged spilled items are skipped by their digest
+    assert sink.write([(large.hash(), large)]) == 0
@@ -0,0 +1,81 @@
+import base64
+import io
+from hashlib import sha256
+
+import boto3
+import pytest
+
+from backup_processor import BackupRestoreProcessor
+from part_extractor import EXTRACTED_PART_PREFIX, PartDataExtractor
+
+
+@pytest.mark.parametrize("chunk_size", [7, 4096, 1024 * 1024])
+def test_large_part_data_is_diverted_at_any_read_size(
+    sms_backup, attachment, chunk_size
+):
+    with PartDataExtractor(
+        io.BytesIO(sms_backup.encode()), min_base64_bytes=1024, chunk_size=chunk_size
+    ) as extractor:
+        parsed = extractor.read()
+        [part] = extractor.parts.values()
+        part.file.seek(0)
+        assert part.file.read() == attachment
+
+    assert (
+        parsed
+        == sms_backup.replace(
+            base64.b64encode(attachment).decode(),
+            f"{EXTRACTED_PART_PREFIX}{sha256(attachment).hexdigest()}",
+        ).encode()
+    )
+    assert part.size == len(attachment)
+
+
+def test_small_part_data_is_left_for_the_parser(sms_backup):
+    with PartDataExtractor(io.BytesIO(sms_backup.encode()), chunk_size=7) as extractor:
+        assert extractor.read() == sms_backup.encode()
+        assert extractor.parts == {}
+
+
+def test_extracted_parts_are_stored_as_parsed_ones(backup_bucket, attachment):
+    s3_client = backup_bucket
+
+    def record_ids(extract_min_bytes):
+        processor = BackupRestoreProcessor(
+            s3_client=s3_client,
+            s3_resource=boto3.resource("s3", region_name="us-east-1"),
+            extract_min_bytes=extract_min_bytes,
+        )
+        return [
+            r.hash()
+            for r in processor.process_backup("sms-backup-restore", "sms-backup.xml")
+        ]
+
+    assert record_ids(1024) == record_ids(None)
+    stored = s3_client.get_object(
+        Bucket="sms-backup-restore", Key=f"parts/{sha256(attachment).hexdigest()}"
+    )
+    assert stored["Body"].read() == attachment
+    assert stored["ContentType"] == "image/png"
+
+
+def test_extracted_parts_are_dropped_when_not_stored(backup_bucket, attachment):
+    s3_client = backup_bucket
+    processor = BackupRestoreProcessor(
+        s3_client=s3_client,
+        s3_resource=boto3.resource("s3", region_name="us-east-1"),
+        store_parts=False,
+        extract_min_bytes=1024,
+    )
+
+    records = []
+    for record in processor.process_backup("sms-backup-restore", "sms-backup.xml"):
+        records.append(record)
+        # The extractor is closed once the backup is exhausted
+        parts_left = dict(processor._extractor.parts)
+
+    assert len(records) == 3
+    assert parts_left == {}
+    assert "Contents" not in s3_client.list_objects_v2(
+        Bucket="sms-backup-restore", Prefix="parts/"
+    )
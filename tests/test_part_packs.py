@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from hashlib import sha256
+
+from batch_requests import batch_write_items
+from part_packs import PartPacker, PartReader, collect_orphaned_packs
+
+
+def make_packer(s3_client, dynamodb_client, part_index_table):
+    return PartPacker(
+        s3_client, dynamodb_client, part_index_table, "sms-backup-restore"
+    )
+
+
+def test_index_items_are_kept_out_of_the_records_table(
+    dynamodb_client, backup_bucket, part_index_table
+):
+    packer = make_packer(backup_bucket, dynamodb_client, part_index_table)
+    part_hash = packer.add(b"attachment")
+    key = packer.flush()
+
+    assert dynamodb_client.scan(TableName="sms-backup-restore")["Count"] == 0
+    reader = PartReader(
+        backup_bucket, dynamodb_client, part_index_table, "sms-backup-restore"
+    )
+    location = reader.locate([part_hash])[part_hash]
+    assert location == (key, 0, len(b"attachment"))
+    assert reader.read(part_hash, location) == b"attachment"
+
+
+def test_parts_stored_standalone_are_not_packed(
+    dynamodb_client, backup_bucket, part_index_table
+):
+    stored, empty = b"stored attachment", b"empty attachment"
+    for data, body in ((stored, stored), (empty, b"")):
+        backup_bucket.put_object(
+            Bucket="sms-backup-restore",
+            Key=f"parts/{sha256(data).hexdigest()}",
+            Body=body,
+        )
+    packer = make_packer(backup_bucket, dynamodb_client, part_index_table)
+    packer.add(stored)
+    packer.add(empty)
+    packer.flush()
+
+    # Earlier versions stored empty objects, which are packed over
+    assert packer.parts_packed == 1
+    index = dynamodb_client.scan(TableName=part_index_table)["Items"]
+    assert [i["part"]["S"] for i in index] == [sha256(empty).hexdigest()]
+
+
+def test_index_writes_back_off_unprocessed_items(
+    dynamodb_client, backup_bucket, part_index_table, monkeypatch
+):
+    batch_write_item = dynamodb_client.batch_write_item
+    calls = []
+
+    def flaky_batch_write_item(RequestItems):
+        calls.append(RequestItems)
+        if len(calls) == 1:
+            return {"UnprocessedItems": RequestItems}
+        return batch_write_item(RequestItems=RequestItems)
+
+    monkeypatch.setattr(dynamodb_client, "batch_write_item", flaky_batch_write_item)
+    sleeps = []
+    monkeypatch.setattr(
+        "part_packs.batch_write_items",
+        partial(batch_write_items, sleep=sleeps.append),
+    )
+    packer = make_packer(backup_bucket, dynamodb_client, part_index_table)
+    packer.add(b"attachment")
+    packer.flush()
+
+    assert len(calls) == 2 and sleeps == [0.05]
+    assert dynamodb_client.scan(TableName=part_index_table)["Count"] == 1
+
+
+def test_orphaned_packs_are_collected(dynamodb_client, backup_bucket, part_index_table):
+    packer = make_packer(backup_bucket, dynamodb_client, part_index_table)
+    packer.add(b"attachment")
+    referenced = packer.flush()
+    for key in ("packs/orphan.pack", "packs/young.pack"):
+        backup_bucket.put_object(Bucket="sms-backup-restore", Key=key, Body=b"x")
+
+    def collect(now):
+        return collect_orphaned_packs(
+            backup_bucket,
+            dynamodb_client,
+            part_index_table,
+            "sms-backup-restore",
+            now=now,
+        )
+
+    # Packs are only collected once their flush has long finished
+    assert collect(datetime.now(timezone.utc)) == 0
+    assert collect(datetime.now(timezone.utc) + timedelta(days=2)) == 2
+    keys = [
+        obj["Key"]
+        for obj in backup_bucket.list_objects_v2(
+            Bucket="sms-backup-restore", Prefix="packs/"
+        )["Contents"]
+    ]
+    assert keys == [referenced]
@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+
+import pytest
+
+from planning import (
+    FANOUT,
+    INLINE,
+    PARALLEL,
+    BackupSize,
+    BackupTooLargeError,
+    ExecutionPlan,
+    Throughput,
+    ThroughputHistory,
+    plan_execution,
+    read_backup_size,
+)
+
+
+@pytest.fixture
+def throughput_history(dynamodb_table, dynamodb_client):
+    dynamodb_client.create_table(
+        TableName="sms-backup-restore-idempotency",
+        KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return ThroughputHistory(dynamodb_client, "sms-backup-restore-idempotency")
+
+
+def test_backup_size_is_read_from_the_root_element(backup_bucket, sms_backup):
+    size = read_backup_size(backup_bucket, "sms-backup-restore", "sms-backup.xml")
+
+    assert size == BackupSize(3, len(sms_backup.encode()))
+
+
+@pytest.mark.parametrize(
+    "record_count,write_units,expected",
+    [
+        (100, 1000.0, INLINE),
+        (100_000, 1000.0, PARALLEL),
+        # Parsing fits, writing at 1000 units/s after it does not
+        (1_000_000, 1000.0, FANOUT),
+        # Writes already go to the queue
+        (1_000_000, None, PARALLEL),
+    ],
+)
+def test_plan_is_chosen_from_estimated_work(record_count, write_units, expected):
+    history = {PARALLEL: Throughput(10_000.0, 50e6)}
+    size = BackupSize(record_count, record_count * 200)
+
+    plan = plan_execution(
+        size,
+        history,
+        budget_seconds=900,
+        parallel=True,
+        fan_out=True,
+        write_units_per_second=write_units,
+    )
+
+    assert plan.strategy == expected
+    assert plan.fits
+
+
+def test_backup_too_large_for_any_plan_does_not_fit():
+    plan = plan_execution(
+        BackupSize(50_000_000, None),
+        {},
+        budget_seconds=900,
+        parallel=True,
+        fan_out=True,
+        write_units_per_second=1000.0,
+    )
+
+    assert plan.strategy == FANOUT
+    assert not plan.fits
+    assert not plan.parse_fits
+
+
+def test_backup_too_large_to_parse_fails_fast(backup_bucket, monkeypatch):
+    import processing
+
+    backup_bucket.put_object(
+        Bucket="sms-backup-restore",
+        Key="sms-huge.xml",
+        Body=b'<?xml version="1.0"?><smses count="50000000"></smses>',
+    )
+    monkeypatch.setattr(processing, "s3_client", backup_bucket)
+    monkeypatch.setattr(processing, "throughput_history", None)
+    processing.idempotency_config.register_lambda_context(
+        SimpleNamespace(get_remaining_time_in_millis=lambda: 900_000)
+    )
+
+    with pytest.raises(BackupTooLargeError, match="sms-huge.xml"):
+        processing.plan_backup("sms-backup-restore", "sms-huge.xml")
+
+
+def test_throughput_history_keeps_moving_averages(throughput_history):
+    assert throughput_history.load() == {}
+
+    throughput_history.record(PARALLEL, 10_000, 10_000_000, 1.0)
+    average = throughput_history.record(PARALLEL, 20_000, 20_000_000, 1.0)
+
+    assert average == pytest.approx(Throughput(13_000, 13_000_000))
+    assert throughput_history.load() == {PARALLEL: average}
+
+
+def test_throughput_is_recorded_from_the_root_count(throughput_history, monkeypatch):
+    import processing
+
+    monkeypatch.setattr(processing, "throughput_history", throughput_history)
+    size = BackupSize(10_000, 10_000_000)
+    plan = ExecutionPlan(size, PARALLEL, False, 1.0, 1.0, 720.0)
+
+    # Duplicates left 8000 of the 10000 parsed records
+    processing.record_throughput(plan, 8_000, 1.0)
+
+    assert throughput_history.load() == {PARALLEL: Throughput(10_000, 10_000_000)}
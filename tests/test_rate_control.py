@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from rate_control import AdaptiveWriteRateController, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def async_sleep(self, seconds):
+        self.sleep(seconds)
+
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=100, clock=clock, sleep=clock.sleep)
+
+    bucket.acquire(100)
+    assert clock.sleeps == []
+    # Capacity consumed beyond the estimate is paid back before the next write
+    bucket.settle(50)
+    clock.now = 1.0
+    bucket.acquire(80)
+    assert clock.sleeps == [pytest.approx(0.3)]
+    # Unused capacity is returned
+    bucket.settle(-10)
+    bucket.acquire(20)
+    assert clock.sleeps == [pytest.approx(0.3), pytest.approx(0.1)]
+    assert clock.now == pytest.approx(1.4)
+
+
+def test_controller_increases_additively_without_throttling():
+    clock = FakeClock()
+    controller = AdaptiveWriteRateController(
+        max_write_request_units=1000, max_concurrency=16, clock=clock
+    )
+    rate, concurrency = controller.allowed_rate, controller.concurrency
+
+    for second in range(1, 4):
+        clock.now = float(second)
+        controller.record(estimated_units=25, consumed_units=25)
+
+    assert controller.allowed_rate == rate + 3 * 45
+    assert controller.concurrency == concurrency + 3
+
+
+def test_controller_backs_off_multiplicatively_and_stays_under_cap():
+    clock = FakeClock()
+    controller = AdaptiveWriteRateController(
+        max_write_request_units=1000, max_concurrency=16, clock=clock
+    )
+    for second in range(1, 30):
+        clock.now = float(second)
+        controller.record(estimated_units=25, consumed_units=25)
+    assert controller.allowed_rate == 900
+    assert controller.concurrency == 16
+
+    controller.throttled()
+    assert controller.allowed_rate == 450
+    assert controller.concurrency == 8
+
+    clock.now = 30.5
+    controller.record(estimated_units=25, consumed_units=30)
+    assert controller.current_rate() == 30
+    clock.now = 32.0
+    assert controller.current_rate() == 0
+
+
+def test_token_bucket_waits_on_the_event_loop():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=100, clock=clock, async_sleep=clock.async_sleep)
+    bucket.acquire(100)
+    assert bucket.try_acquire(50) == 0.5
+
+    asyncio.run(bucket.acquire_async(50))
+    assert clock.sleeps == [0.5]
+    assert bucket.try_acquire(1) > 0
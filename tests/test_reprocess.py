@@ -0,0 +1,126 @@
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from reprocess import BackupObject, covering_set, enqueue_backups, list_backups
+
+UPLOADED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def backup(key, record_count=None):
+    tags = {}
+    if record_count is not None:
+        tags = {"processed": "COMPLETE", "record_count": str(record_count)}
+    return BackupObject(key, '"etag"', UPLOADED, tags)
+
+
+@pytest.fixture
+def s3_client(aws_credentials):
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket="sms-backup-restore")
+        yield s3_client
+
+
+def test_newest_backup_supersedes_older_ones():
+    backups = [
+        backup("sms-20240101000000.xml", 900),
+        backup("sms-20240301000000.xml", 1000),
+        backup("calls-20240201000000.xml", 50),
+        # Held messages later deleted from the phone
+        backup("sms-20231201000000.xml", 1200),
+        backup("sms-20231101000000.xml", 1100),
+        # Never processed, so nothing is known to cover it
+        backup("sms-20231001000000.xml"),
+        # Another phone's backups
+        backup("pixel/sms-20230101000000.xml", 10),
+    ]
+
+    assert [b.key for b in covering_set(backups)] == [
+        "sms-20240301000000.xml",
+        "calls-20240201000000.xml",
+        "sms-20231201000000.xml",
+        "sms-20231001000000.xml",
+        "pixel/sms-20230101000000.xml",
+    ]
+
+
+def test_backups_are_listed_with_their_tags_and_enqueued(s3_client):
+    sqs_client = boto3.client("sqs", region_name="us-east-1")
+    queue_url = sqs_client.create_queue(QueueName="reprocess")["QueueUrl"]
+    for key in ("sms-20240101000000.xml", "restores/sms-2024.xml", "parts/abc"):
+        s3_client.put_object(Bucket="sms-backup-restore", Key=key, Body=b"<smses />")
+    s3_client.put_object_tagging(
+        Bucket="sms-backup-restore",
+        Key="sms-20240101000000.xml",
+        Tagging={
+            "TagSet": [
+                {"Key": "processed", "Value": "COMPLETE"},
+                {"Key": "record_count", "Value": "3"},
+            ]
+        },
+    )
+
+    backups = list_backups(s3_client, "sms-backup-restore")
+
+    assert [(b.key, b.record_count) for b in backups] == [("sms-20240101000000.xml", 3)]
+    assert enqueue_backups(
+        sqs_client, queue_url, "sms-backup-restore", backups, run_id="run-1"
+    )
+    message = sqs_client.receive_message(QueueUrl=queue_url)["Messages"][0]
+    assert json.loads(message["Body"]) == {
+        "bucket": "sms-backup-restore",
+        "key": "sms-20240101000000.xml",
+        "etag": backups[0].etag,
+        "run": "run-1",
+    }
+
+
+def test_reprocess_handler_reports_failed_backups(monkeypatch):
+    import lambda_function
+
+    processed = []
+
+    def process_backup_object(backup):
+        if backup["key"] == "sms-broken.xml":
+            raise ValueError("Unreadable backup")
+        processed.append(backup)
+        return {"record_count": 3}
+
+    monkeypatch.setattr(lambda_function, "process_backup_object", process_backup_object)
+    backups = [
+        {"bucket": "sms-backup-restore", "key": key, "etag": '"etag"', "run": "run-1"}
+        for key in ("sms-20240101000000.xml", "sms-broken.xml")
+    ]
+    event = {
+        "Records": [
+            {
+                "messageId": f"message-{i}",
+                "receiptHandle": f"handle-{i}",
+                "body": json.dumps(body),
+                "attributes": {},
+                "messageAttributes": {},
+                "md5OfBody": "",
+                "eventSource": "aws:sqs",
+                "eventSourceARN": "arn:aws:sqs:us-east-1:123456789012:reprocess",
+                "awsRegion": "us-east-1",
+            }
+            for i, body in enumerate(backups)
+        ]
+    }
+    context = SimpleNamespace(
+        function_name="sms-backup-restore-reprocess-worker",
+        memory_limit_in_mb=8192,
+        invoked_function_arn="arn:aws:lambda:us-east-1:123456789012:function:x",
+        aws_request_id="request-1",
+        get_remaining_time_in_millis=lambda: 60000,
+    )
+
+    response = lambda_function.reprocess_handler(event, context)
+
+    assert processed == backups[:1]
+    assert response["batchItemFailures"] == [{"itemIdentifier": "message-1"}]
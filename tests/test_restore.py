@@ -0,0 +1,155 @@
+import base64
+
+import boto3
+import pytest
+from lxml import etree
+
+from backup_processor import BackupRestoreProcessor
+from compact_records import CompactRecord
+from part_packs import PartPacker
+from restore import BackupRestorer, DeferredHeadUpload
+from sinks import DynamoDBSink
+from table_scan import ParallelTableScanner
+
+
+@pytest.fixture
+def restore_resources(dynamodb_client, backup_bucket, call_record):
+    s3_client = backup_bucket
+    processor = BackupRestoreProcessor(
+        s3_client=s3_client, s3_resource=boto3.resource("s3", region_name="us-east-1")
+    )
+    records = {
+        r.hash(): r
+        for r in processor.process_backup("sms-backup-restore", "sms-backup.xml")
+    }
+    records[call_record.hash()] = call_record
+    DynamoDBSink(dynamodb_client, "sms-backup-restore").write(records.items())
+    restorer = BackupRestorer(
+        dynamodb_client, s3_client, "sms-backup-restore", "sms-backup-restore"
+    )
+    yield s3_client, processor, restorer, records
+
+
+def test_parallel_scan_reads_every_item(dynamodb_client, restore_resources):
+    scanner = ParallelTableScanner(dynamodb_client, "sms-backup-restore", 3)
+
+    items = list(scanner.scan())
+    assert len(items) == scanner.count() == 4
+    assert (
+        scanner.count(
+            FilterExpression="record_type = :call",
+            ExpressionAttributeValues={":call": {"S": "Call"}},
+        )
+        == 1
+    )
+
+
+def test_restore_round_trips_records(restore_resources, attachment):
+    s3_client, processor, restorer, records = restore_resources
+
+    assert restorer.restore("sms", "restores/sms.xml") == 3
+    body = s3_client.get_object(Bucket="sms-backup-restore", Key="restores/sms.xml")
+    root = etree.fromstring(body["Body"].read())
+    assert root.tag == "smses" and root.attrib["count"] == "3"
+    part = root.find("mms/parts/part[@seq='1']")
+    assert base64.b64decode(part.attrib["data"]) == attachment
+
+    restored = processor.process_backup("sms-backup-restore", "restores/sms.xml")
+    restored = {r.hash(): r for r in restored}
+    originals = {k: r for k, r in records.items() if r.record_type != "Call"}
+    assert restored.keys() == originals.keys()
+    for record_id, record in restored.items():
+        assert record.model_dump() == originals[record_id].model_dump()
+
+
+def test_restore_single_conversation(restore_resources):
+    s3_client, _, restorer, _ = restore_resources
+
+    assert restorer.restore("calls", "restores/calls.xml", "5551234567") == 1
+    assert restorer.restore("sms", "restores/sms.xml", "+15557654321") == 1
+    body = s3_client.get_object(Bucket="sms-backup-restore", Key="restores/calls.xml")
+    root = etree.fromstring(body["Body"].read())
+    assert [c.attrib["number"] for c in root] == ["+15551234567"]
+    assert root.attrib["count"] == "1"
+
+
+def test_restore_reads_packed_parts(
+    dynamodb_client, backup_bucket, part_index_table, attachment
+):
+    s3_client = backup_bucket
+    packer = PartPacker(
+        s3_client, dynamodb_client, part_index_table, "sms-backup-restore"
+    )
+    processor = BackupRestoreProcessor(
+        s3_client=s3_client,
+        s3_resource=boto3.resource("s3", region_name="us-east-1"),
+        part_packer=packer,
+    )
+    records = list(processor.process_backup("sms-backup-restore", "sms-backup.xml"))
+    # More MMS sharing the packed attachment, to be located in a single lookup
+    mms = next(r for r in records if r.record_type == "MMS")
+    records += [
+        CompactRecord(f"{mms.hash()}-{i}", mms.record_type, mms.values)
+        for i in range(4)
+    ]
+    DynamoDBSink(dynamodb_client, "sms-backup-restore").write(
+        (r.hash(), r) for r in records
+    )
+    keys = [
+        obj["Key"]
+        for obj in s3_client.list_objects_v2(Bucket="sms-backup-restore")["Contents"]
+    ]
+    assert [k.split("/")[0] for k in keys if "/" in k] == ["packs"]
+    assert packer.packs_written == packer.parts_packed == 1
+    # Parts indexed by an earlier run are not packed again
+    repacker = PartPacker(
+        s3_client, dynamodb_client, part_index_table, "sms-backup-restore"
+    )
+    processor = BackupRestoreProcessor(
+        s3_client=s3_client,
+        s3_resource=boto3.resource("s3", region_name="us-east-1"),
+        part_packer=repacker,
+    )
+    list(processor.process_backup("sms-backup-restore", "sms-backup.xml"))
+    assert repacker.packs_written == 0
+
+    restorer = BackupRestorer(
+        dynamodb_client,
+        s3_client,
+        "sms-backup-restore",
+        "sms-backup-restore",
+        part_index_table=part_index_table,
+    )
+    batch_gets = []
+    dynamodb_client.meta.events.register(
+        "before-call.dynamodb.BatchGetItem",
+        lambda **kwargs: batch_gets.append(kwargs),
+    )
+    assert restorer.restore("sms", "restores/sms.xml") == 7
+    assert len(batch_gets) == 1
+    body = s3_client.get_object(Bucket="sms-backup-restore", Key="restores/sms.xml")
+    parts = etree.fromstring(body["Body"].read()).findall("mms/parts/part[@seq='1']")
+    assert len(parts) == 5
+    for part in parts:
+        assert base64.b64decode(part.attrib["data"]) == attachment
+
+
+def test_deferred_head_is_uploaded_first(backup_bucket):
+    s3_client = backup_bucket
+    part_size = 5 * 1024 * 1024
+    upload = DeferredHeadUpload(
+        s3_client, "sms-backup-restore", "restores/big.xml", part_size
+    )
+    for chunk in (b"a", b"b", b"c"):
+        upload.write(chunk * part_size)
+    upload.write(b"</smses>")
+    upload.close(b"<smses count='3'>")
+
+    body = s3_client.get_object(Bucket="sms-backup-restore", Key="restores/big.xml")
+    assert body["Body"].read() == (
+        b"<smses count='3'>"
+        + b"a" * part_size
+        + b"b" * part_size
+        + b"c" * part_size
+        + b"</smses>"
+    )
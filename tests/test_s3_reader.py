@@ -0,0 +1,65 @@
+import random
+
+import boto3
+import pytest
+from botocore.exceptions import ConnectionClosedError
+from lxml import etree
+from moto import mock_aws
+
+from s3_reader import PrefetchingReader
+
+
+@pytest.fixture
+def s3_client(aws_credentials):
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket="sms-backup-restore")
+        yield s3_client
+
+
+def test_reader_returns_the_object_in_order(s3_client, monkeypatch):
+    body = random.Random(0).randbytes(300_000)
+    s3_client.put_object(Bucket="sms-backup-restore", Key="backup.xml", Body=body)
+
+    get_object = s3_client.get_object
+    failed = set()
+
+    def flaky_get_object(**kwargs):
+        # Every range's first connection resets
+        if kwargs["Range"] not in failed:
+            failed.add(kwargs["Range"])
+            raise ConnectionClosedError(endpoint_url="https://s3")
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(s3_client, "get_object", flaky_get_object)
+    monkeypatch.setattr("s3_reader.RETRY_BACKOFF_SECONDS", 0)
+
+    with PrefetchingReader(
+        s3_client,
+        "sms-backup-restore",
+        "backup.xml",
+        chunk_size=64 * 1024,
+        readahead_chunks=3,
+    ) as reader:
+        assert reader.read(10) == body[:10]
+        assert reader.read() == body[10:]
+        assert reader.read() == b""
+        assert reader.retries == len(failed) == 5
+        assert reader.bytes_read == len(body)
+        assert reader.bytes_per_second > 0
+
+
+def test_reader_feeds_iterparse(s3_client):
+    messages = "".join(f'<sms body="message {i}" />' for i in range(5000))
+    s3_client.put_object(
+        Bucket="sms-backup-restore",
+        Key="backup.xml",
+        Body=f"<smses>{messages}</smses>".encode(),
+    )
+
+    with PrefetchingReader(
+        s3_client, "sms-backup-restore", "backup.xml", chunk_size=4096
+    ) as reader:
+        bodies = [e.attrib["body"] for _, e in etree.iterparse(reader, tag="sms")]
+
+    assert bodies == [f"message {i}" for i in range(5000)]
@@ -0,0 +1,59 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from schemas import RECORD_MODELS
+
+from .conftest import sms_attributes
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+
+GROUP_CALL = {
+    "number": "5551234567~5557654321~5550001111",
+    "duration": "125",
+    "date": "1700000100000",
+    "type": "2",
+    "presentation": "1",
+    "subscription_id": "1",
+    "subscription_component_name": None,
+    "readable_date": "Nov 14, 2023 10:15:00 PM",
+    "contact_name": "(Unknown)",
+}
+
+
+def record_id_with_hash_seed(record_type: str, attributes: dict, seed: int) -> str:
+    """Computes a record's id in an interpreter with the given hash seed."""
+    script = (
+        "import json, sys\n"
+        "from schemas import RECORD_MODELS\n"
+        "record_type, attributes = json.loads(sys.argv[1])\n"
+        "print(RECORD_MODELS[record_type].model_validate(attributes).hash())\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script, json.dumps([record_type, attributes])],
+        env={**os.environ, "PYTHONHASHSEED": str(seed), "PYTHONPATH": str(SRC_DIR)},
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return result.stdout.strip()
+
+
+@pytest.mark.parametrize(
+    "record_type,attributes",
+    [
+        ("SMS", sms_attributes("+15551234567~+15557654321~+15550001111", 0)),
+        ("Call", GROUP_CALL),
+    ],
+)
+def test_group_record_ids_do_not_depend_on_the_hash_seed(record_type, attributes):
+    # Validation sets the parsed timestamp on the attributes it is given
+    record_id = RECORD_MODELS[record_type].model_validate(dict(attributes)).hash()
+
+    assert {
+        record_id_with_hash_seed(record_type, attributes, seed) for seed in (1, 2, 3)
+    } == {record_id}
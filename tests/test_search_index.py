@@ -0,0 +1,118 @@
+import boto3
+import pytest
+
+from item_serializer import serialize_record
+from search_index import SearchIndex, SearchIndexer, list_segments, merge_segments
+from sinks import DynamoDBSink
+
+
+@pytest.fixture
+def search_resources(dynamodb_client, tmp_path):
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket="sms-backup-restore")
+    sink = DynamoDBSink(
+        dynamodb_client,
+        "sms-backup-restore",
+        search_indexer=SearchIndexer(s3_client, "sms-backup-restore"),
+    )
+    index = SearchIndex(
+        s3_client,
+        "sms-backup-restore",
+        cache_dir=str(tmp_path),
+        refresh_interval=0,
+    )
+    yield s3_client, sink, index
+
+
+def test_search_written_messages(search_resources, sms_record, mms_record):
+    s3_client, sink, index = search_resources
+    with sink:
+        sink.write((r.hash(), r) for r in (sms_record, mms_record))
+    assert len(list_segments(s3_client, "sms-backup-restore")) == 1
+
+    [hit] = index.search("DINNER tonight")
+    assert hit["id"] == sms_record.hash()
+    assert hit["address"] == ["+15551234567"]
+    assert "[dinner]" in hit["snippet"]
+    # MMS text parts are indexed; every term must match
+    assert [h["record_type"] for h in index.search("seven")] == ["MMS"]
+    assert index.search("seven dinner") == []
+    # Query syntax is treated as plain text
+    assert index.search('dinner" OR "seven') == []
+
+
+def test_merge_keeps_every_message(search_resources, make_sms):
+    s3_client, sink, index = search_resources
+    for i in range(5):
+        records = [make_sms("+15551234567", i * 10 + j) for j in range(10)]
+        sink.write((r.hash(), r) for r in records)
+        sink.flush()
+    # Rewriting is skipped as unchanged, so nothing is indexed twice
+    sink.write([(records[0].hash(), records[0])])
+    sink.flush()
+    assert len(index.search("message", limit=100)) == 50
+
+    assert merge_segments(s3_client, "sms-backup-restore", fan_in=2) == 3
+    segments = list_segments(s3_client, "sms-backup-restore")
+    assert [s.split("/")[2] for s in segments] == ["2", "0"]
+    hits = index.search("minute", limit=100)
+    assert len(hits) == 50
+    [hit] = index.search("49")
+    assert hit["id"] == records[-1].hash()
+
+
+def test_hits_are_ranked_across_segments(search_resources, make_sms):
+    s3_client, _, index = search_resources
+    indexer = SearchIndexer(s3_client, "sms-backup-restore")
+
+    def index_segment(minute, bodies):
+        records = [
+            make_sms("+15551234567", minute + i).model_copy(update={"body": body})
+            for i, body in enumerate(bodies)
+        ]
+        indexer.add_items(serialize_record(r.hash(), r) for r in records)
+        indexer.flush()
+        return records
+
+    # "dinner" is in every document of the first segment, so its IDF there is
+    # near zero, and rare in the second, where a longer document matches
+    short = index_segment(0, ["dinner"] + [f"dinner plans {i}" for i in range(5)])[0]
+    index_segment(
+        10,
+        ["dinner after the long meeting with everyone from the office"]
+        + [f"unrelated {i}" for i in range(10)],
+    )
+
+    hits = index.search("dinner", limit=1)
+    assert [hit["id"] for hit in hits] == [short.hash()]
+    assert hits[0]["snippet"] == "[dinner]"
+    hits = index.search("dinner", limit=10)
+    assert len(hits) == 7
+    # Ties aside, fewer hits are the best of more
+    scores = [hit["score"] for hit in hits]
+    assert [hit["score"] for hit in index.search("dinner", limit=3)] == scores[:3]
+
+
+def test_newer_segments_shadow_older_documents(search_resources, sms_record):
+    s3_client, _, index = search_resources
+    indexer = SearchIndexer(s3_client, "sms-backup-restore")
+    edited = sms_record.model_copy(update={"body": "Lunch tomorrow instead?"})
+    for record in (sms_record, edited):
+        indexer.add_items([serialize_record(sms_record.hash(), record)])
+        indexer.flush()
+
+    assert index.search("dinner") == []
+    [hit] = index.search("lunch")
+    assert hit["id"] == sms_record.hash()
+
+
+def test_backup_is_indexed_in_one_segment(search_resources, monkeypatch, make_sms):
+    import processing
+
+    s3_client, sink, index = search_resources
+    monkeypatch.setattr(processing, "CHECKPOINT_RECORDS", 10)
+    records = [make_sms("+15551234567", i) for i in range(25)]
+
+    processing.write_records([(r.hash(), r) for r in records], "object", {}, [sink])
+    assert len(list_segments(s3_client, "sms-backup-restore")) == 1
+    assert len(index.search("message", limit=100)) == 25
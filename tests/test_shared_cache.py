@@ -0,0 +1,125 @@
+import boto3
+import pytest
+
+from part_packs import PartPacker
+from shared_cache import InProcessSetCache, RedisSetCache, part_namespace
+from sinks import DynamoDBSink
+
+
+def test_workers_skip_records_written_by_another_worker(
+    dynamodb_client, sms_record, call_record, monkeypatch
+):
+    shared_cache = InProcessSetCache()
+    records = [(r.hash(), r) for r in (sms_record, call_record)]
+    sink = DynamoDBSink(
+        dynamodb_client, "sms-backup-restore", shared_cache=shared_cache
+    )
+    assert sink.write(records) == 2
+
+    # Another worker, without warm caches of its own, neither reads nor writes
+    other_sink = DynamoDBSink(
+        dynamodb_client, "sms-backup-restore", shared_cache=shared_cache
+    )
+    monkeypatch.setattr(
+        dynamodb_client, "batch_get_item", lambda **_: pytest.fail("looked up")
+    )
+    assert other_sink.write(records) == 0
+    metrics = {name: value for name, _, value in shared_cache.metrics()}
+    assert metrics["SharedCacheHitRate"] == 50.0
+    assert metrics["SharedCacheLookups"] == 4
+
+
+def test_workers_skip_parts_packed_by_another_worker(
+    dynamodb_client, part_index_table, monkeypatch
+):
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket="sms-backup-restore")
+    shared_cache = InProcessSetCache()
+
+    def packer():
+        return PartPacker(
+            s3_client,
+            dynamodb_client,
+            part_index_table,
+            "sms-backup-restore",
+            shared_cache=shared_cache,
+        )
+
+    first = packer()
+    part_hash = first.add(b"attachment")
+    first.flush()
+    assert first.parts_packed == 1
+    assert shared_cache.contains(part_namespace("sms-backup-restore"), [part_hash])
+
+    monkeypatch.setattr(
+        dynamodb_client, "batch_get_item", lambda **_: pytest.fail("looked up")
+    )
+    second = packer()
+    assert second.add(b"attachment") == part_hash
+    assert second.flush() is None
+    assert second.packs_written == 0
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, command):
+        return lambda *args: self._commands.append((command, *args))
+
+    def execute(self):
+        self._redis.executed.append([c[0] for c in self._commands])
+        return [self._redis.run(*command) for command in self._commands]
+
+
+class FakeRedis:
+    """Sorted sets and key expiry of Redis, recording the commands sent."""
+
+    def __init__(self):
+        self.sets = {}
+        self.expiry = {}
+        self.executed = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def run(self, command, key, *args):
+        scores = self.sets.setdefault(key, {})
+        if command == "zmscore":
+            return [scores.get(member) for member in args[0]]
+        if command == "zadd":
+            scores.update(args[0])
+        elif command == "zremrangebyscore":
+            for member, score in list(scores.items()):
+                if score <= args[1]:
+                    del scores[member]
+        elif command == "expire":
+            self.expiry[key] = args[0]
+
+
+def test_redis_set_cache_expires_each_member():
+    now = [1000.0]
+    redis = FakeRedis()
+    cache = RedisSetCache(redis, ttl_seconds=60, batch_size=3, clock=lambda: now[0])
+    members = [f"member-{i}" for i in range(10)]
+
+    cache.add("parts:bucket", members[::2])
+    assert redis.executed == [["zadd", "zadd", "zremrangebyscore", "expire"]]
+    assert cache.contains("parts:bucket", members) == [i % 2 == 0 for i in range(10)]
+    assert redis.executed[-1] == ["zmscore"] * 4
+
+    # Adding members later does not keep the earlier ones alive
+    now[0] = 1030.0
+    cache.add("parts:bucket", members[1:2])
+    now[0] = 1060.0
+    assert cache.contains("parts:bucket", members[:2]) == [False, True]
+    now[0] = 1090.0
+    cache.add("parts:bucket", members[3:4])
+    assert set(redis.sets["sms-backup-restore:parts:bucket"]) == {"member-3"}
+    assert redis.expiry["sms-backup-restore:parts:bucket"] == 60
+
+    executed = len(redis.executed)
+    cache.add("parts:bucket", [])
+    assert cache.contains("parts:bucket", []) == []
+    assert len(redis.executed) == executed
@@ -0,0 +1,84 @@
+import json
+import os
+import uuid
+
+import pytest
+
+from sinks import DynamoDBSink, KafkaSink, build_sinks
+
+KAFKA_BOOTSTRAP_SERVERS = os.environ.get("KAFKA_BOOTSTRAP_SERVERS")
+
+
+class FakeFuture:
+    def get(self, timeout=None):
+        return None
+
+
+class FakeProducer:
+    def __init__(self):
+        self.sent = []
+        self.flushed = False
+        self.closed = False
+
+    def send(self, topic, key=None, value=None):
+        self.sent.append((topic, key, value))
+        return FakeFuture()
+
+    def flush(self):
+        self.flushed = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_dynamodb_sink(
+    dynamodb_table, dynamodb_client, sms_record, call_record, mms_record
+):
+    records = [(r.hash(), r) for r in (sms_record, call_record, mms_record)]
+    sink = DynamoDBSink(dynamodb_client, "sms-backup-restore")
+
+    assert sink.write(records) == 3
+    items = dynamodb_table.Table("sms-backup-restore").scan()["Items"]
+    assert {i["id"] for i in items} == {record_id for record_id, _ in records}
+    stored_mms = next(i for i in items if i["record_type"] == "MMS")
+    assert stored_mms["parts"][0]["text"] == "See you at seven"
+    assert stored_mms["m_size"] == 512
+
+
+def test_kafka_sink_keys_by_record_id(sms_record, call_record):
+    producer = FakeProducer()
+    records = [(r.hash(), r) for r in (sms_record, call_record)]
+
+    with KafkaSink("localhost:9092", "records", producer=producer) as sink:
+        assert sink.write(records) == 2
+
+    assert [key for _, key, _ in producer.sent] == [r for r, _ in records]
+    assert producer.sent[0][2]["body"] == sms_record.body
+    assert producer.flushed and producer.closed
+
+
+def test_build_sinks_unknown():
+    with pytest.raises(ValueError):
+        build_sinks("dynamodb,postgres", None, "sms-backup-restore")
+
+
+@pytest.mark.skipif(
+    KAFKA_BOOTSTRAP_SERVERS is None, reason="requires local Redpanda container"
+)
+def test_kafka_sink_redpanda(sms_record):
+    from kafka import KafkaConsumer
+
+    topic = f"sms-backup-restore-{uuid.uuid4()}"
+    record_id = sms_record.hash()
+    with KafkaSink(KAFKA_BOOTSTRAP_SERVERS, topic, compression_type="lz4") as sink:
+        sink.write([(record_id, sms_record)])
+
+    consumer = KafkaConsumer(
+        topic,
+        bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS.split(","),
+        auto_offset_reset="earliest",
+        consumer_timeout_ms=10000,
+    )
+    message = next(iter(consumer))
+    assert message.key.decode() == record_id
+    assert json.loads(message.value)["id"] == record_id
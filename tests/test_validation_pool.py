@@ -0,0 +1,49 @@
+from itertools import batched
+
+import boto3
+import pytest
+
+from backup_processor import BackupRestoreProcessor
+from validation_pool import ValidationPool, validate_chunk
+
+
+@pytest.fixture
+def validation_pool():
+    pool = ValidationPool(workers=3)
+    yield pool
+    pool.close()
+
+
+def test_pool_yields_chunks_in_order(validation_pool, make_sms_snapshot):
+    snapshots = (make_sms_snapshot(f"555{i % 13:07d}", i) for i in range(200))
+    chunks = list(batched(snapshots, 9))
+
+    validated = list(validation_pool.map(chunks))
+
+    assert [[r.model_dump() for r in chunk] for chunk in validated] == [
+        [r.model_dump() for r in validate_chunk(chunk)] for chunk in chunks
+    ]
+
+
+def test_pool_raises_validation_errors_and_recovers(validation_pool, make_sms_snapshot):
+    snapshots = [make_sms_snapshot("5550000000", i) for i in range(4)]
+    invalid = ("sms", {**snapshots[0][1], "type": "not a number"})
+    with pytest.raises(RuntimeError, match="validation failed"):
+        list(validation_pool.map([[snapshots[1]], [invalid], [snapshots[2]]]))
+
+    [[record]] = validation_pool.map([[snapshots[3]]])
+    assert record.field("body") == "message at minute 3"
+
+
+def test_processor_validates_on_the_pool(backup_bucket, validation_pool):
+    s3_client = backup_bucket
+    s3_resource = boto3.resource("s3", region_name="us-east-1")
+
+    serial = BackupRestoreProcessor(s3_client=s3_client, s3_resource=s3_resource)
+    pooled = BackupRestoreProcessor(
+        s3_client=s3_client, s3_resource=s3_resource, validation_pool=validation_pool
+    )
+
+    expected = serial.process_backup("sms-backup-restore", "sms-backup.xml")
+    records = pooled.process_backup("sms-backup-restore", "sms-backup.xml")
+    assert [r.model_dump() for r in records] == [r.model_dump() for r in expected]
@@ -0,0 +1,73 @@
+import pytest
+
+from sinks import DynamoDBSink
+from validation_pool import validate_snapshot
+from warm_cache import TTLCache, phone_numbers
+
+
+def metric_values(cache):
+    return {name.split("/")[0]: value for name, _, value in cache.metrics()}
+
+
+def test_cache_expires_entries_and_reports_hit_rate():
+    now = [0.0]
+    cache = TTLCache(
+        "Test", ttl_seconds=60, max_bytes=1024 * 1024, clock=lambda: now[0]
+    )
+    cache.put("+15551234567", "+15551234567")
+
+    assert cache.get("+15551234567") == "+15551234567"
+    assert "+15557654321" not in cache
+    assert metric_values(cache)["CacheHitRate"] == 50.0
+    now[0] = 59.9
+    assert "+15551234567" in cache
+    now[0] = 60.0
+    assert cache.get("+15551234567") is None
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used_over_budget():
+    cache = TTLCache("Test", ttl_seconds=60, max_bytes=1200)
+    for i in range(10):
+        cache.put(f"part-{i}")
+        assert "part-0" in cache
+
+    assert 0 < len(cache) < 10
+    assert "part-0" in cache
+    assert "part-1" not in cache
+    assert metric_values(cache)["CacheBytes"] <= 1200
+
+
+def test_sink_skips_lookups_of_recently_written_items(
+    dynamodb_client, sms_record, call_record, monkeypatch
+):
+    recent_digests = TTLCache("RecordDigests", ttl_seconds=60, max_bytes=1024**2)
+    records = [(r.hash(), r) for r in (sms_record, call_record)]
+    sink = DynamoDBSink(
+        dynamodb_client, "sms-backup-restore", recent_digests=recent_digests
+    )
+    assert sink.write(records) == 2
+
+    # A warm invocation writing the same records neither reads nor writes
+    warm_sink = DynamoDBSink(
+        dynamodb_client, "sms-backup-restore", recent_digests=recent_digests
+    )
+    monkeypatch.setattr(
+        dynamodb_client, "batch_get_item", lambda **_: pytest.fail("looked up")
+    )
+    assert warm_sink.write(records) == 0
+    counts = {name: value for name, _, value in warm_sink.metrics()}
+    assert counts["RecordsSkipped"] == 2
+
+
+def test_validation_caches_normalized_phone_numbers(make_sms_snapshot):
+    phone_numbers.clear()
+    phone_numbers.metrics()
+
+    first = validate_snapshot(make_sms_snapshot("5551234567", 0))
+    second = validate_snapshot(make_sms_snapshot("5551234567", 1))
+
+    assert first.address == second.address == ("+15551234567",)
+    assert phone_numbers.get("5551234567") == "+15551234567"
+    # The lookup above is the third, after a miss and a hit
+    assert metric_values(phone_numbers)["CacheLookups"] == 3
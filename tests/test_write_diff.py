@@ -0,0 +1,79 @@
+import pytest
+
+from item_serializer import serialize_record
+from sinks import DynamoDBSink
+from write_diff import WriteSkipDiffer, content_digest
+
+
+def test_content_digest_ignores_digest_and_key_order(sms_record):
+    item = serialize_record(sms_record.hash(), sms_record)
+    reordered = dict(reversed(list(item.items())))
+
+    assert content_digest(item) == content_digest(reordered)
+    assert content_digest(item) == content_digest({**item, "digest": {"S": "stale"}})
+
+
+def test_dynamodb_sink_skips_unchanged(
+    dynamodb_client, sms_record, call_record, mms_record
+):
+    records = [(r.hash(), r) for r in (sms_record, call_record, mms_record)]
+    sink = DynamoDBSink(dynamodb_client, "sms-backup-restore")
+
+    assert sink.write(records) == 3
+    counts = {name: value for name, _, value in sink.metrics()}
+    assert (counts["RecordsNew"], counts["RecordsSkipped"]) == (3, 0)
+
+    assert sink.write(records) == 0
+    counts = {name: value for name, _, value in sink.metrics()}
+    assert (counts["RecordsNew"], counts["RecordsSkipped"]) == (0, 3)
+
+
+def test_differ_detects_modified_items(dynamodb_client, sms_record, call_record):
+    sink = DynamoDBSink(dynamodb_client, "sms-backup-restore")
+    sink.write([(r.hash(), r) for r in (sms_record, call_record)])
+
+    items = [serialize_record(r.hash(), r) for r in (sms_record, call_record)]
+    items[0]["contact_name"] = {"S": "Alice Smith"}
+    for item in items:
+        item["digest"] = {"S": content_digest(item)}
+    differ = WriteSkipDiffer(dynamodb_client, "sms-backup-restore")
+    write_diff = differ.diff(items)
+
+    assert write_diff.new == []
+    assert [i["id"]["S"] for i in write_diff.modified] == [sms_record.hash()]
+    assert write_diff.unchanged == 1
+
+
+def test_differ_backs_off_on_unprocessed_keys(dynamodb_client, sms_record, call_record):
+    sink = DynamoDBSink(dynamodb_client, "sms-backup-restore")
+    sink.write([(r.hash(), r) for r in (sms_record, call_record)])
+    items = [serialize_record(r.hash(), r) for r in (sms_record, call_record)]
+    for item in items:
+        item["digest"] = {"S": content_digest(item)}
+
+    class ThrottledClient:
+        """Leaves every key unprocessed the first `throttled` times."""
+
+        def __init__(self, throttled):
+            self.throttled = throttled
+
+        def batch_get_item(self, RequestItems):
+            if not self.throttled:
+                return dynamodb_client.batch_get_item(RequestItems=RequestItems)
+            self.throttled -= 1
+            return {"Responses": {}, "UnprocessedKeys": RequestItems}
+
+    sleeps = []
+    differ = WriteSkipDiffer(
+        ThrottledClient(1), "sms-backup-restore", sleep=sleeps.append
+    )
+    assert differ.diff(items).unchanged == 2
+    assert sleeps == [0.05]
+
+    sleeps.clear()
+    differ = WriteSkipDiffer(
+        ThrottledClient(100), "sms-backup-restore", sleep=sleeps.append
+    )
+    with pytest.raises(RuntimeError, match="after 10 attempts"):
+        differ.diff(items)
+    assert sleeps == [0.05, 0.1, 0.2, 0.4, 0.8, 1.6, 3.2, 5.0, 5.0]